@@ -0,0 +1,45 @@
+# app/api/v1/admin_routes.py
+from functools import partial
+from typing import Any, Dict
+
+import anyio
+import anyio.to_thread
+from fastapi import APIRouter, Depends, Query
+
+from app.api.v1.resy_routes import client_manager, watch_registry
+from app.core.admission import admission
+from app.core.security import require_admin_key
+from app.services.notifications import notifier
+from app.services.runtime_stats import job_stats, loop_monitor, threadpool_stats
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin_key)])
+
+# Own thread limiter for admin work, so it never queues behind a saturated route pool
+_admin_limiter = anyio.CapacityLimiter(2)
+
+
+@router.get("/runtime")
+async def runtime(limit: int = Query(100, ge=0, le=10000)) -> Dict[str, Any]:
+    """
+    Live runtime state, for sizing deployments and catching stalls:
+    tasks and their in-flight calls, outbound connection pools, scheduler
+    jobs (next run, last start lag, duration), event-loop lag, thread pool
+    occupancy, admission control, watches and notifications.
+
+    Deliberately async and off the route threadpool, so it still answers
+    when that pool is saturated: the task listing (a lock and a sort over
+    every session) runs on a thread of its own limiter, the cheap counters
+    and the threadpool occupancy (read from the loop) stay on the loop.
+    """
+    clients = await anyio.to_thread.run_sync(partial(client_manager.stats, limit=limit), limiter=_admin_limiter)
+    return {
+        "tasks": clients["tasks"],
+        "clients": clients["clients"],
+        "connections": clients["connections"],
+        "jobs": job_stats.stats(),
+        "event_loop": loop_monitor.stats(),
+        "threadpools": threadpool_stats(),
+        "admission": admission.stats(),
+        "watches": watch_registry.stats(),
+        "notifications": notifier.stats(),
+    }
@@ -1,20 +1,54 @@
 # app/api/v1/resy_routes.py
+import json
+import logging
+import time
+from datetime import date
 from typing import Optional, List, Any, Dict
-from datetime import datetime, time
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Header
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from app.core.security import rate_limiter
 from app.services.clientManager import ClientManager
-from app.services.resy_client import ResyClientError
+from app.services.resy_client import DeadlineExceeded, ResyClientError
+from app.services.auth_cache import auth_cache
+from app.services.availability_history import availability_history, timeline
+from app.services.availability_index import availability_index
+from app.services.availability_search import candidate_venues, search_available
+from app.services.profile_cache import ProfileCache
+from app.services.venue_resolver import venue_resolver
+from app.services.notifications import check_webhook_url, email_allowed, notifier
+from app.services.watch_registry import Watch, WatchRegistry
+from app.services.watch_store import WatchStore
+from app.services.release_patterns import release_patterns, release_window_for
+from app.services.booking_coordinator import SlotLeasedError, booking_coordinator, booking_definitely_failed, slot_ref
+from app.services.booking_race import BOOKED, UNKNOWN, race_book
+from app.services.slot_ranking import SlotRanker
+from app.services.slots import filter_slots_by_window, parse_find_slots
+from app.services.venue_catalog import (
+    VenueRecord,
+    distance_from,
+    record_from_search_hit,
+    venue_catalog,
+)
 from app.core.token_manager import generate_session_token, validate_session_token
 
 from app.core.config import settings    
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/resy", tags=["resy"])
 
 # Initialize client manager singleton
 client_manager = ClientManager()
+profile_cache = ProfileCache(client_manager)
+watch_registry = WatchRegistry(
+    client_manager,
+    fanout=settings.WATCH_POLL_FANOUT,
+    max_per_task=settings.WATCH_MAX_PER_TASK,
+    notifier=notifier,
+)
+watch_store = WatchStore(watch_registry)
 
 
 # ---------- Pydantic models ----------
@@ -25,6 +59,7 @@ class SlotOut(BaseModel):
     start: str
     end: str
     is_paid: bool
+    score: Optional[int] = None  # preference score when ranked (lower is better)
 
 
 class SlotsResponse(BaseModel):
@@ -34,6 +69,16 @@ class SlotsResponse(BaseModel):
     slots: List[SlotOut]
 
 
+class SlotPreferences(BaseModel):
+    target_time: Optional[str] = None  # "HH:MM" (24h), ideal seating time
+    time_start: Optional[str] = None   # "HH:MM" (24h), acceptable window
+    time_end: Optional[str] = None     # "HH:MM" (24h)
+    preferred_types: List[str] = []    # e.g. ["Patio", "Dining Room"], best first
+    excluded_types: List[str] = []     # e.g. ["Bar"]
+    allow_paid: bool = True
+    prefer_free: bool = False
+
+
 class SlotSearchQuery(BaseModel):
     venue_id: int
     day: str          # "YYYY-MM-DD"
@@ -41,6 +86,8 @@ class SlotSearchQuery(BaseModel):
     time_filter: Optional[str] = None  # "evening", "21:30", etc.
     time_start: Optional[str] = None   # "HH:MM" (24h)
     time_end: Optional[str] = None     # "HH:MM" (24h)
+    # Rank slots best-first; defaults to the task's saved preferences (PUT /preferences)
+    preferences: Optional[SlotPreferences] = None
 
 
 class ReservationPreviewRequest(BaseModel):
@@ -57,12 +104,33 @@ class ReservationPreviewResponse(BaseModel):
 class BookRequest(BaseModel):
     book_token: str
     payment_method_id: Optional[int] = None
+    use_default_payment_method: bool = False  # book with the cached default card if no payment_method_id
+    config_id: Optional[str] = None  # slot the token is for; known already if it was previewed here
 
 
 class BookResponse(BaseModel):
     status: str
     raw: Dict[str, Any]
 
+
+class RaceRequest(BaseModel):
+    venue_id: int
+    day: str                           # "YYYY-MM-DD"
+    party_size: int
+    time_start: Optional[str] = None   # "HH:MM" (24h)
+    time_end: Optional[str] = None     # "HH:MM" (24h)
+    preferences: Optional[SlotPreferences] = None  # defaults to the task's saved preferences
+    top_n: Optional[int] = None        # slots previewed in parallel (default RACE_TOP_N)
+    payment_method_id: Optional[int] = None
+    use_default_payment_method: bool = False  # book with the cached default card if no payment_method_id
+
+
+class RaceResponse(BaseModel):
+    status: str  # "booked" | "skipped" (non-production) | "no_slots" | "failed" | "unknown" (booking may have gone through)
+    slot: Optional[SlotOut] = None
+    raw: Optional[Dict[str, Any]] = None
+    attempts: List[Dict[str, Any]] = []
+
 class IdRequest(BaseModel):
     URL: str
 
@@ -71,6 +139,19 @@ class IdResponse(BaseModel):
     venue_name: str
     session_token: str
 
+class BulkIdRequest(BaseModel):
+    URLs: List[str]
+
+class BulkIdResult(BaseModel):
+    URL: str
+    venue_id: Optional[int] = None
+    venue_name: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkIdResponse(BaseModel):
+    results: List[BulkIdResult]
+    session_token: str
+
 class LoginRequest(BaseModel):
     email: Optional[str] = None
     password: Optional[str] = None
@@ -80,9 +161,16 @@ class LoginResponse(BaseModel):
     status: str
     session_token: str
 
+class LogoutResponse(BaseModel):
+    status: str
+
 class MeResponse(BaseModel):
     user: Dict[str, Any]
 
+class PaymentMethodsResponse(BaseModel):
+    payment_methods: List[Dict[str, Any]]
+    default_payment_method_id: Optional[int] = None
+
 
 class calendarRequest(BaseModel):
     venue_id: int
@@ -100,6 +188,7 @@ class VenueSearchRequest(BaseModel):
     day: Optional[str] = None  # "YYYY-MM-DD" format
     party_size: Optional[int] = None
     per_page: int = 5
+    radius_km: Optional[float] = None  # local catalog search radius (default VENUESEARCH_RADIUS_KM)
 
 class VenueSearchResult(BaseModel):
     name: str
@@ -108,10 +197,139 @@ class VenueSearchResult(BaseModel):
     region: Optional[str] = None
     image_url: Optional[str] = None
     venue_id: int
+    distance_km: Optional[float] = None
 
 class VenueSearchResponse(BaseModel):
     results: List[VenueSearchResult]
 
+class AvailabilitySearchRequest(BaseModel):
+    party_size: int
+    start_date: str                    # "YYYY-MM-DD"
+    end_date: Optional[str] = None     # "YYYY-MM-DD", defaults to start_date
+    time_start: Optional[str] = None   # "HH:MM" (24h)
+    time_end: Optional[str] = None     # "HH:MM" (24h)
+    limit: int = 5                     # stop after this many venue-days with open slots
+    # Either explicit venues (ranked in the given order)...
+    venue_ids: Optional[List[int]] = None
+    # ...or everything matching `query` within radius_km of the point, nearest first
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    radius_km: float = 2.0
+    query: str = ""
+    max_venues: Optional[int] = None   # default AVAILABILITY_SEARCH_MAX_VENUES
+
+class SlotHistoryEvent(BaseModel):
+    day: str
+    party_size: int
+    slot_start: str     # "YYYY-MM-DD HH:MM"
+    observed_at: float  # unix seconds
+    event: str          # "appeared" | "disappeared" | "first_seen" (open when the venue-day was first observed)
+
+class DropTimelinePoint(BaseModel):
+    observed_at: float
+    appeared: int
+    disappeared: int
+    first_seen: int
+
+class SlotHistoryResponse(BaseModel):
+    venue_id: int
+    timeline: List[DropTimelinePoint]
+    events: List[SlotHistoryEvent]
+
+class ReleasePatternResponse(BaseModel):
+    venue_id: int
+    observations: int
+    release: Optional[Dict[str, Any]] = None        # days_ahead, time, window_start/end, confidence, samples
+    cancellations: Optional[Dict[str, Any]] = None  # per_day, peak_hours, by_hour
+    # Only when `day` is given:
+    release_window: Optional[Dict[str, float]] = None  # predicted release of that day (unix start/end)
+    poll_interval_sec: Optional[float] = None           # suggested monitor cadence right now
+
+class WatchNotify(BaseModel):
+    webhook_url: Optional[str] = None  # POSTed {"events": [...]} when slots are found
+    email: Optional[str] = None
+
+
+class WatchRequest(BaseModel):
+    venue_id: int
+    day: str                           # "YYYY-MM-DD"
+    party_size: int
+    time_start: Optional[str] = None   # "HH:MM" (24h)
+    time_end: Optional[str] = None     # "HH:MM" (24h)
+    # Rank matches best-first; defaults to the task's saved preferences (PUT /preferences)
+    preferences: Optional[SlotPreferences] = None
+    # Where to send slot-found notifications (server defaults apply if omitted)
+    notify: Optional[WatchNotify] = None
+
+
+class WatchOut(BaseModel):
+    watch_id: str
+    venue_id: int
+    day: str
+    party_size: int
+    time_start: Optional[str] = None
+    time_end: Optional[str] = None
+    notify: Optional[WatchNotify] = None
+    slots: List[SlotOut]
+    checked_at: Optional[float] = None   # last poll of this venue-day
+    changed_at: Optional[float] = None   # last time the matching slots changed
+    next_poll_at: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+class WatchRemovedResponse(BaseModel):
+    status: str
+    watch_id: str
+
+def _upstream_error(e: ResyClientError) -> HTTPException:
+    """502 for upstream failures; 504 (or 499) when the request's own deadline ran out first."""
+    status_code = e.status_code if isinstance(e, DeadlineExceeded) else 502
+    return HTTPException(status_code=status_code, detail=f"Upstream error: {e.message}")
+
+
+def _check_day(value: str, field: str = "day") -> date:
+    """Parse a "YYYY-MM-DD" request field, or 400 before anything is recorded or sent upstream."""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{field} must be YYYY-MM-DD")
+
+
+def _check_range(start_date: str, end_date: str) -> None:
+    """400 unless start_date..end_date is a valid range of at most CALENDAR_MAX_RANGE_DAYS days."""
+    start = _check_day(start_date, "start_date")
+    end = _check_day(end_date, "end_date")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    if (end - start).days + 1 > settings.CALENDAR_MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=400, detail=f"date range must not exceed {settings.CALENDAR_MAX_RANGE_DAYS} days"
+        )
+
+
+def _venue_result(record: VenueRecord, distance_km: Optional[float] = None) -> VenueSearchResult:
+    return VenueSearchResult(
+        name=record.name,
+        cuisine=record.cuisine,
+        neighborhood=record.neighborhood,
+        region=record.region,
+        image_url=record.image_url,
+        venue_id=record.venue_id,
+        distance_km=round(distance_km, 3) if distance_km is not None else None,
+    )
+
+def _slot_preferences(
+    task_id: str,
+    preferences: Optional[SlotPreferences],
+    time_start: Optional[str],
+    time_end: Optional[str],
+) -> Optional[Dict[str, Any]]:
+    """Inline preferences, else the task's saved ones; the request's time window fills in a missing one."""
+    prefs = preferences.model_dump() if preferences else client_manager.store.load_preferences(task_id)
+    if prefs and not prefs.get("time_start") and not prefs.get("time_end"):
+        prefs = {**prefs, "time_start": time_start, "time_end": time_end}
+    return prefs
+
 # ---------- Routes ----------
 
 @router.post("/slots", response_model=SlotsResponse, dependencies=[Depends(rate_limiter), Depends(validate_session_token)])
@@ -125,109 +343,31 @@ def get_slots(
     Requires a valid session token (obtained from /login or /getID).
     """
     # validate_session_token dependency ensures token is valid and matches task_id
-    resy_client = client_manager.get_resy_client(x_task_id)
-    try:
-        resp = resy_client.find(
-            venue_id=str(query.venue_id),
-            num_seats=query.num_seats,
-            day=query.day,
-            time_filter=query.time_filter,
-        )
-    except ResyClientError as e:
-        raise HTTPException(status_code=502, detail=f"Upstream error: {e.message}")
-
-    venues = resp.get("results", {}).get("venues", [])
-    if not venues:
-        return SlotsResponse(
-            venue_id=query.venue_id,
-            day=query.day,
-            num_seats=query.num_seats,
-            slots=[]
-        )
-
-    venue = venues[0]
-    slots_out: List[SlotOut] = []
-
-    for s in venue.get("slots", []):
-        cfg = s.get("config", {})
-        date = s.get("date", {})
-        payment = s.get("payment", {})
-
-        slots_out.append(
-            SlotOut(
-                token=cfg.get("token"),
-                type=cfg.get("type"),
-                start=date.get("start"),
-                end=date.get("end"),
-                is_paid=bool(payment.get("is_paid")),
-            )
-        )
-
-    # Optional time-range filtering (keeps monitoring if nothing matches).
-    # We compare against the time-of-day of the slot's "start" value.
-    def _parse_hhmm(v: Optional[str]) -> Optional[time]:
-        if not v:
-            return None
-        try:
-            hh, mm = v.split(":")
-            return time(hour=int(hh), minute=int(mm))
-        except Exception:
-            return None
-
-    def _extract_slot_time(slot_start: Optional[str]) -> Optional[time]:
-        if not slot_start:
-            return None
-        # Try ISO first (handle trailing Z)
-        try:
-            s = slot_start.replace("Z", "+00:00")
-            dt = datetime.fromisoformat(s)
-            return dt.timetz().replace(tzinfo=None)
-        except Exception:
-            pass
-        # Fallback: grab HH:MM anywhere in string
+    _check_day(query.day)
+    with client_manager.use_client(x_task_id) as resy_client:
         try:
-            import re
-            m = re.search(r"(\d{2}):(\d{2})", slot_start)
-            if not m:
-                return None
-            return time(hour=int(m.group(1)), minute=int(m.group(2)))
-        except Exception:
-            return None
-
-    start_t = _parse_hhmm(query.time_start)
-    end_t = _parse_hhmm(query.time_end)
-
-    if start_t or end_t:
-        filtered: List[SlotOut] = []
-        for slot in slots_out:
-            slot_t = _extract_slot_time(slot.start)
-            if slot_t is None:
-                continue
-
-            # Only start bound
-            if start_t and not end_t:
-                if slot_t >= start_t:
-                    filtered.append(slot)
-                continue
-
-            # Only end bound
-            if end_t and not start_t:
-                if slot_t <= end_t:
-                    filtered.append(slot)
-                continue
-
-            # Both bounds
-            assert start_t and end_t
-            if start_t <= end_t:
-                # normal same-day window
-                if start_t <= slot_t <= end_t:
-                    filtered.append(slot)
-            else:
-                # window crosses midnight (e.g. 22:00 -> 02:00)
-                if slot_t >= start_t or slot_t <= end_t:
-                    filtered.append(slot)
-
-        slots_out = filtered
+            resp = resy_client.find(
+                venue_id=str(query.venue_id),
+                num_seats=query.num_seats,
+                day=query.day,
+                time_filter=query.time_filter,
+            )
+        except ResyClientError as e:
+            raise _upstream_error(e)
+
+    all_slots = parse_find_slots(resp)
+    availability_index.record_find(query.venue_id, query.num_seats, query.day, bool(all_slots))
+    availability_history.record(query.venue_id, query.day, query.num_seats, [slot["start"] for slot in all_slots])
+
+    preferences = _slot_preferences(x_task_id, query.preferences, query.time_start, query.time_end)
+    if preferences:
+        ranked = SlotRanker(preferences).rank(all_slots)
+        slots_out = [SlotOut(**slot, score=score) for score, slot in ranked]
+    else:
+        # Optional time-range filtering (keeps monitoring if nothing matches).
+        # We compare against the time-of-day of the slot's "start" value.
+        slots = filter_slots_by_window(all_slots, query.time_start, query.time_end)
+        slots_out = [SlotOut(**slot) for slot in slots]
 
     return SlotsResponse(
         venue_id=query.venue_id,
@@ -237,6 +377,33 @@ def get_slots(
     )
 
 
+@router.put(
+    "/preferences",
+    response_model=SlotPreferences,
+    dependencies=[Depends(rate_limiter), Depends(validate_session_token)],
+)
+def set_preferences(
+    body: SlotPreferences,
+    x_task_id: str = Header(..., alias="x-task-id")
+):
+    """
+    Save the task's slot preferences. /slots then returns slots ranked
+    best-first, so an auto-book can take the first one.
+    """
+    client_manager.store.save_preferences(x_task_id, body.model_dump())
+    return body
+
+
+@router.get(
+    "/preferences",
+    response_model=SlotPreferences,
+    dependencies=[Depends(rate_limiter), Depends(validate_session_token)],
+)
+def get_preferences(x_task_id: str = Header(..., alias="x-task-id")):
+    """The task's saved slot preferences (defaults if none were saved)."""
+    return SlotPreferences(**(client_manager.store.load_preferences(x_task_id) or {}))
+
+
 @router.post(
     "/reservation/preview",
     response_model=ReservationPreviewResponse,
@@ -250,22 +417,23 @@ def preview_reservation(
     Hit your getReservation wrapper that does the commit sequence and returns
     the book_token + user payment methods.
     """
-    resy_client = client_manager.get_resy_client(x_task_id)
-    try:
-        res_json = resy_client.getReservation(
-            config_id=body.config_id,
-            day=body.day,
-            party_size=body.party_size,
-        )
-    except ResyClientError as e:
-        raise HTTPException(status_code=502, detail=f"Upstream error: {e.message}")
+    with client_manager.use_client(x_task_id) as resy_client:
+        try:
+            res_json = resy_client.getReservation(
+                config_id=body.config_id,
+                day=body.day,
+                party_size=body.party_size,
+            )
+        except ResyClientError as e:
+            raise _upstream_error(e)
 
     book_token = res_json.get("book_token", {}).get("value")
     user = res_json.get("user") or {}
-    payment_methods = user.get("payment_methods") or []
+    payment_methods = user.get("payment_methods") or profile_cache.payment_methods(x_task_id)
 
     if not book_token:
         raise HTTPException(status_code=500, detail="No book_token returned")
+    booking_coordinator.remember_preview(book_token, slot_ref(body.config_id))
 
     return ReservationPreviewResponse(
         book_token=book_token,
@@ -280,13 +448,16 @@ def preview_reservation(
 )
 def book_reservation(
     body: BookRequest,
-    x_task_id: str = Header(..., alias="x-task-id")
+    x_task_id: str = Header(..., alias="x-task-id"),
+    idempotency_key: Optional[str] = Header(None, alias="idempotency-key"),
 ):
     """
     Confirm the booking using the book_token and optional payment_method_id.
+    Without a payment_method_id no card is sent, unless use_default_payment_method
+    asks for the user's default cached payment method.
+    Retrying with the same Idempotency-Key header returns the first response
+    instead of booking again.
     """
-    resy_client = client_manager.get_resy_client(x_task_id)
-
     if settings.MODE != "production":
         # In non-production modes, we don't want to actually book anything.
         print("Skipping booking in non-production mode.")
@@ -295,13 +466,52 @@ def book_reservation(
             raw={"message": "Booking skipped in non-production mode."},
         )
 
-    try:
-        result = resy_client.book(
-            book_token=body.book_token,
-            payment_method_id=body.payment_method_id,
+    if idempotency_key:
+        started, stored = client_manager.store.begin_idempotent(
+            x_task_id, idempotency_key, time.time(), settings.BOOKING_CLAIM_STALE_SEC
         )
-    except ResyClientError as e:
-        raise HTTPException(status_code=502, detail=f"Upstream error: {e.message}")
+        if stored is not None:
+            return BookResponse(**stored)
+        if not started:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress.")
+
+    try:
+        _claim_booking(x_task_id)
+    except HTTPException:
+        if idempotency_key:
+            client_manager.store.abandon_idempotent(x_task_id, idempotency_key)
+        raise
+
+    ref = slot_ref(body.config_id) or booking_coordinator.slot_for_token(body.book_token)
+    with client_manager.use_client(x_task_id) as resy_client:
+        try:
+            payment_method_id = profile_cache.payment_method_for(
+                x_task_id, body.payment_method_id, body.use_default_payment_method
+            )
+            result = booking_coordinator.book(
+                resy_client,
+                x_task_id,
+                ref,
+                lambda: resy_client.book(book_token=body.book_token, payment_method_id=payment_method_id),
+            )
+        except ResyClientError as e:
+            # Only a clear rejection frees the task (and the key); if the booking may have
+            # gone through, both stay claimed until they go stale
+            if booking_definitely_failed(e):
+                client_manager.store.finish_booking(x_task_id, False, time.time())
+                if idempotency_key:
+                    client_manager.store.abandon_idempotent(x_task_id, idempotency_key)
+            if isinstance(e, SlotLeasedError):
+                raise HTTPException(status_code=409, detail=e.message)
+            raise _upstream_error(e)
+        except Exception:
+            client_manager.store.finish_booking(x_task_id, False, time.time())
+            if idempotency_key:
+                client_manager.store.abandon_idempotent(x_task_id, idempotency_key)
+            raise
+    client_manager.store.finish_booking(x_task_id, True, time.time())
+    if idempotency_key:
+        client_manager.store.finish_idempotent(x_task_id, idempotency_key, {"status": "ok", "raw": result})
 
     # You can shape this however you want; here I keep raw for debugging
     return BookResponse(
@@ -311,6 +521,92 @@ def book_reservation(
 
 
 
+def _claim_booking(task_id: str) -> None:
+    """Take the task's booking claim (one booking per task, across workers) or raise 409."""
+    if not client_manager.store.claim_booking(task_id, time.time(), settings.BOOKING_CLAIM_STALE_SEC):
+        raise HTTPException(
+            status_code=409,
+            detail="This task already has a booking in progress or completed.",
+        )
+
+
+@router.post(
+    "/reservation/race",
+    response_model=RaceResponse,
+    dependencies=[Depends(rate_limiter), Depends(validate_session_token)],
+)
+def race_reservation(
+    body: RaceRequest,
+    x_task_id: str = Header(..., alias="x-task-id")
+):
+    """
+    Find, rank, preview and book in one call for contested drops.
+    Previews the top N ranked slots (/3/details) in parallel and books the
+    best one that returns a book_token; the rest are abandoned. At most one
+    booking per task: a second race or /reservation/book for the task gets 409.
+    """
+    top_n = max(1, body.top_n or settings.RACE_TOP_N)
+    production = settings.MODE == "production"
+    _check_day(body.day)
+
+    _claim_booking(x_task_id)
+    outcome: Dict[str, Any] = {"status": "no_slots", "slot": None, "result": None, "attempts": []}
+    try:
+        # The task's own client finds and books; each parallel preview gets one of the others
+        with client_manager.use_clients(x_task_id, top_n + 1) as (resy_client, *preview_clients):
+            try:
+                resp = resy_client.find(venue_id=str(body.venue_id), num_seats=body.party_size, day=body.day)
+            except ResyClientError as e:
+                raise _upstream_error(e)
+
+            all_slots = parse_find_slots(resp)
+            availability_index.record_find(body.venue_id, body.party_size, body.day, bool(all_slots))
+            availability_history.record(body.venue_id, body.day, body.party_size, [slot["start"] for slot in all_slots])
+
+            preferences = _slot_preferences(x_task_id, body.preferences, body.time_start, body.time_end) or {
+                "time_start": body.time_start, "time_end": body.time_end,
+            }
+            candidates = [slot for _, slot in SlotRanker(preferences).rank(all_slots)[:top_n]]
+            if candidates:
+                payment_method_id = profile_cache.payment_method_for(
+                    x_task_id, body.payment_method_id, body.use_default_payment_method
+                )
+
+                def book(slot: Dict[str, Any], book_token: str) -> Dict[str, Any]:
+                    if not production:
+                        logger.info("Race for task %s: skipping booking in non-production mode", x_task_id)
+                        return {"message": "Booking skipped in non-production mode."}
+                    return booking_coordinator.book(
+                        resy_client,
+                        x_task_id,
+                        slot_ref(slot["token"], body.venue_id, slot["start"]),
+                        lambda: resy_client.book(book_token=book_token, payment_method_id=payment_method_id),
+                    )
+
+                outcome = race_book(preview_clients, candidates, body.day, body.party_size, book)
+    except Exception:
+        # race_book reports booking failures in its outcome; anything raised here (a failed
+        # find, an unexpected error) leaves no booking behind, so free the task's claim
+        client_manager.store.finish_booking(x_task_id, False, time.time())
+        raise
+    # An ambiguous booking failure keeps the claim until it goes stale, so a retry cannot
+    # turn into a double booking
+    if outcome["status"] != UNKNOWN:
+        booked = outcome["status"] == BOOKED and production
+        client_manager.store.finish_booking(x_task_id, booked, time.time())
+
+    status = outcome["status"]
+    if status == BOOKED and not production:
+        status = "skipped"
+
+    return RaceResponse(
+        status=status,
+        slot=SlotOut(**outcome["slot"]) if outcome["slot"] else None,
+        raw=outcome["result"],
+        attempts=outcome["attempts"],
+    )
+
+
 @router.post(
     "/getID",
     response_model=IdResponse,
@@ -324,35 +620,23 @@ def getID(
     Takes in a resy.com restauraunts URL and returns the venue id and venue name.
     Also returns a session token for protected API calls.
     """
-    resy_client = client_manager.get_resy_client(x_task_id)
-    try:
-        print(f"[getID] Looking up venue with URL: {body.URL}")
-        res_json = resy_client.lookup_venue(
-            url=body.URL,
-        )
-        print(f"[getID] Lookup successful, response keys: {list(res_json.keys())}")
-    except ValueError as e:
-        print(f"[getID] ValueError: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Invalid URL format: {str(e)}")
-    except ResyClientError as e:
-        error_detail = f"Upstream error: {e.message}"
-        if e.details:
-            error_detail += f" | Details: {e.details}"
-        print(f"[getID] ResyClientError: {error_detail}")
-        raise HTTPException(status_code=502, detail=error_detail)
-    except Exception as e:
-        print(f"[getID] Unexpected error: {type(e).__name__}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
-
-    venue_id_obj = res_json.get("id")
-    if not venue_id_obj or not isinstance(venue_id_obj, dict):
-        raise HTTPException(status_code=500, detail="Invalid venue ID format in response")
-    
-    venue_id = str(venue_id_obj.get("resy"))
-    venue_name = str(res_json.get("name", ""))
-
-    if not venue_id:
-        raise HTTPException(status_code=500, detail="No venue ID returned from lookup")
+    with client_manager.use_client(x_task_id) as resy_client:
+        try:
+            print(f"[getID] Looking up venue with URL: {body.URL}")
+            venue_id, venue_name = venue_resolver.resolve_url(resy_client, body.URL, venue_catalog)
+            print(f"[getID] Lookup successful, venue id: {venue_id}")
+        except ValueError as e:
+            print(f"[getID] ValueError: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Invalid URL format: {str(e)}")
+        except ResyClientError as e:
+            error_detail = f"Upstream error: {e.message}"
+            if e.details:
+                error_detail += f" | Details: {e.details}"
+            print(f"[getID] ResyClientError: {error_detail}")
+            raise HTTPException(status_code=502, detail=error_detail)
+        except Exception as e:
+            print(f"[getID] Unexpected error: {type(e).__name__}: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
     # Generate and return a session token
     session_token = generate_session_token(x_task_id)
@@ -365,6 +649,45 @@ def getID(
     
     return response
 
+
+@router.post(
+    "/getIDs",
+    response_model=BulkIdResponse,
+    dependencies=[Depends(rate_limiter)],
+)
+def getIDs(
+    body: BulkIdRequest,
+    x_task_id: str = Header(..., alias="x-task-id")
+):
+    """
+    Bulk version of /getID: resolves many resy.com venue URLs in one call.
+    URLs pointing at the same venue are looked up once, uncached venues are
+    looked up concurrently, and each URL gets its own result or error.
+    The whole batch counts as one request against the rate limit and
+    returns one session token.
+    """
+    if len(body.URLs) > settings.VENUE_RESOLVE_MAX_URLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many URLs (max {settings.VENUE_RESOLVE_MAX_URLS} per request)",
+        )
+
+    with client_manager.use_client(x_task_id) as resy_client:
+        resolved = venue_resolver.resolve_many(
+            resy_client,
+            body.URLs,
+            venue_catalog,
+            fanout=settings.VENUE_RESOLVE_FANOUT,
+        )
+
+    return BulkIdResponse(
+        results=[
+            BulkIdResult(URL=r["url"], venue_id=r["venue_id"], venue_name=r["venue_name"], error=r["error"])
+            for r in resolved
+        ],
+        session_token=generate_session_token(x_task_id),
+    )
+
 @router.post(
     "/login",
     response_model=LoginResponse,
@@ -372,6 +695,7 @@ def getID(
 )
 def login(
     body: LoginRequest,
+    background_tasks: BackgroundTasks,
     x_task_id: str = Header(..., alias="x-task-id")
 ):
     """
@@ -379,29 +703,42 @@ def login(
     1. Email + password (legacy, for backwards compatibility)
     2. Resy auth token (preferred - obtained from client-side authentication)
     
-    Stores the auth token on the task-specific resy_client session.
+    Stores the auth token on the task-specific resy_client session and
+    prefetches the user's profile / payment methods in the background.
     Returns a session token for protected API calls.
     """
-    resy_client = client_manager.get_resy_client(x_task_id)
-    try:
-        # Preferred: Use token from client-side authentication
-        if body.resy_token:
-            resy_client.setToken(token=body.resy_token)
-        # Legacy: Use email/password (for backwards compatibility)
-        elif body.email and body.password:
-            resy_client.login(email=body.email, password=body.password)
-            resy_client.setToken()
-        else:
+    with client_manager.use_client(x_task_id) as resy_client:
+        try:
+            # Preferred: Use token from client-side authentication
+            if body.resy_token:
+                resy_client.setToken(token=body.resy_token)
+            # Legacy: Use email/password (for backwards compatibility)
+            elif body.email and body.password:
+                # Reuse a still-valid token from an earlier login with the same account
+                cached_token = auth_cache.get_token(body.email, body.password) if auth_cache else None
+                if cached_token:
+                    resy_client.setToken(token=cached_token)
+                else:
+                    resy_client.login(email=body.email, password=body.password)
+                    resy_client.setToken()
+                    if auth_cache:
+                        auth_cache.store(body.email, body.password, resy_client.userAuth)
+            else:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Either resy_token or (email and password) must be provided",
+                )
+            # Share the token with the other workers
+            client_manager.save_session(x_task_id)
+        except ResyClientError as e:
+            # Bubble up a clean error to the client
             raise HTTPException(
-                status_code=400,
-                detail="Either resy_token or (email and password) must be provided",
+                status_code=401 if (e.status_code and e.status_code == 401) else 502,
+                detail=f"Login failed: {e.message}",
             )
-    except ResyClientError as e:
-        # Bubble up a clean error to the client
-        raise HTTPException(
-            status_code=401 if (e.status_code and e.status_code == 401) else 502,
-            detail=f"Login failed: {e.message}",
-        )
+
+    # Runs after the response is sent, so booking later finds payment methods cached
+    background_tasks.add_task(profile_cache.prefetch, x_task_id)
 
     # Generate and return a session token
     session_token = generate_session_token(x_task_id)
@@ -412,6 +749,136 @@ def login(
     return response
 
 
+@router.post(
+    "/logout",
+    response_model=LogoutResponse,
+    dependencies=[Depends(rate_limiter), Depends(validate_session_token)],
+)
+def logout(x_task_id: str = Header(..., alias="x-task-id")):
+    """
+    End the task's session: drops its Resy auth and watches and revokes
+    every session token issued for it, on all workers.
+    """
+    watch_store.remove([w.watch_id for w in watch_store.for_task(x_task_id)])
+    client_manager.drop_task(x_task_id)
+    return LogoutResponse(status="ok")
+
+
+# ---------- Watches ----------
+
+def _watch_out(watch: Watch) -> WatchOut:
+    # Watches run by another worker have no local group; their status comes from the store
+    group = watch_registry.group_of(watch) if watch_registry.get(watch.watch_id) is watch else None
+    return WatchOut(
+        watch_id=watch.watch_id,
+        venue_id=watch.venue_id,
+        day=watch.day,
+        party_size=watch.party_size,
+        time_start=watch.time_start,
+        time_end=watch.time_end,
+        notify=WatchNotify(**watch.notify) if watch.notify else None,
+        slots=[SlotOut(**slot) for slot in watch.slots],
+        checked_at=watch.checked_at,
+        changed_at=watch.changed_at,
+        next_poll_at=group.next_poll if group is not None and group.next_poll else None,
+        last_error=group.last_error if group is not None else None,
+    )
+
+
+def _account_email(task_id: str) -> Optional[str]:
+    """The logged-in account's email, if Resy reports it as verified."""
+    profile = profile_cache.get(task_id, max_age=float("inf"))
+    if profile is None:
+        try:
+            profile = profile_cache.fetch(task_id)
+        except ResyClientError:
+            return None
+    return profile.get("em_address") if profile.get("em_is_verified") else None
+
+
+def _task_watch(watch_id: str, task_id: str) -> Watch:
+    watch = watch_store.get(watch_id, task_id)
+    if watch is None:
+        raise HTTPException(status_code=404, detail="Watch not found")
+    return watch
+
+
+@router.post(
+    "/watches",
+    response_model=WatchOut,
+    dependencies=[Depends(rate_limiter), Depends(validate_session_token)],
+)
+def create_watch(
+    body: WatchRequest,
+    x_task_id: str = Header(..., alias="x-task-id")
+):
+    """
+    Start a backend monitor for a venue, day and party size. Watches on the
+    same venue-day-party size share one upstream poll; GET /watches/{id}
+    returns the slots matching this watch's window or preferences, and
+    matches are pushed to the configured notification sinks.
+    """
+    _check_day(body.day)
+
+    if body.notify and body.notify.webhook_url:
+        try:
+            check_webhook_url(body.notify.webhook_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"notify.{e}")
+    if body.notify and body.notify.email and not email_allowed(body.notify.email, _account_email(x_task_id)):
+        raise HTTPException(
+            status_code=400,
+            detail="notify.email must be the account's verified email or an address allowed by the server",
+        )
+
+    preferences = _slot_preferences(x_task_id, body.preferences, body.time_start, body.time_end)
+    watch = Watch(
+        task_id=x_task_id,
+        venue_id=body.venue_id,
+        day=body.day,
+        party_size=body.party_size,
+        time_start=body.time_start,
+        time_end=body.time_end,
+        preferences=preferences,
+        notify=body.notify.model_dump(exclude_none=True) if body.notify else None,
+    )
+    try:
+        watch_store.add(watch)
+    except ValueError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return _watch_out(watch)
+
+
+@router.get(
+    "/watches",
+    response_model=List[WatchOut],
+    dependencies=[Depends(rate_limiter), Depends(validate_session_token)],
+)
+def list_watches(x_task_id: str = Header(..., alias="x-task-id")):
+    """The task's watches with their latest matching slots."""
+    return [_watch_out(w) for w in watch_store.for_task(x_task_id)]
+
+
+@router.get(
+    "/watches/{watch_id}",
+    response_model=WatchOut,
+    dependencies=[Depends(rate_limiter), Depends(validate_session_token)],
+)
+def get_watch(watch_id: str, x_task_id: str = Header(..., alias="x-task-id")):
+    return _watch_out(_task_watch(watch_id, x_task_id))
+
+
+@router.delete(
+    "/watches/{watch_id}",
+    response_model=WatchRemovedResponse,
+    dependencies=[Depends(rate_limiter), Depends(validate_session_token)],
+)
+def delete_watch(watch_id: str, x_task_id: str = Header(..., alias="x-task-id")):
+    _task_watch(watch_id, x_task_id)
+    watch_store.remove([watch_id])
+    return WatchRemovedResponse(status="ok", watch_id=watch_id)
+
+
 # ---------- Me route ----------
 
 @router.get(
@@ -423,11 +890,10 @@ def get_me(x_task_id: str = Header(..., alias="x-task-id")):
     """
     Return the current logged-in Resy user. This is only available if the user is logged in.
     Requires that /login has already been called successfully so
-    resy_client has an auth token set.
+    resy_client has an auth token set. Served from the profile cache when fresh.
     """
-    resy_client = client_manager.get_resy_client(x_task_id)
     try:
-        user_json = resy_client.getUser()
+        user_json = profile_cache.get_or_fetch(x_task_id)
     except ResyClientError as e:
         raise HTTPException(
             status_code=401 if (e.status_code and e.status_code == 401) else 502,
@@ -437,6 +903,31 @@ def get_me(x_task_id: str = Header(..., alias="x-task-id")):
     return MeResponse(user=user_json)
 
 
+@router.get(
+    "/payment-methods",
+    response_model=PaymentMethodsResponse,
+    dependencies=[Depends(rate_limiter)],
+)
+def get_payment_methods(x_task_id: str = Header(..., alias="x-task-id")):
+    """
+    Return the logged-in user's payment methods from the profile cache
+    (fetched from Resy only if nothing is cached yet).
+    """
+    if not profile_cache.payment_methods(x_task_id):
+        try:
+            profile_cache.fetch(x_task_id)
+        except ResyClientError as e:
+            raise HTTPException(
+                status_code=401 if (e.status_code and e.status_code == 401) else 502,
+                detail=f"Failed to fetch user: {e.message}",
+            )
+
+    return PaymentMethodsResponse(
+        payment_methods=profile_cache.payment_methods(x_task_id),
+        default_payment_method_id=profile_cache.default_payment_method_id(x_task_id),
+    )
+
+
 
 @router.post(
     "/calendar",
@@ -450,22 +941,31 @@ def calendar(
     """
     Returns an array of all available dates for a venue between start_date and end_date.
     This wraps Resy /4/calendar.
+    Served from the in-memory availability index while it is fresh.
     """
-    resy_client = client_manager.get_resy_client(x_task_id)
-    try:
-        res_json = resy_client.get_calendar(
-            venue_id=str(body.venue_id),
-            start_date=body.start_date,
-            end_date=body.end_date,
-            num_seats=body.num_seats,
-        )
-    except ResyClientError as e:
-        raise HTTPException(status_code=502, detail=f"Upstream error: {e.message}")
+    _check_range(body.start_date, body.end_date)
+    cached = availability_index.available_dates(body.venue_id, body.num_seats, body.start_date, body.end_date)
+    if cached is not None:
+        return calendarResponse(dates=cached)
+
+    with client_manager.use_client(x_task_id) as resy_client:
+        try:
+            res_json = resy_client.get_calendar(
+                venue_id=str(body.venue_id),
+                start_date=body.start_date,
+                end_date=body.end_date,
+                num_seats=body.num_seats,
+            )
+        except ResyClientError as e:
+            raise _upstream_error(e)
 
     available_dates = [
             x["date"] for x in res_json.get("scheduled", [])
             if x.get("inventory", {}).get("reservation") == "available"
         ]
+    availability_index.record_calendar(
+        body.venue_id, body.num_seats, body.start_date, body.end_date, available_dates
+    )
 
     return calendarResponse(
         dates=available_dates,
@@ -479,6 +979,7 @@ def calendar(
 )
 def venue_search(
     body: VenueSearchRequest,
+    background_tasks: BackgroundTasks,
     x_task_id: str = Header(..., alias="x-task-id")
 ):
     """
@@ -490,54 +991,186 @@ def venue_search(
     latitude = settings.VENUESEARCH_OVERRIDE_LATITUDE if settings.VENUESEARCH_OVERRIDE_LATITUDE is not None else body.latitude
     longitude = settings.VENUESEARCH_OVERRIDE_LONGITUDE if settings.VENUESEARCH_OVERRIDE_LONGITUDE is not None else body.longitude
 
-    resy_client = client_manager.get_resy_client(x_task_id)
-    try:
-        res_json = resy_client.venue_search(
-            latitude=latitude,
-            longitude=longitude,
-            query=body.query,
-            day=body.day,
-            party_size=body.party_size,
-            per_page=body.per_page,
-        )
-    except ResyClientError as e:
-        raise HTTPException(status_code=502, detail=f"Upstream error: {e.message}")
-
-    # Parse the response and extract venue information
-    results: List[VenueSearchResult] = []
+    # Serve from the local venue catalog (nearest first) when it can answer on its own:
+    # either it already has a full page of matches within the radius, or this query was
+    # fetched upstream for this area recently. Availability-filtered searches
+    # (day/party_size) always go upstream.
+    if not body.day and not body.party_size:
+        radius_km = body.radius_km or settings.VENUESEARCH_RADIUS_KM
+        local = venue_catalog.search_near(body.query, latitude, longitude, radius_km, limit=body.per_page)
+        if len(local) >= body.per_page or venue_catalog.query_is_fresh(body.query, latitude, longitude):
+            return VenueSearchResponse(results=[_venue_result(r, d) for r, d in local])
+
+    with client_manager.use_client(x_task_id) as resy_client:
+        try:
+            res_json = resy_client.venue_search(
+                latitude=latitude,
+                longitude=longitude,
+                query=body.query,
+                day=body.day,
+                party_size=body.party_size,
+                per_page=body.per_page,
+            )
+        except ResyClientError as e:
+            raise _upstream_error(e)
 
     # The response structure may vary; be defensive (Resy sometimes returns nulls)
     search = res_json.get("search") or {}
     hits = search.get("hits") or []
 
-    for hit in hits:
-        if not isinstance(hit, dict):
-            continue
-
-        # Get venue ID - could be in different places
-        venue_id = hit.get("id", {}).get("resy") if isinstance(hit.get("id"), dict) else None
-        
-        if not venue_id:
-            continue  # Skip if no venue ID found
-        
-        # Extract other fields
-        name = hit.get("name", "")
-        cuisine_list = hit.get("cuisine") or []
-        cuisine = cuisine_list[0] if isinstance(cuisine_list, list) and cuisine_list else None
-        neighborhood = hit.get("neighborhood")
-        region = hit.get("region")
-        images_list = hit.get("images") or []
-        image_url = images_list[0] if isinstance(images_list, list) and images_list else None
-
-        results.append(
-            VenueSearchResult(
-                name=name,
-                cuisine=cuisine,
-                neighborhood=neighborhood,
-                region=region,
-                image_url=image_url,
-                venue_id=int(venue_id),
-            )
+    records = [record_from_search_hit(hit) for hit in hits if isinstance(hit, dict)]
+    records = [r for r in records if r is not None]  # Skip hits without a venue ID
+
+    # Index the hits after the response is sent
+    background_tasks.add_task(
+        venue_catalog.ingest_search,
+        records,
+        None if (body.day or body.party_size) else body.query,
+        latitude,
+        longitude,
+    )
+
+    distance_to = distance_from(latitude, longitude)
+    results = []
+    for r in records:
+        distance = None
+        if r.latitude is not None and r.longitude is not None:
+            distance = distance_to(r.latitude, r.longitude)
+        results.append(_venue_result(r, distance))
+    return VenueSearchResponse(results=results)
+
+
+@router.post(
+    "/search/available",
+    dependencies=[Depends(rate_limiter), Depends(validate_session_token)],
+)
+def search_available_slots(
+    body: AvailabilitySearchRequest,
+    x_task_id: str = Header(..., alias="x-task-id")
+):
+    """
+    Find open tables across venues and a date range in one call.
+    Chains venue lookup, /4/venue/calendar per venue and /4/find per bookable
+    venue-day concurrently, applying the same time window as /slots.
+    Streams newline-delimited JSON events ("venues", "result", "error", "done")
+    and stops once `limit` results are found.
+    """
+    end_date = body.end_date or body.start_date
+    _check_range(body.start_date, end_date)
+    if body.limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    max_venues = body.max_venues or settings.AVAILABILITY_SEARCH_MAX_VENUES
+
+    if body.venue_ids:
+        venues = []
+        for venue_id in body.venue_ids[:max_venues]:
+            record = venue_catalog.get(venue_id)
+            venues.append({"venue_id": venue_id, "name": record.name if record else None, "distance_km": None})
+    else:
+        if body.latitude is None or body.longitude is None:
+            raise HTTPException(status_code=400, detail="Provide venue_ids or latitude/longitude")
+        latitude = settings.VENUESEARCH_OVERRIDE_LATITUDE if settings.VENUESEARCH_OVERRIDE_LATITUDE is not None else body.latitude
+        longitude = settings.VENUESEARCH_OVERRIDE_LONGITUDE if settings.VENUESEARCH_OVERRIDE_LONGITUDE is not None else body.longitude
+        with client_manager.use_client(x_task_id) as resy_client:
+            try:
+                venues = candidate_venues(
+                    resy_client,
+                    venue_catalog,
+                    latitude=latitude,
+                    longitude=longitude,
+                    radius_km=body.radius_km,
+                    query=body.query,
+                    max_venues=max_venues,
+                    day=body.start_date if end_date == body.start_date else None,
+                    party_size=body.party_size,
+                )
+            except ResyClientError as e:
+                raise _upstream_error(e)
+
+    fanout = settings.AVAILABILITY_SEARCH_FANOUT
+
+    def events():
+        # One client per concurrent call, attached for as long as the stream runs
+        with client_manager.use_clients(x_task_id, fanout) as resy_clients:
+            yield json.dumps({"event": "venues", "venues": venues}) + "\n"
+            for event in search_available(
+                resy_clients,
+                venues,
+                index=availability_index,
+                history=availability_history,
+                party_size=body.party_size,
+                start_date=body.start_date,
+                end_date=end_date,
+                time_start=body.time_start,
+                time_end=body.time_end,
+                limit=body.limit,
+                fanout=fanout,
+            ):
+                yield json.dumps(event) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@router.get(
+    "/history/{venue_id}",
+    response_model=SlotHistoryResponse,
+    dependencies=[Depends(rate_limiter)],
+)
+def slot_history(
+    venue_id: int,
+    party_size: Optional[int] = None,
+    day: Optional[str] = None,      # "YYYY-MM-DD"
+    since: Optional[float] = None,  # unix seconds
+    until: Optional[float] = None,  # unix seconds
+    limit: int = 1000,
+):
+    """
+    When slots appeared and disappeared at a venue, oldest first, as seen by
+    /slots, searches and monitors. `timeline` groups the events per
+    observation, which shows when a venue drops tables.
+    """
+    try:
+        events = availability_history.events(
+            venue_id, party_size=party_size, day=day, since=since, until=until, limit=min(limit, 10000)
         )
-    
-    return VenueSearchResponse(results=results)
\ No newline at end of file
+    except ValueError:
+        raise HTTPException(status_code=400, detail="day must be YYYY-MM-DD")
+
+    return SlotHistoryResponse(
+        venue_id=venue_id,
+        timeline=[DropTimelinePoint(**p) for p in timeline(events)],
+        events=[SlotHistoryEvent(**e) for e in events],
+    )
+
+
+@router.get(
+    "/history/{venue_id}/release-pattern",
+    response_model=ReleasePatternResponse,
+    dependencies=[Depends(rate_limiter)],
+)
+def release_pattern(
+    venue_id: int,
+    day: Optional[str] = None,  # "YYYY-MM-DD": also predict when this day opens
+):
+    """
+    Predict when a venue drops inventory, from the recorded slot history:
+    the release horizon (days ahead) and time of day, and when cancellations
+    tend to show up. With `day`, also the predicted release window for that
+    day and how often a monitor watching it should poll now.
+    """
+    prediction = release_patterns.predict(venue_id)
+    response = ReleasePatternResponse(
+        venue_id=venue_id,
+        observations=prediction["observations"],
+        release=prediction["release"],
+        cancellations=prediction["cancellations"],
+    )
+    if day:
+        try:
+            window = release_window_for(prediction, day)
+            response.poll_interval_sec = release_patterns.poll_interval(venue_id, day)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="day must be YYYY-MM-DD")
+        if window is not None:
+            response.release_window = {"start": window[0], "end": window[1]}
+    return response
@@ -0,0 +1,451 @@
+# app/cli.py
+"""
+Headless monitor runner: many watches in one process, no web server.
+
+    python -m app.cli watches.json [--concurrency 16] [--max-rps 5] [--duration 3600]
+
+The spec file is JSON lines (one watch per line), a JSON list of watches,
+or an object {"accounts": {...}, "watches": [...]}:
+
+    {"accounts": {"me": {"resy_token": "..."}},            # or email + password
+                                                           # (+ "payment_method_id": N or
+                                                           #  "use_default_payment_method": true)
+     "watches": [{"venue_id": 1234, "day": "2026-11-02", "party_size": 2,
+                  "time_start": "18:00", "time_end": "21:00",  # or "preferences": {...}
+                  "account": "me", "book": true}]}
+
+Watches run on the same WatchRegistry / MonitorScheduler as the API's
+/watches: one ClientManager (one pool of ResyClients and connections) for
+the whole fleet, overlapping watches sharing one poll, cadence from the
+release-pattern analyzer. On top of that the runner enforces budgets: at
+most `--concurrency` polls in flight, at most `--max-rps` polls started per
+second across the fleet, and a per-poll deadline carried into ResyClient
+(app/core/deadlines.py), so a slow upstream can't stall the fleet.
+
+Everything the runner does is written to stdout as one JSON object per
+line with an "event" field: started, login, invalid_spec, slot_found,
+booking, poll_error, poll (with --poll-events), stats, stopped. Logs go
+to stderr.
+
+Watches with "book": true race-book the best matching slots when they
+appear (same flow as /reservation/race), once per account. Outside
+MODE=production the race stops short of /3/book and reports "skipped".
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import signal
+import sys
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, IO, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.deadlines import Deadline, deadline_scope
+from app.services.auth_cache import auth_cache
+from app.services.availability_history import availability_history
+from app.services.booking_coordinator import booking_coordinator, slot_ref
+from app.services.booking_race import BOOKED, UNKNOWN, race_book
+from app.services.clientManager import ClientManager
+from app.services.notifications import NotificationSink, Notifier
+from app.services.profile_cache import ProfileCache
+from app.services.release_patterns import release_patterns
+from app.services.resy_client import ResyClientError
+from app.services.watch_registry import GroupKey, Watch, WatchRegistry
+
+logger = logging.getLogger("app.cli")
+
+DEFAULT_ACCOUNT = "default"  # watches without "account" poll without logging in
+
+
+# ---------- Output ----------
+
+class EventWriter:
+    """Writes events as JSON lines; safe to call from any thread."""
+
+    def __init__(self, out: IO[str]):
+        self.out = out
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields: Any) -> None:
+        line = json.dumps({"event": event, "at": round(time.time(), 3), **fields}, default=str)
+        with self._lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+
+class EventSink(NotificationSink):
+    """Notifier sink for slot-found events: one `slot_found` line each."""
+
+    name = "events"
+
+    def __init__(self, writer: EventWriter, **kwargs):
+        super().__init__(**kwargs)
+        self.writer = writer
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            self.writer.emit("slot_found", **{k: v for k, v in event.items() if k != "notify"})
+
+
+class BookingSink(NotificationSink):
+    """Notifier sink that race-books slot-found events of watches marked "book"."""
+
+    name = "booking"
+
+    def __init__(self, runner: "Runner", **kwargs):
+        super().__init__(**kwargs)
+        self.runner = runner
+
+    def accepts(self, event: Dict[str, Any]) -> bool:
+        return event["watch_id"] in self.runner.booking_watches
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            self.runner.book(event)
+
+
+# ---------- Budgets ----------
+
+class RateBudget:
+    """Spaces out poll starts to at most `rate` per second across all workers (0 = unlimited)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class RunnerRegistry(WatchRegistry):
+    """WatchRegistry whose polls go through the runner's rate budget and per-poll deadline."""
+
+    def __init__(self, client_manager, writer: EventWriter, budget: RateBudget, poll_timeout: float,
+                 poll_events: bool = False, **kwargs):
+        super().__init__(client_manager, **kwargs)
+        self.writer = writer
+        self.budget = budget
+        self.poll_timeout = poll_timeout
+        self.poll_events = poll_events
+        self.polls = 0
+        self.poll_errors = 0
+
+    def poll(self, key: GroupKey) -> Optional[float]:
+        self.budget.wait()
+        with deadline_scope(Deadline(self.poll_timeout)):
+            interval = super().poll(key)
+        group = self._groups.get(key)
+        if group is None:
+            return interval
+        venue_id, day, party_size = key
+        with self._lock:
+            if group.last_error is not None:
+                self.poll_errors += 1
+            else:
+                self.polls += 1
+        if group.last_error is not None:
+            self.writer.emit("poll_error", venue_id=venue_id, day=day, party_size=party_size,
+                             error=group.last_error, next_in=interval)
+        elif self.poll_events:
+            self.writer.emit("poll", venue_id=venue_id, day=day, party_size=party_size,
+                             slots=len(group.slots or []), watches=len(group.watches), next_in=interval)
+        return interval
+
+
+# ---------- Specs ----------
+
+def load_specs(path: str) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+    """Accounts and watch specs from a JSON object, a JSON list or JSON lines."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        accounts, specs = data.get("accounts") or {}, data.get("watches") or []
+    elif isinstance(data, list):
+        accounts, specs = {}, data
+    else:
+        raise ValueError(f"expected a JSON object, list or JSON lines, got {type(data).__name__}")
+    if not isinstance(accounts, dict) or not isinstance(specs, list):
+        raise ValueError('"accounts" must be an object and "watches" a list')
+    return accounts, specs
+
+
+def watch_from_spec(spec: Dict[str, Any], task_id: str) -> Watch:
+    """Build a Watch from one spec, validated like POST /watches. Raises ValueError."""
+    try:
+        date.fromisoformat(spec["day"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("day must be YYYY-MM-DD")
+    try:
+        return Watch(
+            task_id=task_id,
+            venue_id=spec["venue_id"],
+            day=spec["day"],
+            party_size=spec.get("party_size", 2),
+            time_start=spec.get("time_start"),
+            time_end=spec.get("time_end"),
+            preferences=spec.get("preferences"),
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"bad watch spec: {e!r}")
+
+
+def task_id_for(account: str) -> str:
+    return f"cli:{account}"
+
+
+# ---------- Runner ----------
+
+class Runner:
+    def __init__(self, args: argparse.Namespace, writer: EventWriter):
+        self.args = args
+        self.writer = writer
+        self.production = settings.MODE == "production"
+        self.client_manager = ClientManager()
+        self.profile_cache = ProfileCache(self.client_manager)
+        self.booking_watches: Dict[str, Watch] = {}
+        # task_id -> (payment_method_id, use_default_payment_method) from the account
+        self.payment_choices: Dict[str, Tuple[Optional[int], bool]] = {}
+        self._booked_tasks: Set[str] = set()
+        self._booking_lock = threading.Lock()
+        self.notifier = Notifier(
+            [EventSink(writer), BookingSink(self, concurrency=args.concurrency, batch_size=1)],
+            queue_size=settings.NOTIFY_QUEUE_MAX,
+            batch_wait=settings.NOTIFY_BATCH_WAIT_SEC,
+            max_attempts=1,
+        )
+        self.registry = RunnerRegistry(
+            self.client_manager,
+            writer,
+            RateBudget(args.max_rps),
+            args.poll_timeout,
+            poll_events=args.poll_events,
+            fanout=args.concurrency,
+            max_per_task=sys.maxsize,
+            notifier=self.notifier,
+        )
+
+    # ---------- Setup ----------
+
+    def login(self, account: str, credentials: Dict[str, Any]) -> bool:
+        task_id = task_id_for(account)
+        try:
+            with self.client_manager.use_client(task_id) as resy_client:
+                if credentials.get("resy_token"):
+                    resy_client.setToken(token=credentials["resy_token"])
+                elif credentials.get("email") and credentials.get("password"):
+                    email, password = credentials["email"], credentials["password"]
+                    cached_token = auth_cache.get_token(email, password) if auth_cache else None
+                    if cached_token:
+                        resy_client.setToken(token=cached_token)
+                    else:
+                        resy_client.login(email=email, password=password)
+                        resy_client.setToken()
+                        if auth_cache:
+                            auth_cache.store(email, password, resy_client.userAuth)
+                else:
+                    self.writer.emit("login", account=account, ok=False,
+                                     error="either resy_token or email and password are required")
+                    return False
+            self.client_manager.save_session(task_id)
+        except ResyClientError as e:
+            self.writer.emit("login", account=account, ok=False, error=e.message)
+            return False
+        self.payment_choices[task_id] = (
+            credentials.get("payment_method_id"), bool(credentials.get("use_default_payment_method"))
+        )
+        self.profile_cache.prefetch(task_id)
+        self.writer.emit("login", account=account, ok=True)
+        return True
+
+    def build_watches(self, accounts: Dict[str, Dict[str, Any]], specs: List[Dict[str, Any]]) -> List[Watch]:
+        logged_in = {name for name, credentials in accounts.items() if self.login(name, credentials)}
+        watches: List[Watch] = []
+        for i, spec in enumerate(specs):
+            account = spec.get("account", DEFAULT_ACCOUNT) if isinstance(spec, dict) else DEFAULT_ACCOUNT
+            try:
+                if not isinstance(spec, dict):
+                    raise ValueError("watch spec must be an object")
+                if account != DEFAULT_ACCOUNT and account not in logged_in:
+                    raise ValueError(f"account {account!r} is not logged in")
+                if spec.get("book") and account == DEFAULT_ACCOUNT:
+                    raise ValueError("booking needs an account")
+                watch = watch_from_spec(spec, task_id_for(account))
+            except ValueError as e:
+                self.writer.emit("invalid_spec", index=i, error=str(e))
+                continue
+            if spec.get("book"):
+                self.booking_watches[watch.watch_id] = watch
+            watches.append(watch)
+        return watches
+
+    # ---------- Booking ----------
+
+    def book(self, event: Dict[str, Any]) -> None:
+        """Race-book a slot-found event's slots; at most one booking per account (task)."""
+        watch = self.booking_watches.get(event["watch_id"])
+        task_id = event["task_id"]
+        if watch is None or not event["slots"]:
+            return
+        with self._booking_lock:
+            if task_id in self._booked_tasks:
+                return
+        if not self.client_manager.store.claim_booking(task_id, time.time(), settings.BOOKING_CLAIM_STALE_SEC):
+            self.writer.emit("booking", watch_id=watch.watch_id, status="claimed",
+                             error="This task already has a booking in progress or completed.")
+            return
+
+        outcome: Dict[str, Any] = {"status": UNKNOWN, "slot": None, "result": None, "attempts": []}
+        try:
+            candidates = event["slots"][:max(1, settings.RACE_TOP_N)]
+            # One client books, the others preview in parallel (see race_book)
+            with self.client_manager.use_clients(task_id, len(candidates) + 1) as (resy_client, *preview_clients):
+                payment_method_id = self.profile_cache.payment_method_for(
+                    task_id, *self.payment_choices.get(task_id, (None, False))
+                )
+
+                def book(slot: Dict[str, Any], book_token: str) -> Dict[str, Any]:
+                    if not self.production:
+                        return {"message": "Booking skipped in non-production mode."}
+                    return booking_coordinator.book(
+                        resy_client,
+                        task_id,
+                        slot_ref(slot["token"], watch.venue_id, slot["start"]),
+                        lambda: resy_client.book(book_token=book_token, payment_method_id=payment_method_id),
+                    )
+
+                outcome = race_book(preview_clients, candidates, watch.day, watch.party_size, book)
+        except ResyClientError as e:
+            outcome["attempts"].append({"stage": "setup", "ok": False, "error": f"Upstream error: {e.message}"})
+            outcome["status"] = "failed"
+        except Exception:
+            # Not a booking outcome (race_book reports those): free the account's claim
+            outcome["status"] = "failed"
+            raise
+        finally:
+            # Same rule as /reservation/race: an ambiguous failure keeps the claim until it goes stale
+            if outcome["status"] != UNKNOWN:
+                booked = outcome["status"] == BOOKED and self.production
+                self.client_manager.store.finish_booking(task_id, booked, time.time())
+
+        status = outcome["status"]
+        if status == BOOKED and not self.production:
+            status = "skipped"
+        self.writer.emit("booking", watch_id=watch.watch_id, account=task_id.split(":", 1)[1], status=status,
+                         slot=outcome["slot"], raw=outcome["result"], attempts=outcome["attempts"])
+        if status in (BOOKED, UNKNOWN):
+            # The account has its booking (or may have): its watches are done
+            with self._booking_lock:
+                self._booked_tasks.add(task_id)
+            self.registry.remove_many([w.watch_id for w in self.registry.for_task(task_id)])
+
+    # ---------- Run ----------
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.registry.stats(),
+            "polls": self.registry.polls,
+            "poll_errors": self.registry.poll_errors,
+            "connections": self.client_manager.stats(limit=0)["connections"],
+            "notifications": self.notifier.stats(),
+        }
+
+    async def run(self, watches: List[Watch], stop: asyncio.Event) -> None:
+        self.notifier.start()
+        self.registry.scheduler.start()
+        self.registry.add_many(watches, spread=self.args.spread)
+        self.writer.emit("started", watches=len(watches), groups=self.registry.stats()["groups"],
+                         mode=settings.MODE, dry_run=not self.production)
+
+        started = time.monotonic()
+        try:
+            while not stop.is_set() and len(self.registry):
+                timeout = self.args.stats_interval or 60.0
+                if self.args.duration:
+                    timeout = min(timeout, self.args.duration - (time.monotonic() - started))
+                    if timeout <= 0:
+                        break
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                await asyncio.to_thread(availability_history.flush)
+                await asyncio.to_thread(release_patterns.refresh_stale)
+                if self.args.stats_interval and not stop.is_set():
+                    self.writer.emit("stats", **self.stats())
+        finally:
+            await self.registry.scheduler.stop()
+            await self.notifier.stop()
+            await asyncio.to_thread(availability_history.flush)
+            self.writer.emit("stopped", elapsed_sec=round(time.monotonic() - started, 1), **self.stats())
+
+
+async def _main(args: argparse.Namespace, out: IO[str]) -> int:
+    writer = EventWriter(out)
+    try:
+        accounts, specs = load_specs(args.specs)
+    except (OSError, ValueError) as e:
+        writer.emit("invalid_spec", index=None, error=f"cannot read {args.specs}: {e}")
+        return 2
+
+    runner = Runner(args, writer)
+    watches = await asyncio.to_thread(runner.build_watches, accounts, specs)
+    if not watches:
+        writer.emit("stopped", elapsed_sec=0.0, watches=0)
+        return 1
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # not available on this platform; Ctrl-C still ends the run
+    await runner.run(watches, stop)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run many Resy watches headlessly, emitting JSON event lines.")
+    parser.add_argument("specs", help="watch specs: JSON lines, a JSON list, or {\"accounts\", \"watches\"}")
+    parser.add_argument("--concurrency", type=int, default=settings.WATCH_POLL_FANOUT,
+                        help="polls (and bookings) in flight at once")
+    parser.add_argument("--max-rps", type=float, default=0.0,
+                        help="most polls started per second across all watches (0 = no limit)")
+    parser.add_argument("--poll-timeout", type=float, default=settings.REQUEST_DEADLINE_POLLING_SEC,
+                        help="deadline for one poll, retries included (seconds)")
+    parser.add_argument("--spread", type=float, default=settings.WATCH_RESUME_SPREAD_SEC,
+                        help="spread the first polls over this many seconds")
+    parser.add_argument("--duration", type=float, default=0.0, help="stop after this many seconds (0 = run until stopped)")
+    parser.add_argument("--stats-interval", type=float, default=60.0, help="emit a stats event this often (seconds)")
+    parser.add_argument("--poll-events", action="store_true", help="emit an event for every successful poll")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                        stream=sys.stderr)
+    # stdout carries only events; stray prints (ResyClient debugging, route helpers) go to stderr
+    out = sys.stdout
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            return asyncio.run(_main(args, out))
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+# app/core/admission.py
+"""
+Admission control in front of the routes.
+
+Every route handler is sync and runs in Starlette's threadpool (40 threads),
+so when Resy slows down, requests of every kind used to pile up in one
+queue there. Instead, requests that go upstream are classified and
+admitted here, on the event loop, before they take a thread:
+
+  booking   /reservation/*                critical: may use the reserved capacity
+  session   /login, /logout, /me, ...     normal
+  polling   /slots, /calendar             normal
+  search    /venuesearch, /getID(s),      low: shed at once when full
+            /search/available
+
+Each class has its own concurrency limit and all classes share
+ADMISSION_MAX_CONCURRENT, of which ADMISSION_RESERVED_BOOKING is usable by
+booking only, so a flood of searches or polls can never take the last
+threads from a booking. A request that can't start waits up to its class's
+queue budget; freed capacity goes to waiting bookings first. A request not
+admitted in time gets a 503 with a Retry-After based on how long that class
+has recently taken to serve a request. Queueing never outlasts the
+request's deadline (app/core/deadlines.py).
+
+Routes that only touch local state (watches, history, preferences) are not
+admitted here.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.deadlines import api_paths, current_deadline
+
+CRITICAL, NORMAL, LOW = 0, 1, 2
+
+
+class RouteClass:
+    __slots__ = (
+        "name", "priority", "prefixes", "limit", "queue_budget", "max_queue",
+        "active", "waiters", "admitted", "queued", "shed", "service_time",
+    )
+
+    def __init__(self, name: str, priority: int, prefixes: Tuple[str, ...], limit: int, queue_budget: float):
+        self.name = name
+        self.priority = priority
+        self.prefixes = prefixes
+        self.limit = limit
+        self.queue_budget = queue_budget
+        self.max_queue = 4 * limit
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.service_time = 1.0  # moving average of seconds per request (for Retry-After)
+
+
+class AdmissionController:
+    def __init__(self, classes: List[RouteClass], capacity: int, reserved: int):
+        self.classes = sorted(classes, key=lambda c: c.priority)
+        self.capacity = capacity
+        self.reserved = reserved
+        self.active = 0
+
+    def classify(self, path: str) -> Optional[RouteClass]:
+        for route_class in self.classes:
+            if path.startswith(route_class.prefixes):
+                return route_class
+        return None
+
+    def _can_start(self, route_class: RouteClass) -> bool:
+        if route_class.active >= route_class.limit:
+            return False
+        shared = self.capacity if route_class.priority == CRITICAL else self.capacity - self.reserved
+        return self.active < shared
+
+    def _start(self, route_class: RouteClass) -> None:
+        route_class.active += 1
+        route_class.admitted += 1
+        self.active += 1
+
+    async def acquire(self, route_class: RouteClass) -> bool:
+        """
+        Wait for capacity within the class's queue budget (and the request's
+        deadline, if that is sooner). False means shed the request.
+        """
+        if not route_class.waiters and self._can_start(route_class):
+            self._start(route_class)
+            return True
+        budget = route_class.queue_budget
+        deadline = current_deadline()
+        if deadline is not None:
+            budget = min(budget, deadline.remaining())
+        if budget <= 0 or len(route_class.waiters) >= route_class.max_queue:
+            route_class.shed += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        route_class.waiters.append(waiter)
+        route_class.queued += 1
+        try:
+            await asyncio.wait_for(waiter, budget)
+            return True
+        except asyncio.TimeoutError:
+            route_class.shed += 1
+            return False
+        except asyncio.CancelledError:
+            # Client went away while queued; hand back capacity granted in the meantime
+            if waiter.done() and not waiter.cancelled():
+                self.release(route_class, 0.0)
+            raise
+        finally:
+            try:
+                route_class.waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self, route_class: RouteClass, elapsed: float) -> None:
+        route_class.active -= 1
+        self.active -= 1
+        if elapsed > 0:
+            route_class.service_time += 0.2 * (elapsed - route_class.service_time)
+        # Hand freed capacity to waiters, most important class first
+        for waiting in self.classes:
+            while waiting.waiters and self._can_start(waiting):
+                waiter = waiting.waiters.popleft()
+                if waiter.done():
+                    continue  # timed out or cancelled
+                self._start(waiting)
+                waiter.set_result(True)
+
+    def retry_after(self, route_class: RouteClass) -> int:
+        return max(1, math.ceil(route_class.service_time))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "capacity": self.capacity,
+            "reserved": self.reserved,
+            "classes": {
+                c.name: {
+                    "active": c.active,
+                    "limit": c.limit,
+                    "waiting": len(c.waiters),
+                    "admitted": c.admitted,
+                    "queued": c.queued,
+                    "shed": c.shed,
+                    "service_time_ms": round(c.service_time * 1000, 1),
+                }
+                for c in self.classes
+            },
+        }
+
+
+class AdmissionMiddleware:
+    """Plain ASGI middleware (no BaseHTTPMiddleware), so shed requests cost next to nothing."""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        route_class = self.controller.classify(scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.controller.acquire(route_class):
+            await self._reject(send, self.controller.retry_after(route_class))
+            return
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class, time.monotonic() - started)
+
+    @staticmethod
+    async def _reject(send, retry_after: int) -> None:
+        body = json.dumps({"detail": "Server busy, try again shortly."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+admission = AdmissionController(
+    [
+        RouteClass("booking", CRITICAL, api_paths("/reservation/"), settings.ADMISSION_MAX_CONCURRENT,
+                   settings.ADMISSION_BOOKING_QUEUE_SEC),
+        RouteClass("session", NORMAL, api_paths("/login", "/logout", "/me", "/payment-methods"),
+                   settings.ADMISSION_SESSION_LIMIT, settings.ADMISSION_QUEUE_SEC),
+        RouteClass("polling", NORMAL, api_paths("/slots", "/calendar"),
+                   settings.ADMISSION_POLLING_LIMIT, settings.ADMISSION_QUEUE_SEC),
+        RouteClass("search", LOW, api_paths("/venuesearch", "/getID", "/search/available"),
+                   settings.ADMISSION_SEARCH_LIMIT, settings.ADMISSION_LOW_PRIORITY_QUEUE_SEC),
+    ],
+    capacity=settings.ADMISSION_MAX_CONCURRENT,
+    reserved=settings.ADMISSION_RESERVED_BOOKING,
+)
@@ -22,10 +22,63 @@ class Settings(BaseSettings):
     API_KEY: str = "super-secret-dev-key"  # override in .env
     RATE_LIMIT_REQUESTS: int = 30          # per window
     RATE_LIMIT_WINDOW_SEC: int = 60
+    # Rate-limit hits a worker claims from the shared log at once and hands out from memory
+    # (1 = a write transaction per request), and how long unused claims are held before going back
+    RATE_LIMIT_LEASE_SIZE: int = 5
+    RATE_LIMIT_LEASE_SEC: float = 1.0
+    # Credential for /admin (sent as x-admin-key); the admin routes answer 403 while it is unset
+    ADMIN_API_KEY: str | None = None
+
+    # Admission control (app/core/admission.py): requests admitted at once in total (keep below the
+    # 40-thread route threadpool), how many of those only booking may use, per-class limits, and how
+    # long a request may wait to start before a 503 (0 = shed at once, used for low-priority search)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENT: int = 36
+    ADMISSION_RESERVED_BOOKING: int = 8
+    ADMISSION_SESSION_LIMIT: int = 8
+    ADMISSION_POLLING_LIMIT: int = 16
+    ADMISSION_SEARCH_LIMIT: int = 8
+    ADMISSION_QUEUE_SEC: float = 2.0
+    ADMISSION_BOOKING_QUEUE_SEC: float = 10.0
+    ADMISSION_LOW_PRIORITY_QUEUE_SEC: float = 0.0
+
+    # End-to-end request deadlines (app/core/deadlines.py): default budget, route defaults for
+    # polling (/slots, /calendar) and search, and the most a client may ask for via x-request-timeout
+    REQUEST_DEADLINE_SEC: float = 30.0
+    REQUEST_DEADLINE_POLLING_SEC: float = 10.0
+    REQUEST_DEADLINE_SEARCH_SEC: float = 8.0
+    REQUEST_DEADLINE_MAX_SEC: float = 60.0
+
+    # Scheduler maintenance jobs run on a thread pool of this size; the event-loop lag probe's interval
+    MAINTENANCE_JOB_WORKERS: int = 4
+    LOOP_LAG_INTERVAL_SEC: float = 0.5
+
+    # Shared task-session / rate-limit state ("sqlite" works across workers, "memory" is single-process)
+    STATE_BACKEND: str = "sqlite"
+    STATE_DB_PATH: str = "state.db"
     
     # JWT token secret (should be a long random string in production)
     JWT_SECRET_KEY: str = "your-super-secret-jwt-key-change-in-production"
     
+    # Cache Resy auth tokens per account so repeat email/password logins skip /4/auth/password.
+    # Tokens are encrypted with a key derived from AUTH_CACHE_SECRET, which must be a dedicated
+    # random secret (32+ characters, not JWT_SECRET_KEY); the cache stays off without one.
+    # When set it also keys the encryption of task sessions in STATE_DB_PATH (else <path>.key).
+    AUTH_CACHE_ENABLED: bool = False
+    AUTH_CACHE_SECRET: str | None = None
+    AUTH_CACHE_REFRESH_MARGIN_SEC: int = 1800  # tokens this close to expiry are not handed out
+
+    # How often the cached user profile / payment methods are refreshed for live tasks
+    PROFILE_REFRESH_SEC: int = 600
+
+    # Venue catalog: how long an upstream /venuesearch result counts as complete for that query
+    VENUE_CATALOG_QUERY_TTL_SEC: int = 24 * 3600
+
+    # Venue URL -> id lookups (/getID, /getIDs): cache lifetime, concurrent lookups per batch, batch size cap
+    VENUE_RESOLVE_TTL_SEC: int = 7 * 24 * 3600
+    VENUE_RESOLVE_FANOUT: int = 8
+    VENUE_RESOLVE_MAX_URLS: int = 100
+
     # CORS origins (comma-separated list, or "*" for all)
     CORS_ORIGINS: str = "http://localhost:3000,http://localhost:5173,http://127.0.0.1:5173"
 
@@ -33,5 +86,79 @@ class Settings(BaseSettings):
     # Example (Toronto): VENUESEARCH_OVERRIDE_LATITUDE=43.6532, VENUESEARCH_OVERRIDE_LONGITUDE=-79.3832
     VENUESEARCH_OVERRIDE_LATITUDE: float | None = None
     VENUESEARCH_OVERRIDE_LONGITUDE: float | None = None
+    # Radius for answering venue searches from the local catalog
+    VENUESEARCH_RADIUS_KM: float = 25.0
+
+    # How long calendar data in the in-memory availability index answers /calendar without going upstream
+    AVAILABILITY_CACHE_TTL_SEC: int = 60
+    # Longest start_date..end_date range (in days) /calendar and /search/available accept
+    CALENDAR_MAX_RANGE_DAYS: int = 366
+
+    # Warm-start snapshots of the venue catalog, venue lookups and availability index:
+    # where they are written, how often, and the age past which a snapshot is ignored
+    CACHE_SNAPSHOT_DIR: str = "cache_snapshots"
+    CACHE_SNAPSHOT_SEC: int = 300
+    CACHE_SNAPSHOT_MAX_AGE_SEC: int = 24 * 3600
+
+    # Slot appeared/disappeared history (stored next to the shared state): retention and write batching interval
+    HISTORY_RETENTION_DAYS: int = 30
+    HISTORY_FLUSH_SEC: int = 2
+
+    # Release-pattern predictions: recompute interval, and the polling cadence monitors derive from them
+    RELEASE_PATTERN_TTL_SEC: int = 600
+    POLL_INTERVAL_HOT_SEC: float = 5.0     # inside a predicted release window
+    POLL_INTERVAL_WARM_SEC: float = 60.0   # cancellation peak hours, or no history yet
+    POLL_INTERVAL_COLD_SEC: float = 300.0  # everything else
+
+    # Race mode booking: how many top-ranked slots to preview in parallel, and when an
+    # unfinished booking claim (e.g. from a crashed worker) may be taken over
+    RACE_TOP_N: int = 3
+    BOOKING_CLAIM_STALE_SEC: int = 120
+
+    # Booking coordination: how long a task's lease on a slot lasts, how long
+    # idempotency keys are remembered, and how hard to look for a booking whose
+    # /3/book call failed ambiguously before giving up
+    SLOT_LEASE_TTL_SEC: int = 120
+    IDEMPOTENCY_TTL_SEC: int = 24 * 3600
+    BOOKING_CONFIRM_ATTEMPTS: int = 3
+    BOOKING_CONFIRM_DELAY_SEC: float = 1.0
+
+    # Backend watches (monitors): how many groups poll concurrently, how much earlier a poll
+    # may fire to spread bursts (fraction of its interval), and how many watches one task may hold
+    WATCH_POLL_JITTER: float = 0.1
+    WATCH_POLL_FANOUT: int = 8
+    WATCH_MAX_PER_TASK: int = 20
+    # Watch persistence: batched write/heartbeat interval, when a silent owner's watches are
+    # taken over, and over how long resumed watches are spread out
+    WATCH_SYNC_SEC: float = 2.0
+    WATCH_OWNER_STALE_SEC: float = 15.0
+    WATCH_RESUME_SPREAD_SEC: float = 30.0
+
+    # Watch notifications: sinks to deliver slot-found events to ("stdout", "file", "webhook",
+    # "smtp"; comma separated, empty = off), queue bound, batching, workers per sink and retries
+    NOTIFY_SINKS: str = ""
+    NOTIFY_QUEUE_MAX: int = 10000
+    NOTIFY_BATCH_SIZE: int = 20
+    NOTIFY_BATCH_WAIT_SEC: float = 0.5
+    NOTIFY_CONCURRENCY: int = 4
+    NOTIFY_MAX_ATTEMPTS: int = 5
+    NOTIFY_FILE_PATH: str = "notifications.jsonl"
+    NOTIFY_WEBHOOK_URL: str | None = None   # used when a watch has no webhook_url of its own
+    NOTIFY_WEBHOOK_TIMEOUT_SEC: float = 5.0
+    NOTIFY_EMAIL_TO: str | None = None      # used when a watch has no email of its own
+    # Per-watch destinations are restricted: webhook_url must be on one of these hosts (comma
+    # separated; empty = any host that resolves only to public addresses), and email must be the
+    # account's verified email, NOTIFY_EMAIL_TO or one of NOTIFY_EMAIL_ALLOWED (comma separated)
+    NOTIFY_WEBHOOK_ALLOWED_HOSTS: str = ""
+    NOTIFY_EMAIL_ALLOWED: str = ""
+    SMTP_HOST: str | None = None
+    SMTP_PORT: int = 587
+    SMTP_USERNAME: str | None = None
+    SMTP_PASSWORD: str | None = None
+    SMTP_FROM: str | None = None
+
+    # "Next available" search: max concurrent upstream calls per search, and max venues considered
+    AVAILABILITY_SEARCH_FANOUT: int = 8
+    AVAILABILITY_SEARCH_MAX_VENUES: int = 20
 
 settings = Settings()
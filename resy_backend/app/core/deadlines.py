@@ -0,0 +1,167 @@
+# app/core/deadlines.py
+"""
+End-to-end request deadlines, carried down to the upstream calls.
+
+Every API request gets a deadline when it arrives: the `x-request-timeout`
+header (seconds, capped at REQUEST_DEADLINE_MAX_SEC) or the route's default.
+Time spent waiting for admission counts against it. The deadline rides in a
+context variable, which Starlette copies into the threadpool thread running
+the handler, so ResyClient picks it up without any route passing it along:
+each attempt's timeout is cut to what is left, and a retry whose backoff
+wouldn't leave room for another attempt is not made (see ResyClient._request).
+
+A client that disconnects cancels its deadline: a pending backoff sleep
+wakes up and no further upstream attempt starts. A call already on the wire
+is allowed to finish (requests can't abort it), but its timeout is already
+bounded by the deadline.
+
+Thread pools don't copy context variables; work fanned out from a request
+is wrapped with `carry` so it runs under the same deadline. Work that
+outlives the response (background tasks) runs without one.
+"""
+import asyncio
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional, Tuple, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+
+class Deadline:
+    __slots__ = ("expires_at", "cancelled")
+
+    def __init__(self, timeout: float):
+        self.expires_at = time.monotonic() + timeout
+        self.cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.cancelled.is_set() or self.remaining() <= 0
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def detach(self) -> None:
+        """The response is out: whatever still runs for this request is no longer bound by it."""
+        self.expires_at = math.inf
+
+    def sleep(self, seconds: float) -> bool:
+        """Sleep, waking early on cancellation. False if cancelled."""
+        return not self.cancelled.wait(seconds)
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[None]:
+    """Run the block under `deadline` (None: no deadline)."""
+    token = _current.set(deadline)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def carry(fn: Callable[..., T]) -> Callable[..., T]:
+    """Wrap `fn` to run under the caller's deadline when submitted to a thread pool."""
+    deadline = _current.get()
+    if deadline is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with deadline_scope(deadline):
+            return fn(*args, **kwargs)
+
+    return run
+
+
+# ---------- Middleware ----------
+
+def api_paths(*paths: str) -> Tuple[str, ...]:
+    """Path prefixes of the Resy routes (see app/main.py and resy_routes)."""
+    return tuple(f"/api/v1/resy{p}" for p in paths)
+
+
+# Route defaults; anything else gets REQUEST_DEADLINE_SEC
+ROUTE_DEADLINES = (
+    (api_paths("/slots", "/calendar"), settings.REQUEST_DEADLINE_POLLING_SEC),
+    (api_paths("/venuesearch", "/getID", "/search/available"), settings.REQUEST_DEADLINE_SEARCH_SEC),
+)
+
+
+def route_deadline(path: str) -> float:
+    for prefixes, timeout in ROUTE_DEADLINES:
+        if path.startswith(prefixes):
+            return timeout
+    return settings.REQUEST_DEADLINE_SEC
+
+
+def _header_timeout(scope) -> Optional[float]:
+    for name, value in scope["headers"]:
+        if name == b"x-request-timeout":
+            try:
+                timeout = float(value)
+            except ValueError:
+                return None
+            return timeout if timeout > 0 else None
+    return None
+
+
+class DeadlineMiddleware:
+    """Plain ASGI middleware: sets the request's deadline and cancels it if the client disconnects."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timeout = _header_timeout(scope) or route_deadline(scope["path"])
+        deadline = Deadline(min(timeout, settings.REQUEST_DEADLINE_MAX_SEC))
+
+        # Sync handlers never read from `receive` while they run, so nothing would notice a
+        # disconnect; pump messages through a queue and watch for it here instead.
+        messages: asyncio.Queue = asyncio.Queue()
+        state = {"responded": False, "disconnected": False}
+
+        async def pump() -> None:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    state["disconnected"] = True
+                    if not state["responded"]:
+                        deadline.cancel()
+                await messages.put(message)
+                if state["disconnected"]:
+                    return
+
+        async def pumped_receive():
+            if state["disconnected"] and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        async def tracking_send(message) -> None:
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["responded"] = True
+                deadline.detach()
+            await send(message)
+
+        pump_task = asyncio.get_running_loop().create_task(pump())
+        try:
+            with deadline_scope(deadline):
+                await self.app(scope, pumped_receive, tracking_send)
+        finally:
+            pump_task.cancel()
@@ -1,10 +1,9 @@
 # app/core/security.py
+import hmac
 import time
 from fastapi import HTTPException, status, Depends, Request
 from app.core.config import settings
-
-# In-memory rate limit store: {identifier: [timestamps]}
-_request_log: dict[str, list[float]] = {}
+from app.core.state_store import state_store
 
 
 def get_api_key(request: Request) -> str:
@@ -25,32 +24,38 @@ def get_api_key(request: Request) -> str:
     return api_key
 
 
+def require_admin_key(request: Request) -> None:
+    """
+    Admin routes use their own credential (ADMIN_API_KEY, sent as x-admin-key),
+    independent of the client API key. Disabled unless configured.
+    """
+    expected = settings.ADMIN_API_KEY
+    if not expected:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin API is disabled.")
+    given = request.headers.get("x-admin-key") or ""
+    if not hmac.compare_digest(given.encode(), expected.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or missing admin key.")
+
 
 def rate_limiter(
     request: Request,
     api_key: str = Depends(get_api_key),  # ensures auth happens first
 ):
     """
-    Naive per-API-key rate limiting in memory.
-    Good enough for your own project; upgrade later to Redis.
+    Per-API-key sliding-window rate limiting.
+    Hits are recorded in the shared state store so the limit holds across workers.
     """
     identifier = api_key  # you could also mix in client IP if you want
     now = time.time()
 
-    max_requests = settings.RATE_LIMIT_REQUESTS
-    window = settings.RATE_LIMIT_WINDOW_SEC
-
-    history = _request_log.setdefault(identifier, [])
-
-    # keep only timestamps within the last `window` seconds
-    cutoff = now - window
-    history = [t for t in history if t > cutoff]
-    _request_log[identifier] = history
-
-    if len(history) >= max_requests:
+    allowed = state_store.allow_request(
+        identifier,
+        now=now,
+        window=settings.RATE_LIMIT_WINDOW_SEC,
+        max_requests=settings.RATE_LIMIT_REQUESTS,
+    )
+    if not allowed:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"Rate limit exceeded, try again in a bit.",
         )
-
-    history.append(now)
@@ -0,0 +1,159 @@
+# app/core/snapshots.py
+"""
+Compact on-disk snapshots of in-memory caches, read through mmap.
+
+A snapshot is one file of (key, value, expires_at) entries sorted by key:
+
+    header   magic "RCSN", version, created_at, entry count
+    index    one fixed-size record per entry: offset, key length, value length, expires_at
+    data     key bytes immediately followed by value bytes, per entry
+
+Opening a snapshot maps the file and reads only the header, so startup
+costs the same for ten entries or a million. `get` binary-searches the
+index in the mapping and decodes nothing but the entry it returns; entries
+past their `expires_at`, and whole snapshots older than the caller's max
+age, read as missing.
+
+Files are written to a temporary name and renamed into place, so a reader
+never sees a half-written snapshot, and a mapping taken before the rename
+stays valid.
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Iterable, Iterator, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RCSN"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHdI")   # magic, version, reserved, created_at, count
+_ENTRY = struct.Struct("<IHId")      # data offset, key length, value length, expires_at
+
+# (key, value, expires_at)
+Entry = Tuple[bytes, bytes, float]
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class Snapshot:
+    def __init__(self, path: str):
+        """Map `path`. Raises OSError or SnapshotError."""
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise SnapshotError("file too short")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.created_at, self.count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise SnapshotError(f"not a version {VERSION} snapshot")
+        if _HEADER.size + self.count * _ENTRY.size > size:
+            self.close()
+            raise SnapshotError("truncated index")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _entry(self, i: int) -> Tuple[int, int, int, float]:
+        return _ENTRY.unpack_from(self._mm, _HEADER.size + i * _ENTRY.size)
+
+    def get(self, key: bytes, now: Optional[float] = None) -> Optional[Tuple[bytes, float]]:
+        """(value, expires_at) for `key`, or None if absent or expired."""
+        mm = self._mm
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, key_len, value_len, expires_at = self._entry(mid)
+            found = mm[offset:offset + key_len]
+            if found < key:
+                lo = mid + 1
+            elif found > key:
+                hi = mid
+            else:
+                if expires_at <= (time.time() if now is None else now):
+                    return None
+                start = offset + key_len
+                return mm[start:start + value_len], expires_at
+        return None
+
+    def items(self, now: Optional[float] = None) -> Iterator[Entry]:
+        """Every unexpired entry, in key order."""
+        now = time.time() if now is None else now
+        mm = self._mm
+        for i in range(self.count):
+            offset, key_len, value_len, expires_at = self._entry(i)
+            if expires_at <= now:
+                continue
+            start = offset + key_len
+            yield mm[offset:start], mm[start:start + value_len], expires_at
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+def open_snapshot(path: str, max_age: float, now: Optional[float] = None) -> Optional[Snapshot]:
+    """The snapshot at `path`, or None if there is none, it is unreadable, or older than `max_age`."""
+    now = time.time() if now is None else now
+    try:
+        snapshot = Snapshot(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, SnapshotError) as e:
+        logger.warning("Ignoring unreadable snapshot %s: %s", path, e)
+        return None
+    if now - snapshot.created_at > max_age:
+        logger.info("Ignoring stale snapshot %s (%.0fs old)", path, now - snapshot.created_at)
+        snapshot.close()
+        return None
+    return snapshot
+
+
+def write_snapshot(path: str, entries: Iterable[Entry], now: Optional[float] = None) -> int:
+    """Atomically replace `path` with `entries` (first occurrence of a key wins). Returns the entry count."""
+    now = time.time() if now is None else now
+    unique = {}
+    for key, value, expires_at in entries:
+        if expires_at > now and key not in unique:
+            unique[key] = (value, expires_at)
+    keys = sorted(unique)
+
+    index = bytearray()
+    data = bytearray()
+    offset = _HEADER.size + len(keys) * _ENTRY.size
+    for key in keys:
+        value, expires_at = unique[key]
+        index += _ENTRY.pack(offset + len(data), len(key), len(value), expires_at)
+        data += key
+        data += value
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, now, len(keys)))
+        f.write(index)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(keys)
+
+
+def merge_entries(memory: Iterable[Entry], snapshot: Optional[Snapshot], now: float) -> Iterator[Entry]:
+    """
+    A cache's entries for the next snapshot: what it holds in memory, plus
+    the entries of the snapshot it started from that it never loaded (so a
+    save shortly after boot doesn't forget them).
+    """
+    seen: Set[bytes] = set()
+    for entry in memory:
+        seen.add(entry[0])
+        yield entry
+    if snapshot is not None:
+        for entry in snapshot.items(now):
+            if entry[0] not in seen:
+                yield entry
@@ -0,0 +1,789 @@
+# app/core/state_store.py
+"""
+Shared state for task sessions and rate-limit counters.
+
+With several uvicorn workers every process must see the same task sessions
+(auth token, cookies, last access) and the same rate-limit history, so this
+state lives in a small SQLite database in WAL mode that all workers open.
+A process-local in-memory backend is kept for single-worker/dev use.
+
+Select with STATE_BACKEND ("sqlite" or "memory") and STATE_DB_PATH.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from app.core.config import settings
+
+
+# Secrets that ship in the code and so protect nothing
+_DEFAULT_SECRETS = {"your-super-secret-jwt-key-change-in-production", "super-secret-dev-key"}
+MIN_SECRET_LENGTH = 32
+
+
+def dedicated_secret(secret: Optional[str]) -> Optional[str]:
+    """`secret` if it is fit to encrypt data at rest: set, long enough, not a default and not the JWT key."""
+    if not secret or len(secret) < MIN_SECRET_LENGTH:
+        return None
+    if secret in _DEFAULT_SECRETS or secret == settings.JWT_SECRET_KEY:
+        return None
+    return secret
+
+
+def _session_key(path: str) -> bytes:
+    """
+    Fernet key for session secrets in the database at `path`: derived from
+    AUTH_CACHE_SECRET when a dedicated one is configured, otherwise a random
+    key kept next to the database (`<path>.key`, owner-only) and shared by
+    every worker that opens it.
+    """
+    secret = dedicated_secret(settings.AUTH_CACHE_SECRET)
+    if secret is not None:
+        return base64.urlsafe_b64encode(hmac.new(secret.encode(), b"resy-task-sessions", hashlib.sha256).digest())
+    if path == ":memory:":
+        return Fernet.generate_key()
+    key_path = path + ".key"
+    try:
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker may still be writing it
+        for _ in range(50):
+            with open(key_path, "rb") as f:
+                key = f.read().strip()
+            if key:
+                return key
+            time.sleep(0.01)
+        raise RuntimeError(f"Session key file {key_path} is empty")
+    key = Fernet.generate_key()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """
+    Open a SQLite connection tuned for many concurrent readers and writers
+    across processes (WAL journal, relaxed fsync, generous busy timeout).
+    """
+    conn = sqlite3.connect(path, timeout=10.0, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    return conn
+
+
+class SQLiteStateStore:
+    """
+    Task sessions and rate-limit history shared by all workers on a host.
+
+    Session auth tokens and cookies are Fernet-encrypted at rest (see
+    _session_key); decrypted values are memoised per ciphertext since
+    load_session runs on every request.
+    """
+
+    # Bound on memoised decryptions (roughly one per live session)
+    DECRYPTED_CACHE_SIZE = 4096
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS task_sessions (
+        task_id     TEXT PRIMARY KEY,
+        auth_token  TEXT NOT NULL DEFAULT '',
+        cookies     TEXT NOT NULL DEFAULT '{}',
+        last_access REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_task_sessions_last_access ON task_sessions(last_access);
+
+    CREATE TABLE IF NOT EXISTS task_profiles (
+        task_id    TEXT PRIMARY KEY,
+        profile    TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS task_preferences (
+        task_id     TEXT PRIMARY KEY,
+        preferences TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS task_bookings (
+        task_id    TEXT PRIMARY KEY,
+        status     TEXT NOT NULL,  -- 'booking' (claimed, in progress) or 'booked'
+        updated_at REAL NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS task_watches (
+        watch_id   TEXT PRIMARY KEY,
+        task_id    TEXT NOT NULL,
+        spec       TEXT NOT NULL,  -- JSON: venue_id, day, party_size, time_start, time_end, preferences
+        created_at REAL NOT NULL,
+        owner      TEXT NOT NULL,  -- process running the watch
+        heartbeat  REAL NOT NULL,  -- last time the owner said it is alive (0 = released)
+        status     TEXT NOT NULL DEFAULT '{}'  -- JSON: latest slots, checked_at, changed_at (owner writes)
+    );
+    CREATE INDEX IF NOT EXISTS idx_task_watches_task ON task_watches(task_id);
+    CREATE INDEX IF NOT EXISTS idx_task_watches_heartbeat ON task_watches(heartbeat);
+
+    CREATE TABLE IF NOT EXISTS slot_leases (
+        slot_key   TEXT PRIMARY KEY,  -- "venue_id:day:HH:MM"
+        task_id    TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        task_id    TEXT NOT NULL,
+        key        TEXT NOT NULL,
+        response   TEXT,              -- NULL while the request is in flight
+        created_at REAL NOT NULL,
+        PRIMARY KEY (task_id, key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys(created_at);
+
+    CREATE TABLE IF NOT EXISTS rate_limit_log (
+        identifier TEXT NOT NULL,
+        ts         REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_rate_limit_log ON rate_limit_log(identifier, ts);
+
+    CREATE TABLE IF NOT EXISTS revoked_tasks (
+        task_id    TEXT PRIMARY KEY,
+        revoked_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_revoked_tasks_revoked_at ON revoked_tasks(revoked_at);
+    """
+
+    def __init__(self, path: str, rate_lease_size: int = 1, rate_lease_sec: float = 1.0):
+        self.path = path
+        self._local = threading.local()
+        self._fernet = Fernet(_session_key(path))
+        self._decrypted: Dict[str, str] = {}
+        # Rate-limit hits claimed from the shared log and not handed out yet: {identifier: [unused, claimed_at]}
+        self.rate_lease_size = max(1, rate_lease_size)
+        self.rate_lease_sec = rate_lease_sec
+        self._rate_leases: Dict[str, List[float]] = {}
+        self._rate_lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+        if "status" not in {r[1] for r in conn.execute("PRAGMA table_info(task_watches)")}:
+            conn.execute("ALTER TABLE task_watches ADD COLUMN status TEXT NOT NULL DEFAULT '{}'")
+        # Rows written before encryption hold plaintext; drop their secrets (the task logs in again)
+        conn.execute(
+            """
+            UPDATE task_sessions SET auth_token = '', cookies = '{}'
+            WHERE (auth_token != '' AND auth_token NOT LIKE 'gAAAAA%')
+               OR (cookies != '{}' AND cookies LIKE '{%')
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; Starlette runs sync routes on a threadpool.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect_sqlite(self.path)
+            self._local.conn = conn
+        return conn
+
+    # ---------- Task sessions ----------
+
+    def _encrypt(self, value: str) -> str:
+        return self._fernet.encrypt(value.encode()).decode() if value else ""
+
+    def _decrypt(self, value: str) -> str:
+        if not value:
+            return ""
+        plain = self._decrypted.get(value)
+        if plain is None:
+            try:
+                plain = self._fernet.decrypt(value.encode()).decode()
+            except InvalidToken:
+                # Written under another key; treat the session as logged out
+                return ""
+            if len(self._decrypted) >= self.DECRYPTED_CACHE_SIZE:
+                self._decrypted.clear()
+            self._decrypted[value] = plain
+        return plain
+
+    def load_session(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT auth_token, cookies, last_access FROM task_sessions WHERE task_id = ?",
+            (task_id,),
+        ).fetchone()
+        if not row:
+            return None
+        cookies = self._decrypt(row[1]) if row[1] != "{}" else ""
+        return {
+            "auth_token": self._decrypt(row[0]),
+            "cookies": json.loads(cookies) if cookies else {},
+            "last_access": row[2],
+        }
+
+    def save_session(self, task_id: str, auth_token: str, cookies: Dict[str, str], last_access: float) -> None:
+        self._conn().execute(
+            """
+            INSERT INTO task_sessions (task_id, auth_token, cookies, last_access) VALUES (?, ?, ?, ?)
+            ON CONFLICT(task_id) DO UPDATE SET
+                auth_token = excluded.auth_token,
+                cookies = excluded.cookies,
+                last_access = excluded.last_access
+            """,
+            (task_id, self._encrypt(auth_token), self._encrypt(json.dumps(cookies)) if cookies else "{}", last_access),
+        )
+
+    def touch_session(self, task_id: str, last_access: float) -> None:
+        self._conn().execute(
+            """
+            INSERT INTO task_sessions (task_id, last_access) VALUES (?, ?)
+            ON CONFLICT(task_id) DO UPDATE SET last_access = excluded.last_access
+            """,
+            (task_id, last_access),
+        )
+
+    def delete_sessions(self, task_ids: Iterable[str]) -> None:
+        rows = [(t,) for t in task_ids]
+        conn = self._conn()
+        conn.executemany("DELETE FROM task_sessions WHERE task_id = ?", rows)
+        conn.executemany("DELETE FROM task_profiles WHERE task_id = ?", rows)
+        conn.executemany("DELETE FROM task_preferences WHERE task_id = ?", rows)
+        conn.executemany("DELETE FROM task_bookings WHERE task_id = ?", rows)
+        conn.executemany("DELETE FROM task_watches WHERE task_id = ?", rows)
+
+    def expire_sessions(self, cutoff: float) -> List[str]:
+        """
+        Delete sessions last accessed before `cutoff` and return their ids.
+        Tasks with watches are kept: their polls need the session material
+        after the browser has gone (watches end with their day or at logout).
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = [r[0] for r in conn.execute(
+                "SELECT task_id FROM task_sessions WHERE last_access < ? "
+                "AND task_id NOT IN (SELECT task_id FROM task_watches)",
+                (cutoff,),
+            )]
+            conn.executemany("DELETE FROM task_sessions WHERE task_id = ?", [(t,) for t in expired])
+            conn.executemany("DELETE FROM task_profiles WHERE task_id = ?", [(t,) for t in expired])
+            conn.executemany("DELETE FROM task_preferences WHERE task_id = ?", [(t,) for t in expired])
+            conn.executemany("DELETE FROM task_bookings WHERE task_id = ?", [(t,) for t in expired])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return expired
+
+    # ---------- User profiles ----------
+
+    def load_profile(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT profile, fetched_at FROM task_profiles WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return {"profile": json.loads(row[0]), "fetched_at": row[1]}
+
+    def save_profile(self, task_id: str, profile: Dict[str, Any], fetched_at: float) -> None:
+        self._conn().execute(
+            """
+            INSERT INTO task_profiles (task_id, profile, fetched_at) VALUES (?, ?, ?)
+            ON CONFLICT(task_id) DO UPDATE SET profile = excluded.profile, fetched_at = excluded.fetched_at
+            """,
+            (task_id, json.dumps(profile), fetched_at),
+        )
+
+    # ---------- Slot preferences ----------
+
+    def load_preferences(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT preferences FROM task_preferences WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_preferences(self, task_id: str, preferences: Dict[str, Any]) -> None:
+        self._conn().execute(
+            """
+            INSERT INTO task_preferences (task_id, preferences) VALUES (?, ?)
+            ON CONFLICT(task_id) DO UPDATE SET preferences = excluded.preferences
+            """,
+            (task_id, json.dumps(preferences)),
+        )
+
+    # ---------- Booking claims ----------
+
+    def claim_booking(self, task_id: str, now: float, stale_after: float) -> bool:
+        """
+        Claim the right to book for a task. False if the task already booked,
+        or another request holds a claim younger than `stale_after` seconds.
+        """
+        cur = self._conn().execute(
+            """
+            INSERT INTO task_bookings (task_id, status, updated_at) VALUES (?, 'booking', ?)
+            ON CONFLICT(task_id) DO UPDATE SET updated_at = excluded.updated_at
+            WHERE task_bookings.status = 'booking' AND task_bookings.updated_at < ?
+            """,
+            (task_id, now, now - stale_after),
+        )
+        return cur.rowcount == 1
+
+    def finish_booking(self, task_id: str, booked: bool, now: float) -> None:
+        """Release a claim: mark the task booked for good, or free it for another attempt."""
+        if booked:
+            self._conn().execute(
+                "UPDATE task_bookings SET status = 'booked', updated_at = ? WHERE task_id = ?", (now, task_id)
+            )
+        else:
+            self._conn().execute("DELETE FROM task_bookings WHERE task_id = ? AND status = 'booking'", (task_id,))
+
+    def booking_status(self, task_id: str) -> Optional[str]:
+        row = self._conn().execute("SELECT status FROM task_bookings WHERE task_id = ?", (task_id,)).fetchone()
+        return row[0] if row else None
+
+    # ---------- Watches ----------
+
+    def write_watches(
+        self,
+        upserts: List[Tuple[str, str, Dict[str, Any], float]],
+        deletes: Iterable[str],
+        owner: str,
+        now: float,
+    ) -> None:
+        """Apply a batch of (watch_id, task_id, spec, created_at) upserts and deletions in one transaction."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                """
+                INSERT INTO task_watches (watch_id, task_id, spec, created_at, owner, heartbeat)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(watch_id) DO UPDATE SET
+                    spec = excluded.spec, owner = excluded.owner, heartbeat = excluded.heartbeat
+                """,
+                [(w, t, json.dumps(spec), c, owner, now) for w, t, spec, c in upserts],
+            )
+            conn.executemany("DELETE FROM task_watches WHERE watch_id = ?", [(w,) for w in deletes])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def heartbeat_watches(self, owner: str, now: float, statuses: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """Refresh the owner's heartbeat and store the latest status of watches whose results changed."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE task_watches SET heartbeat = ? WHERE owner = ?", (now, owner))
+            if statuses:
+                conn.executemany(
+                    "UPDATE task_watches SET status = ? WHERE watch_id = ? AND owner = ?",
+                    [(json.dumps(status), w, owner) for w, status in statuses.items()],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def owned_watch_ids(self, owner: str) -> List[str]:
+        return [r[0] for r in self._conn().execute("SELECT watch_id FROM task_watches WHERE owner = ?", (owner,))]
+
+    def load_watches(self, task_id: str) -> List[Dict[str, Any]]:
+        """Every stored watch of a task, whichever process runs it."""
+        rows = self._conn().execute(
+            "SELECT watch_id, task_id, spec, created_at, owner, status FROM task_watches "
+            "WHERE task_id = ? ORDER BY created_at",
+            (task_id,),
+        ).fetchall()
+        return [
+            {"watch_id": w, "task_id": t, "spec": json.loads(spec), "created_at": c, "owner": o, "status": json.loads(st)}
+            for w, t, spec, c, o, st in rows
+        ]
+
+    def adopt_watches(self, owner: str, now: float, stale_after: float) -> List[Dict[str, Any]]:
+        """Take over watches whose owner stopped heartbeating (or released them) and return them."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT watch_id, task_id, spec, created_at FROM task_watches WHERE heartbeat < ? AND owner != ?",
+                (now - stale_after, owner),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE task_watches SET owner = ?, heartbeat = ? WHERE watch_id = ?",
+                [(owner, now, r[0]) for r in rows],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [{"watch_id": w, "task_id": t, "spec": json.loads(spec), "created_at": c} for w, t, spec, c in rows]
+
+    def release_watches(self, owner: str) -> None:
+        """Let any process adopt this owner's watches right away (clean shutdown)."""
+        self._conn().execute("UPDATE task_watches SET heartbeat = 0 WHERE owner = ?", (owner,))
+
+    # ---------- Slot leases ----------
+
+    def claim_slot(self, slot_key: str, task_id: str, now: float, ttl: float) -> bool:
+        """Lease a slot for `ttl` seconds. False while another task holds an unexpired lease on it."""
+        cur = self._conn().execute(
+            """
+            INSERT INTO slot_leases (slot_key, task_id, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(slot_key) DO UPDATE SET task_id = excluded.task_id, expires_at = excluded.expires_at
+            WHERE slot_leases.task_id = excluded.task_id OR slot_leases.expires_at < ?
+            """,
+            (slot_key, task_id, now + ttl, now),
+        )
+        return cur.rowcount == 1
+
+    def release_slot(self, slot_key: str, task_id: str) -> None:
+        self._conn().execute("DELETE FROM slot_leases WHERE slot_key = ? AND task_id = ?", (slot_key, task_id))
+
+    def prune_slot_leases(self, now: float) -> None:
+        self._conn().execute("DELETE FROM slot_leases WHERE expires_at < ?", (now,))
+
+    # ---------- Idempotency keys ----------
+
+    def begin_idempotent(
+        self, task_id: str, key: str, now: float, stale_after: float
+    ) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Start a request under an idempotency key: (True, None) if this caller
+        should run it, (False, response) if it already completed, (False, None)
+        if another request with the key is still in flight.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT response, created_at FROM idempotency_keys WHERE task_id = ? AND key = ?", (task_id, key)
+            ).fetchone()
+            if row is None or (row[0] is None and row[1] < now - stale_after):
+                conn.execute(
+                    """
+                    INSERT INTO idempotency_keys (task_id, key, response, created_at) VALUES (?, ?, NULL, ?)
+                    ON CONFLICT(task_id, key) DO UPDATE SET created_at = excluded.created_at
+                    """,
+                    (task_id, key, now),
+                )
+                result: Tuple[bool, Optional[Dict[str, Any]]] = (True, None)
+            else:
+                result = (False, json.loads(row[0]) if row[0] is not None else None)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def finish_idempotent(self, task_id: str, key: str, response: Dict[str, Any]) -> None:
+        self._conn().execute(
+            "UPDATE idempotency_keys SET response = ? WHERE task_id = ? AND key = ?",
+            (json.dumps(response), task_id, key),
+        )
+
+    def abandon_idempotent(self, task_id: str, key: str) -> None:
+        """Forget an in-flight key whose request definitely had no effect, so it can be retried."""
+        self._conn().execute(
+            "DELETE FROM idempotency_keys WHERE task_id = ? AND key = ? AND response IS NULL", (task_id, key)
+        )
+
+    def prune_idempotency(self, before: float) -> None:
+        self._conn().execute("DELETE FROM idempotency_keys WHERE created_at < ?", (before,))
+
+    # ---------- Session token revocation ----------
+
+    def revoke_tasks(self, task_ids: Iterable[str], revoked_at: float) -> None:
+        self._conn().executemany(
+            """
+            INSERT INTO revoked_tasks (task_id, revoked_at) VALUES (?, ?)
+            ON CONFLICT(task_id) DO UPDATE SET revoked_at = excluded.revoked_at
+            """,
+            [(t, revoked_at) for t in task_ids],
+        )
+
+    def load_revocations(self, since: float) -> List[Tuple[str, float]]:
+        """Revocations recorded at or after `since` (incremental sync)."""
+        return self._conn().execute(
+            "SELECT task_id, revoked_at FROM revoked_tasks WHERE revoked_at >= ?", (since,)
+        ).fetchall()
+
+    def prune_revocations(self, before: float) -> None:
+        self._conn().execute("DELETE FROM revoked_tasks WHERE revoked_at < ?", (before,))
+
+    # ---------- Rate limiting ----------
+
+    def allow_request(self, identifier: str, now: float, window: float, max_requests: int) -> bool:
+        """
+        Sliding-window limiter: record a hit and return True, or return False
+        if `identifier` already made `max_requests` hits in the last `window` seconds.
+
+        Hits are claimed from the shared log up to `rate_lease_size` at a time
+        (fewer as the limit nears) and handed out from memory, so most requests
+        take no write transaction. Claimed hits count against every worker's
+        limit from when they were claimed; those still unused once the lease is
+        `rate_lease_sec` old are given back with the next claim. A rejection
+        is a plain read unless there is something to give back.
+        """
+        with self._rate_lock:
+            lease = self._rate_leases.get(identifier)
+            if lease is not None and lease[0] > 0 and now - lease[1] < self.rate_lease_sec:
+                lease[0] -= 1
+                return True
+            unused, claimed_at = (int(lease[0]), lease[1]) if lease is not None else (0, 0.0)
+
+            conn = self._conn()
+            count_sql = "SELECT COUNT(*) FROM rate_limit_log WHERE identifier = ? AND ts > ?"
+            if not unused:
+                (count,) = conn.execute(count_sql, (identifier, now - window)).fetchone()
+                if count >= max_requests:
+                    return False
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "DELETE FROM rate_limit_log WHERE identifier = ? AND ts <= ?",
+                    (identifier, now - window),
+                )
+                if unused:
+                    conn.execute(
+                        "DELETE FROM rate_limit_log WHERE rowid IN "
+                        "(SELECT rowid FROM rate_limit_log WHERE identifier = ? AND ts = ? LIMIT ?)",
+                        (identifier, claimed_at, unused),
+                    )
+                (count,) = conn.execute(count_sql, (identifier, now - window)).fetchone()
+                left = max_requests - count
+                claim = min(self.rate_lease_size, max(1, left // 2)) if left > 0 else 0
+                conn.executemany(
+                    "INSERT INTO rate_limit_log (identifier, ts) VALUES (?, ?)", [(identifier, now)] * claim
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if claim:
+                self._rate_leases[identifier] = [claim - 1, now]
+            else:
+                self._rate_leases.pop(identifier, None)
+            return claim > 0
+
+
+class MemoryStateStore:
+    """Process-local equivalent of SQLiteStateStore (single worker only)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._request_log: Dict[str, List[float]] = {}
+        self._revoked: Dict[str, float] = {}
+        self._profiles: Dict[str, Dict[str, Any]] = {}
+        self._preferences: Dict[str, Dict[str, Any]] = {}
+        self._bookings: Dict[str, Tuple[str, float]] = {}
+        self._slot_leases: Dict[str, Tuple[str, float]] = {}
+        self._watches: Dict[str, Dict[str, Any]] = {}
+        self._idempotency: Dict[Tuple[str, str], Tuple[Optional[Dict[str, Any]], float]] = {}
+
+    def load_session(self, task_id: str) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(task_id)
+        return dict(session) if session else None
+
+    def save_session(self, task_id: str, auth_token: str, cookies: Dict[str, str], last_access: float) -> None:
+        with self._lock:
+            self._sessions[task_id] = {
+                "auth_token": auth_token,
+                "cookies": dict(cookies),
+                "last_access": last_access,
+            }
+
+    def touch_session(self, task_id: str, last_access: float) -> None:
+        with self._lock:
+            session = self._sessions.setdefault(task_id, {"auth_token": "", "cookies": {}})
+            session["last_access"] = last_access
+
+    def delete_sessions(self, task_ids: Iterable[str]) -> None:
+        task_ids = set(task_ids)
+        with self._lock:
+            for task_id in task_ids:
+                self._sessions.pop(task_id, None)
+                self._profiles.pop(task_id, None)
+                self._preferences.pop(task_id, None)
+                self._bookings.pop(task_id, None)
+            self._drop_watches(task_ids)
+
+    def expire_sessions(self, cutoff: float) -> List[str]:
+        with self._lock:
+            watched = {row["task_id"] for row in self._watches.values()}
+            expired = [t for t, s in self._sessions.items() if s["last_access"] < cutoff and t not in watched]
+            for task_id in expired:
+                del self._sessions[task_id]
+                self._profiles.pop(task_id, None)
+                self._preferences.pop(task_id, None)
+                self._bookings.pop(task_id, None)
+        return expired
+
+    def _drop_watches(self, task_ids: set) -> None:
+        self._watches = {w: row for w, row in self._watches.items() if row["task_id"] not in task_ids}
+
+    def load_profile(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return self._profiles.get(task_id)
+
+    def save_profile(self, task_id: str, profile: Dict[str, Any], fetched_at: float) -> None:
+        with self._lock:
+            self._profiles[task_id] = {"profile": profile, "fetched_at": fetched_at}
+
+    def load_preferences(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return self._preferences.get(task_id)
+
+    def save_preferences(self, task_id: str, preferences: Dict[str, Any]) -> None:
+        with self._lock:
+            self._preferences[task_id] = dict(preferences)
+
+    def claim_booking(self, task_id: str, now: float, stale_after: float) -> bool:
+        with self._lock:
+            current = self._bookings.get(task_id)
+            if current is not None and (current[0] == "booked" or current[1] >= now - stale_after):
+                return False
+            self._bookings[task_id] = ("booking", now)
+            return True
+
+    def finish_booking(self, task_id: str, booked: bool, now: float) -> None:
+        with self._lock:
+            if booked:
+                self._bookings[task_id] = ("booked", now)
+            elif self._bookings.get(task_id, ("",))[0] == "booking":
+                del self._bookings[task_id]
+
+    def booking_status(self, task_id: str) -> Optional[str]:
+        current = self._bookings.get(task_id)
+        return current[0] if current else None
+
+    def write_watches(
+        self,
+        upserts: List[Tuple[str, str, Dict[str, Any], float]],
+        deletes: Iterable[str],
+        owner: str,
+        now: float,
+    ) -> None:
+        with self._lock:
+            for watch_id, task_id, spec, created_at in upserts:
+                self._watches[watch_id] = {
+                    "watch_id": watch_id, "task_id": task_id, "spec": dict(spec),
+                    "created_at": created_at, "owner": owner, "heartbeat": now,
+                    "status": self._watches.get(watch_id, {}).get("status", {}),
+                }
+            for watch_id in deletes:
+                self._watches.pop(watch_id, None)
+
+    def heartbeat_watches(self, owner: str, now: float, statuses: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        with self._lock:
+            for row in self._watches.values():
+                if row["owner"] == owner:
+                    row["heartbeat"] = now
+                    if statuses and row["watch_id"] in statuses:
+                        row["status"] = dict(statuses[row["watch_id"]])
+
+    def owned_watch_ids(self, owner: str) -> List[str]:
+        with self._lock:
+            return [w for w, row in self._watches.items() if row["owner"] == owner]
+
+    def load_watches(self, task_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = [dict(row) for row in self._watches.values() if row["task_id"] == task_id]
+        return sorted(rows, key=lambda row: row["created_at"])
+
+    def adopt_watches(self, owner: str, now: float, stale_after: float) -> List[Dict[str, Any]]:
+        adopted = []
+        with self._lock:
+            for row in self._watches.values():
+                if row["heartbeat"] < now - stale_after and row["owner"] != owner:
+                    row["owner"], row["heartbeat"] = owner, now
+                    adopted.append({k: row[k] for k in ("watch_id", "task_id", "spec", "created_at")})
+        return adopted
+
+    def release_watches(self, owner: str) -> None:
+        with self._lock:
+            for row in self._watches.values():
+                if row["owner"] == owner:
+                    row["heartbeat"] = 0.0
+
+    def claim_slot(self, slot_key: str, task_id: str, now: float, ttl: float) -> bool:
+        with self._lock:
+            current = self._slot_leases.get(slot_key)
+            if current is not None and current[0] != task_id and current[1] >= now:
+                return False
+            self._slot_leases[slot_key] = (task_id, now + ttl)
+            return True
+
+    def release_slot(self, slot_key: str, task_id: str) -> None:
+        with self._lock:
+            if self._slot_leases.get(slot_key, ("",))[0] == task_id:
+                del self._slot_leases[slot_key]
+
+    def prune_slot_leases(self, now: float) -> None:
+        with self._lock:
+            self._slot_leases = {k: v for k, v in self._slot_leases.items() if v[1] >= now}
+
+    def begin_idempotent(
+        self, task_id: str, key: str, now: float, stale_after: float
+    ) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        with self._lock:
+            current = self._idempotency.get((task_id, key))
+            if current is None or (current[0] is None and current[1] < now - stale_after):
+                self._idempotency[(task_id, key)] = (None, now)
+                return True, None
+            return False, current[0]
+
+    def finish_idempotent(self, task_id: str, key: str, response: Dict[str, Any]) -> None:
+        with self._lock:
+            current = self._idempotency.get((task_id, key))
+            if current is not None:
+                self._idempotency[(task_id, key)] = (dict(response), current[1])
+
+    def abandon_idempotent(self, task_id: str, key: str) -> None:
+        with self._lock:
+            current = self._idempotency.get((task_id, key))
+            if current is not None and current[0] is None:
+                del self._idempotency[(task_id, key)]
+
+    def prune_idempotency(self, before: float) -> None:
+        with self._lock:
+            self._idempotency = {k: v for k, v in self._idempotency.items() if v[1] >= before}
+
+    def revoke_tasks(self, task_ids: Iterable[str], revoked_at: float) -> None:
+        with self._lock:
+            for task_id in task_ids:
+                self._revoked[task_id] = revoked_at
+
+    def load_revocations(self, since: float) -> List[Tuple[str, float]]:
+        return [(t, ts) for t, ts in list(self._revoked.items()) if ts >= since]
+
+    def prune_revocations(self, before: float) -> None:
+        with self._lock:
+            self._revoked = {t: ts for t, ts in self._revoked.items() if ts >= before}
+
+    def allow_request(self, identifier: str, now: float, window: float, max_requests: int) -> bool:
+        with self._lock:
+            cutoff = now - window
+            history = [t for t in self._request_log.get(identifier, []) if t > cutoff]
+            allowed = len(history) < max_requests
+            if allowed:
+                history.append(now)
+            self._request_log[identifier] = history
+        return allowed
+
+
+def create_state_store():
+    if settings.STATE_BACKEND == "memory":
+        return MemoryStateStore()
+    if settings.STATE_BACKEND == "sqlite":
+        return SQLiteStateStore(
+            settings.STATE_DB_PATH,
+            rate_lease_size=settings.RATE_LIMIT_LEASE_SIZE,
+            rate_lease_sec=settings.RATE_LIMIT_LEASE_SEC,
+        )
+    raise ValueError(f"Unknown STATE_BACKEND: {settings.STATE_BACKEND!r}")
+
+
+# Shared by security.rate_limiter, token_manager and ClientManager.
+state_store = create_state_store()
@@ -1,32 +1,94 @@
 # app/core/token_manager.py
+import hashlib
+import threading
 import jwt
 import time
-from datetime import datetime, timedelta
+from collections import OrderedDict
 from fastapi import HTTPException, status, Header
-from typing import Optional
+from typing import Dict, Iterable, Optional, Tuple
 from app.core.config import settings
+from app.core.state_store import state_store
 
 # Secret key for JWT signing (should be in .env in production)
 JWT_SECRET_KEY = settings.JWT_SECRET_KEY
 JWT_ALGORITHM = "HS256"
 TOKEN_EXPIRY_HOURS = 24  # Tokens expire after 24 hours
 
+# Verified tokens, keyed by SHA-256 digest: {digest: (task_id, iat, exp)}.
+# Monitors re-send the same token every few seconds, so after the first
+# signature check the polling path is a dict lookup.
+TOKEN_CACHE_SIZE = 10000
+_token_cache: "OrderedDict[bytes, Tuple[str, float, float]]" = OrderedDict()
+# Guards the token cache and the revocation state below
+_cache_lock = threading.Lock()
+
+# Revoked tasks: {task_id: revoked_at}. Tokens issued at or before revoked_at
+# are rejected. Mirrored from the shared state store so a logout handled by
+# one worker is seen by the others within REVOCATION_SYNC_SEC.
+REVOCATION_SYNC_SEC = 1.0
+_revoked: Dict[str, float] = {}
+_last_revocation_sync = 0.0
+
 
 def generate_session_token(task_id: str) -> str:
     """
     Generate a JWT token for a session.
     The token is encrypted and can only be decrypted by the server.
     """
+    now = time.time()
     payload = {
         "task_id": task_id,
-        "iat": datetime.utcnow(),  # Issued at
-        "exp": datetime.utcnow() + timedelta(hours=TOKEN_EXPIRY_HOURS),  # Expiration
+        "iat": now,  # Issued at (sub-second, so a token minted right after a revocation stays valid)
+        "exp": now + TOKEN_EXPIRY_HOURS * 3600,  # Expiration
     }
-    
+
     token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return token
 
 
+def revoke_task_tokens(task_ids: Iterable[str]) -> None:
+    """
+    Invalidate every session token issued so far for these tasks
+    (logout / task expiry). Tokens generated afterwards are unaffected.
+    """
+    task_ids = list(task_ids)
+    if not task_ids:
+        return
+    now = time.time()
+    state_store.revoke_tasks(task_ids, now)
+    with _cache_lock:
+        for task_id in task_ids:
+            _revoked[task_id] = max(now, _revoked.get(task_id, 0.0))
+
+
+def _sync_revocations(now: float) -> None:
+    """Merge revocations from the shared store; only one caller per interval reads it."""
+    global _last_revocation_sync
+    with _cache_lock:
+        if now - _last_revocation_sync < REVOCATION_SYNC_SEC:
+            return  # another request synced in the meantime
+        since = _last_revocation_sync - REVOCATION_SYNC_SEC  # overlap to tolerate commit ordering
+        _last_revocation_sync = now
+    rows = state_store.load_revocations(since)
+
+    # Anything revoked before the oldest still-valid token can be forgotten
+    horizon = now - TOKEN_EXPIRY_HOURS * 3600
+    with _cache_lock:
+        for task_id, revoked_at in rows:
+            if revoked_at > _revoked.get(task_id, 0.0):
+                _revoked[task_id] = revoked_at
+        expired = [t for t, ts in _revoked.items() if ts < horizon]
+        for task_id in expired:
+            del _revoked[task_id]
+    if expired:
+        state_store.prune_revocations(horizon)
+
+
+def _is_revoked(task_id: str, issued_at: float) -> bool:
+    revoked_at = _revoked.get(task_id)
+    return revoked_at is not None and issued_at <= revoked_at
+
+
 def validate_session_token(
     token: Optional[str] = Header(None, alias="x-session-token"),
     x_task_id: str = Header(..., alias="x-task-id")
@@ -40,29 +102,59 @@ def validate_session_token(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Missing session token. Please start a booking session first.",
         )
-    
-    try:
-        # Decode and verify the token
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        
-        # Verify the task_id matches
-        token_task_id = payload.get("task_id")
-        if token_task_id != x_task_id:
+
+    now = time.time()
+    if now - _last_revocation_sync >= REVOCATION_SYNC_SEC:
+        _sync_revocations(now)
+
+    digest = hashlib.sha256(token.encode()).digest()
+    with _cache_lock:
+        cached = _token_cache.get(digest)
+        if cached is not None:
+            _token_cache.move_to_end(digest)
+
+    if cached is None:
+        try:
+            # Decode and verify the token
+            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token task_id mismatch.",
+                detail="Session token has expired. Please start a new session.",
             )
-        
-        return token_task_id
-        
-    except jwt.ExpiredSignatureError:
+        except jwt.InvalidTokenError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid session token.",
+            )
+
+        cached = (payload.get("task_id"), float(payload.get("iat", 0)), float(payload.get("exp", 0)))
+        with _cache_lock:
+            _token_cache[digest] = cached
+            if len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+
+    token_task_id, issued_at, expires_at = cached
+
+    if expires_at <= now:
+        with _cache_lock:
+            _token_cache.pop(digest, None)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Session token has expired. Please start a new session.",
         )
-    except jwt.InvalidTokenError:
+
+    if _is_revoked(token_task_id, issued_at):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session token has been revoked. Please start a new session.",
+        )
+
+    # Verify the task_id matches
+    if token_task_id != x_task_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid session token.",
+            detail="Token task_id mismatch.",
         )
 
+    return token_task_id
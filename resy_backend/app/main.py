@@ -2,34 +2,115 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from apscheduler.executors.pool import ThreadPoolExecutor as JobExecutor
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from app.api.v1.resy_routes import router as resy_router
+from app.api.v1.admin_routes import router as admin_router
+from app.api.v1.resy_routes import router as resy_router, client_manager, profile_cache, watch_registry, watch_store
+from app.core.admission import AdmissionMiddleware, admission
+from app.core.deadlines import DeadlineMiddleware
 from app.core.logging import RequestLoggingMiddleware
 from app.core.config import settings
-from app.services.clientManager import ClientManager
+from app.services.auth_cache import auth_cache
+from app.services.availability_history import availability_history
+from app.services.booking_coordinator import booking_coordinator
+from app.services.cache_snapshots import cache_snapshots
+from app.services.notifications import notifier
+from app.services.release_patterns import release_patterns
+from app.services.runtime_stats import job_stats, loop_monitor
 
-# Initialize client manager singleton
-client_manager = ClientManager()
-
-# Initialize scheduler
-scheduler = AsyncIOScheduler()
+# Initialize scheduler. Maintenance jobs are all blocking (SQLite, files, upstream calls), so they
+# run on their own small pool: never on the event loop, and not competing with asyncio.to_thread work.
+scheduler = AsyncIOScheduler(executors={"default": JobExecutor(settings.MAINTENANCE_JOB_WORKERS)})
+job_stats.attach(scheduler)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Start the scheduler
+    # Startup: map the cache snapshots of the previous run (instant; entries load on first use)
+    cache_snapshots.load()
+    # Start the scheduler
     scheduler.start()
+    loop_monitor.start()
+    scheduler.add_job(cache_snapshots.warm, id="warm_caches", replace_existing=True)  # once, right away
+    scheduler.add_job(
+        cache_snapshots.save,
+        "interval",
+        seconds=settings.CACHE_SNAPSHOT_SEC,
+        id="snapshot_caches",
+        replace_existing=True,
+    )
     scheduler.add_job(
         client_manager.clean_up_old_clients,
         "interval",
-        minutes=5,  # Run cleanup every 5 minutes
+        seconds=30,  # Expiry is heap-driven, so frequent runs are cheap
         id="cleanup_old_clients",
         replace_existing=True,
     )
+    scheduler.add_job(
+        profile_cache.refresh_stale,
+        "interval",
+        minutes=2,
+        id="refresh_profiles",
+        replace_existing=True,
+    )
+    if auth_cache is not None:
+        scheduler.add_job(
+            auth_cache.prune,
+            "interval",
+            hours=1,
+            id="prune_auth_cache",
+            replace_existing=True,
+        )
+    scheduler.add_job(
+        availability_history.flush,
+        "interval",
+        seconds=settings.HISTORY_FLUSH_SEC,
+        id="flush_availability_history",
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        release_patterns.refresh_stale,
+        "interval",
+        minutes=1,
+        id="refresh_release_patterns",
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        availability_history.prune,
+        "interval",
+        hours=1,
+        id="prune_availability_history",
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        booking_coordinator.prune,
+        "interval",
+        minutes=10,
+        id="prune_booking_coordination",
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        watch_store.sync,
+        "interval",
+        seconds=settings.WATCH_SYNC_SEC,
+        id="sync_watches",
+        replace_existing=True,
+    )
+    # Watches run on their own heap scheduler on this loop, not as APScheduler jobs.
+    # Resume the ones persisted before the restart, staggered so they don't poll all at once.
+    notifier.start()
+    watch_registry.scheduler.start()
+    watch_store.adopt(spread=settings.WATCH_RESUME_SPREAD_SEC)
     yield
     # Shutdown: Stop the scheduler
+    await loop_monitor.stop()
+    await watch_registry.scheduler.stop()
+    await notifier.stop()
     scheduler.shutdown()
+    watch_store.close()
+    availability_history.flush()
+    cache_snapshots.save()
 
 
 app = FastAPI(title="Resy Backend API", lifespan=lifespan)
@@ -37,6 +118,13 @@ app = FastAPI(title="Resy Backend API", lifespan=lifespan)
 # Add request logging middleware (should be after error handlers but before other middleware)
 # app.add_middleware(RequestLoggingMiddleware)
 
+# Admission control: per-route-class concurrency limits and load shedding, before requests take a
+# threadpool thread. Added before CORS so CORS wraps it and 503s still carry CORS headers.
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+# Request deadlines wrap admission, so time spent queued counts against them
+app.add_middleware(DeadlineMiddleware)
+
 # CORS configuration - supports development and production
 # Parse CORS origins from environment variable
 cors_origins = settings.CORS_ORIGINS.split(",") if settings.CORS_ORIGINS != "*" else ["*"]
@@ -51,6 +139,7 @@ app.add_middleware(
 )
 
 app.include_router(resy_router, prefix="/api/v1")
+app.include_router(admin_router, prefix="/api/v1")
 
 
 @app.get("/")
@@ -0,0 +1,146 @@
+# app/services/auth_cache.py
+"""
+Reuse Resy auth tokens across tasks that log in with the same account.
+
+Every /login with email + password used to cost a /4/auth/password round
+trip. Tokens are cached per account so later tasks start without one,
+until the token is close to expiry; then the next login goes upstream
+again and re-caches.
+
+Only what is needed to hand out a token is kept: rows are keyed by an HMAC
+of the email, the password is checked against a salted scrypt verifier
+(the password itself is never stored, not even encrypted), and the token
+is Fernet-encrypted. The key comes from AUTH_CACHE_SECRET, which must be a
+dedicated secret: the cache stays off while it is unset, equal to the JWT
+secret or the shipped default. Secrets are never logged.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import jwt
+from cryptography.fernet import Fernet, InvalidToken
+
+from app.core.config import settings
+from app.core.state_store import connect_sqlite, dedicated_secret
+
+logger = logging.getLogger(__name__)
+
+# Used when a Resy token's expiry cannot be read from the token itself.
+DEFAULT_TOKEN_TTL_SEC = 6 * 3600
+
+
+def _derive_key(secret: str, purpose: bytes) -> bytes:
+    return hmac.new(secret.encode(), purpose, hashlib.sha256).digest()
+
+
+def _token_expiry(token: str, now: float) -> float:
+    """Resy auth tokens are JWTs; read `exp` without verifying (we only need the date)."""
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False})
+        exp = claims.get("exp")
+        if exp:
+            return float(exp)
+    except jwt.InvalidTokenError:
+        pass
+    return now + DEFAULT_TOKEN_TTL_SEC
+
+
+def _hash_password(password: str, salt: bytes) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=2 ** 14, r=8, p=1, dklen=32)
+
+
+class AuthCache:
+    SCHEMA = """
+    -- Earlier versions kept the credentials (encrypted) for background re-login; drop them
+    DROP TABLE IF EXISTS auth_cache;
+    CREATE TABLE IF NOT EXISTS auth_tokens (
+        account_key   TEXT PRIMARY KEY,
+        password_salt BLOB NOT NULL,
+        password_hash BLOB NOT NULL,
+        token         BLOB NOT NULL,
+        expires_at    REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_auth_tokens_expires_at ON auth_tokens(expires_at);
+    """
+
+    def __init__(self, path: str, secret: str, refresh_margin: float):
+        self.refresh_margin = refresh_margin
+        self._index_key = _derive_key(secret, b"resy-auth-cache-index")
+        self._fernet = Fernet(base64.urlsafe_b64encode(_derive_key(secret, b"resy-auth-cache-encryption")))
+        self._lock = threading.Lock()
+        self._conn = connect_sqlite(path)
+        self._conn.executescript(self.SCHEMA)
+
+    def _account_key(self, email: str) -> str:
+        return hmac.new(self._index_key, email.strip().lower().encode(), hashlib.sha256).hexdigest()
+
+    def get_token(self, email: str, password: str) -> Optional[str]:
+        """
+        Return a cached token for this account if the password matches and the
+        token is not about to expire; otherwise None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT password_salt, password_hash, token, expires_at FROM auth_tokens WHERE account_key = ?",
+                (self._account_key(email),),
+            ).fetchone()
+        if not row:
+            return None
+        salt, pw_hash, token, expires_at = row
+        if expires_at - time.time() < self.refresh_margin:
+            return None
+        if not hmac.compare_digest(_hash_password(password, salt), pw_hash):
+            return None
+        try:
+            return self._fernet.decrypt(token).decode()
+        except InvalidToken:
+            return None
+
+    def store(self, email: str, password: str, token: str) -> None:
+        salt = os.urandom(16)
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO auth_tokens (account_key, password_salt, password_hash, token, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(account_key) DO UPDATE SET
+                    password_salt = excluded.password_salt,
+                    password_hash = excluded.password_hash,
+                    token = excluded.token,
+                    expires_at = excluded.expires_at
+                """,
+                (self._account_key(email), salt, _hash_password(password, salt),
+                 self._fernet.encrypt(token.encode()), _token_expiry(token, time.time())),
+            )
+
+    def invalidate(self, email: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM auth_tokens WHERE account_key = ?", (self._account_key(email),))
+
+    def prune(self) -> None:
+        """Drop tokens that can no longer be handed out."""
+        with self._lock:
+            self._conn.execute("DELETE FROM auth_tokens WHERE expires_at < ?", (time.time() + self.refresh_margin,))
+
+
+def create_auth_cache() -> Optional[AuthCache]:
+    if not settings.AUTH_CACHE_ENABLED:
+        return None
+    secret = dedicated_secret(settings.AUTH_CACHE_SECRET)
+    if secret is None:
+        logger.error(
+            "Auth cache disabled: AUTH_CACHE_SECRET must be set to a dedicated secret "
+            "(not the JWT secret or a default value)"
+        )
+        return None
+    path = settings.STATE_DB_PATH if settings.STATE_BACKEND == "sqlite" else ":memory:"
+    return AuthCache(path=path, secret=secret, refresh_margin=settings.AUTH_CACHE_REFRESH_MARGIN_SEC)
+
+
+auth_cache = create_auth_cache()
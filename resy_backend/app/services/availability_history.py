@@ -0,0 +1,297 @@
+# app/services/availability_history.py
+"""
+Append-only history of when slots appear and disappear.
+
+Every find result we see (/slots, the next-available search, monitors) is
+handed to `record`, which only appends to an in-memory buffer. A scheduler
+job drains the buffer: it diffs each observation against the last snapshot
+stored for the same (venue, day, party size) and writes one row per slot
+that appeared or disappeared, plus the new snapshot, all in a single
+batched transaction. The snapshot lives in SQLite rather than in the
+process so that several workers observing the same venue-day do not each
+write the same events. Nothing on the request path writes to SQLite:
+queries read the flushed rows and add the events still-buffered
+observations will produce, computed the same way without writing them.
+
+Rows are compact (integers only: day ordinal, slot start as minute of day,
+observed-at, event code) and older than HISTORY_RETENTION_DAYS are pruned.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import date
+from typing import Any, Deque, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.state_store import connect_sqlite
+from app.services.slots import extract_slot_time
+
+logger = logging.getLogger(__name__)
+
+APPEARED = 1
+DISAPPEARED = -1
+# Slots open the first time a venue-day is observed at all: we don't know when they appeared
+FIRST_SEEN = 2
+
+_EVENT_NAMES = {APPEARED: "appeared", DISAPPEARED: "disappeared", FIRST_SEEN: "first_seen"}
+
+# (venue_id, day ordinal, party_size)
+_Key = Tuple[int, int, int]
+# (key, observed_at, slot starts) as queued by `record`
+_Observation = Tuple[_Key, float, Tuple[Optional[str], ...]]
+# slot_history row: (venue_id, day, party_size, slot_minute, observed_at, event)
+_Row = Tuple[int, int, int, int, float, int]
+
+
+def _slot_minutes(starts: Iterable[Optional[str]]) -> FrozenSet[int]:
+    minutes = set()
+    for start in starts:
+        t = extract_slot_time(start)
+        if t is not None:
+            minutes.add(t.hour * 60 + t.minute)
+    return frozenset(minutes)
+
+
+class AvailabilityHistory:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS slot_history (
+        venue_id    INTEGER NOT NULL,
+        day         INTEGER NOT NULL,
+        party_size  INTEGER NOT NULL,
+        slot_minute INTEGER NOT NULL,
+        observed_at REAL NOT NULL,
+        event       INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_slot_history_venue ON slot_history(venue_id, observed_at);
+    CREATE INDEX IF NOT EXISTS idx_slot_history_observed_at ON slot_history(observed_at);
+
+    -- Last slot set written per key, shared by all workers
+    CREATE TABLE IF NOT EXISTS slot_snapshots (
+        venue_id    INTEGER NOT NULL,
+        day         INTEGER NOT NULL,
+        party_size  INTEGER NOT NULL,
+        slots       TEXT NOT NULL,  -- JSON list of slot minutes
+        observed_at REAL NOT NULL,
+        PRIMARY KEY (venue_id, day, party_size)
+    );
+    """
+
+    def __init__(self, path: str, retention_sec: float, max_pending: int = 50000):
+        self.retention_sec = retention_sec
+        self._conn = connect_sqlite(path)
+        self._conn.executescript(self.SCHEMA)
+        # Observations waiting for the next flush; if flushing stalls the oldest are dropped
+        self._pending: Deque[_Observation] = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+
+    # ---------- Request path ----------
+
+    def record(
+        self,
+        venue_id: int,
+        day: str,
+        party_size: int,
+        slot_starts: Iterable[Optional[str]],
+        observed_at: Optional[float] = None,
+    ) -> None:
+        """Queue one observation (the full, unfiltered slot list for a venue-day). Cheap; no I/O."""
+        key = (int(venue_id), date.fromisoformat(day).toordinal(), int(party_size))
+        self._pending.append((key, observed_at or time.time(), tuple(slot_starts)))
+
+    # ---------- Background ----------
+
+    def _snapshot(self, key: _Key) -> Optional[Tuple[FrozenSet[int], float]]:
+        """Last stored (slots, observed_at) for `key`, or None if the key was never recorded."""
+        row = self._conn.execute(
+            "SELECT slots, observed_at FROM slot_snapshots WHERE venue_id = ? AND day = ? AND party_size = ?",
+            key,
+        ).fetchone()
+        if row:
+            return frozenset(json.loads(row[0])), row[1]
+        # Written before snapshots existed: rebuild from the events
+        slots = self._replay_events(key)
+        return None if slots is None else (slots, 0.0)
+
+    def _replay_events(self, key: _Key) -> Optional[FrozenSet[int]]:
+        """Slots the event history says are currently open for `key`, or None if there are no events."""
+        rows = self._conn.execute(
+            "SELECT slot_minute, event FROM slot_history WHERE venue_id = ? AND day = ? AND party_size = ? "
+            "ORDER BY observed_at",
+            key,
+        ).fetchall()
+        if not rows:
+            return None
+        latest = dict(rows)
+        return frozenset(minute for minute, event in latest.items() if event != DISAPPEARED)
+
+    def _diff(
+        self,
+        observations: Iterable[_Observation],
+        snapshots: Dict[_Key, Optional[Tuple[FrozenSet[int], float]]],
+    ) -> List[_Row]:
+        """
+        Event rows for `observations`, diffed against the stored snapshots
+        (loaded into `snapshots` as needed, which is left holding the new ones).
+        Caller holds the lock.
+        """
+        rows: List[_Row] = []
+        for key, observed_at, starts in observations:
+            if key not in snapshots:
+                snapshots[key] = self._snapshot(key)
+            snapshot = snapshots[key]
+            appeared = APPEARED
+            if snapshot is None:
+                previous, appeared = frozenset(), FIRST_SEEN
+            elif observed_at < snapshot[1]:
+                continue  # another worker already wrote a newer observation
+            else:
+                previous = snapshot[0]
+            current = _slot_minutes(starts)
+            snapshots[key] = (current, observed_at)
+            venue_id, day, party_size = key
+            for minute in current - previous:
+                rows.append((venue_id, day, party_size, minute, observed_at, appeared))
+            for minute in previous - current:
+                rows.append((venue_id, day, party_size, minute, observed_at, DISAPPEARED))
+        return rows
+
+    def _buffered(self, venue_id: int) -> List[_Row]:
+        """
+        Rows the next flush will write for a venue's queued observations,
+        computed without writing anything. Caller holds the lock (so no flush
+        runs in between).
+        """
+        observations = [o for o in list(self._pending) if o[0][0] == venue_id]
+        return self._diff(observations, {}) if observations else []
+
+    def flush(self) -> int:
+        """Scheduler job: diff queued observations and write the events in one transaction. Returns rows written."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            # BEGIN IMMEDIATE so two workers flushing the same key serialise on the snapshot
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                observations = [self._pending.popleft() for _ in range(len(self._pending))]
+                snapshots: Dict[_Key, Optional[Tuple[FrozenSet[int], float]]] = {}
+                rows = self._diff(observations, snapshots)
+                self._conn.executemany(
+                    "INSERT INTO slot_history (venue_id, day, party_size, slot_minute, observed_at, event) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.executemany(
+                    """
+                    INSERT INTO slot_snapshots (venue_id, day, party_size, slots, observed_at) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(venue_id, day, party_size) DO UPDATE SET
+                        slots = excluded.slots, observed_at = excluded.observed_at
+                    """,
+                    [(*key, json.dumps(sorted(snap[0])), snap[1]) for key, snap in snapshots.items() if snap],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return len(rows)
+
+    def prune(self) -> int:
+        """Scheduler job: drop rows past retention and snapshots for days that are over."""
+        cutoff = time.time() - self.retention_sec
+        yesterday = date.today().toordinal() - 1
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM slot_history WHERE observed_at < ?", (cutoff,)).rowcount
+            self._conn.execute("DELETE FROM slot_snapshots WHERE day < ?", (yesterday,))
+        if deleted:
+            logger.info("Availability history: pruned %d row(s)", deleted)
+        return deleted
+
+    # ---------- Queries ----------
+
+    def events(
+        self,
+        venue_id: int,
+        party_size: Optional[int] = None,
+        day: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 1000,
+    ) -> List[Dict[str, Any]]:
+        """
+        Appeared/disappeared/first_seen events for a venue, oldest first,
+        including those of observations not flushed yet.
+        """
+        since, until = since or 0.0, until or float("inf")
+        day_ord = date.fromisoformat(day).toordinal() if day is not None else None
+        sql = ("SELECT day, party_size, slot_minute, observed_at, event FROM slot_history "
+               "WHERE venue_id = ? AND observed_at >= ? AND observed_at <= ?")
+        params: List[Any] = [int(venue_id), since, until]
+        if party_size is not None:
+            sql += " AND party_size = ?"
+            params.append(int(party_size))
+        if day_ord is not None:
+            sql += " AND day = ?"
+            params.append(day_ord)
+        sql += " ORDER BY observed_at, day, slot_minute LIMIT ?"
+        params.append(int(limit))
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            buffered = self._buffered(int(venue_id))
+        if buffered:
+            rows += [
+                row[1:] for row in buffered
+                if since <= row[4] <= until
+                and (party_size is None or row[2] == int(party_size))
+                and (day_ord is None or row[1] == day_ord)
+            ]
+            rows = sorted(rows, key=lambda r: (r[3], r[0], r[2]))[:int(limit)]
+
+        events = []
+        for day_ord, size, minute, observed_at, event in rows:
+            d = date.fromordinal(day_ord).isoformat()
+            events.append({
+                "day": d,
+                "party_size": size,
+                "slot_start": f"{d} {minute // 60:02d}:{minute % 60:02d}",
+                "observed_at": observed_at,
+                "event": _EVENT_NAMES[event],
+            })
+        return events
+
+    def appearances(
+        self, venue_id: int, since: float = 0.0, buffered: bool = True
+    ) -> List[Tuple[int, int, int, float]]:
+        """
+        Raw (day ordinal, party_size, slot_minute, observed_at) rows of slots that
+        appeared at a venue. `buffered=False` leaves out observations not flushed
+        yet (at most HISTORY_FLUSH_SEC old), which saves diffing them.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, party_size, slot_minute, observed_at FROM slot_history "
+                "WHERE venue_id = ? AND observed_at >= ? AND event = ? ORDER BY observed_at",
+                (int(venue_id), since, APPEARED),
+            ).fetchall()
+            pending = self._buffered(int(venue_id)) if buffered else []
+        extra = [(r[1], r[2], r[3], r[4]) for r in pending if r[5] == APPEARED and r[4] >= since]
+        return sorted(rows + extra, key=lambda r: r[3]) if extra else rows
+
+
+def timeline(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Group events by observation: one entry per poll that saw slots drop or vanish."""
+    points: List[Dict[str, Any]] = []
+    for e in events:
+        if not points or points[-1]["observed_at"] != e["observed_at"]:
+            points.append({"observed_at": e["observed_at"], "appeared": 0, "disappeared": 0, "first_seen": 0})
+        points[-1][e["event"]] += 1
+    return points
+
+
+def create_availability_history() -> AvailabilityHistory:
+    path = settings.STATE_DB_PATH if settings.STATE_BACKEND == "sqlite" else ":memory:"
+    return AvailabilityHistory(path=path, retention_sec=settings.HISTORY_RETENTION_DAYS * 24 * 3600)
+
+
+availability_history = create_availability_history()
@@ -0,0 +1,298 @@
+# app/services/availability_index.py
+"""
+In-memory availability per (venue, party size): one bit per day.
+
+Every /4/venue/calendar and /4/find response we see is folded in, so the
+calendar route (and monitors) can answer from memory while the data is
+fresh and only go upstream to refresh it.
+
+Each bitmap is a pair of Python ints over day ordinals starting at `base`:
+`known` marks days we have data for, `available` the days with inventory.
+Range checks, "first available day after X" and change detection are plain
+shifts, masks and XOR instead of walking date lists.
+
+Bitmaps survive restarts through a snapshot (see cache_snapshots); a
+(venue, party size) not yet in memory is read from the startup snapshot
+the first time it is asked for.
+"""
+import json
+import struct
+import threading
+import time
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.snapshots import Entry, Snapshot, merge_entries
+
+# Days in the past are dropped once the bitmap base is this far behind today.
+_PAST_DAYS_KEPT = 1
+# Longest calendar range folded in at once (the routes reject longer ones up front)
+MAX_RANGE_DAYS = settings.CALENDAR_MAX_RANGE_DAYS
+# Snapshot key: (venue_id, party_size)
+_SNAPSHOT_KEY = struct.Struct(">qi")
+
+
+@lru_cache(maxsize=4096)
+def _ordinal(day: str) -> int:
+    return date.fromisoformat(day).toordinal()
+
+
+@lru_cache(maxsize=4096)
+def _iso(ordinal: int) -> str:
+    return date.fromordinal(ordinal).isoformat()
+
+
+def _span(first: int, last: int) -> int:
+    """Mask with bits first..last (inclusive) set."""
+    if last < first:
+        return 0
+    return ((1 << (last - first + 1)) - 1) << first
+
+
+def _bits_to_days(bits: int, base: int) -> List[str]:
+    # Scanning the binary string is much cheaper than peeling bits off a big int one by one
+    digits = bin(bits)[:1:-1]  # least significant bit first
+    days = []
+    i = digits.find("1")
+    while i != -1:
+        days.append(_iso(base + i))
+        i = digits.find("1", i + 1)
+    return days
+
+
+class AvailabilityBitmap:
+    __slots__ = ("base", "known", "available", "calendar_span", "calendar_at", "updated_at")
+
+    def __init__(self, base: int):
+        self.base = base
+        self.known = 0
+        self.available = 0
+        self.calendar_span = (0, -1)  # day range of the last calendar refresh
+        self.calendar_at = 0.0
+        self.updated_at = 0.0   # last change of any kind
+
+    def _rebase(self, first: int) -> None:
+        """Make sure day `first` is addressable, moving `base` back if needed."""
+        if first < self.base:
+            shift = self.base - first
+            self.known <<= shift
+            self.available <<= shift
+            self.base = first
+
+    def trim(self, today: int) -> None:
+        """Forget days before `today - _PAST_DAYS_KEPT`."""
+        cut = today - _PAST_DAYS_KEPT - self.base
+        if cut > 0:
+            self.known >>= cut
+            self.available >>= cut
+            self.base += cut
+
+    def set_range(self, first: int, last: int, available_days: Iterable[int]) -> None:
+        """
+        Replace days first..last: the given days become available, the rest
+        unavailable. Raises ValueError for ranges over MAX_RANGE_DAYS.
+        """
+        if last - first + 1 > MAX_RANGE_DAYS:
+            raise ValueError(f"calendar range over {MAX_RANGE_DAYS} days")
+        self._rebase(first)
+        mask = _span(first - self.base, last - self.base)
+        digits = ["0"] * (last - first + 1)
+        for d in available_days:
+            if first <= d <= last:
+                digits[last - d] = "1"  # most significant (latest day) first
+        bits = int("".join(digits), 2) << (first - self.base) if digits else 0
+        self.known |= mask
+        self.available = (self.available & ~mask) | bits
+
+    def set_day(self, day: int, is_available: bool) -> None:
+        self._rebase(day)
+        bit = 1 << (day - self.base)
+        self.known |= bit
+        if is_available:
+            self.available |= bit
+        else:
+            self.available &= ~bit
+
+    def days_between(self, first: int, last: int) -> List[str]:
+        lo = max(first, self.base)
+        if last < lo:
+            return []
+        return _bits_to_days(self.available & _span(lo - self.base, last - self.base), self.base)
+
+    def first_available(self, first: int, last: Optional[int] = None) -> Optional[str]:
+        """Earliest available day >= first (and <= last, if given)."""
+        offset = max(first - self.base, 0)
+        bits = self.available >> offset
+        if last is not None:
+            if last - self.base < offset:
+                return None
+            bits &= (1 << (last - self.base - offset + 1)) - 1
+        if not bits:
+            return None
+        return _iso(self.base + offset + (bits & -bits).bit_length() - 1)
+
+    def snapshot(self) -> Tuple[int, int]:
+        """(base, available) pair to hand to `changes_since` later."""
+        return self.base, self.available
+
+    def to_json(self) -> bytes:
+        return json.dumps([
+            self.base, format(self.known, "x"), format(self.available, "x"),
+            *self.calendar_span, self.calendar_at, self.updated_at,
+        ]).encode()
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "AvailabilityBitmap":
+        base, known, available, span_first, span_last, calendar_at, updated_at = json.loads(data)
+        bitmap = cls(base)
+        bitmap.known, bitmap.available = int(known, 16), int(available, 16)
+        bitmap.calendar_span = (span_first, span_last)
+        bitmap.calendar_at, bitmap.updated_at = calendar_at, updated_at
+        return bitmap
+
+    def changes_since(self, snapshot: Tuple[int, int]) -> Tuple[List[str], List[str]]:
+        """(days that became available, days that stopped being available) since `snapshot`."""
+        prev_base, prev = snapshot
+        base = min(prev_base, self.base)
+        prev <<= prev_base - base
+        now = self.available << (self.base - base)
+        changed = prev ^ now
+        return _bits_to_days(changed & now, base), _bits_to_days(changed & prev, base)
+
+
+class AvailabilityIndex:
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._bitmaps: Dict[Tuple[int, int], AvailabilityBitmap] = {}
+        self._snapshot: Optional[Snapshot] = None
+
+    def __len__(self) -> int:
+        return len(self._bitmaps)
+
+    def _get(self, venue_id: int, party_size: int) -> Optional[AvailabilityBitmap]:
+        """Bitmap for the key, from memory or else the startup snapshot. Caller holds the lock."""
+        key = (int(venue_id), int(party_size))
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None and self._snapshot is not None:
+            found = self._snapshot.get(_SNAPSHOT_KEY.pack(*key))
+            if found is not None:
+                bitmap = AvailabilityBitmap.from_json(found[0])
+                bitmap.trim(date.today().toordinal())
+                self._bitmaps[key] = bitmap
+        return bitmap
+
+    def _bitmap(self, venue_id: int, party_size: int, first: int) -> AvailabilityBitmap:
+        key = (int(venue_id), int(party_size))
+        bitmap = self._get(*key)
+        if bitmap is None:
+            bitmap = AvailabilityBitmap(first)
+            self._bitmaps[key] = bitmap
+        bitmap.trim(date.today().toordinal())
+        return bitmap
+
+    # ---------- Updates ----------
+
+    def record_calendar(
+        self,
+        venue_id: int,
+        party_size: int,
+        start_date: str,
+        end_date: str,
+        available_dates: Iterable[str],
+    ) -> None:
+        """Fold in a calendar response: `available_dates` are open, every other day in the range is not."""
+        first, last = _ordinal(start_date), _ordinal(end_date)
+        now = time.time()
+        with self._lock:
+            bitmap = self._bitmap(venue_id, party_size, first)
+            bitmap.set_range(first, last, (_ordinal(d) for d in available_dates))
+            bitmap.calendar_span = (first, last)
+            bitmap.calendar_at = now
+            bitmap.updated_at = now
+
+    def record_find(self, venue_id: int, party_size: int, day: str, has_slots: bool) -> None:
+        """Fold in a /4/find response for one day (any slots at all means the day is available)."""
+        d = _ordinal(day)
+        with self._lock:
+            bitmap = self._bitmap(venue_id, party_size, d)
+            bitmap.set_day(d, has_slots)
+            bitmap.updated_at = time.time()
+
+    # ---------- Queries ----------
+
+    def available_dates(
+        self,
+        venue_id: int,
+        party_size: int,
+        start_date: str,
+        end_date: str,
+        max_age: Optional[float] = None,
+    ) -> Optional[List[str]]:
+        """
+        Available days in [start_date, end_date] if the last calendar refresh
+        covered the whole range and is younger than `max_age` (default: the
+        index max age); None means "ask upstream".
+        """
+        first, last = _ordinal(start_date), _ordinal(end_date)
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            bitmap = self._get(venue_id, party_size)
+            if bitmap is None or time.time() - bitmap.calendar_at > max_age:
+                return None
+            span_first, span_last = bitmap.calendar_span
+            if first < span_first or last > span_last:
+                return None
+            return bitmap.days_between(first, last)
+
+    def first_available(
+        self,
+        venue_id: int,
+        party_size: int,
+        after: str,
+        until: Optional[str] = None,
+    ) -> Optional[str]:
+        """Earliest known-available day on or after `after` (and on or before `until`)."""
+        with self._lock:
+            bitmap = self._get(venue_id, party_size)
+            if bitmap is None:
+                return None
+            return bitmap.first_available(_ordinal(after), _ordinal(until) if until else None)
+
+    def snapshot(self, venue_id: int, party_size: int) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            bitmap = self._get(venue_id, party_size)
+            return bitmap.snapshot() if bitmap is not None else None
+
+    def changes_since(
+        self,
+        venue_id: int,
+        party_size: int,
+        snapshot: Optional[Tuple[int, int]],
+    ) -> Tuple[List[str], List[str]]:
+        """(newly available days, no longer available days) since `snapshot` (None = empty)."""
+        with self._lock:
+            bitmap = self._get(venue_id, party_size)
+            if bitmap is None:
+                return [], []
+            return bitmap.changes_since(snapshot or (bitmap.base, 0))
+
+    # ---------- Snapshots ----------
+
+    def attach_snapshot(self, snapshot: Snapshot) -> None:
+        self._snapshot = snapshot
+
+    def snapshot_entries(self, now: float) -> Iterator[Entry]:
+        """Bitmaps last touched within CACHE_SNAPSHOT_MAX_AGE_SEC (older ones expire in the snapshot)."""
+        with self._lock:
+            items = [(key, bitmap.to_json(), bitmap.updated_at) for key, bitmap in self._bitmaps.items()]
+        memory = (
+            (_SNAPSHOT_KEY.pack(*key), data, updated_at + settings.CACHE_SNAPSHOT_MAX_AGE_SEC)
+            for key, data, updated_at in items
+        )
+        return merge_entries(memory, self._snapshot, now)
+
+
+availability_index = AvailabilityIndex(max_age=settings.AVAILABILITY_CACHE_TTL_SEC)
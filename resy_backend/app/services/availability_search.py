@@ -0,0 +1,248 @@
+# app/services/availability_search.py
+"""
+"Next available anywhere": find open tables across several venues and a
+date range in one request.
+
+Doing this from the browser means venuesearch, then /4/venue/calendar per
+venue, then /4/find per venue-day, all one after another. Here it runs as a
+pipeline on a small thread pool:
+
+  1. candidate venues come from the local venue catalog (upstream venuesearch
+     only when the catalog knows nothing nearby), nearest first;
+  2. one calendar call per venue prunes the date range to days with
+     inventory;
+  3. /4/find runs for the surviving venue-days, at most `fanout` calls in
+     flight, earliest day / nearest venue first;
+  4. slots go through the same time-window filter as /slots.
+
+Events are yielded as they happen so the route can stream them. A result is
+one venue-day with at least one matching slot, ranked by (day, venue
+distance). The search stops as soon as it has `limit` results and nothing
+still queued or running could rank ahead of them; queued calls are then
+dropped. It also stops (with `complete` false) once the request's deadline
+has passed or its client has gone away.
+"""
+import heapq
+import queue as queue_module
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.deadlines import carry, current_deadline
+from app.services.availability_history import AvailabilityHistory
+from app.services.availability_index import AvailabilityIndex
+from app.services.resy_client import ResyClient, ResyClientError
+from app.services.slots import filter_slots_by_window, parse_find_slots
+from app.services.venue_catalog import VenueCatalog, distance_from, record_from_search_hit
+
+_CALENDAR = "calendar"
+_FIND = "find"
+
+
+def candidate_venues(
+    resy_client: ResyClient,
+    catalog: VenueCatalog,
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    query: str = "",
+    max_venues: int = 20,
+    day: Optional[str] = None,
+    party_size: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Venues within `radius_km` matching `query`, nearest first, as
+    {"venue_id", "name", "distance_km"} dicts. Served from the catalog; falls
+    back to one upstream venuesearch (indexed into the catalog) when the
+    catalog has nothing in range. Raises ResyClientError from that call.
+    """
+    local = catalog.search_near(query, latitude, longitude, radius_km, limit=max_venues)
+    if not local and not catalog.query_is_fresh(query, latitude, longitude):
+        res_json = resy_client.venue_search(
+            latitude=latitude,
+            longitude=longitude,
+            query=query,
+            day=day,
+            party_size=party_size,
+            per_page=max_venues,
+        )
+        hits = (res_json.get("search") or {}).get("hits") or []
+        records = [record_from_search_hit(hit) for hit in hits if isinstance(hit, dict)]
+        records = [r for r in records if r is not None]
+        catalog.ingest_search(records, None if (day or party_size) else query, latitude, longitude)
+
+        distance_to = distance_from(latitude, longitude)
+        local = []
+        for r in records:
+            if r.latitude is None or r.longitude is None:
+                continue
+            distance = distance_to(r.latitude, r.longitude)
+            if distance <= radius_km:
+                local.append((r, distance))
+        local.sort(key=lambda pair: pair[1])
+        local = local[:max_venues]
+
+    return [
+        {"venue_id": r.venue_id, "name": r.name, "distance_km": round(d, 3)}
+        for r, d in local
+    ]
+
+
+def available_days(calendar_json: Dict[str, Any], start_date: str, end_date: str) -> List[str]:
+    """Days in [start_date, end_date] the calendar reports as bookable, in order."""
+    return sorted(
+        x["date"] for x in calendar_json.get("scheduled", [])
+        if x.get("inventory", {}).get("reservation") == "available"
+        and start_date <= x.get("date", "") <= end_date
+    )
+
+
+def search_available(
+    resy_clients: List[ResyClient],
+    venues: List[Dict[str, Any]],
+    party_size: int,
+    start_date: str,
+    end_date: str,
+    time_start: Optional[str] = None,
+    time_end: Optional[str] = None,
+    limit: int = 5,
+    fanout: int = 8,
+    index: Optional[AvailabilityIndex] = None,
+    history: Optional[AvailabilityHistory] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Run the calendar -> find pipeline over `venues` (ranked: earlier in the
+    list wins ties on the same day) and yield events. Each call in flight
+    has one of `resy_clients` to itself, so at most len(resy_clients) run
+    at once (see ClientManager.use_clients):
+
+      {"event": "result", "venue_id", "name", "distance_km", "day", "slots"}
+      {"event": "error", "stage", "venue_id", "day", "detail"}
+      {"event": "done", "results": [...top `limit`...], "complete", "calendar_calls", "find_calls"}
+
+    With an `index`, fresh calendar data is taken from it instead of going
+    upstream, and every calendar/find response is recorded in it. Find
+    responses are also recorded in `history`.
+
+    `complete` is False only when the deadline ran out or the client went
+    away first; stopping once nothing left could rank in the top `limit` is
+    still complete. Closing the generator cancels whatever is still queued
+    and waits for calls already running.
+    """
+    # Jobs are ordered by the best (day, venue rank) they could still produce,
+    # so the head of the heap bounds everything not yet seen. A calendar job
+    # could yield any day of the range, hence start_date.
+    queue: List[Tuple[str, int, str]] = [(start_date, rank, _CALENDAR) for rank in range(len(venues))]
+    heapq.heapify(queue)
+    in_flight: Dict[Future, Tuple[str, int, str]] = {}
+    results: List[Tuple[Tuple[str, int], Dict[str, Any]]] = []
+    calls = {_CALENDAR: 0, _FIND: 0}
+    fanout = max(1, min(fanout, len(resy_clients)))
+    idle_clients: "queue_module.SimpleQueue[ResyClient]" = queue_module.SimpleQueue()
+    for client in resy_clients[:fanout]:
+        idle_clients.put(client)
+
+    def kth_key() -> Optional[Tuple[str, int]]:
+        if len(results) < limit:
+            return None
+        return results[limit - 1][0]
+
+    def can_stop() -> bool:
+        kth = kth_key()
+        if kth is None:
+            return False
+        bounds = [job[:2] for job in in_flight.values()]
+        if queue:
+            bounds.append(queue[0][:2])
+        return not bounds or kth < min(bounds)
+
+    def run(job: Tuple[str, int, str]) -> Dict[str, Any]:
+        day, rank, stage = job
+        venue_id = str(venues[rank]["venue_id"])
+        # Never blocks: there are as many clients as calls in flight
+        resy_client = idle_clients.get()
+        try:
+            if stage == _CALENDAR:
+                return resy_client.get_calendar(
+                    venue_id=venue_id, num_seats=party_size, start_date=start_date, end_date=end_date
+                )
+            return resy_client.find(venue_id=venue_id, num_seats=party_size, day=day)
+        finally:
+            idle_clients.put(resy_client)
+
+    executor = ThreadPoolExecutor(max_workers=fanout, thread_name_prefix="availability")
+    deadline = current_deadline()
+    complete = True
+    try:
+        while queue or in_flight:
+            if can_stop():
+                break  # the top `limit` are settled
+            if deadline is not None and deadline.expired():
+                complete = False
+                break
+            while queue and len(in_flight) < fanout:
+                job = heapq.heappop(queue)
+                if job[2] == _CALENDAR and index is not None:
+                    venue_id = venues[job[1]]["venue_id"]
+                    cached = index.available_dates(venue_id, party_size, start_date, end_date)
+                    if cached is not None:
+                        for d in cached:
+                            heapq.heappush(queue, (d, job[1], _FIND))
+                        continue
+                calls[job[2]] += 1
+                in_flight[executor.submit(carry(run), job)] = job
+
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            # Handle completions in rank order so ties stream deterministically
+            for future in sorted(done, key=lambda f: in_flight[f]):
+                day, rank, stage = in_flight.pop(future)
+                venue = venues[rank]
+                try:
+                    payload = future.result()
+                except ResyClientError as e:
+                    yield {
+                        "event": "error",
+                        "stage": stage,
+                        "venue_id": venue["venue_id"],
+                        "day": None if stage == _CALENDAR else day,
+                        "detail": f"Upstream error: {e.message}",
+                    }
+                    continue
+
+                if stage == _CALENDAR:
+                    days = available_days(payload, start_date, end_date)
+                    if index is not None:
+                        index.record_calendar(venue["venue_id"], party_size, start_date, end_date, days)
+                    for d in days:
+                        heapq.heappush(queue, (d, rank, _FIND))
+                    continue
+
+                all_slots = parse_find_slots(payload)
+                if index is not None:
+                    index.record_find(venue["venue_id"], party_size, day, bool(all_slots))
+                if history is not None:
+                    history.record(venue["venue_id"], day, party_size, [slot["start"] for slot in all_slots])
+                slots = filter_slots_by_window(all_slots, time_start, time_end)
+                if not slots:
+                    continue
+                result = {
+                    "venue_id": venue["venue_id"],
+                    "name": venue.get("name"),
+                    "distance_km": venue.get("distance_km"),
+                    "day": day,
+                    "slots": slots,
+                }
+                results.append(((day, rank), result))
+                results.sort(key=lambda pair: pair[0])
+                yield {"event": "result", **result}
+
+        yield {
+            "event": "done",
+            "results": [r for _, r in results[:limit]],
+            "complete": complete,
+            "calendar_calls": calls[_CALENDAR],
+            "find_calls": calls[_FIND],
+        }
+    finally:
+        # Drop queued work, but let calls already on the wire finish: they use
+        # the caller's clients, which must not go back to the pool mid-request.
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,168 @@
+# app/services/booking_coordinator.py
+"""
+Exactly-once booking across tasks and workers.
+
+  * Slot leases: before committing a booking, a task leases the slot
+    (venue, day, time) in the shared state store. Another task chasing the
+    same slot gets a 409-style rejection right away, instead of spending an
+    attempt on a slot that is about to be gone (or booking it twice). Leases
+    expire on their own; a definite failure releases the lease early.
+  * No blind resends: ResyClient never retries a /3/book that upstream may
+    have acted on. When the outcome is ambiguous (timeout, 5xx, dropped
+    connection) the coordinator looks for the reservation in the user's
+    upcoming reservations instead.
+
+Idempotency keys for /reservation/book live in the route, on top of the
+same state store.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.deadlines import deadline_scope
+from app.core.state_store import state_store
+from app.services.resy_client import DeadlineExceeded, ResyClient, ResyClientError
+from app.services.slots import extract_slot_time, parse_config_token
+
+logger = logging.getLogger(__name__)
+
+# (venue_id, "YYYY-MM-DD", "HH:MM")
+SlotRef = Tuple[int, str, str]
+
+
+class SlotLeasedError(ResyClientError):
+    """Another task holds the lease on the slot; treated like an upstream rejection (409)."""
+
+    def __init__(self, key: str):
+        super().__init__("Slot is being booked by another task", status_code=409, details={"slot": key})
+
+
+def booking_definitely_failed(error: ResyClientError) -> bool:
+    """
+    True if Resy clearly refused the booking, or it was never sent (so trying
+    again or elsewhere cannot double book).
+    """
+    if isinstance(error, DeadlineExceeded):
+        return True
+    return error.status_code is not None and 400 <= error.status_code < 500 and error.status_code != 408
+
+
+def slot_ref(config_id: Optional[str], venue_id: Optional[int] = None, start: Optional[str] = None) -> Optional[SlotRef]:
+    """SlotRef from a config token, or from a venue id and slot start ("YYYY-MM-DD HH:MM:SS")."""
+    parsed = parse_config_token(config_id)
+    if parsed is not None:
+        return parsed
+    t = extract_slot_time(start)
+    if venue_id is None or t is None:
+        return None
+    return int(venue_id), start[:10], f"{t.hour:02d}:{t.minute:02d}"
+
+
+def slot_key(ref: SlotRef) -> str:
+    venue_id, day, hhmm = ref
+    return f"{venue_id}:{day}:{hhmm}"
+
+
+def _matches(reservation: Dict[str, Any], ref: SlotRef) -> bool:
+    venue_id, day, hhmm = ref
+    venue = reservation.get("venue") or {}
+    rid = venue.get("id")
+    if isinstance(rid, dict):
+        rid = rid.get("resy")
+    return (
+        str(rid) == str(venue_id)
+        and reservation.get("day") == day
+        and str(reservation.get("time_slot") or "")[:5] == hhmm
+    )
+
+
+class BookingCoordinator:
+    def __init__(self, store=None, lease_ttl: float = 120.0, preview_ttl: float = 600.0):
+        self.store = store if store is not None else state_store
+        self.lease_ttl = lease_ttl
+        self.preview_ttl = preview_ttl
+        self._lock = threading.Lock()
+        # book_token -> (slot, expires_at), so /reservation/book knows which slot a token is for
+        self._previews: Dict[str, Tuple[SlotRef, float]] = {}
+
+    # ---------- Book tokens ----------
+
+    def remember_preview(self, book_token: str, ref: Optional[SlotRef]) -> None:
+        if ref is None:
+            return
+        now = time.time()
+        with self._lock:
+            if len(self._previews) > 1000:
+                self._previews = {t: v for t, v in self._previews.items() if v[1] > now}
+            self._previews[book_token] = (ref, now + self.preview_ttl)
+
+    def slot_for_token(self, book_token: str) -> Optional[SlotRef]:
+        entry = self._previews.get(book_token)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    # ---------- Booking ----------
+
+    def find_reservation(self, resy_client: ResyClient, ref: SlotRef) -> Optional[Dict[str, Any]]:
+        """The user's upcoming reservation for `ref`, if there is one."""
+        for attempt in range(settings.BOOKING_CONFIRM_ATTEMPTS):
+            if attempt:
+                time.sleep(settings.BOOKING_CONFIRM_DELAY_SEC)  # the reservation list may lag the booking
+            try:
+                reservations = resy_client.get_reservations().get("reservations") or []
+            except ResyClientError as e:
+                logger.warning("Could not list reservations to confirm a booking: %s", e.message)
+                continue
+            for reservation in reservations:
+                if _matches(reservation, ref):
+                    return reservation
+        return None
+
+    def book(
+        self,
+        resy_client: ResyClient,
+        task_id: str,
+        ref: Optional[SlotRef],
+        submit: Callable[[], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        Lease `ref` and run `submit` (the actual /3/book call). Raises
+        SlotLeasedError if another task holds the slot. An ambiguous
+        failure is settled against the user's reservations: if the booking is
+        there it counts as success, otherwise the error is re-raised and the
+        lease is kept until it expires.
+        """
+        key = slot_key(ref) if ref is not None else None
+        if key is not None and not self.store.claim_slot(key, task_id, time.time(), self.lease_ttl):
+            raise SlotLeasedError(key)
+
+        try:
+            return submit()
+        except ResyClientError as e:
+            if booking_definitely_failed(e):
+                if key is not None:
+                    self.store.release_slot(key, task_id)
+                raise
+            if ref is None:
+                raise
+            # Settle the outcome even if the request's deadline has passed: the claim depends on it
+            with deadline_scope(None):
+                reservation = self.find_reservation(resy_client, ref)
+            if reservation is None:
+                raise
+            logger.warning("Booking for %s failed ambiguously (%s) but went through", key, e.message)
+            return {"reservation": reservation, "confirmed_from": "reservations"}
+
+    def prune(self) -> None:
+        """Scheduler job: drop expired leases and old idempotency keys."""
+        now = time.time()
+        self.store.prune_slot_leases(now)
+        self.store.prune_idempotency(now - settings.IDEMPOTENCY_TTL_SEC)
+        with self._lock:
+            self._previews = {t: v for t, v in self._previews.items() if v[1] > now}
+
+
+booking_coordinator = BookingCoordinator(lease_ttl=settings.SLOT_LEASE_TTL_SEC)
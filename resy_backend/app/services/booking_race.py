@@ -0,0 +1,115 @@
+# app/services/booking_race.py
+"""
+Race mode for contested drops: preview several candidate slots at once and
+book the best one that can still be had.
+
+The sequential flow previews one config_id (/3/details) and books it; if the
+slot was taken in the meantime the whole find -> preview -> book cycle
+starts over. Here the top N ranked slots are previewed in parallel. As soon
+as the best-ranked slot that is still possible has returned a book_token
+(every better one has failed), it is booked. If that booking is definitely
+rejected, the next token in rank order is tried. Remaining previews are
+abandoned (their book tokens simply expire). Previews in flight each have
+a client of their own, and bookings run on the calling thread with the
+caller's client: a requests.Session is not shared between threads (see
+ClientManager.use_clients).
+
+At most one booking is ever attempted at a time and the race stops at the
+first success. A booking failure that might still have gone through
+upstream (network error, timeout, 5xx) ends the race without trying
+another slot. Callers are expected to hold the task's booking claim
+(state_store.claim_booking) around the race, and to book through the
+booking coordinator so slots leased by other tasks are skipped.
+"""
+import queue as queue_module
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.deadlines import carry
+from app.services.booking_coordinator import booking_definitely_failed
+from app.services.resy_client import ResyClient, ResyClientError
+
+BOOKED = "booked"
+FAILED = "failed"
+UNKNOWN = "unknown"  # a booking call failed in a way that may still have booked
+
+
+def _book_token(preview: Dict[str, Any]) -> Optional[str]:
+    return (preview.get("book_token") or {}).get("value")
+
+
+def race_book(
+    preview_clients: List[ResyClient],
+    candidates: List[Dict[str, Any]],
+    day: str,
+    party_size: int,
+    book: Callable[[Dict[str, Any], str], Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Preview `candidates` (slot dicts, best first) in parallel, at most
+    len(preview_clients) at once (none of them the client `book` uses), and book the best one that returns a
+    book_token, via `book(slot, book_token)`.
+
+    Returns {"status": "booked" | "failed" | "unknown", "slot", "result",
+    "attempts"} where `attempts` lists every preview/book call with its outcome.
+    """
+    n = len(candidates)
+    tokens: List[Any] = [None] * n  # None: preview pending; False: unusable; str: book token
+    attempts: List[Dict[str, Any]] = []
+    outcome: Dict[str, Any] = {"status": FAILED, "slot": None, "result": None, "attempts": attempts}
+    if not n:
+        return outcome
+
+    workers = max(1, min(n, len(preview_clients)))
+    idle_clients: "queue_module.SimpleQueue[ResyClient]" = queue_module.SimpleQueue()
+    for client in preview_clients[:workers]:
+        idle_clients.put(client)
+
+    def preview(slot: Dict[str, Any]) -> Dict[str, Any]:
+        # Never blocks: there are as many clients as previews in flight
+        resy_client = idle_clients.get()
+        try:
+            return resy_client.getReservation(config_id=slot["token"], day=day, party_size=party_size)
+        finally:
+            idle_clients.put(resy_client)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="race")
+    try:
+        futures = {executor.submit(carry(preview), slot): i for i, slot in enumerate(candidates)}
+        best = 0  # every candidate ranked above this one is unusable
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                token = _book_token(future.result())
+                error = None if token else "No book_token returned"
+            except ResyClientError as e:
+                token, error = None, f"Upstream error: {e.message}"
+            tokens[i] = token or False
+            attempts.append({"stage": "preview", "config_id": candidates[i]["token"], "ok": bool(token), "error": error})
+
+            # Book in rank order: only once everything ranked above has failed
+            while best < n and tokens[best] is not None:
+                if tokens[best] is False:
+                    best += 1
+                    continue
+                slot = candidates[best]
+                try:
+                    result = book(slot, tokens[best])
+                except ResyClientError as e:
+                    attempts.append({"stage": "book", "config_id": slot["token"], "ok": False,
+                                     "error": f"Upstream error: {e.message}"})
+                    if not booking_definitely_failed(e):
+                        outcome.update(status=UNKNOWN, slot=slot)
+                        return outcome
+                    tokens[best] = False
+                    best += 1
+                    continue
+                attempts.append({"stage": "book", "config_id": slot["token"], "ok": True, "error": None})
+                outcome.update(status=BOOKED, slot=slot, result=result)
+                return outcome
+            if best >= n:
+                break
+        return outcome
+    finally:
+        # Previews still running use the caller's clients; let them finish before they are released
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,87 @@
+# app/services/cache_snapshots.py
+"""
+Warm starts: the in-memory caches snapshot to disk and pick up where they
+left off after a restart or deploy.
+
+  venue_catalog       venues seen so far + which searches were fetched upstream
+  venue_resolver      venue URL -> id lookups
+  availability_index  per-venue calendar bitmaps
+
+(Sessions, profiles and cached logins already live in the shared state
+store and the auth cache, so they are warm without this.)
+
+Each cache is written to CACHE_SNAPSHOT_DIR/<name>.snap every
+CACHE_SNAPSHOT_SEC and at shutdown. On startup `load` only maps the files
+(see app.core.snapshots), which is instant; caches read entries from the
+mapping the first time they are asked for one, and the catalog, whose
+search indexes need every venue, is rebuilt by a one-off background job
+(`warm`). Snapshots older than CACHE_SNAPSHOT_MAX_AGE_SEC are ignored, and
+each entry keeps the expiry its cache would have given it.
+"""
+import logging
+import os
+import time
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.core.snapshots import open_snapshot, write_snapshot
+from app.services.availability_index import availability_index
+from app.services.venue_catalog import venue_catalog
+from app.services.venue_resolver import venue_resolver
+
+logger = logging.getLogger(__name__)
+
+
+class CacheSnapshots:
+    def __init__(self, directory: str, max_age: float):
+        self.directory = directory
+        self.max_age = max_age
+        self._caches: Dict[str, Any] = {}
+
+    def register(self, name: str, cache: Any) -> None:
+        """`cache` provides attach_snapshot(snapshot) and snapshot_entries(now), optionally warm_from_snapshot()."""
+        self._caches[name] = cache
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.snap")
+
+    def load(self) -> int:
+        """Map every cache's snapshot and hand it to the cache. Returns how many were found."""
+        loaded = 0
+        for name, cache in self._caches.items():
+            snapshot = open_snapshot(self._path(name), self.max_age)
+            if snapshot is None:
+                continue
+            cache.attach_snapshot(snapshot)
+            loaded += 1
+            logger.info("Attached %s snapshot (%d entries, %.0fs old)", name, len(snapshot), time.time() - snapshot.created_at)
+        return loaded
+
+    def warm(self) -> None:
+        """One-off background job after `load`: bulk-load the caches that need everything in memory."""
+        for name, cache in self._caches.items():
+            warm = getattr(cache, "warm_from_snapshot", None)
+            if warm is None:
+                continue
+            started = time.monotonic()
+            count = warm()
+            if count:
+                logger.info("Warmed %s with %d entries in %.2fs", name, count, time.monotonic() - started)
+
+    def save(self) -> int:
+        """Scheduler job (and shutdown): snapshot every cache. Returns the total entries written."""
+        os.makedirs(self.directory, exist_ok=True)
+        total = 0
+        for name, cache in self._caches.items():
+            now = time.time()
+            try:
+                total += write_snapshot(self._path(name), cache.snapshot_entries(now), now)
+            except OSError as e:
+                logger.error("Could not snapshot %s: %s", name, e)
+        return total
+
+
+cache_snapshots = CacheSnapshots(settings.CACHE_SNAPSHOT_DIR, settings.CACHE_SNAPSHOT_MAX_AGE_SEC)
+cache_snapshots.register("venue_catalog", venue_catalog)
+cache_snapshots.register("venue_resolver", venue_resolver)
+cache_snapshots.register("availability_index", availability_index)
@@ -1,80 +1,279 @@
-import json
+import heapq
+import threading
 import time
-import os
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from app.services.resy_client import ResyClient
 from app.core.config import settings
+from app.core.state_store import state_store
+from app.core.token_manager import revoke_task_tokens
 
 
 # ---------- Client Storage ----------
 
+class TaskSession:
+    """
+    Compact per-task record. Only the session material is kept between
+    requests; a live ResyClient is attached while the task has calls in flight.
+    """
+
+    __slots__ = ("task_id", "auth_token", "cookies", "created_at", "last_access", "client", "in_flight", "dropped")
+
+    def __init__(self, task_id: str, now: float):
+        self.task_id = task_id
+        self.auth_token = ""
+        self.cookies: Optional[Dict[str, str]] = None
+        self.created_at = now
+        self.last_access = now
+        self.client: Optional[ResyClient] = None
+        self.in_flight = 0
+        # Logged out while calls were in flight; the last release closes the client
+        self.dropped = False
+
+
 class ClientManager:
-    def __init__(self):
-        self.resy_client_storage = {}
-        self.storage_file = "tasks.json"
+    """
+    Maps task ids to ResyClient instances.
+
+    Session material (auth token, cookies, last access) lives in the shared
+    state store so any worker can serve any task. Locally each task is a
+    TaskSession; ResyClients come from a small pool and are only attached
+    while a request for the task is running (see use_client). Expiry is
+    driven by a heap of deadlines instead of scanning every task.
+    """
+
+    def __init__(self, store=None):
+        self.sessions: Dict[str, TaskSession] = {}
+        self.store = store if store is not None else state_store
         self.max_age = 200 # 200 seconds
+        self.touch_interval = 5 # only write last access to the store this often
+        self.max_idle_clients = 32 # pooled ResyClients kept around between requests
+
+        self._lock = threading.Lock()
+        self._idle_clients: List[ResyClient] = []
+        self._expiry_heap: List[Tuple[float, str]] = []
+
+    def _new_client(self) -> ResyClient:
+        return ResyClient(
+            api_key=settings.RESY_API_KEY,
+            user_agent=settings.USER_AGENT,
+            request_timeout=settings.REQUEST_TIMEOUT
+        )
+
+    def get_resy_client(self, task_id: str) -> ResyClient:
+        """
+        Attach a client to the task and return it. Every call must be paired
+        with release_resy_client; prefer the use_client context manager.
+        """
+        return self._acquire(task_id, touch=True).client
+
+    def _acquire(self, task_id: str, touch: bool) -> TaskSession:
+        now = time.time()
+        stored = self.store.load_session(task_id)
+
+        with self._lock:
+            session = self.sessions.get(task_id)
+            if session is None:
+                session = TaskSession(task_id, now)
+                if not touch:
+                    # Background use must not revive an idle task
+                    session.last_access = stored["last_access"] if stored else now - self.max_age
+                self.sessions[task_id] = session
+                heapq.heappush(self._expiry_heap, (session.last_access + self.max_age, task_id))
+
+            # Another worker may have logged this task in (or refreshed its token) since we last saw it
+            if stored:
+                if stored["auth_token"] and stored["auth_token"] != session.auth_token:
+                    session.auth_token = stored["auth_token"]
+                    if session.client is not None:
+                        session.client.setToken(token=session.auth_token)
+                if stored["cookies"] and stored["cookies"] != session.cookies:
+                    session.cookies = stored["cookies"]
+                    if session.client is not None:
+                        session.client.setCookie(session.cookies)
+
+            if session.client is None:
+                client = self._idle_clients.pop() if self._idle_clients else self._new_client()
+                client.load_state(session.auth_token, session.cookies)
+                session.client = client
+            session.in_flight += 1
+            if not touch:
+                return session
+            session.last_access = now
+
+        if not stored or now - stored["last_access"] >= self.touch_interval:
+            self.store.touch_session(task_id, now)
 
-    def _load_tasks(self):
-        """Load tasks from JSON file, return empty dict if file doesn't exist."""
-        if not os.path.exists(self.storage_file):
-            return {}
+        return session
+
+    def release_resy_client(self, task_id: str) -> None:
+        """Detach the task's client once no calls are in flight and return it to the pool."""
+        with self._lock:
+            session = self.sessions.get(task_id)
+        if session is not None:
+            self._release(session)
+
+    def _release(self, session: TaskSession) -> None:
+        changed_cookies = None
+        with self._lock:
+            if session.client is None:
+                return
+            session.in_flight -= 1
+            if session.in_flight > 0:
+                return
+
+            client = session.client
+            session.client = None
+            if session.dropped:
+                # The task logged out; its token and cookies must not be reused
+                client.session.close()
+                return
+            state = client.export_state()
+            session.auth_token = state["auth_token"]
+            if (state["cookies"] or None) != session.cookies:
+                session.cookies = state["cookies"] or None
+                changed_cookies = state["cookies"]
+
+            if len(self._idle_clients) < self.max_idle_clients:
+                client.load_state()
+                self._idle_clients.append(client)
+            else:
+                client.session.close()
+
+        # Upstream set new cookies during this request; share them with the other workers
+        if changed_cookies is not None:
+            self.store.save_session(session.task_id, session.auth_token, changed_cookies, time.time())
+
+    @contextmanager
+    def use_client(self, task_id: str, touch: bool = True) -> Iterator[ResyClient]:
+        """
+        Borrow the task's client for the duration of the block. Background
+        work (watch polls, profile refreshes) passes touch=False so it does
+        not count as activity; a task with watches keeps its stored session
+        anyway (see expire_sessions), and only its local record is dropped
+        while idle.
+        """
+        session = self._acquire(task_id, touch)
         try:
-            with open(self.storage_file, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-
-    def _save_tasks(self, tasks):
-        """Save tasks to JSON file."""
-        with open(self.storage_file, "w") as f:
-            json.dump(tasks, f)
-
-    def get_resy_client(self, task_id: str):
-        tasks = self._load_tasks()
-        task = tasks.get(task_id, None)
-
-        if not task:
-            # New task - create client
-            resy_client = ResyClient(
-                api_key=settings.RESY_API_KEY,
-                user_agent=settings.USER_AGENT,
-                request_timeout=settings.REQUEST_TIMEOUT
-            )
-            self.resy_client_storage[task_id] = resy_client
-        else:
-            # Existing task - get from memory or create if missing
-            resy_client = self.resy_client_storage.get(task_id, None)
-
-            # If the client is for some reason in json but not in memory, create a new one
-            if not resy_client:
-                resy_client = ResyClient(
-                    api_key=settings.RESY_API_KEY,
-                    user_agent=settings.USER_AGENT,
-                    request_timeout=settings.REQUEST_TIMEOUT
-                )
-                self.resy_client_storage[task_id] = resy_client
-
-        # Update last accessed time
-        tasks[task_id] = {"lastUpdated": time.time()}
-        self._save_tasks(tasks)
-
-        return resy_client
+            yield session.client
+        finally:
+            self._release(session)
+
+    @contextmanager
+    def use_clients(self, task_id: str, n: int) -> Iterator[List[ResyClient]]:
+        """
+        Borrow `n` clients carrying the task's session, for work that calls
+        upstream from several threads at once: a requests.Session is not
+        meant to be shared between threads. The first is the task's own
+        client (see use_client); the others come from the pool and go back
+        to it afterwards. Cookies upstream sets on those extra clients are
+        not kept.
+        """
+        with self.use_client(task_id) as primary:
+            state = primary.export_state()
+            with self._lock:
+                extras = [self._idle_clients.pop() for _ in range(min(n - 1, len(self._idle_clients)))]
+            extras += [self._new_client() for _ in range(n - 1 - len(extras))]
+            for client in extras:
+                client.load_state(state["auth_token"], state["cookies"])
+            try:
+                yield [primary] + extras
+            finally:
+                with self._lock:
+                    for client in extras:
+                        if len(self._idle_clients) < self.max_idle_clients:
+                            client.load_state()
+                            self._idle_clients.append(client)
+                        else:
+                            client.session.close()
+
+    def save_session(self, task_id: str) -> None:
+        """Persist the task's auth token and cookies so other workers can pick them up."""
+        with self._lock:
+            session = self.sessions.get(task_id)
+            if session is None:
+                return
+            if session.client is not None:
+                state = session.client.export_state()
+                session.auth_token = state["auth_token"]
+                session.cookies = state["cookies"] or None
+            auth_token, cookies = session.auth_token, session.cookies or {}
+        self.store.save_session(task_id, auth_token, cookies, time.time())
+
+    def authenticated_task_ids(self) -> List[str]:
+        """Live tasks in this process that have a Resy auth token."""
+        with self._lock:
+            return [t for t, s in self.sessions.items() if s.auth_token or (s.client and s.client.userAuth)]
+
+    def stats(self, limit: int = 100) -> Dict[str, Any]:
+        """
+        Live tasks (most recently used first, at most `limit`), pooled clients
+        and their outbound connections, for the admin runtime endpoint.
+        """
+        now = time.time()
+        with self._lock:
+            sessions = sorted(self.sessions.values(), key=lambda s: s.last_access, reverse=True)
+            tasks = [
+                {
+                    "task_id": s.task_id,
+                    "age_sec": round(now - s.created_at, 1),
+                    "idle_sec": round(now - s.last_access, 1),
+                    "in_flight": s.in_flight,
+                    "authenticated": bool(s.auth_token or (s.client and s.client.userAuth)),
+                }
+                for s in sessions[:limit]
+            ]
+            in_flight = sum(s.in_flight for s in sessions)
+            attached = [s.client for s in sessions if s.client is not None]
+            idle = list(self._idle_clients)
+
+        connections = {"in_use": 0, "idle": 0, "opened": 0}
+        for client in attached + idle:
+            for k, v in client.pool_stats().items():
+                connections[k] += v
+        return {
+            "tasks": {"live": len(sessions), "in_flight": in_flight, "items": tasks},
+            "clients": {"attached": len(attached), "pooled": len(idle), "max_pooled": self.max_idle_clients},
+            "connections": connections,
+        }
+
+    def drop_task(self, task_id: str) -> None:
+        """
+        Forget a task everywhere (logout). In-flight calls finish on their
+        attached client, which the last of them closes.
+        """
+        with self._lock:
+            session = self.sessions.pop(task_id, None)
+            if session is not None:
+                session.dropped = True
+        self.store.delete_sessions([task_id])
+        revoke_task_tokens([task_id])
 
     def clean_up_old_clients(self):
-        tasks = self._load_tasks()
         current_time = time.time()
-        tasks_to_remove = []
-
-        # Find tasks to remove (can't modify dict while iterating)
-        for task_id, task in tasks.items():
-            if current_time - task["lastUpdated"] > self.max_age:
-                tasks_to_remove.append(task_id)
+        cutoff = current_time - self.max_age
 
-        # Remove from both storage and tasks dict
-        for task_id in tasks_to_remove:
-            self.resy_client_storage.pop(task_id, None)
-            tasks.pop(task_id, None)
+        # Sessions expired in the shared store (possibly idle here but used on another worker).
+        # Their session tokens die with them.
+        store_expired = self.store.expire_sessions(cutoff)
+        revoke_task_tokens(store_expired)
 
-        # Save updated tasks
-        self._save_tasks(tasks)
+        with self._lock:
+            for task_id in store_expired:
+                session = self.sessions.get(task_id)
+                if session is not None and session.in_flight == 0:
+                    del self.sessions[task_id]
 
+            # Pop deadlines that have passed; re-arm the ones that were touched since
+            heap = self._expiry_heap
+            while heap and heap[0][0] <= current_time:
+                _, task_id = heapq.heappop(heap)
+                session = self.sessions.get(task_id)
+                if session is None:
+                    continue
+                expires_at = session.last_access + self.max_age
+                if expires_at > current_time or session.in_flight:
+                    heapq.heappush(heap, (max(expires_at, current_time + 1), task_id))
+                    continue
+                del self.sessions[task_id]
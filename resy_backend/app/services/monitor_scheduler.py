@@ -0,0 +1,212 @@
+# app/services/monitor_scheduler.py
+"""
+Scheduler for thousands of monitor polls on one event loop.
+
+One asyncio task sleeps until the earliest due key in a heap, hands every
+due key to a bounded thread pool (polls are blocking HTTP calls) and goes
+back to sleep. A key is rescheduled when its poll finishes, after the delay
+the poll returned, so a key is never polled twice at once. Removing a key
+just invalidates its heap entry (lazy deletion), so add/remove are
+O(log n) and bulk operations don't rebuild anything.
+
+Jitter only ever pulls a poll earlier (by up to `jitter` of its delay), so
+polls that would land on the same tick spread out without ever sleeping
+past the time the caller asked for (e.g. a predicted release window).
+
+`stats()` reports the lag between the scheduled and actual fire time
+(dispatch) and until the poll actually started (includes waiting for a
+free worker).
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def percentiles_ms(samples: Iterable[float]) -> Dict[str, float]:
+    """p50/p99/max of samples in seconds, reported in milliseconds."""
+    values = sorted(samples)
+    if not values:
+        return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+    n = len(values)
+    return {
+        "p50": round(values[n // 2] * 1000, 3),
+        "p99": round(values[min(n - 1, int(n * 0.99))] * 1000, 3),
+        "max": round(values[-1] * 1000, 3),
+    }
+
+
+class MonitorScheduler:
+    def __init__(
+        self,
+        callback: Callable[[Hashable], Optional[float]],
+        max_workers: int = 8,
+        jitter: float = 0.1,
+        error_delay: float = 60.0,
+        lag_samples: int = 4096,
+    ):
+        """
+        `callback(key)` runs on a worker thread and returns the delay until
+        the key's next run, or None to drop the key.
+        """
+        self.callback = callback
+        self.max_workers = max_workers
+        self.jitter = jitter
+        self.error_delay = error_delay
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._live: Dict[Hashable, int] = {}   # key -> sequence number of its valid heap entry
+        self._running: Set[Hashable] = set()
+        self._dropped: Set[Hashable] = set()   # removed while running: don't reschedule
+        self._seq = itertools.count()
+        self._fired = 0
+        self._dispatch_lag: Deque[float] = deque(maxlen=lag_samples)
+        self._start_lag: Deque[float] = deque(maxlen=lag_samples)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __len__(self) -> int:
+        return len(self._live) + len(self._running)
+
+    # ---------- Scheduling (any thread) ----------
+
+    def _push(self, key: Hashable, when: float) -> None:
+        seq = next(self._seq)
+        self._live[key] = seq
+        heapq.heappush(self._heap, (when, seq, key))
+
+    def _wake(self) -> None:
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def schedule(self, key: Hashable, delay: float = 0.0) -> None:
+        """Run `key` after `delay` seconds (replacing any pending run). No-op while it is running."""
+        self.schedule_many([(key, delay)])
+
+    def schedule_many(self, items: Iterable[Tuple[Hashable, float]]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for key, delay in items:
+                if key in self._running:
+                    self._dropped.discard(key)  # it reschedules itself when done
+                    continue
+                self._push(key, now + max(delay, 0.0))
+        self._wake()
+
+    def spread(self, keys: Iterable[Hashable], window: float) -> None:
+        """Schedule `keys` at random points over the next `window` seconds (no burst at once)."""
+        self.schedule_many((key, random.uniform(0.0, window)) for key in keys)
+
+    def cancel(self, key: Hashable) -> None:
+        self.cancel_many([key])
+
+    def cancel_many(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            for key in keys:
+                self._live.pop(key, None)
+                if key in self._running:
+                    self._dropped.add(key)
+            # Compact when most entries are dead, so memory tracks the live keys
+            if len(self._heap) > 64 and len(self._heap) > 4 * len(self._live):
+                self._heap = [e for e in self._heap if self._live.get(e[2]) == e[1]]
+                heapq.heapify(self._heap)
+
+    # ---------- Event loop ----------
+
+    def start(self) -> None:
+        """Start dispatching on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="monitor")
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._loop = None
+        self._wakeup = None
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None and self._executor is not None
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            due: List[Tuple[float, Hashable]] = []
+            with self._lock:
+                heap = self._heap
+                while heap and heap[0][0] <= now:
+                    when, seq, key = heapq.heappop(heap)
+                    if self._live.get(key) != seq:
+                        continue  # cancelled or rescheduled
+                    del self._live[key]
+                    self._running.add(key)
+                    due.append((when, key))
+                timeout = heap[0][0] - now if heap else None
+
+            for when, key in due:
+                self._dispatch_lag.append(now - when)
+                future = self._executor.submit(self._call, key, when)
+                future.add_done_callback(lambda f, key=key: self._finished(key, f))
+            self._fired += len(due)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _call(self, key: Hashable, when: float) -> Optional[float]:
+        self._start_lag.append(time.monotonic() - when)
+        return self.callback(key)
+
+    def _finished(self, key: Hashable, future: Future) -> None:
+        # Worker thread (or the loop, if cancelled): reschedule with the delay the poll asked for
+        if future.cancelled():
+            delay: Optional[float] = 0.0  # shut down before it ran; due again on the next start
+        elif future.exception() is not None:
+            logger.error("Monitor job %r failed", key, exc_info=future.exception())
+            delay = self.error_delay
+        else:
+            delay = future.result()
+        with self._lock:
+            self._running.discard(key)
+            if key in self._dropped:
+                self._dropped.discard(key)
+                return
+            if delay is None:
+                return
+            if self.jitter and delay > 0:
+                delay -= delay * random.uniform(0.0, self.jitter)
+            self._push(key, time.monotonic() + delay)
+        self._wake()
+
+    # ---------- Introspection ----------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            scheduled, running = len(self._live), len(self._running)
+        return {
+            "scheduled": scheduled,
+            "running": running,
+            "fired": self._fired,
+            "dispatch_lag_ms": percentiles_ms(list(self._dispatch_lag)),
+            "start_lag_ms": percentiles_ms(list(self._start_lag)),
+        }
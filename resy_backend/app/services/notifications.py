@@ -0,0 +1,484 @@
+# app/services/notifications.py
+"""
+Slot-found notifications for watches, delivered from the backend.
+
+When a watch's matching slots change to a non-empty set, the registry
+publishes an event. `publish` is safe from any thread and never blocks: it
+hands the event to the event loop and returns, so polling never waits on a
+webhook or mail server. Events repeating the last slot set sent for a watch
+are dropped.
+
+On the loop, each configured sink has its own queue and `concurrency`
+worker coroutines. A worker takes up to `batch_size` events (waiting at
+most NOTIFY_BATCH_WAIT_SEC for more after the first), sends them as one
+batch and retries failures with exponential backoff. Sinks deliver a batch
+per destination (webhook URL, email recipient) and report which
+destinations failed, so only those events are retried. A slow or failing
+sink never holds up the others.
+
+Per-watch destinations come from API users, so webhook URLs are checked
+(see check_webhook_url) when the watch is created and again before every
+delivery, and redirects are not followed. Because DNS may answer
+differently by the time we connect, the webhook session also checks the
+address it actually connected to and refuses non-public ones.
+
+Sinks (NOTIFY_SINKS, comma separated):
+  stdout   one JSON line per event (development)
+  file     JSON lines appended to NOTIFY_FILE_PATH (tests)
+  webhook  POST {"events": [...]} to the watch's webhook_url (or NOTIFY_WEBHOOK_URL)
+  smtp     one email per recipient: the watch's email (or NOTIFY_EMAIL_TO)
+"""
+import abc
+import asyncio
+import ipaddress
+import json
+import logging
+import random
+import smtplib
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from email.message import EmailMessage
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Destinations ----------
+
+def _split_setting(value: str) -> List[str]:
+    return [v.strip().lower() for v in value.split(",") if v.strip()]
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_webhook_url(url: str) -> None:
+    """
+    Raise ValueError unless `url` is an http(s) URL we may POST to: on a
+    NOTIFY_WEBHOOK_ALLOWED_HOSTS host if that is set, otherwise on a host
+    that resolves only to public addresses (no loopback, private,
+    link-local or reserved ranges).
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("webhook_url must be an http(s) URL")
+    host = parts.hostname.lower()
+    allowed_hosts = _split_setting(settings.NOTIFY_WEBHOOK_ALLOWED_HOSTS)
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise ValueError(f"webhook_url host {host!r} is not allowed")
+        return
+    try:
+        infos = socket.getaddrinfo(host, parts.port or 443, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"webhook_url host {host!r} does not resolve")
+    for info in infos:
+        if not _is_public(info[4][0]):
+            raise ValueError(f"webhook_url host {host!r} resolves to a non-public address")
+
+
+class _PublicPeerMixin:
+    """
+    Re-check the address actually connected to, so a host that resolved to
+    public addresses in check_webhook_url cannot be re-pointed at an
+    internal one before the POST. Hosts on the allowlist are trusted by name.
+    """
+
+    def _new_conn(self):
+        sock = super()._new_conn()
+        if not _split_setting(settings.NOTIFY_WEBHOOK_ALLOWED_HOSTS) and not _is_public(sock.getpeername()[0]):
+            sock.close()
+            raise ValueError(f"webhook_url host {self.host!r} resolves to a non-public address")
+        return sock
+
+
+class _PublicHTTPConnection(_PublicPeerMixin, HTTPConnection):
+    pass
+
+
+class _PublicHTTPSConnection(_PublicPeerMixin, HTTPSConnection):
+    pass
+
+
+class _PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+
+class _PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+
+class _PublicOnlyAdapter(HTTPAdapter):
+    """Transport adapter whose connections raise ValueError when they reach a non-public address."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _PublicHTTPConnectionPool,
+            "https": _PublicHTTPSConnectionPool,
+        }
+
+
+def email_allowed(email: str, account_email: Optional[str]) -> bool:
+    """Per-watch emails may only go to the account's own (verified) address or configured ones."""
+    email = email.strip().lower()
+    if account_email and email == account_email.strip().lower():
+        return True
+    if settings.NOTIFY_EMAIL_TO and email == settings.NOTIFY_EMAIL_TO.strip().lower():
+        return True
+    return email in _split_setting(settings.NOTIFY_EMAIL_ALLOWED)
+
+
+# ---------- Sinks ----------
+
+class DeliveryError(Exception):
+    """
+    Part of a batch was not delivered: `failed` events should be retried,
+    `rejected` is how many were dropped for good (e.g. a disallowed URL).
+    """
+
+    def __init__(self, message: str, failed: List[Dict[str, Any]], rejected: int = 0):
+        super().__init__(message)
+        self.failed = failed
+        self.rejected = rejected
+
+
+class NotificationSink(abc.ABC):
+    """
+    Delivers batches of events. `send` runs on a worker thread; it raises
+    DeliveryError when only some events failed, any other exception to have
+    the whole batch retried.
+    """
+
+    name = "sink"
+
+    def __init__(self, concurrency: int = 1, batch_size: int = 20):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+
+    def accepts(self, event: Dict[str, Any]) -> bool:
+        return True
+
+    @abc.abstractmethod
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        ...
+
+
+class StdoutSink(NotificationSink):
+    name = "stdout"
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        sys.stdout.write("".join(json.dumps(e) + "\n" for e in events))
+        sys.stdout.flush()
+
+
+class FileSink(NotificationSink):
+    name = "file"
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e) + "\n" for e in events))
+
+
+class WebhookSink(NotificationSink):
+    name = "webhook"
+
+    def __init__(self, default_url: Optional[str], timeout: float, **kwargs):
+        super().__init__(**kwargs)
+        self.default_url = default_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", _PublicOnlyAdapter())
+        self.session.mount("https://", _PublicOnlyAdapter())
+        if default_url:  # the operator's own URL is trusted, wherever it points
+            parts = urlsplit(default_url)
+            self.session.mount(f"{parts.scheme}://{parts.netloc}/", HTTPAdapter())
+
+    def _url(self, event: Dict[str, Any]) -> Optional[str]:
+        return (event.get("notify") or {}).get("webhook_url") or self.default_url
+
+    def accepts(self, event: Dict[str, Any]) -> bool:
+        return self._url(event) is not None
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        by_url: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for event in events:
+            by_url[self._url(event)].append(event)
+        failed: List[Dict[str, Any]] = []
+        rejected = 0
+        errors = []
+        for url, batch in by_url.items():
+            try:
+                if url != self.default_url:  # the operator's own URL is trusted
+                    check_webhook_url(url)
+                resp = self.session.post(url, json={"events": batch}, timeout=self.timeout, allow_redirects=False)
+                if resp.status_code >= 300:
+                    raise requests.HTTPError(f"{resp.status_code} from webhook", response=resp)
+            except ValueError as e:  # disallowed URL, also when found at connect time
+                rejected += len(batch)
+                errors.append(str(e))
+            except requests.RequestException as e:
+                failed.extend(batch)
+                errors.append(str(e))
+        if failed or rejected:
+            raise DeliveryError("; ".join(errors), failed, rejected)
+
+
+class SmtpSink(NotificationSink):
+    name = "smtp"
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        sender: str,
+        default_to: Optional[str],
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.host, self.port = host, port
+        self.sender, self.default_to = sender, default_to
+        self.username, self.password = username, password
+
+    def _to(self, event: Dict[str, Any]) -> Optional[str]:
+        return (event.get("notify") or {}).get("email") or self.default_to
+
+    def accepts(self, event: Dict[str, Any]) -> bool:
+        return self._to(event) is not None
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        by_to: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for event in events:
+            by_to[self._to(event)].append(event)
+        delivered = set()
+        errors = []
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=15) as smtp:
+                smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password or "")
+                for to, batch in by_to.items():
+                    msg = EmailMessage()
+                    msg["From"], msg["To"] = self.sender, to
+                    msg["Subject"] = f"Resy: tables found at {len(batch)} watch(es)"
+                    lines = []
+                    for e in batch:
+                        lines.append(f"Venue {e['venue_id']} on {e['day']} for {e['party_size']}:")
+                        lines.extend(f"  {s.get('start')}  {s.get('type') or ''}" for s in e["slots"])
+                    msg.set_content("\n".join(lines))
+                    try:
+                        smtp.send_message(msg)
+                    except smtplib.SMTPRecipientsRefused as e:
+                        errors.append(str(e))
+                        continue
+                    delivered.add(to)
+        except (smtplib.SMTPException, OSError) as e:
+            # Connection-level failure: retry only the recipients not reached yet
+            errors.append(str(e))
+        failed = [e for to, batch in by_to.items() if to not in delivered for e in batch]
+        if failed:
+            raise DeliveryError("; ".join(errors), failed)
+
+
+def sinks_from_settings() -> List[NotificationSink]:
+    options = {"concurrency": settings.NOTIFY_CONCURRENCY, "batch_size": settings.NOTIFY_BATCH_SIZE}
+    sinks: List[NotificationSink] = []
+    for name in (n.strip() for n in settings.NOTIFY_SINKS.split(",")):
+        if not name:
+            continue
+        if name == "stdout":
+            sinks.append(StdoutSink(**options))
+        elif name == "file":
+            sinks.append(FileSink(settings.NOTIFY_FILE_PATH, **options))
+        elif name == "webhook":
+            sinks.append(WebhookSink(settings.NOTIFY_WEBHOOK_URL, settings.NOTIFY_WEBHOOK_TIMEOUT_SEC, **options))
+        elif name == "smtp":
+            if not settings.SMTP_HOST or not settings.SMTP_FROM:
+                raise ValueError("The smtp notification sink needs SMTP_HOST and SMTP_FROM")
+            sinks.append(SmtpSink(
+                settings.SMTP_HOST, settings.SMTP_PORT, settings.SMTP_FROM, settings.NOTIFY_EMAIL_TO,
+                username=settings.SMTP_USERNAME, password=settings.SMTP_PASSWORD, **options,
+            ))
+        else:
+            raise ValueError(f"Unknown notification sink: {name!r}")
+    return sinks
+
+
+# ---------- Pipeline ----------
+
+class Notifier:
+    def __init__(
+        self,
+        sinks: List[NotificationSink],
+        queue_size: int = 10000,
+        batch_wait: float = 0.5,
+        max_attempts: int = 5,
+        backoff_base: float = 1.0,
+    ):
+        self.sinks = sinks
+        self.queue_size = queue_size
+        self.batch_wait = batch_wait
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self._lock = threading.Lock()
+        self._last_sent: Dict[str, frozenset] = {}  # watch_id -> slot tokens last published
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: List[asyncio.Task] = []
+        self._stats: Dict[str, Dict[str, int]] = {
+            s.name: {"sent": 0, "failed": 0, "retried": 0, "dropped": 0} for s in sinks
+        }
+        self._deduped = 0
+
+    # ---------- Producers (any thread) ----------
+
+    def publish(self, event: Dict[str, Any]) -> bool:
+        """Queue a slot-found event for every sink that takes it. Never blocks; False if not queued."""
+        if not self.sinks:
+            return False
+        tokens = frozenset(s.get("token") for s in event["slots"])
+        with self._lock:
+            if self._last_sent.get(event["watch_id"]) == tokens:
+                self._deduped += 1
+                return False
+            loop = self._loop
+            try:
+                if loop is None:
+                    raise RuntimeError("not started")
+                loop.call_soon_threadsafe(self._enqueue, event)
+            except RuntimeError:  # not started, or the loop closed
+                logger.warning("Notification for watch %s dropped: notifier not running", event["watch_id"])
+                return False
+            # Only once queued, so a dropped event is sent again on the next poll
+            self._last_sent[event["watch_id"]] = tokens
+        return True
+
+    def forget(self, watch_id: str) -> None:
+        """Drop dedup state for a removed watch."""
+        with self._lock:
+            self._last_sent.pop(watch_id, None)
+
+    def _enqueue(self, event: Dict[str, Any]) -> None:
+        for sink in self.sinks:
+            if not sink.accepts(event):
+                continue
+            try:
+                self._queues[sink.name].put_nowait(event)
+            except asyncio.QueueFull:
+                self._stats[sink.name]["dropped"] += 1
+
+    # ---------- Workers (event loop) ----------
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        for sink in self.sinks:
+            self._queues[sink.name] = asyncio.Queue(maxsize=self.queue_size)
+            for _ in range(max(1, sink.concurrency)):
+                self._workers.append(self._loop.create_task(self._worker(sink)))
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """Give queued notifications a moment to go out, then stop the workers."""
+        if self._queues:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(q.join() for q in self._queues.values())), drain_timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Stopping with undelivered notifications")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+        self._loop = None
+
+    async def _next_batch(self, sink: NotificationSink, queue: asyncio.Queue) -> List[Dict[str, Any]]:
+        batch = [await queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < sink.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self, sink: NotificationSink) -> None:
+        queue = self._queues[sink.name]
+        stats = self._stats[sink.name]
+        while True:
+            batch = await self._next_batch(sink, queue)
+            try:
+                pending = batch
+                for attempt in range(1, self.max_attempts + 1):
+                    try:
+                        await asyncio.to_thread(sink.send, pending)
+                        stats["sent"] += len(pending)
+                        break
+                    except DeliveryError as e:
+                        # Retry only the destinations that failed
+                        stats["sent"] += len(pending) - len(e.failed) - e.rejected
+                        if e.rejected:
+                            stats["failed"] += e.rejected
+                            logger.warning("Notification sink %s rejected %d event(s): %s", sink.name, e.rejected, e)
+                        pending, error = e.failed, e
+                    except Exception as e:
+                        error = e
+                    if not pending:
+                        break
+                    if attempt == self.max_attempts:
+                        stats["failed"] += len(pending)
+                        logger.error(
+                            "Notification sink %s gave up on %d event(s): %s", sink.name, len(pending), error
+                        )
+                        break
+                    stats["retried"] += 1
+                    delay = self.backoff_base * (2 ** (attempt - 1)) + random.random() * 0.3
+                    logger.warning("Notification sink %s failed (%s); retrying in %.1fs", sink.name, error, delay)
+                    await asyncio.sleep(delay)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    # ---------- Introspection ----------
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "deduped": self._deduped,
+            "sinks": {
+                name: {**counts, "queued": self._queues[name].qsize() if name in self._queues else 0}
+                for name, counts in self._stats.items()
+            },
+        }
+
+
+notifier = Notifier(
+    sinks_from_settings(),
+    queue_size=settings.NOTIFY_QUEUE_MAX,
+    batch_wait=settings.NOTIFY_BATCH_WAIT_SEC,
+    max_attempts=settings.NOTIFY_MAX_ATTEMPTS,
+)
@@ -0,0 +1,80 @@
+# app/services/profile_cache.py
+"""
+Per-task cache of the logged-in user's profile (GET /2/user), including the
+payment methods booking needs.
+
+The profile is fetched in the background right after /login and refreshed
+periodically, so /me, /reservation/preview and /reservation/book read it
+from the shared state store instead of waiting on Resy.
+"""
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.resy_client import ResyClientError
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileCache:
+    def __init__(self, client_manager, store=None):
+        self.client_manager = client_manager
+        self.store = store if store is not None else client_manager.store
+        self.ttl = settings.PROFILE_REFRESH_SEC
+
+    def fetch(self, task_id: str, touch: bool = True) -> Dict[str, Any]:
+        """Fetch the profile from Resy now and cache it. Raises ResyClientError."""
+        with self.client_manager.use_client(task_id, touch=touch) as resy_client:
+            profile = resy_client.getUser()
+        self.store.save_profile(task_id, profile, time.time())
+        return profile
+
+    def prefetch(self, task_id: str, touch: bool = True) -> None:
+        """Background variant of fetch (after /login): failures are logged, not raised."""
+        try:
+            self.fetch(task_id, touch=touch)
+        except ResyClientError as e:
+            logger.warning("Profile prefetch failed for task %s: %s", task_id, e.message)
+
+    def get(self, task_id: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Cached profile if it is younger than `max_age` (default: the refresh interval), else None."""
+        cached = self.store.load_profile(task_id)
+        if not cached:
+            return None
+        if time.time() - cached["fetched_at"] > (self.ttl if max_age is None else max_age):
+            return None
+        return cached["profile"]
+
+    def get_or_fetch(self, task_id: str) -> Dict[str, Any]:
+        return self.get(task_id) or self.fetch(task_id)
+
+    def payment_methods(self, task_id: str) -> List[Dict[str, Any]]:
+        # Payment methods rarely change; a stale copy beats a round trip on the booking path.
+        profile = self.get(task_id, max_age=float("inf")) or {}
+        return profile.get("payment_methods") or []
+
+    def default_payment_method_id(self, task_id: str) -> Optional[int]:
+        methods = self.payment_methods(task_id)
+        if not methods:
+            return None
+        chosen = next((m for m in methods if m.get("is_default")), methods[0])
+        return chosen.get("id")
+
+    def payment_method_for(self, task_id: str, payment_method_id: Optional[int], use_default: bool) -> Optional[int]:
+        """
+        Card to book with: the one asked for, else the cached default only if the
+        caller opted in (booking must never charge a card nobody picked).
+        """
+        if payment_method_id is not None:
+            return payment_method_id
+        return self.default_payment_method_id(task_id) if use_default else None
+
+    def refresh_stale(self) -> None:
+        """Scheduler job: refresh profiles of live, logged-in tasks that are past the refresh interval."""
+        now = time.time()
+        for task_id in self.client_manager.authenticated_task_ids():
+            cached = self.store.load_profile(task_id)
+            if cached and now - cached["fetched_at"] < self.ttl:
+                continue
+            self.prefetch(task_id, touch=False)
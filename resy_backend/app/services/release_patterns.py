@@ -0,0 +1,201 @@
+# app/services/release_patterns.py
+"""
+Work out when a venue releases inventory, from the availability history.
+
+Venues usually open a new day at a fixed horizon (e.g. 14 days ahead) and a
+fixed time (e.g. 09:00), and otherwise only leak a slot or two through
+cancellations. Both show up in the history as bursts of "appeared" rows: all
+slots a single observation saw appear for one day.
+
+  * release bursts are the large ones (RELEASE_MIN_SLOTS or more); the most
+    common days-ahead among them is the horizon, and the spread of their
+    observation times gives the release window;
+  * everything else counts as a cancellation, summarised per hour of day.
+
+Times are in the server's local time zone, so run the backend with TZ set to
+the venues' zone.
+
+`poll_interval` turns a prediction into a polling cadence for monitors: poll
+hard around the predicted release of the day being watched, moderately in
+cancellation peak hours, and rarely otherwise. It runs after every poll, so
+it only reads the cached prediction (computed once per venue from what is
+already on disk); a scheduler job recomputes predictions as they age.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.availability_history import AvailabilityHistory, availability_history
+
+# A burst at least this large (slots appearing for one day in one observation) counts as a release
+RELEASE_MIN_SLOTS = 3
+# Fewer release bursts than this and we don't predict a release window
+MIN_RELEASE_SAMPLES = 3
+# Padding around the observed release window (observations lag the real drop by up to one poll)
+WINDOW_PADDING_MIN = 5
+# Hours whose cancellation count is at least this share of the busiest hour are "peak"
+PEAK_HOUR_SHARE = 0.5
+
+
+def _percentile(sorted_values: List[int], q: float) -> int:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _hhmm(minute: int) -> str:
+    minute %= 24 * 60
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def analyze(rows: List[Tuple[int, int, int, float]]) -> Dict[str, Any]:
+    """
+    Build a prediction from (day ordinal, party_size, slot_minute, observed_at)
+    "appeared" rows (see AvailabilityHistory.appearances).
+    """
+    # (observed_at, day) -> number of slots that appeared in that observation
+    bursts: Dict[Tuple[float, int], int] = defaultdict(int)
+    for day, _party_size, _minute, observed_at in rows:
+        bursts[(observed_at, day)] += 1
+
+    releases: List[Tuple[int, int]] = []       # (days_ahead, minute of day observed)
+    cancellations: List[Tuple[float, int]] = []  # (observed_at, hour of day)
+    for (observed_at, day), size in bursts.items():
+        seen = datetime.fromtimestamp(observed_at)
+        days_ahead = day - seen.date().toordinal()
+        if size >= RELEASE_MIN_SLOTS:
+            releases.append((days_ahead, seen.hour * 60 + seen.minute))
+        else:
+            cancellations.append((observed_at, seen.hour))
+
+    release = None
+    if len(releases) >= MIN_RELEASE_SAMPLES:
+        horizon, hits = Counter(d for d, _ in releases).most_common(1)[0]
+        minutes = sorted(m for d, m in releases if d == horizon)
+        if hits >= MIN_RELEASE_SAMPLES:
+            start = max(_percentile(minutes, 0.1) - WINDOW_PADDING_MIN, 0)
+            end = min(_percentile(minutes, 0.9) + WINDOW_PADDING_MIN, 24 * 60 - 1)
+            release = {
+                "days_ahead": horizon,
+                "time": _hhmm(_percentile(minutes, 0.5)),
+                "window_start": _hhmm(start),
+                "window_end": _hhmm(end),
+                "confidence": round(hits / len(releases), 2),
+                "samples": hits,
+            }
+
+    cancellation_summary = None
+    if cancellations:
+        per_hour = Counter(hour for _, hour in cancellations)
+        busiest = max(per_hour.values())
+        first_seen = min(t for t, _ in cancellations)
+        span_days = max((time.time() - first_seen) / 86400, 1.0)
+        cancellation_summary = {
+            "per_day": round(len(cancellations) / span_days, 2),
+            "peak_hours": sorted(h for h, n in per_hour.items() if n >= busiest * PEAK_HOUR_SHARE),
+            "by_hour": {h: per_hour[h] for h in sorted(per_hour)},
+        }
+
+    return {
+        "observations": len(bursts),
+        "release": release,
+        "cancellations": cancellation_summary,
+    }
+
+
+def _minutes(hhmm: str) -> int:
+    hh, mm = hhmm.split(":")
+    return int(hh) * 60 + int(mm)
+
+
+def release_window_for(prediction: Dict[str, Any], day: str) -> Optional[Tuple[float, float]]:
+    """(start, end) unix times at which `day` is predicted to be released, if there is a release pattern."""
+    release = prediction.get("release")
+    if not release:
+        return None
+    release_date = date.fromisoformat(day) - timedelta(days=release["days_ahead"])
+    midnight = datetime.combine(release_date, datetime.min.time()).timestamp()
+    return (
+        midnight + _minutes(release["window_start"]) * 60,
+        midnight + _minutes(release["window_end"]) * 60,
+    )
+
+
+class ReleasePatternAnalyzer:
+    """Per-venue predictions, recomputed from the history at most every `ttl` seconds."""
+
+    def __init__(self, history: AvailabilityHistory, ttl: float, lookback_sec: float):
+        self.history = history
+        self.ttl = ttl
+        self.lookback_sec = lookback_sec
+        self._lock = threading.Lock()
+        self._cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+
+    def _compute(self, venue_id: int, now: float, buffered: bool) -> Dict[str, Any]:
+        prediction = analyze(self.history.appearances(venue_id, since=now - self.lookback_sec, buffered=buffered))
+        prediction["venue_id"] = int(venue_id)
+        with self._lock:
+            self._cache[int(venue_id)] = (now, prediction)
+        return prediction
+
+    def predict(self, venue_id: int) -> Dict[str, Any]:
+        """Prediction including observations not yet flushed (API reads; nothing is written)."""
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(int(venue_id))
+        if cached and now - cached[0] < self.ttl:
+            return cached[1]
+        return self._compute(venue_id, now, buffered=True)
+
+    def cached(self, venue_id: int) -> Dict[str, Any]:
+        """The cached prediction however old (refresh_stale renews it); computed from flushed rows if missing."""
+        with self._lock:
+            cached = self._cache.get(int(venue_id))
+        if cached:
+            return cached[1]
+        return self._compute(venue_id, time.time(), buffered=False)
+
+    def refresh_stale(self) -> int:
+        """Scheduler job: recompute predictions older than `ttl` from the flushed history. Returns how many."""
+        now = time.time()
+        with self._lock:
+            stale = [v for v, (computed_at, _) in self._cache.items() if now - computed_at >= self.ttl]
+        for venue_id in stale:
+            self._compute(venue_id, now, buffered=False)
+        return len(stale)
+
+    def poll_interval(self, venue_id: int, day: str, now: Optional[float] = None) -> float:
+        """
+        Seconds until a monitor watching `venue_id` for `day` should check again.
+        Hot around the predicted release of that day, warm in cancellation
+        peak hours, cold otherwise (and a plain warm cadence with no history).
+        """
+        now = time.time() if now is None else now
+        prediction = self.cached(venue_id)
+        hot, warm, cold = settings.POLL_INTERVAL_HOT_SEC, settings.POLL_INTERVAL_WARM_SEC, settings.POLL_INTERVAL_COLD_SEC
+
+        if not prediction["release"] and not prediction["cancellations"]:
+            return warm
+
+        interval = cold
+        cancellations = prediction["cancellations"]
+        if cancellations and datetime.fromtimestamp(now).hour in cancellations["peak_hours"]:
+            interval = warm
+
+        window = release_window_for(prediction, day)
+        if window is not None:
+            start, end = window
+            if start <= now <= end:
+                return hot
+            if now < start:
+                # Don't sleep past the window opening
+                interval = min(interval, max(hot, start - now))
+        return interval
+
+
+release_patterns = ReleasePatternAnalyzer(
+    availability_history,
+    ttl=settings.RELEASE_PATTERN_TTL_SEC,
+    lookback_sec=settings.HISTORY_RETENTION_DAYS * 24 * 3600,
+)
@@ -1,11 +1,22 @@
+import logging
 import random
 import time
 from typing import Optional, Dict, Any
 import requests
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlparse
 import json
 import re
 
+from app.core.deadlines import Deadline, current_deadline
+
+logger = logging.getLogger(__name__)
+
+# An attempt isn't started with less than this left before the request deadline.
+MIN_ATTEMPT_SEC = 0.25
+# Pause between the reservation details call and its commit.
+COMMIT_PAUSE_SEC = 0.5
+
+
 class ResyClientError(Exception):
     def __init__(self, message: str, status_code: Optional[int] = None, details: Optional[dict] = None):
         super().__init__(message)
@@ -14,6 +25,35 @@ class ResyClientError(Exception):
         self.details = details or {}
 
 
+class DeadlineExceeded(ResyClientError):
+    """
+    The request's deadline ran out (504) or its client disconnected (499).
+    Only raised before an attempt is sent, so upstream never saw the call.
+    """
+
+
+RESY_URL_RE = re.compile(
+    r"^https?://(www\.)?resy\.com/cities/([^/]+)/venues/([^/?#]+)",
+    re.IGNORECASE
+)
+
+
+def parse_resy_url(url: str):
+    """
+    Extract (city_slug, venue_slug) from a Resy venue URL like:
+    https://resy.com/cities/toronto-on/venues/casa-paco
+    """
+    url = url.strip()
+    m = RESY_URL_RE.match(url)
+    if not m:
+        path = urlparse(url).path.strip("/")
+        parts = path.split("/")
+        if len(parts) >= 4 and parts[0] == "cities" and parts[2] == "venues":
+            return parts[1], parts[3]
+        raise ValueError("URL does not look like a valid Resy venue URL")
+    return m.group(2), m.group(3)
+
+
 class ResyClient:
     def __init__(
         self,
@@ -33,23 +73,46 @@ class ResyClient:
 
         self.session = requests.Session()
 
-        headers = {
+        self._base_headers = {
             'user-agent': '' + self.user_agent,
             'Accept-Encoding': 'gzip, deflate, br, zstd', 
             'accept': 'application/json, text/plain, */*', 
             'authorization': 'ResyAPI api_key="{}"'.format(self.api_key), 
             'authority': 'api.resy.com'
         }   
-        self.session.headers.update(headers)
+        self.session.headers.update(self._base_headers)
+        self._clean_headers = dict(self.session.headers)
 
   
 
-    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
-        """HTTP request with retry/backoff (no proxies)."""
+    def _request(self, method: str, url: str, idempotent: bool = True, **kwargs) -> requests.Response:
+        """
+        HTTP request with retry/backoff (no proxies).
+
+        Non-idempotent calls (booking, committing a hold) are only retried when
+        upstream certainly did not act on them: a 429, or a connection that was
+        never established. Anything else (5xx, read timeout, dropped connection)
+        is raised as is, and the caller checks state instead of resending.
+
+        Under a request deadline (app.core.deadlines), no attempt starts without
+        MIN_ATTEMPT_SEC left or after the client went away (DeadlineExceeded),
+        idempotent attempts time out when the deadline does, and a retry whose
+        backoff would eat the rest of the budget is not made. Non-idempotent
+        attempts keep the full timeout once sent: cutting a /3/book short would
+        only turn an answer into an unknown outcome.
+        """
         kwargs.setdefault("timeout", self.timeout)
+        retry_statuses = (429, 500, 502, 503, 504) if idempotent else (429,)
+        retry_errors = (requests.Timeout, requests.ConnectionError) if idempotent else (requests.ConnectTimeout,)
+        deadline = current_deadline()
+        timeout = kwargs["timeout"]
 
         last_exc = None
         for attempt in range(1, self.max_retries + 1):
+            if deadline is not None:
+                remaining = self._check_deadline(deadline)
+                if idempotent:
+                    kwargs["timeout"] = min(timeout, remaining)
             try:
 
                 resp = self.session.request(method, url, **kwargs)
@@ -57,9 +120,7 @@ class ResyClient:
                 
                 # Retry certain upstream statuses; otherwise raise with details.
                 if resp.status_code >= 400:
-                    if resp.status_code in (429, 500, 502, 503, 504) and attempt < self.max_retries:
-                        sleep_s = self.backoff_base * (2 ** (attempt - 1)) + random.random() * 0.3
-                        time.sleep(sleep_s)
+                    if resp.status_code in retry_statuses and self._backoff(attempt, deadline):
                         continue
                     raise ResyClientError(
                         f"Upstream error {resp.status_code}",
@@ -70,13 +131,33 @@ class ResyClient:
                 return resp
             except (requests.Timeout, requests.ConnectionError) as e:
                 last_exc = e
-                if attempt < self.max_retries:
-                    sleep_s = self.backoff_base * (2 ** (attempt - 1)) + random.random() * 0.3
-                    time.sleep(sleep_s)
+                if isinstance(e, retry_errors) and self._backoff(attempt, deadline):
                     continue
                 raise ResyClientError("Network error", details={"error": str(e)})
         raise ResyClientError("Network error", details={"error": str(last_exc)})
 
+    @staticmethod
+    def _check_deadline(deadline: Deadline) -> float:
+        """Seconds left for an attempt; raises DeadlineExceeded if it shouldn't start."""
+        if deadline.cancelled.is_set():
+            raise DeadlineExceeded("Request cancelled by the client", status_code=499)
+        remaining = deadline.remaining()
+        if remaining < MIN_ATTEMPT_SEC:
+            raise DeadlineExceeded("Request deadline exceeded", status_code=504)
+        return remaining
+
+    def _backoff(self, attempt: int, deadline: Optional[Deadline]) -> bool:
+        """Sleep before retry `attempt + 1`; False if there should be no retry."""
+        if attempt >= self.max_retries:
+            return False
+        sleep_s = self.backoff_base * (2 ** (attempt - 1)) + random.random() * 0.3
+        if deadline is None:
+            time.sleep(sleep_s)
+            return True
+        if deadline.remaining() - sleep_s < MIN_ATTEMPT_SEC:
+            return False  # no time for another attempt: fail now with the real error
+        return deadline.sleep(sleep_s)
+
     # --- Public methods ---
 
     def lookup_venue(self, url: str) -> Dict[str, Any]:
@@ -84,30 +165,11 @@ class ResyClient:
         GET /3/venue?url_slug=<venue_slug>&location=<city_slug>
         Returns JSON that includes `id`.
         """
+        city_slug, venue_slug = parse_resy_url(url)
+        return self.lookup_venue_slug(city_slug, venue_slug)
 
-        RESY_URL_RE = re.compile(
-            r"^https?://(www\.)?resy\.com/cities/([^/]+)/venues/([^/?#]+)",
-            re.IGNORECASE
-            )
-        
-        def parse_resy_url(url: str):
-            """
-            Extract (city_slug, venue_slug) from a Resy venue URL like:
-            https://resy.com/cities/toronto-on/venues/casa-paco
-            """
-            m = RESY_URL_RE.match(url.strip())
-            if not m:
-                from urllib.parse import urlparse
-                path = urlparse(url).path.strip("/")
-                parts = path.split("/")
-                if len(parts) >= 4 and parts[0] == "cities" and parts[2] == "venues":
-                    return parts[1], parts[3]
-                raise ValueError("URL does not look like a valid Resy venue URL")
-            return m.group(2), m.group(3)
-
-
-        city_slug, venue_slug = parse_resy_url(url.strip())
-
+    def lookup_venue_slug(self, city_slug: str, venue_slug: str) -> Dict[str, Any]:
+        """lookup_venue for an already parsed (city_slug, venue_slug)."""
         url = "https://api.resy.com/3/venue"
 
         params = {"url_slug": venue_slug, "location": city_slug}
@@ -173,8 +235,6 @@ class ResyClient:
             "password": password,
         }
 
-        print(payload)
-
         resp = self._request("POST", url, data=payload)
         if resp.status_code != 200:
             raise ResyClientError("Login failed", status_code=resp.status_code, details={"text": resp.text})
@@ -212,6 +272,49 @@ class ResyClient:
 
         for key, value in dic.items():
             self.session.cookies.set(key, value)
+
+    def load_state(self, auth_token: str = "", cookies: Optional[Dict[str, str]] = None) -> None:
+        """
+        Reset the client to a clean session and load another task's session
+        material into it. Lets ClientManager reuse pooled clients (and their
+        connection pools) across tasks without leaking auth between them.
+        """
+        self.userAuth = ""
+        if self.session.cookies:
+            self.session.cookies.clear()
+        self.session.headers = requests.structures.CaseInsensitiveDict(self._clean_headers)
+        if auth_token:
+            self.setToken(token=auth_token)
+        if cookies:
+            self.setCookie(cookies)
+
+    def export_state(self) -> Dict[str, Any]:
+        """
+        Return the session material needed to rebuild this client elsewhere
+        (see ClientManager.save_session).
+        """
+        return {
+            "auth_token": self.userAuth,
+            "cookies": requests.utils.dict_from_cookiejar(self.session.cookies),
+        }
+
+    def pool_stats(self) -> Dict[str, int]:
+        """
+        Connection usage of this client's session: connections checked out
+        right now, idle kept-alive ones, and how many were ever opened.
+        """
+        stats = {"in_use": 0, "idle": 0, "opened": 0}
+        for adapter in self.session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None or pool.pool is None:
+                    continue
+                queue = pool.pool  # LifoQueue of idle connections (None = free slot)
+                stats["in_use"] += queue.maxsize - queue.qsize()
+                stats["idle"] += sum(1 for conn in list(queue.queue) if conn is not None)
+                stats["opened"] += pool.num_connections
+        return stats
    
 
     def getReservation(self, config_id, day, party_size):
@@ -226,24 +329,27 @@ class ResyClient:
             "day": day,
             "party_size": party_size
         }
-        print("sending get reso")
+        logger.debug("Requesting reservation details for config %s", config_id)
         url = "https://api.resy.com/3/details"
 
         resp = self._request("POST", url, json=data)
-        
-        time.sleep(0.5)
+
+        deadline = current_deadline()
+        if deadline is None:
+            time.sleep(COMMIT_PAUSE_SEC)
+        elif deadline.remaining() - COMMIT_PAUSE_SEC >= MIN_ATTEMPT_SEC:
+            deadline.sleep(COMMIT_PAUSE_SEC)  # a disconnect wakes it and the commit below is not sent
+        # else: commit right away rather than pause past the deadline
         data["commit"] = 1
-        print("sending commit reso")
-        resp = self._request("POST", url, json=data).json()
+        logger.debug("Committing reservation details for config %s", config_id)
+        resp = self._request("POST", url, json=data, idempotent=False).json()
     
         return resp
 
     def book(self, book_token: str, payment_method_id):
 
-        self.session.headers.update({
-            "Content-Type": "application/x-www-form-urlencoded",
-
-        })
+        # Per request, not on the session: other calls may be in flight on this client
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
 
         data: Dict[str, Any] = {
             "book_token": book_token,
@@ -255,7 +361,7 @@ class ResyClient:
 
 
         url = "https://api.resy.com/3/book"
-        resp = self._request("POST", url, data=data)
+        resp = self._request("POST", url, data=data, headers=headers, idempotent=False)
 
         return resp.json()
 
@@ -273,6 +379,18 @@ class ResyClient:
         resp = self._request("GET", url)
         return resp.json()
 
+    def get_reservations(self) -> Dict[str, Any]:
+        """
+        GET /3/user/reservations?type=upcoming
+        The user's upcoming reservations (used to settle ambiguous bookings).
+        """
+        if not self.userAuth:
+            raise ResyClientError("Authorization token not set. Please set the token using setToken().")
+
+        url = "https://api.resy.com/3/user/reservations"
+        resp = self._request("GET", url, params={"type": "upcoming"})
+        return resp.json()
+
     def venue_search(
         self,
         latitude: float,
@@ -0,0 +1,134 @@
+# app/services/runtime_stats.py
+"""
+Runtime introspection for the admin API (app/api/v1/admin_routes.py):
+event-loop lag, scheduler jobs, and the thread pools requests and jobs run on.
+
+  * LoopLagMonitor: a task that sleeps a fixed interval and records how late
+    it wakes up. Anything blocking the loop (sync I/O in a coroutine, a
+    long-running callback) shows up here directly.
+  * JobStats: listens to APScheduler events, so each job reports how late
+    its last run started relative to its scheduled time, how long it took,
+    and how often it failed or was skipped because the previous run was
+    still going.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import anyio.to_thread
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+)
+
+from app.core.config import settings
+from app.services.monitor_scheduler import percentiles_ms
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.5, samples: int = 1200):
+        self.interval = interval
+        self._lag: Deque[float] = deque(maxlen=samples)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._lag.append(max(0.0, time.monotonic() - expected))
+
+    def stats(self) -> Dict[str, Any]:
+        samples = list(self._lag)
+        return {
+            "interval_ms": self.interval * 1000,
+            "lag_ms": percentiles_ms(samples),
+            "last_ms": round(samples[-1] * 1000, 3) if samples else None,
+        }
+
+
+class JobStats:
+    def __init__(self):
+        self.scheduler = None
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._started: Dict[str, float] = {}
+
+    def attach(self, scheduler) -> None:
+        self.scheduler = scheduler
+        scheduler.add_listener(
+            self._on_event,
+            EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES,
+        )
+
+    def _on_event(self, event) -> None:
+        # Submission is reported on the loop after the job was handed to the pool, so a quick
+        # job can report completion first; count both sides instead of tracking a running flag.
+        now = time.time()
+        with self._lock:
+            job = self._jobs.setdefault(event.job_id, {
+                "runs": 0, "errors": 0, "missed": 0, "skipped": 0, "submitted": 0,
+                "last_run_at": None, "last_lag_ms": None, "last_duration_ms": None, "last_error": None,
+            })
+            if event.code == EVENT_JOB_SUBMITTED:
+                job["submitted"] += 1
+                job["last_run_at"] = now
+                job["last_lag_ms"] = round((now - event.scheduled_run_times[-1].timestamp()) * 1000, 1)
+                if job["submitted"] > job["runs"]:
+                    self._started[event.job_id] = now
+            elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+                job["runs"] += 1
+                started = self._started.pop(event.job_id, None) or event.scheduled_run_time.timestamp()
+                job["last_duration_ms"] = round((now - started) * 1000, 1)
+                if event.code == EVENT_JOB_ERROR:
+                    job["errors"] += 1
+                    job["last_error"] = repr(event.exception)
+            elif event.code == EVENT_JOB_MISSED:
+                job["missed"] += 1
+            else:  # EVENT_JOB_MAX_INSTANCES: previous run still going
+                job["skipped"] += 1
+
+    def running(self) -> int:
+        with self._lock:
+            return sum(max(0, job["submitted"] - job["runs"]) for job in self._jobs.values())
+
+    def stats(self) -> List[Dict[str, Any]]:
+        jobs = self.scheduler.get_jobs() if self.scheduler is not None else []
+        out = []
+        with self._lock:
+            for job in jobs:
+                counts = self._jobs.get(job.id, {})
+                out.append({
+                    "id": job.id,
+                    "trigger": str(job.trigger),
+                    "next_run_at": job.next_run_time.timestamp() if job.next_run_time else None,
+                    "running": max(0, counts.get("submitted", 0) - counts.get("runs", 0)),
+                    **counts,
+                })
+        return out
+
+
+def threadpool_stats() -> Dict[str, Any]:
+    """Occupancy of the pools work runs on. Call from the event loop (the route pool's limiter lives there)."""
+    routes = anyio.to_thread.current_default_thread_limiter().statistics()
+    return {
+        "routes": {"busy": routes.borrowed_tokens, "size": routes.total_tokens, "waiting": routes.tasks_waiting},
+        "jobs": {"busy": job_stats.running(), "size": settings.MAINTENANCE_JOB_WORKERS},
+    }
+
+
+loop_monitor = LoopLagMonitor(interval=settings.LOOP_LAG_INTERVAL_SEC)
+job_stats = JobStats()
@@ -0,0 +1,117 @@
+# app/services/slot_ranking.py
+"""
+Rank /4/find slots against a task's preferences, so the slot an auto-book
+should take is first in the list.
+
+Preferences (all optional):
+  target_time     "HH:MM"  ideal seating time
+  time_start/end  "HH:MM"  acceptable window (may cross midnight)
+  preferred_types [str]    seating types in order of preference, e.g. ["Patio", "Dining Room"]
+  excluded_types  [str]    seating types never to take, e.g. ["Bar"]
+  allow_paid      bool     take slots that need a deposit/prepayment (default True)
+  prefer_free     bool     rank free slots ahead of paid ones of the same type (default False)
+
+Everything is compiled to integers once; ranking is one pass over the slots
+computing an integer score (lower is better), then a sort on that score:
+
+  score = type_rank * TYPE_WEIGHT + paid * PAID_WEIGHT + minutes from target
+
+so seating type dominates, then free vs paid, then closeness to the target
+(or, without a target, earliest in the window).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.slots import extract_slot_time, parse_hhmm
+
+MINUTES_PER_DAY = 24 * 60
+# The time distance is always under a day, so these weights keep the ordering lexicographic
+PAID_WEIGHT = MINUTES_PER_DAY
+TYPE_WEIGHT = 2 * MINUTES_PER_DAY
+
+
+def hhmm_minutes(v: Optional[str]) -> Optional[int]:
+    t = parse_hhmm(v)
+    return None if t is None else t.hour * 60 + t.minute
+
+
+def slot_minute(start: Optional[str]) -> Optional[int]:
+    """Minute of day of a slot start; same result as slots.extract_slot_time, without datetime parsing in the common case."""
+    # Resy sends "YYYY-MM-DD HH:MM:SS"
+    if start and len(start) >= 16 and start[10] in " T" and start[13] == ":":
+        hh, mm = start[11:13], start[14:16]
+        if hh.isdigit() and mm.isdigit() and int(hh) < 24 and int(mm) < 60:
+            return int(hh) * 60 + int(mm)
+    t = extract_slot_time(start)
+    return None if t is None else t.hour * 60 + t.minute
+
+
+def minute_in_window(minute: int, start: Optional[int], end: Optional[int]) -> bool:
+    """Same rule as slots.in_window, on minutes of the day (either bound optional, may cross midnight)."""
+    if start is None and end is None:
+        return True
+    if end is None:
+        return minute >= start
+    if start is None:
+        return minute <= end
+    if start <= end:
+        return start <= minute <= end
+    return minute >= start or minute <= end  # window crosses midnight
+
+
+class SlotRanker:
+    __slots__ = ("target", "start", "end", "type_ranks", "unranked", "excluded", "allow_paid", "prefer_free")
+
+    def __init__(self, preferences: Dict[str, Any]):
+        self.target = hhmm_minutes(preferences.get("target_time"))
+        self.start = hhmm_minutes(preferences.get("time_start"))
+        self.end = hhmm_minutes(preferences.get("time_end"))
+        preferred = [t.strip().lower() for t in preferences.get("preferred_types") or []]
+        self.type_ranks = {t: i for i, t in reversed(list(enumerate(preferred)))}
+        self.unranked = len(preferred)
+        self.excluded = {t.strip().lower() for t in preferences.get("excluded_types") or []}
+        self.allow_paid = preferences.get("allow_paid", True)
+        self.prefer_free = preferences.get("prefer_free", False)
+
+    def _in_window(self, minute: int) -> bool:
+        return minute_in_window(minute, self.start, self.end)
+
+    def score(self, slot: Dict[str, Any]) -> Optional[int]:
+        """Integer score for a slot (lower is better), or None if the slot is unacceptable."""
+        slot_type = (slot.get("type") or "").lower()
+        if slot_type in self.excluded:
+            return None
+        paid = bool(slot.get("is_paid"))
+        if paid and not self.allow_paid:
+            return None
+
+        minute = slot_minute(slot.get("start"))
+        if minute is None:
+            # Without a time we can only keep it when nothing time-related was asked for
+            if self.start is not None or self.end is not None or self.target is not None:
+                return None
+            distance = 0
+        else:
+            if not self._in_window(minute):
+                return None
+            if self.target is not None:
+                distance = abs(minute - self.target)
+                distance = min(distance, MINUTES_PER_DAY - distance)
+            elif self.start is not None:
+                distance = (minute - self.start) % MINUTES_PER_DAY  # earliest in the window first
+            else:
+                distance = 0
+
+        score = self.type_ranks.get(slot_type, self.unranked) * TYPE_WEIGHT + distance
+        if paid and self.prefer_free:
+            score += PAID_WEIGHT
+        return score
+
+    def rank(self, slots: List[Dict[str, Any]]) -> List[Tuple[int, Dict[str, Any]]]:
+        """Acceptable slots as (score, slot), best first; ties keep upstream order."""
+        scored = []
+        for i, slot in enumerate(slots):
+            s = self.score(slot)
+            if s is not None:
+                scored.append((s, i, slot))
+        scored.sort(key=lambda item: (item[0], item[1]))
+        return [(s, slot) for s, _, slot in scored]
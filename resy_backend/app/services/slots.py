@@ -0,0 +1,117 @@
+# app/services/slots.py
+"""
+Slot parsing and time-of-day window filtering for Resy /4/find responses.
+
+Shared by the /slots route and anything else that needs to interpret find
+results the same way (e.g. the multi-venue availability search).
+"""
+import re
+from datetime import datetime, time
+from typing import Any, Dict, List, Optional, Tuple
+
+_HHMM_RE = re.compile(r"(\d{2}):(\d{2})")
+# rgs://resy/<venue_id>/<template>/<n>/<day>/<day>/<HH:MM:SS>/<party_size>/<type>
+_CONFIG_TOKEN_RE = re.compile(r"^rgs://resy/(\d+)/[^/]*/[^/]*/(\d{4}-\d{2}-\d{2})/[^/]*/(\d{2}:\d{2})")
+
+
+def parse_find_slots(resp: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Flatten the first venue's slots into dicts with the SlotOut fields:
+    token, type, start, end, is_paid.
+    """
+    venues = resp.get("results", {}).get("venues", [])
+    if not venues:
+        return []
+
+    slots = []
+    for s in venues[0].get("slots", []):
+        cfg = s.get("config", {})
+        date = s.get("date", {})
+        payment = s.get("payment", {})
+        slots.append({
+            "token": cfg.get("token"),
+            "type": cfg.get("type"),
+            "start": date.get("start"),
+            "end": date.get("end"),
+            "is_paid": bool(payment.get("is_paid")),
+        })
+    return slots
+
+
+def parse_config_token(token: Optional[str]) -> Optional[Tuple[int, str, str]]:
+    """(venue_id, "YYYY-MM-DD", "HH:MM") encoded in a slot's config token, if it has the usual shape."""
+    m = _CONFIG_TOKEN_RE.match(token or "")
+    if not m:
+        return None
+    return int(m.group(1)), m.group(2), m.group(3)
+
+
+def parse_hhmm(v: Optional[str]) -> Optional[time]:
+    if not v:
+        return None
+    try:
+        hh, mm = v.split(":")
+        return time(hour=int(hh), minute=int(mm))
+    except Exception:
+        return None
+
+
+def extract_slot_time(slot_start: Optional[str]) -> Optional[time]:
+    """Time of day of a slot's "start" value."""
+    if not slot_start:
+        return None
+    # Try ISO first (handle trailing Z)
+    try:
+        s = slot_start.replace("Z", "+00:00")
+        dt = datetime.fromisoformat(s)
+        return dt.timetz().replace(tzinfo=None)
+    except Exception:
+        pass
+    # Fallback: grab HH:MM anywhere in string
+    m = _HHMM_RE.search(slot_start)
+    if not m:
+        return None
+    try:
+        return time(hour=int(m.group(1)), minute=int(m.group(2)))
+    except ValueError:
+        return None
+
+
+def in_window(slot_t: time, start_t: Optional[time], end_t: Optional[time]) -> bool:
+    # Only start bound
+    if start_t and not end_t:
+        return slot_t >= start_t
+    # Only end bound
+    if end_t and not start_t:
+        return slot_t <= end_t
+    if not start_t and not end_t:
+        return True
+    assert start_t and end_t
+    if start_t <= end_t:
+        # normal same-day window
+        return start_t <= slot_t <= end_t
+    # window crosses midnight (e.g. 22:00 -> 02:00)
+    return slot_t >= start_t or slot_t <= end_t
+
+
+def filter_slots_by_window(
+    slots: List[Dict[str, Any]],
+    time_start: Optional[str],
+    time_end: Optional[str],
+) -> List[Dict[str, Any]]:
+    """
+    Keep slots whose start time-of-day falls in [time_start, time_end] ("HH:MM",
+    either bound optional, windows may cross midnight). Unparseable bounds are
+    ignored; with a bound set, slots without a parseable start are dropped.
+    """
+    start_t = parse_hhmm(time_start)
+    end_t = parse_hhmm(time_end)
+    if not start_t and not end_t:
+        return slots
+
+    filtered = []
+    for slot in slots:
+        slot_t = extract_slot_time(slot.get("start"))
+        if slot_t is not None and in_window(slot_t, start_t, end_t):
+            filtered.append(slot)
+    return filtered
@@ -0,0 +1,488 @@
+# app/services/venue_catalog.py
+"""
+Local catalog of every venue the backend has seen (venue search hits and
+/getID lookups), with an in-memory prefix index for typeahead and a geohash
+grid for "near here" queries.
+
+Queries are tokenised and each token is prefix-matched against a sorted
+token list (bisect), so lookups stay well under a millisecond for tens of
+thousands of venues. Venues with coordinates are also bucketed by geohash
+at a few precisions; a radius search unions the cells covering its bounding
+box and orders the survivors by great-circle distance.
+
+The /venuesearch route answers from here and only goes upstream when the
+local result is sparse and that (query, area) has not been fetched recently.
+
+The catalog survives restarts through a snapshot (see cache_snapshots).
+`get` answers from the startup snapshot right away; the search indexes are
+rebuilt from it in the background by `warm_from_snapshot`, and only then
+are the remembered upstream queries restored, so a query is never treated
+as fresh while its venues are still missing locally.
+"""
+import bisect
+import heapq
+import json
+import math
+import re
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.snapshots import Entry, Snapshot, merge_entries
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(normalize(text))
+
+
+# ---------- Geo helpers ----------
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Cell size in degrees (lat, lng) per geohash precision.
+_GEOHASH_CELL = {p: (180.0 / 2 ** ((5 * p) // 2), 360.0 / 2 ** ((5 * p + 1) // 2)) for p in range(1, 10)}
+# Precisions venues are indexed at (~39km, ~4.9km, ~1.2km cells).
+INDEX_PRECISIONS = (4, 5, 6)
+# Precision of the "has this area been fetched upstream" bookkeeping.
+FILL_PRECISION = 5
+# A radius query uses the finest precision whose covering stays under this many cells.
+MAX_QUERY_CELLS = 48
+EARTH_RADIUS_KM = 6371.0088
+
+
+def geohash(lat: float, lng: float, precision: int) -> str:
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                value = (value << 1) | 1
+                lng_lo = mid
+            else:
+                value <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def distance_from(lat: float, lng: float) -> Callable[[float, float], float]:
+    """haversine_km from a fixed origin, with the origin's trigonometry done once (for scoring many venues)."""
+    p1 = math.radians(lat)
+    cos_p1 = math.cos(p1)
+    sin, cos, radians, asin, sqrt = math.sin, math.cos, math.radians, math.asin, math.sqrt
+
+    def distance(lat2: float, lng2: float) -> float:
+        p2 = radians(lat2)
+        a = sin((p2 - p1) / 2) ** 2 + cos_p1 * cos(p2) * sin(radians(lng2 - lng) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+    return distance
+
+
+def _bounding_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    coslat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = min(180.0, math.degrees(radius_km / (EARTH_RADIUS_KM * coslat)))
+    return max(-90.0, lat - dlat), min(90.0, lat + dlat), lng - dlng, lng + dlng
+
+
+def covering_cells(lat: float, lng: float, radius_km: float) -> Tuple[int, FrozenSet[str]]:
+    """
+    Geohash cells (at one of INDEX_PRECISIONS) covering the circle's bounding box.
+    Searches repeat from the same few places, so the centre is snapped to a
+    ~100m grid (radius padded to compensate) and the covering is memoised.
+    """
+    return _covering_cells(round(lat, 3), round(lng, 3), round(radius_km + 0.1, 1))
+
+
+@lru_cache(maxsize=4096)
+def _covering_cells(lat: float, lng: float, radius_km: float) -> Tuple[int, FrozenSet[str]]:
+    lat_min, lat_max, lng_min, lng_max = _bounding_box(lat, lng, radius_km)
+    precision = INDEX_PRECISIONS[0]
+    for p in reversed(INDEX_PRECISIONS):
+        h, w = _GEOHASH_CELL[p]
+        if (math.ceil((lat_max - lat_min) / h) + 1) * (math.ceil((lng_max - lng_min) / w) + 1) <= MAX_QUERY_CELLS:
+            precision = p
+            break
+
+    h, w = _GEOHASH_CELL[precision]
+    cells: Set[str] = set()
+    y = lat_min
+    while True:
+        x = lng_min
+        while True:
+            cells.add(geohash(y, ((x + 180.0) % 360.0) - 180.0, precision))
+            if x >= lng_max:
+                break
+            x = min(x + w, lng_max)
+        if y >= lat_max:
+            break
+        y = min(y + h, lat_max)
+    return precision, frozenset(cells)
+
+
+class VenueRecord:
+    __slots__ = (
+        "venue_id", "name", "cuisine", "neighborhood", "region", "image_url",
+        "latitude", "longitude", "updated_at",
+    )
+
+    def __init__(
+        self,
+        venue_id: int,
+        name: str,
+        cuisine: Optional[str] = None,
+        neighborhood: Optional[str] = None,
+        region: Optional[str] = None,
+        image_url: Optional[str] = None,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        updated_at: float = 0.0,
+    ):
+        self.venue_id = venue_id
+        self.name = name
+        self.cuisine = cuisine
+        self.neighborhood = neighborhood
+        self.region = region
+        self.image_url = image_url
+        self.latitude = latitude
+        self.longitude = longitude
+        self.updated_at = updated_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def _first(value: Any) -> Optional[str]:
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value or None
+
+
+def record_from_search_hit(hit: Dict[str, Any]) -> Optional[VenueRecord]:
+    """Map a /3/venuesearch/search hit; None if it has no Resy venue id."""
+    venue_id = hit.get("id", {}).get("resy") if isinstance(hit.get("id"), dict) else None
+    if not venue_id:
+        return None
+    geoloc = hit.get("_geoloc") or {}
+    return VenueRecord(
+        venue_id=int(venue_id),
+        name=hit.get("name", ""),
+        cuisine=_first(hit.get("cuisine")),
+        neighborhood=hit.get("neighborhood"),
+        region=hit.get("region"),
+        image_url=_first(hit.get("images")),
+        latitude=geoloc.get("lat"),
+        longitude=geoloc.get("lng"),
+    )
+
+
+def record_from_venue_lookup(venue: Dict[str, Any]) -> Optional[VenueRecord]:
+    """Map a /3/venue response (see ResyClient.lookup_venue)."""
+    venue_id = venue.get("id", {}).get("resy") if isinstance(venue.get("id"), dict) else None
+    if not venue_id:
+        return None
+    location = venue.get("location") or {}
+    return VenueRecord(
+        venue_id=int(venue_id),
+        name=venue.get("name", ""),
+        cuisine=_first(venue.get("type") or venue.get("cuisine")),
+        neighborhood=location.get("neighborhood"),
+        region=location.get("region") or location.get("locality"),
+        image_url=_first(venue.get("images")),
+        latitude=location.get("latitude"),
+        longitude=location.get("longitude"),
+    )
+
+
+class VenueCatalog:
+    def __init__(self, query_ttl: float = 24 * 3600):
+        self.query_ttl = query_ttl
+        self._lock = threading.Lock()
+        self._venues: Dict[int, VenueRecord] = {}
+        self._postings: Dict[str, Set[int]] = {}  # token -> venue ids
+        self._tokens: List[str] = []               # sorted keys of _postings
+        self._venue_tokens: Dict[int, List[str]] = {}
+        self._norm_names: Dict[int, str] = {}
+        self._cells: Dict[int, Dict[str, Set[int]]] = {p: {} for p in INDEX_PRECISIONS}
+        self._queries: Dict[Tuple[str, str], float] = {}  # (normalised query, area cell) -> last upstream fetch
+        self._snapshot: Optional[Snapshot] = None  # until warm_from_snapshot has indexed it
+
+    def __len__(self) -> int:
+        return len(self._venues)
+
+    def get(self, venue_id: int) -> Optional[VenueRecord]:
+        record = self._venues.get(venue_id)
+        if record is None and self._snapshot is not None:
+            found = self._snapshot.get(b"v:%d" % venue_id)
+            if found is not None:
+                record = VenueRecord(*json.loads(found[0]))
+        return record
+
+    # ---------- Writes ----------
+
+    def add(self, record: VenueRecord) -> None:
+        record.updated_at = record.updated_at or time.time()
+        tokens = set(tokenize(record.name))
+        for field in (record.cuisine, record.neighborhood, record.region):
+            tokens.update(tokenize(field))
+
+        with self._lock:
+            existing = self._venues.get(record.venue_id)
+            if existing is not None and existing.updated_at > record.updated_at:
+                return  # an older copy (e.g. from a snapshot) never replaces a newer one
+            if existing is not None:
+                # Keep fields the new source doesn't know (e.g. a search hit without coordinates)
+                for attr in VenueRecord.__slots__:
+                    if getattr(record, attr) in (None, "") and getattr(existing, attr) not in (None, ""):
+                        setattr(record, attr, getattr(existing, attr))
+                self._unindex(record.venue_id)
+            self._venues[record.venue_id] = record
+            self._venue_tokens[record.venue_id] = sorted(tokens)
+            self._norm_names[record.venue_id] = normalize(record.name)
+            if record.latitude is not None and record.longitude is not None:
+                for precision, cells in self._cells.items():
+                    cell = geohash(record.latitude, record.longitude, precision)
+                    cells.setdefault(cell, set()).add(record.venue_id)
+            for token in tokens:
+                ids = self._postings.get(token)
+                if ids is None:
+                    self._postings[token] = {record.venue_id}
+                    bisect.insort(self._tokens, token)
+                else:
+                    ids.add(record.venue_id)
+
+    def add_many(self, records: Iterable[Optional[VenueRecord]]) -> None:
+        for record in records:
+            if record is not None:
+                self.add(record)
+
+    def ingest_search(
+        self,
+        records: Iterable[VenueRecord],
+        query: Optional[str] = None,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+    ) -> None:
+        """
+        Add upstream search results; with `query`, also mark that query as
+        freshly fetched for the area around (latitude, longitude).
+        """
+        self.add_many(records)
+        if query is not None:
+            self.mark_query_fetched(query, latitude, longitude)
+
+    def _unindex(self, venue_id: int) -> None:
+        old = self._venues.get(venue_id)
+        if old is not None and old.latitude is not None and old.longitude is not None:
+            for precision, cells in self._cells.items():
+                cell = geohash(old.latitude, old.longitude, precision)
+                ids = cells.get(cell)
+                if ids is not None:
+                    ids.discard(venue_id)
+                    if not ids:
+                        del cells[cell]
+        for token in self._venue_tokens.pop(venue_id, []):
+            ids = self._postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(venue_id)
+            if not ids:
+                del self._postings[token]
+                i = bisect.bisect_left(self._tokens, token)
+                if i < len(self._tokens) and self._tokens[i] == token:
+                    del self._tokens[i]
+
+    @staticmethod
+    def _query_key(query: str, latitude: Optional[float], longitude: Optional[float]) -> Tuple[str, str]:
+        area = geohash(latitude, longitude, FILL_PRECISION) if latitude is not None and longitude is not None else ""
+        return " ".join(tokenize(query)), area
+
+    def mark_query_fetched(self, query: str, latitude: Optional[float] = None, longitude: Optional[float] = None) -> None:
+        self._queries[self._query_key(query, latitude, longitude)] = time.time()
+
+    def query_is_fresh(self, query: str, latitude: Optional[float] = None, longitude: Optional[float] = None) -> bool:
+        """True if this query was fetched upstream for this area within the TTL."""
+        fetched = self._queries.get(self._query_key(query, latitude, longitude))
+        return fetched is not None and time.time() - fetched < self.query_ttl
+
+    # ---------- Snapshots ----------
+
+    def attach_snapshot(self, snapshot: Snapshot) -> None:
+        self._snapshot = snapshot
+
+    def warm_from_snapshot(self) -> int:
+        """Index every venue in the startup snapshot, then restore the query bookkeeping. Returns venues added."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return 0
+        records: List[VenueRecord] = []
+        queries: Dict[Tuple[str, str], float] = {}
+        for key, value, expires_at in snapshot.items():
+            if key.startswith(b"v:"):
+                records.append(VenueRecord(*json.loads(value)))
+            elif key.startswith(b"q:"):
+                area, _, query = key[2:].decode().partition(":")
+                queries[(query, area)] = expires_at - self.query_ttl
+        self.add_many(records)
+        for query_key, fetched in queries.items():
+            if fetched > self._queries.get(query_key, 0.0):
+                self._queries[query_key] = fetched
+        self._snapshot = None
+        return len(records)
+
+    def snapshot_entries(self, now: float) -> Iterator[Entry]:
+        """Venues don't expire; remembered queries expire with the query TTL."""
+        with self._lock:
+            records = list(self._venues.values())
+        queries = list(self._queries.items())
+        memory: List[Entry] = [
+            (b"v:%d" % r.venue_id, json.dumps([getattr(r, k) for k in VenueRecord.__slots__]).encode(), math.inf)
+            for r in records
+        ]
+        memory.extend(
+            (f"q:{area}:{query}".encode(), b"", fetched + self.query_ttl) for (query, area), fetched in queries
+        )
+        return merge_entries(memory, self._snapshot, now)
+
+    # ---------- Reads ----------
+
+    def _prefix_ids(self, prefix: str) -> Set[int]:
+        tokens = self._tokens
+        i = bisect.bisect_left(tokens, prefix)
+        ids: Set[int] = set()
+        end = prefix + "\uffff"
+        while i < len(tokens) and tokens[i] < end:
+            ids.update(self._postings[tokens[i]])
+            i += 1
+        return ids
+
+    def match_ids(self, query: str) -> Set[int]:
+        """Ids of venues where every query token prefixes some indexed token."""
+        q_tokens = tokenize(query)
+        if not q_tokens:
+            return set()
+        with self._lock:
+            # Most selective (longest) tokens first keeps the intersection small
+            result: Optional[Set[int]] = None
+            for token in sorted(set(q_tokens), key=len, reverse=True):
+                ids = self._prefix_ids(token)
+                result = ids if result is None else result & ids
+                if not result:
+                    return set()
+            return result or set()
+
+    def search(self, query: str, limit: int = 5) -> List[VenueRecord]:
+        """
+        Best `limit` matches: names starting with the query first, then names
+        with a token starting with a query token, then matches on other fields.
+        """
+        q = normalize(query).strip()
+        q_tokens = tokenize(query)
+
+        norm_names = self._norm_names
+
+        def rank(record: VenueRecord):
+            name = norm_names[record.venue_id]
+            if name.startswith(q):
+                tier = 0
+            elif any(t.startswith(qt) for t in _TOKEN_RE.findall(name) for qt in q_tokens):
+                tier = 1
+            else:
+                tier = 2
+            return (tier, len(record.name), record.name)
+
+        venues = self._venues
+        records = [venues[i] for i in self.match_ids(query) if i in venues]
+        return heapq.nsmallest(limit, records, key=rank)
+
+    def ids_near(self, latitude: float, longitude: float, radius_km: float) -> Set[int]:
+        """Candidate ids from the grid cells covering the radius (not yet distance-filtered)."""
+        precision, cells = covering_cells(latitude, longitude, radius_km)
+        grid = self._cells[precision]
+        ids: Set[int] = set()
+        with self._lock:
+            for cell in cells:
+                found = grid.get(cell)
+                if found:
+                    ids.update(found)
+        return ids
+
+    def search_near(
+        self,
+        query: str,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: int = 5,
+    ) -> List[Tuple[VenueRecord, float]]:
+        """
+        Venues within `radius_km` matching `query` (all venues if the query is
+        blank), as (record, distance_km). Names starting with the query come
+        first; within that, nearest first.
+        """
+        if tokenize(query):
+            candidates = self.match_ids(query)
+            # Few text matches: checking their distance directly beats walking the grid
+            if len(candidates) > 256:
+                candidates &= self.ids_near(latitude, longitude, radius_km)
+        else:
+            candidates = self.ids_near(latitude, longitude, radius_km)
+
+        q = normalize(query).strip()
+        venues = self._venues
+        norm_names = self._norm_names
+        distance_to = distance_from(latitude, longitude)
+        scored = []
+        for venue_id in candidates:
+            record = venues.get(venue_id)
+            if record is None or record.latitude is None or record.longitude is None:
+                continue
+            distance = distance_to(record.latitude, record.longitude)
+            if distance > radius_km:
+                continue
+            tier = 0 if q and norm_names[venue_id].startswith(q) else 1
+            scored.append((tier, distance, venue_id, record))
+        best = heapq.nsmallest(limit, scored)
+        return [(record, distance) for _, distance, _, record in best]
+
+
+venue_catalog = VenueCatalog(query_ttl=settings.VENUE_CATALOG_QUERY_TTL_SEC)
@@ -0,0 +1,178 @@
+# app/services/venue_resolver.py
+"""
+Resolve resy.com venue URLs to venue ids, with a cache.
+
+A venue's slug -> id mapping practically never changes, so successful
+lookups are kept (keyed by the lowercased (city_slug, venue_slug)) and
+/getID and the bulk resolve endpoint only go upstream for venues they have
+not seen recently. Resolved venues are also added to the venue catalog.
+
+The cache survives restarts through a snapshot (see cache_snapshots): keys
+missing from memory are looked up in the snapshot the process started
+from, so nothing is loaded up front.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.deadlines import carry
+from app.core.snapshots import Entry, Snapshot, merge_entries
+from app.services.resy_client import ResyClient, ResyClientError, parse_resy_url
+from app.services.venue_catalog import VenueCatalog, record_from_venue_lookup
+
+
+class VenueResolver:
+    def __init__(self, ttl: float, max_entries: int = 4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (city_slug, venue_slug) -> (expires_at, venue_id, venue_name), least recently used first
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, int, str]]" = OrderedDict()
+        self._snapshot: Optional[Snapshot] = None
+
+    @staticmethod
+    def key_for_url(url: str) -> Tuple[str, str]:
+        """Cache key for a venue URL. Raises ValueError for URLs that are not Resy venue URLs."""
+        city_slug, venue_slug = parse_resy_url(url)
+        return city_slug.lower(), venue_slug.lower()
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[Tuple[int, str]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                entry = self._restore(key)
+                if entry is None:
+                    return None
+            if entry[0] <= time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry[1], entry[2]
+
+    def _remember(self, key: Tuple[str, str], venue_id: int, venue_name: str) -> None:
+        with self._lock:
+            self._insert(key, (time.time() + self.ttl, venue_id, venue_name))
+
+    def _insert(self, key: Tuple[str, str], entry: Tuple[float, int, str]) -> None:
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    # ---------- Snapshots ----------
+
+    def attach_snapshot(self, snapshot: Snapshot) -> None:
+        self._snapshot = snapshot
+
+    def _restore(self, key: Tuple[str, str]) -> Optional[Tuple[float, int, str]]:
+        """Entry for `key` from the startup snapshot, moved into memory. Caller holds the lock."""
+        if self._snapshot is None:
+            return None
+        found = self._snapshot.get(f"{key[0]}/{key[1]}".encode())
+        if found is None:
+            return None
+        venue_id, venue_name = json.loads(found[0])
+        entry = (found[1], venue_id, venue_name)
+        self._insert(key, entry)
+        return entry
+
+    def snapshot_entries(self, now: float) -> Iterable[Entry]:
+        with self._lock:
+            items = list(self._cache.items())
+        memory = (
+            (f"{city}/{venue}".encode(), json.dumps([venue_id, name]).encode(), expires_at)
+            for (city, venue), (expires_at, venue_id, name) in items
+        )
+        return merge_entries(memory, self._snapshot, now)
+
+    def resolve_key(
+        self,
+        resy_client: ResyClient,
+        key: Tuple[str, str],
+        catalog: Optional[VenueCatalog] = None,
+    ) -> Tuple[int, str]:
+        """(venue_id, venue_name) for a (city_slug, venue_slug) key. Raises ResyClientError."""
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        res_json = resy_client.lookup_venue_slug(*key)
+        venue_id_obj = res_json.get("id")
+        if not venue_id_obj or not isinstance(venue_id_obj, dict) or not venue_id_obj.get("resy"):
+            raise ResyClientError("Invalid venue ID format in response", details={"response": res_json})
+
+        venue_id = int(venue_id_obj["resy"])
+        venue_name = str(res_json.get("name", ""))
+        self._remember(key, venue_id, venue_name)
+        if catalog is not None:
+            catalog.add_many([record_from_venue_lookup(res_json)])
+        return venue_id, venue_name
+
+    def resolve_url(
+        self,
+        resy_client: ResyClient,
+        url: str,
+        catalog: Optional[VenueCatalog] = None,
+    ) -> Tuple[int, str]:
+        """(venue_id, venue_name) for a venue URL. Raises ValueError or ResyClientError."""
+        return self.resolve_key(resy_client, self.key_for_url(url), catalog)
+
+    def resolve_many(
+        self,
+        resy_client: ResyClient,
+        urls: List[str],
+        catalog: Optional[VenueCatalog] = None,
+        fanout: int = 8,
+    ) -> List[Dict[str, Any]]:
+        """
+        Resolve many URLs at once. Each distinct venue is looked up once
+        (cache misses run concurrently, at most `fanout` at a time). Returns
+        one {"url", "venue_id", "venue_name", "error"} dict per input URL,
+        in input order; failures set `error` instead of raising.
+        """
+        keys: List[Optional[Tuple[str, str]]] = []
+        errors: Dict[int, str] = {}
+        for i, url in enumerate(urls):
+            try:
+                keys.append(self.key_for_url(url))
+            except ValueError as e:
+                keys.append(None)
+                errors[i] = f"Invalid URL format: {e}"
+
+        resolved: Dict[Tuple[str, str], Any] = {}
+        misses = []
+        for key in dict.fromkeys(k for k in keys if k is not None):
+            cached = self._cached(key)
+            if cached is not None:
+                resolved[key] = cached
+            else:
+                misses.append(key)
+
+        def lookup(key: Tuple[str, str]) -> Any:
+            try:
+                return self.resolve_key(resy_client, key, catalog)
+            except ResyClientError as e:
+                return e
+
+        if misses:
+            with ThreadPoolExecutor(max_workers=max(1, min(fanout, len(misses)))) as executor:
+                for key, outcome in zip(misses, executor.map(carry(lookup), misses)):
+                    resolved[key] = outcome
+
+        results = []
+        for i, (url, key) in enumerate(zip(urls, keys)):
+            item: Dict[str, Any] = {"url": url, "venue_id": None, "venue_name": None, "error": errors.get(i)}
+            outcome = resolved.get(key) if key is not None else None
+            if isinstance(outcome, ResyClientError):
+                item["error"] = f"Upstream error: {outcome.message}"
+            elif outcome is not None:
+                item["venue_id"], item["venue_name"] = outcome
+            results.append(item)
+        return results
+
+
+venue_resolver = VenueResolver(ttl=settings.VENUE_RESOLVE_TTL_SEC)
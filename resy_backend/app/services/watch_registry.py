@@ -0,0 +1,355 @@
+# app/services/watch_registry.py
+"""
+Backend monitors ("watches"), with overlapping watches sharing one poll.
+
+A watch is a subscriber's spec: venue, day, party size and either a time
+window or full slot preferences. Watches are grouped by (venue, day, party
+size), the granularity of a /4/find call, and each group is polled with a
+single find without `time_filter`. The result is then filtered per watch
+with the same window/ranking logic as /slots. Upstream calls therefore
+grow with the number of distinct venue-day-party sizes being watched, not
+with the number of watchers. (Party sizes can't share a call: availability
+differs per party size.)
+
+Each group is a key in the monitor scheduler and polls at the cadence the
+release-pattern analyzer suggests for its venue and day. Every poll also
+feeds the availability index and the slot history, like /slots does.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.availability_history import availability_history
+from app.services.availability_index import availability_index
+from app.services.monitor_scheduler import MonitorScheduler
+from app.services.release_patterns import release_patterns
+from app.services.resy_client import ResyClientError
+from app.services.slot_ranking import SlotRanker, hhmm_minutes, minute_in_window, slot_minute
+from app.services.slots import parse_find_slots
+
+logger = logging.getLogger(__name__)
+
+# (venue_id, day, party_size)
+GroupKey = Tuple[int, str, int]
+
+
+class Watch:
+    __slots__ = (
+        "watch_id", "task_id", "venue_id", "day", "party_size", "time_start", "time_end",
+        "preferences", "notify", "ranker", "window", "slots", "created_at", "checked_at", "changed_at",
+    )
+
+    def __init__(
+        self,
+        task_id: str,
+        venue_id: int,
+        day: str,
+        party_size: int,
+        time_start: Optional[str] = None,
+        time_end: Optional[str] = None,
+        preferences: Optional[Dict[str, Any]] = None,
+        notify: Optional[Dict[str, Any]] = None,
+    ):
+        self.watch_id = uuid.uuid4().hex
+        self.task_id = task_id
+        self.venue_id = int(venue_id)
+        self.day = day
+        self.party_size = int(party_size)
+        self.time_start = time_start
+        self.time_end = time_end
+        self.preferences = preferences
+        self.notify = notify  # webhook_url / email for slot-found notifications
+        self.ranker = SlotRanker(preferences) if preferences else None
+        self.window = (hhmm_minutes(time_start), hhmm_minutes(time_end))
+        self.slots: List[Dict[str, Any]] = []
+        self.created_at = time.time()
+        self.checked_at: Optional[float] = None
+        self.changed_at: Optional[float] = None
+
+    def spec(self) -> Dict[str, Any]:
+        """What it takes to recreate the watch (see WatchStore)."""
+        return {
+            "venue_id": self.venue_id,
+            "day": self.day,
+            "party_size": self.party_size,
+            "time_start": self.time_start,
+            "time_end": self.time_end,
+            "preferences": self.preferences,
+            "notify": self.notify,
+        }
+
+    @classmethod
+    def from_spec(cls, watch_id: str, task_id: str, spec: Dict[str, Any], created_at: float) -> "Watch":
+        watch = cls(task_id=task_id, **spec)
+        watch.watch_id = watch_id
+        watch.created_at = created_at
+        return watch
+
+    def status(self) -> Dict[str, Any]:
+        """Latest results, as stored for other workers to read (see WatchStore)."""
+        return {"slots": self.slots, "checked_at": self.checked_at, "changed_at": self.changed_at}
+
+    def apply_status(self, status: Dict[str, Any]) -> None:
+        self.slots = status.get("slots") or []
+        self.checked_at = status.get("checked_at")
+        self.changed_at = status.get("changed_at")
+
+    @property
+    def key(self) -> GroupKey:
+        return self.venue_id, self.day, self.party_size
+
+    def match(self, slots: List[Dict[str, Any]], minutes: List[Optional[int]]) -> List[Dict[str, Any]]:
+        """
+        This watch's view of a group's slots (with their start minutes, computed
+        once per poll): ranked by its preferences, or filtered by its window
+        exactly like slots.filter_slots_by_window.
+        """
+        if self.ranker is not None:
+            return [{**slot, "score": score} for score, slot in self.ranker.rank(slots)]
+        start, end = self.window
+        if start is None and end is None:
+            return slots
+        return [s for s, m in zip(slots, minutes) if m is not None and minute_in_window(m, start, end)]
+
+    def update(self, slots: List[Dict[str, Any]], minutes: List[Optional[int]], now: float) -> bool:
+        """Take a new poll result; True if the matching slots changed."""
+        matched = self.match(slots, minutes)
+        changed = [s["token"] for s in matched] != [s["token"] for s in self.slots]
+        if changed:
+            self.changed_at = now
+        self.slots = matched
+        self.checked_at = now
+        return changed
+
+    def event(self, found_at: float) -> Dict[str, Any]:
+        """Slot-found notification payload."""
+        return {
+            "watch_id": self.watch_id,
+            "task_id": self.task_id,
+            "venue_id": self.venue_id,
+            "day": self.day,
+            "party_size": self.party_size,
+            "slots": self.slots,
+            "found_at": found_at,
+            "notify": self.notify,
+        }
+
+
+class WatchGroup:
+    __slots__ = ("key", "watches", "slots", "minutes", "next_poll", "last_error", "polled_at")
+
+    def __init__(self, key: GroupKey):
+        self.key = key
+        self.watches: Dict[str, Watch] = {}
+        self.slots: Optional[List[Dict[str, Any]]] = None  # last unfiltered find result
+        self.minutes: List[Optional[int]] = []              # start minute of each of those slots
+        self.next_poll = 0.0
+        self.last_error: Optional[str] = None
+        self.polled_at: Optional[float] = None
+
+
+class WatchRegistry:
+    def __init__(self, client_manager, fanout: int = 8, max_per_task: int = 20, notifier=None):
+        self.client_manager = client_manager
+        self.notifier = notifier
+        self.fanout = fanout
+        self.max_per_task = max_per_task
+        self._lock = threading.Lock()
+        self._groups: Dict[GroupKey, WatchGroup] = {}
+        self._watches: Dict[str, Watch] = {}
+        self._by_task: Dict[str, Dict[str, Watch]] = {}
+        # Watches whose results changed since the journal last took them
+        self._changed: Set[str] = set()
+        self.journal = None  # WatchStore, when watches are persisted
+        self.scheduler = MonitorScheduler(
+            self._scheduled_poll,
+            max_workers=fanout,
+            jitter=settings.WATCH_POLL_JITTER,
+            error_delay=settings.POLL_INTERVAL_WARM_SEC,
+        )
+
+    def __len__(self) -> int:
+        return len(self._watches)
+
+    # ---------- Subscribers ----------
+
+    def add(self, watch: Watch) -> Watch:
+        """Register a watch; it joins (or starts) the group for its venue, day and party size."""
+        self.add_many([watch])
+        return watch
+
+    def add_many(self, watches: List[Watch], spread: float = 0.0, resumed: bool = False) -> None:
+        """
+        Register several watches at once. New groups poll right away, or at
+        random points over `spread` seconds so a bulk add doesn't burst.
+        Raises ValueError (adding nothing) if a task would exceed its limit.
+        `resumed` watches come from the journal: no limit check, not re-saved.
+        """
+        new_groups: List[GroupKey] = []
+        with self._lock:
+            added: Dict[str, int] = {}
+            for watch in watches:
+                added[watch.task_id] = added.get(watch.task_id, 0) + 1
+            for task_id, n in added.items():
+                if not resumed and len(self._by_task.get(task_id, {})) + n > self.max_per_task:
+                    raise ValueError(f"Too many watches for this task (max {self.max_per_task})")
+
+            for watch in watches:
+                group = self._groups.get(watch.key)
+                if group is None:
+                    group = WatchGroup(watch.key)
+                    self._groups[watch.key] = group
+                    new_groups.append(watch.key)
+                group.watches[watch.watch_id] = watch
+                self._watches[watch.watch_id] = watch
+                self._by_task.setdefault(watch.task_id, {})[watch.watch_id] = watch
+                if group.slots is not None:
+                    # The group has already polled: answer from its last result until the next one
+                    watch.update(group.slots, group.minutes, group.polled_at or time.time())
+                    self._changed.add(watch.watch_id)
+        if self.journal is not None and not resumed:
+            self.journal.saved(watches)
+        if spread > 0:
+            self.scheduler.spread(new_groups, spread)
+        else:
+            self.scheduler.schedule_many((key, 0.0) for key in new_groups)
+
+    def remove(self, watch_id: str) -> Optional[Watch]:
+        removed = self.remove_many([watch_id])
+        return removed[0] if removed else None
+
+    def remove_many(self, watch_ids: Iterable[str], journal: bool = True) -> List[Watch]:
+        """
+        Unregister watches; groups left without watches stop polling.
+        `journal=False` when the store already reflects the removal.
+        """
+        removed: List[Watch] = []
+        emptied: List[GroupKey] = []
+        with self._lock:
+            for watch_id in watch_ids:
+                watch = self._watches.pop(watch_id, None)
+                if watch is None:
+                    continue
+                removed.append(watch)
+                self._changed.discard(watch_id)
+                task_watches = self._by_task.get(watch.task_id)
+                if task_watches is not None:
+                    task_watches.pop(watch_id, None)
+                    if not task_watches:
+                        del self._by_task[watch.task_id]
+                group = self._groups.get(watch.key)
+                if group is not None:
+                    group.watches.pop(watch_id, None)
+                    if not group.watches:
+                        del self._groups[watch.key]
+                        emptied.append(watch.key)
+        if emptied:
+            self.scheduler.cancel_many(emptied)
+        if self.journal is not None and journal and removed:
+            self.journal.deleted([w.watch_id for w in removed])
+        if self.notifier is not None:
+            for watch in removed:
+                self.notifier.forget(watch.watch_id)
+        return removed
+
+    def get(self, watch_id: str) -> Optional[Watch]:
+        return self._watches.get(watch_id)
+
+    def for_task(self, task_id: str) -> List[Watch]:
+        with self._lock:
+            return list(self._by_task.get(task_id, {}).values())
+
+    def take_changed(self) -> Dict[str, Dict[str, Any]]:
+        """Status of every watch whose results changed since the last call."""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            return {w: self._watches[w].status() for w in changed if w in self._watches}
+
+    def group_of(self, watch: Watch) -> Optional[WatchGroup]:
+        return self._groups.get(watch.key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {"watches": len(self._watches), "groups": len(self._groups)}
+        return {**counts, "scheduler": self.scheduler.stats()}
+
+    # ---------- Polling ----------
+
+    def poll(self, key: GroupKey) -> Optional[float]:
+        """
+        One find for the group, fanned out to every watch in it. Returns the
+        seconds until the group should poll again (None if it has no watches).
+        """
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None or not group.watches:
+                return None
+            task_id = next(iter(group.watches.values())).task_id
+        venue_id, day, party_size = key
+
+        now = time.time()
+        try:
+            with self.client_manager.use_client(task_id, touch=False) as resy_client:
+                resp = resy_client.find(venue_id=str(venue_id), num_seats=party_size, day=day)
+        except ResyClientError as e:
+            logger.warning("Watch poll for venue %s on %s failed: %s", venue_id, day, e.message)
+            with self._lock:
+                group.last_error = e.message
+                group.next_poll = now + settings.POLL_INTERVAL_WARM_SEC
+            return settings.POLL_INTERVAL_WARM_SEC
+
+        slots = parse_find_slots(resp)
+        minutes = [slot_minute(slot["start"]) for slot in slots]
+        availability_index.record_find(venue_id, party_size, day, bool(slots))
+        availability_history.record(venue_id, day, party_size, [slot["start"] for slot in slots], observed_at=now)
+        interval = release_patterns.poll_interval(venue_id, day, now)
+
+        found, cleared = [], []
+        with self._lock:
+            group.slots = slots
+            group.minutes = minutes
+            group.polled_at = now
+            group.last_error = None
+            group.next_poll = now + interval
+            for watch in group.watches.values():
+                first_check = watch.checked_at is None
+                changed = watch.update(slots, minutes, now)
+                if changed or first_check:
+                    self._changed.add(watch.watch_id)
+                if changed:
+                    if watch.slots:
+                        found.append(watch.event(now))
+                    else:
+                        cleared.append(watch.watch_id)
+
+        # Hand-off only: delivery happens on the notifier's workers, never in the poll
+        if self.notifier is not None:
+            for watch_id in cleared:
+                self.notifier.forget(watch_id)
+            for event in found:
+                self.notifier.publish(event)
+        return interval
+
+    def _scheduled_poll(self, key: GroupKey) -> Optional[float]:
+        """Monitor scheduler callback: days that are over end their watches instead of polling."""
+        if key[1] < date.today().isoformat():
+            with self._lock:
+                group = self._groups.get(key)
+                watch_ids = list(group.watches) if group is not None else []
+            self.remove_many(watch_ids)
+            return None
+        return self.poll(key)
+
+    def poll_all(self) -> int:
+        """Poll every group once, right now, outside the scheduler (benchmarks, one-off runs)."""
+        with self._lock:
+            keys = list(self._groups)
+        if keys:
+            with ThreadPoolExecutor(max_workers=min(self.fanout, len(keys)), thread_name_prefix="watch") as executor:
+                list(executor.map(self.poll, keys))
+        return len(keys)
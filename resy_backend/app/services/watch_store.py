@@ -0,0 +1,176 @@
+# app/services/watch_store.py
+"""
+Durable watches: survive restarts and deploys, and are visible to every worker.
+
+Watch definitions go to the shared state store (task_watches); the session
+material they poll with (auth token, cookies) is already there via
+ClientManager, and idle-session expiry leaves it alone while the task has
+watches. Creating or removing a watch writes through to the store right
+away (if the store is busy the change is queued and retried on the next
+sync), so any worker can list, read or delete a task's watches; those
+owned by another process are read from their rows, including the latest
+results the owner stores on each sync.
+
+Every row names the process running it (`owner`) and a heartbeat the owner
+refreshes on each sync. On startup, and on every sync, a process adopts the
+rows whose owner stopped heartbeating (a crashed worker) or released them
+(clean shutdown), and stops running watches whose rows are gone (deleted
+through another worker, or at the task's logout). Adopted
+watches are rescheduled spread over WATCH_RESUME_SPREAD_SEC, so a restart
+with thousands of watches doesn't hit Resy with all their polls at once.
+"""
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.state_store import state_store
+from app.services.watch_registry import Watch, WatchRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class WatchStore:
+    def __init__(self, registry: WatchRegistry, store=None, owner: str = ""):
+        self.registry = registry
+        self.store = store if store is not None else state_store
+        self.owner = owner or uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._upserts: Dict[str, Watch] = {}
+        self._deletes: Set[str] = set()
+        # Watches this process has written (or adopted): the ones whose rows it expects to find
+        self._persisted: Set[str] = set()
+        registry.journal = self
+
+    # ---------- Registry hooks (request path) ----------
+
+    def saved(self, watches: Iterable[Watch]) -> None:
+        with self._lock:
+            for watch in watches:
+                self._upserts[watch.watch_id] = watch
+                self._deletes.discard(watch.watch_id)
+        self._write_through()
+
+    def deleted(self, watch_ids: Iterable[str]) -> None:
+        with self._lock:
+            for watch_id in watch_ids:
+                self._upserts.pop(watch_id, None)
+                self._deletes.add(watch_id)
+        self._write_through()
+
+    def _write_through(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            # Still queued; the next sync retries
+            logger.warning("Watch write-through failed, deferring to the next sync: %s", e)
+
+    # ---------- Any worker ----------
+
+    def _from_row(self, row: Dict[str, Any]) -> Watch:
+        watch = Watch.from_spec(row["watch_id"], row["task_id"], row["spec"], row["created_at"])
+        watch.apply_status(row.get("status") or {})
+        return watch
+
+    def for_task(self, task_id: str) -> List[Watch]:
+        """The task's watches: live ones from this process, the rest as their owners last stored them."""
+        local = {w.watch_id: w for w in self.registry.for_task(task_id)}
+        watches = list(local.values())
+        for row in self.store.load_watches(task_id):
+            if row["watch_id"] in local:
+                continue
+            try:
+                watches.append(self._from_row(row))
+            except (TypeError, ValueError) as e:
+                logger.warning("Skipping unreadable watch %s: %s", row["watch_id"], e)
+        return watches
+
+    def get(self, watch_id: str, task_id: str) -> Optional[Watch]:
+        watch = self.registry.get(watch_id)
+        if watch is not None:
+            return watch if watch.task_id == task_id else None
+        return next((w for w in self.for_task(task_id) if w.watch_id == watch_id), None)
+
+    def add(self, watch: Watch) -> Watch:
+        """Register a watch here. Raises ValueError if the task is at its limit across all workers."""
+        if len(self.store.load_watches(watch.task_id)) >= self.registry.max_per_task:
+            raise ValueError(f"Too many watches for this task (max {self.registry.max_per_task})")
+        return self.registry.add(watch)
+
+    def remove(self, watch_ids: Iterable[str]) -> None:
+        """
+        Delete watches wherever they run: local ones stop now, rows owned by
+        other processes are deleted and their owners stop them on their next sync.
+        """
+        watch_ids = list(watch_ids)
+        self.registry.remove_many(watch_ids, journal=False)
+        self.deleted(watch_ids)
+
+    # ---------- Background ----------
+
+    def flush(self) -> int:
+        """Write queued changes in one transaction. Returns the number of rows touched."""
+        with self._lock:
+            upserts, self._upserts = self._upserts, {}
+            deletes, self._deletes = self._deletes, set()
+            if not upserts and not deletes:
+                return 0
+            rows: List[Tuple[str, str, dict, float]] = [
+                (w.watch_id, w.task_id, w.spec(), w.created_at) for w in upserts.values()
+            ]
+            try:
+                self.store.write_watches(rows, deletes, self.owner, time.time())
+            except Exception:
+                # Put the batch back and try again on the next sync
+                self._upserts.update(upserts)
+                self._deletes.update(deletes)
+                raise
+            self._persisted.update(upserts)
+            self._persisted.difference_update(deletes)
+        return len(rows) + len(deletes)
+
+    def adopt(self, spread: float) -> int:
+        """Load watches nobody is running and schedule them over `spread` seconds. Returns how many."""
+        rows = self.store.adopt_watches(self.owner, time.time(), settings.WATCH_OWNER_STALE_SEC)
+        if not rows:
+            return 0
+        watches = []
+        for row in rows:
+            try:
+                watches.append(self._from_row(row))
+            except (TypeError, ValueError) as e:
+                logger.warning("Skipping unreadable watch %s: %s", row["watch_id"], e)
+        with self._lock:
+            self._persisted.update(w.watch_id for w in watches)
+        self.registry.add_many(watches, spread=spread, resumed=True)
+        logger.info("Resumed %d watch(es)", len(watches))
+        return len(watches)
+
+    def reconcile(self) -> int:
+        """Stop watches whose rows were deleted elsewhere or taken over by another process. Returns how many."""
+        with self._lock:
+            owned = set(self.store.owned_watch_ids(self.owner))
+            gone = self._persisted - owned - set(self._upserts)
+            self._persisted -= gone
+        if gone:
+            self.registry.remove_many(gone, journal=False)
+            logger.info("Stopped %d watch(es) removed elsewhere", len(gone))
+        return len(gone)
+
+    def sync(self) -> None:
+        """
+        Scheduler job: write queued changes, heartbeat (with the latest results),
+        drop watches removed elsewhere and adopt watches of dead processes.
+        """
+        self.flush()
+        self.store.heartbeat_watches(self.owner, time.time(), self.registry.take_changed())
+        self.reconcile()
+        self.adopt(spread=settings.WATCH_RESUME_SPREAD_SEC)
+
+    def close(self) -> None:
+        """Clean shutdown: write everything and hand the watches over at once."""
+        self.flush()
+        self.store.heartbeat_watches(self.owner, time.time(), self.registry.take_changed())
+        self.store.release_watches(self.owner)
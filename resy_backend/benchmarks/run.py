@@ -0,0 +1,578 @@
+# benchmarks/run.py
+"""
+Offline micro-benchmarks for the route handlers and parsing hot paths.
+
+Everything runs in-process: `requests.Session.request` is replaced with a
+canned transport that serves synthetic Resy payloads, so no network access
+or real credentials are needed.
+
+Usage (from resy_backend/):
+    python -m benchmarks.run                  # compare against baselines.json
+    python -m benchmarks.run --update         # record baselines for new benchmarks
+    python -m benchmarks.run --update --force # re-record every baseline (new machine)
+    python -m benchmarks.run -k slots         # only benchmarks matching "slots"
+    python -m benchmarks.run --threshold 0.5  # allow 50% slowdown before failing
+
+Each benchmark is timed over REPEATS repeats, each right after a fixed
+reference workload, and compared on the median of benchmark/reference
+ratios: a shared box that slows down for a while slows both alike, so
+the comparison holds. Baselines are stored scaled to the reference time
+recorded with them (reference_us). A benchmark only counts as regressed if it is slower than its baseline by
+more than the threshold, more than its own run-to-run spread (so noisy
+cases get a wider band) and more than NOISE_FLOOR_US, and is still slower
+when timed a second time. Exits with status 1 if any benchmark regressed.
+
+`--update` never overwrites an existing baseline unless `--force` is
+given: a change that makes something slower has to show up as a
+regression here, not disappear into a re-recorded baseline.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Settings require these; the values are irrelevant offline.
+os.environ.setdefault("RESY_API_KEY", "benchmark-key")
+os.environ.setdefault("MODE", "development")
+
+import requests
+
+BASELINE_FILE = Path(__file__).parent / "baselines.json"
+DEFAULT_THRESHOLD = 0.25  # fail if >25% slower than baseline
+MIN_REPEAT_TIME = 0.05    # seconds per timing repeat
+REPEATS = 15
+SPREAD_FACTOR = 3.0       # a regression must exceed this many times the run's relative spread
+NOISE_FLOOR_US = 2.0      # ignore absolute differences below this
+
+
+# ---------- Synthetic payloads ----------
+
+def make_find_payload(num_slots: int, day: str = "2025-09-02") -> Dict[str, Any]:
+    slots = []
+    for i in range(num_slots):
+        minutes = 17 * 60 + (i * 15) % (6 * 60)
+        hh, mm = divmod(minutes, 60)
+        slots.append({
+            "config": {
+                "token": f"rgs://resy/1234/5678/2/{day}/{day}/{hh:02d}:{mm:02d}:00/2/{i}",
+                "type": ["Dining Room", "Patio", "Bar"][i % 3],
+            },
+            "date": {
+                "start": f"{day} {hh:02d}:{mm:02d}:00",
+                "end": f"{day} {(hh + 2) % 24:02d}:{mm:02d}:00",
+            },
+            "payment": {"is_paid": i % 5 == 0},
+        })
+    return {"results": {"venues": [{"venue": {"id": {"resy": 1234}}, "slots": slots}]}}
+
+
+def make_calendar_payload(start: date, days: int) -> Dict[str, Any]:
+    scheduled = []
+    for i in range(days):
+        d = start + timedelta(days=i)
+        scheduled.append({
+            "date": d.isoformat(),
+            "inventory": {
+                "reservation": "available" if i % 3 else "sold-out",
+                "event": "not available",
+                "walk-in": "available",
+            },
+        })
+    return {"scheduled": scheduled, "last_calendar_day": (start + timedelta(days=days - 1)).isoformat()}
+
+
+def make_venuesearch_payload(num_hits: int) -> Dict[str, Any]:
+    hits = []
+    for i in range(num_hits):
+        hits.append({
+            "id": {"resy": 1000 + i},
+            "name": f"Venue {i}",
+            "cuisine": ["Italian", "Pizza"],
+            "neighborhood": "Little Italy",
+            "region": "Toronto",
+            "images": [f"https://image.resy.com/{i}.jpg"],
+            "_geoloc": {"lat": 43.65 + i * 0.001, "lng": -79.38 - i * 0.001},
+        })
+    return {"search": {"hits": hits, "nbHits": num_hits}}
+
+
+def make_catalog_records(num_venues: int):
+    from app.services.venue_catalog import VenueRecord
+
+    words = ["trattoria", "osteria", "bistro", "taqueria", "izakaya", "brasserie", "pizzeria", "cantina"]
+    names = ["roma", "verde", "luna", "sol", "rosa", "nord", "mare", "fuoco", "oro", "alba"]
+    cuisines = ["Italian", "Mexican", "Japanese", "French", "Pizza", "Seafood"]
+    hoods = ["Little Italy", "Ossington", "Kensington", "Leslieville", "Yorkville"]
+    return [
+        VenueRecord(
+            venue_id=100000 + i,
+            name=f"{words[i % len(words)].title()} {names[(i // len(words)) % len(names)].title()} {i}",
+            cuisine=cuisines[i % len(cuisines)],
+            neighborhood=hoods[i % len(hoods)],
+            region="Toronto",
+            latitude=43.60 + (i % 100) * 0.002,
+            longitude=-79.45 + (i // 100) * 0.002,
+        )
+        for i in range(num_venues)
+    ]
+
+
+# ---------- Offline transport ----------
+
+class FakeTransport:
+    """Stands in for `requests.Session.request`, routing by URL path."""
+
+    def __init__(self):
+        self.routes: Dict[str, Dict[str, Any]] = {}
+        self._bodies: Dict[str, bytes] = {}
+
+    def set(self, path: str, payload: Dict[str, Any]) -> None:
+        self.routes[path] = payload
+        self._bodies[path] = json.dumps(payload).encode()
+
+    def __call__(self, session, method, url, **kwargs) -> requests.Response:
+        path = url.split("api.resy.com", 1)[-1].split("?", 1)[0]
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = url
+        resp.headers["Content-Type"] = "application/json"
+        resp._content = self._bodies.get(path, b"{}")
+        return resp
+
+
+# ---------- Harness ----------
+
+class Benchmark:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[], Any],
+        setup: Optional[Callable[[], None]] = None,
+        teardown: Optional[Callable[[], None]] = None,
+        tolerance: Optional[float] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.setup = setup
+        self.teardown = teardown
+        self.tolerance = tolerance  # allowed slowdown for this case, if wider than --threshold
+
+
+def _reference_work() -> None:
+    """Fixed, dependency-free interpreter workload the benchmarks are measured against."""
+    counts: Dict[int, int] = {}
+    for i in range(2000):
+        counts[i % 97] = counts.get(i % 97, 0) + i
+    json.loads(json.dumps(sorted(counts.items())))
+
+
+class Timing:
+    def __init__(self, samples: List[float], reference: List[float]):
+        n = len(samples)
+        self.median = sorted(samples)[n // 2]
+        # Each repeat relative to the reference work timed right before it: shared-box
+        # slowdowns hit both alike and cancel out
+        ratios = sorted(t / r for t, r in zip(samples, reference))
+        self.ratio = ratios[n // 2]
+        # Relative interquartile range: how much this case moves between repeats
+        self.spread = (ratios[(3 * n) // 4] - ratios[n // 4]) / self.ratio if self.ratio else 0.0
+        self.reference = sorted(reference)[n // 2]
+
+    def scaled(self, reference_us: float) -> float:
+        """Time per call on a box whose reference work takes `reference_us`."""
+        return self.ratio * reference_us
+
+
+def time_benchmark(bench: Benchmark) -> Timing:
+    """Time per call over REPEATS repeats (microseconds), each paired with a reference timing."""
+    if bench.setup:
+        bench.setup()
+    gc.collect()
+    gc.disable()  # like timeit: keep collector pauses out of the numbers
+    try:
+        return _time_calls(bench.fn)
+    finally:
+        gc.enable()
+        if bench.teardown:
+            bench.teardown()
+
+
+def _calibrate(fn: Callable[[], Any]) -> int:
+    """Loop count so one repeat runs for at least MIN_REPEAT_TIME."""
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= MIN_REPEAT_TIME:
+            return number
+        number *= 2 if elapsed * 10 > MIN_REPEAT_TIME else 10
+
+
+def _per_call_us(fn: Callable[[], Any], number: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - t0) / number * 1e6
+
+
+_reference_number = 0
+
+
+def _time_calls(fn: Callable[[], Any]) -> Timing:
+    global _reference_number
+    if not _reference_number:
+        _reference_number = _calibrate(_reference_work)
+    fn()  # warm-up
+    number = _calibrate(fn)
+
+    samples, reference = [], []
+    for _ in range(REPEATS):
+        reference.append(_per_call_us(_reference_work, _reference_number))
+        samples.append(_per_call_us(fn, number))
+    return Timing(samples, reference)
+
+
+def measure_reference() -> float:
+    """Median reference time per call (microseconds) on this box, right now."""
+    global _reference_number
+    if not _reference_number:
+        _reference_number = _calibrate(_reference_work)
+    return sorted(_per_call_us(_reference_work, _reference_number) for _ in range(REPEATS))[REPEATS // 2]
+
+
+def regressed(bench: Benchmark, us: float, timing: Timing, base: float, threshold: float) -> bool:
+    allowed = max(bench.tolerance or threshold, threshold, SPREAD_FACTOR * timing.spread)
+    return us > base * (1 + allowed) and us - base > NOISE_FLOOR_US
+
+
+def build_benchmarks(transport: FakeTransport, workdir: str) -> List[Benchmark]:
+    from fastapi import BackgroundTasks
+
+    from app.api.v1 import resy_routes
+    from app.core import security
+    from app.core.config import settings
+    from app.core.state_store import SQLiteStateStore
+    from app.core.token_manager import generate_session_token, validate_session_token
+    from app.services.availability_history import AvailabilityHistory
+    from app.services.availability_index import AvailabilityIndex
+    from app.services.clientManager import ClientManager
+    from app.services.venue_catalog import VenueCatalog
+
+    benches: List[Benchmark] = []
+    task_id = "bench-task"
+
+    # get_slots: parsing + time-window filtering. The history buffer is kept small, as the
+    # scheduler would keep it by flushing, so it doesn't pile up across timing loops.
+    for n in (10, 100, 1000):
+        payload = make_find_payload(n)
+
+        def setup(payload=payload):
+            transport.set("/4/find", payload)
+            resy_routes.availability_history = AvailabilityHistory(
+                os.path.join(workdir, "history.db"), retention_sec=3600, max_pending=100
+            )
+
+        unfiltered = resy_routes.SlotSearchQuery(venue_id=1234, day="2025-09-02", num_seats=2)
+        windowed = resy_routes.SlotSearchQuery(
+            venue_id=1234, day="2025-09-02", num_seats=2, time_start="18:30", time_end="21:00"
+        )
+        benches.append(Benchmark(
+            f"get_slots[{n}]",
+            lambda q=unfiltered: resy_routes.get_slots(q, x_task_id=task_id),
+            setup,
+        ))
+        benches.append(Benchmark(
+            f"get_slots_window[{n}]",
+            lambda q=windowed: resy_routes.get_slots(q, x_task_id=task_id),
+            setup,
+        ))
+        ranked = resy_routes.SlotSearchQuery(
+            venue_id=1234, day="2025-09-02", num_seats=2,
+            preferences=resy_routes.SlotPreferences(
+                target_time="19:30", time_start="18:30", time_end="21:00",
+                preferred_types=["Patio", "Dining Room"], excluded_types=["Bar"], prefer_free=True,
+            ),
+        )
+        benches.append(Benchmark(
+            f"get_slots_ranked[{n}]",
+            lambda q=ranked: resy_routes.get_slots(q, x_task_id=task_id),
+            setup,
+        ))
+
+    # calendar: date extraction over a year, upstream (fresh index each call) and from the availability index
+    cal_start = date.today() + timedelta(days=1)
+    cal_payload = make_calendar_payload(cal_start, 366)
+    cal_body = resy_routes.calendarRequest(
+        venue_id=1234, num_seats=2, start_date=cal_start.isoformat(),
+        end_date=(cal_start + timedelta(days=365)).isoformat(),
+    )
+
+    def calendar_miss():
+        resy_routes.availability_index = AvailabilityIndex(max_age=60)
+        resy_routes.calendar(cal_body, x_task_id=task_id)
+
+    benches.append(Benchmark(
+        "calendar[366d]",
+        calendar_miss,
+        lambda: transport.set("/4/venue/calendar", cal_payload),
+    ))
+
+    def calendar_cached_setup():
+        transport.set("/4/venue/calendar", cal_payload)
+        resy_routes.availability_index = AvailabilityIndex(max_age=3600)
+        resy_routes.calendar(cal_body, x_task_id=task_id)
+
+    benches.append(Benchmark(
+        "calendar_cached[366d]",
+        lambda: resy_routes.calendar(cal_body, x_task_id=task_id),
+        calendar_cached_setup,
+    ))
+
+    # venue_search: upstream hit mapping (empty catalog each call, so every query misses)
+    for n in (5, 50):
+        vs_payload = make_venuesearch_payload(n)
+        vs_body = resy_routes.VenueSearchRequest(latitude=43.65, longitude=-79.38, query="pizza", per_page=n)
+
+        def venue_search_miss(b=vs_body):
+            resy_routes.venue_catalog = VenueCatalog()
+            resy_routes.venue_search(b, BackgroundTasks(), x_task_id=task_id)
+
+        benches.append(Benchmark(
+            f"venue_search[{n}]",
+            venue_search_miss,
+            lambda p=vs_payload: transport.set("/3/venuesearch/search", p),
+        ))
+
+    # venue_search served from a warm local catalog (typeahead)
+    catalog = VenueCatalog()
+    catalog.add_many(make_catalog_records(5000))
+    typeahead_body = resy_routes.VenueSearchRequest(latitude=43.65, longitude=-79.38, query="trattoria ro", per_page=5)
+
+    def typeahead_setup():
+        resy_routes.venue_catalog = catalog
+
+    benches.append(Benchmark(
+        "venue_typeahead[5000]",
+        lambda: resy_routes.venue_search(typeahead_body, BackgroundTasks(), x_task_id=task_id),
+        typeahead_setup,
+    ))
+
+    # Warm start: rebuild the catalog's search indexes from a mapped snapshot
+    from app.core.snapshots import Snapshot, write_snapshot
+
+    snapshot_path = os.path.join(workdir, "venue_catalog.snap")
+
+    def catalog_snapshot_setup():
+        write_snapshot(snapshot_path, catalog.snapshot_entries(time.time()))
+
+    def catalog_warm():
+        warmed = VenueCatalog()
+        warmed.attach_snapshot(Snapshot(snapshot_path))
+        warmed.warm_from_snapshot()
+
+    benches.append(Benchmark("catalog_warm_start[5000]", catalog_warm, catalog_snapshot_setup))
+
+    # "Next available" search: calendar pruning + bounded find fan-out over N venues x 7 days
+    from app.services.availability_search import search_available
+
+    for n in (5, 20):
+        venues = [{"venue_id": 1000 + i, "name": f"venue {i}", "distance_km": i * 0.1} for i in range(n)]
+
+        def availability_setup():
+            transport.set("/4/venue/calendar", make_calendar_payload(date(2025, 9, 1), 7))
+            transport.set("/4/find", make_find_payload(20))
+
+        def availability_search(venues=venues):
+            with resy_routes.client_manager.use_clients(task_id, 8) as clients:
+                for _ in search_available(
+                    clients, venues, party_size=2, start_date="2025-09-01", end_date="2025-09-07",
+                    time_start="19:00", time_end="21:00", limit=len(venues),
+                ):
+                    pass
+
+        benches.append(Benchmark(f"availability_search[{n}x7d]", availability_search, availability_setup))
+
+    # Bulk venue URL resolution: 50 URLs over 20 distinct venues, cold resolver cache
+    from app.services.venue_resolver import VenueResolver
+
+    bulk_urls = resy_routes.BulkIdRequest(
+        URLs=[f"https://resy.com/cities/toronto-on/venues/venue-{i % 20}" for i in range(50)]
+    )
+
+    def bulk_resolve():
+        resy_routes.venue_resolver = VenueResolver(ttl=3600)
+        resy_routes.getIDs(bulk_urls, x_task_id=task_id)
+
+    benches.append(Benchmark(
+        "getIDs[50]",
+        bulk_resolve,
+        lambda: transport.set("/3/venue", {"id": {"resy": 1234}, "name": "Venue", "location": {}}),
+    ))
+
+    # Watch polling: 1000 watches over 10 venue-days, one find per group fanned out to its watches
+    from app.services.watch_registry import Watch, WatchRegistry
+
+    def watch_setup():
+        transport.set("/4/find", make_find_payload(100))
+        resy_routes.availability_history = AvailabilityHistory(
+            os.path.join(workdir, "history.db"), retention_sec=3600, max_pending=100
+        )
+
+    def watch_poll():
+        registry = WatchRegistry(resy_routes.client_manager, max_per_task=1000)
+        for i in range(1000):
+            hh = 17 + i % 5
+            registry.add(Watch(task_id, 1000 + i % 10, "2099-09-02", 2, f"{hh:02d}:00", f"{hh + 1:02d}:30"))
+        registry.poll_all()
+
+    benches.append(Benchmark("watch_poll[1000w/10g]", watch_poll, watch_setup))
+
+    # Monitor scheduler bookkeeping: bulk-schedule then cancel 10k monitors (no event loop needed)
+    from app.services.monitor_scheduler import MonitorScheduler
+
+    def scheduler_churn():
+        scheduler = MonitorScheduler(lambda key: None)
+        scheduler.spread(range(10000), 60.0)
+        scheduler.cancel_many(range(10000))
+
+    benches.append(Benchmark("monitor_scheduler[10k add+cancel]", scheduler_churn))
+
+    # JWT validation
+    token = generate_session_token(task_id)
+    benches.append(Benchmark(
+        "validate_session_token",
+        lambda: validate_session_token(token=token, x_task_id=task_id),
+    ))
+
+    # Rate limiter (allowed path). A zero-length window expires the previous
+    # hit on every call, so this measures the steady-state prune + count + record.
+    window = settings.RATE_LIMIT_WINDOW_SEC
+
+    def rate_limit_setup():
+        settings.RATE_LIMIT_WINDOW_SEC = 0
+
+    def rate_limit_teardown():
+        settings.RATE_LIMIT_WINDOW_SEC = window
+
+    benches.append(Benchmark(
+        "rate_limiter",
+        lambda: security.rate_limiter(None, api_key=settings.API_KEY),
+        rate_limit_setup,
+        rate_limit_teardown,
+    ))
+
+    # ClientManager attach/release round trip with N live tasks
+    for n in (10, 1000, 10000):
+        manager = ClientManager(store=SQLiteStateStore(os.path.join(workdir, f"tasks_{n}.db")))
+
+        def populate(manager=manager, n=n):
+            for i in range(n):
+                with manager.use_client(f"task-{i}"):
+                    pass
+
+        def use_client_once(manager=manager, n=n):
+            with manager.use_client(f"task-{n // 2}"):
+                pass
+
+        benches.append(Benchmark(f"use_client[{n}]", use_client_once, populate))
+
+    return benches
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run offline backend micro-benchmarks.")
+    parser.add_argument("--update", action="store_true", help="record baselines for benchmarks that have none")
+    parser.add_argument("--force", action="store_true", help="with --update, overwrite existing baselines too")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed fractional slowdown vs. baseline (default 0.25)")
+    parser.add_argument("-k", dest="keyword", default=None, help="only run benchmarks containing this string")
+    parser.add_argument("--baseline-file", default=str(BASELINE_FILE))
+    args = parser.parse_args(argv)
+
+    transport = FakeTransport()
+    real_request = requests.Session.request
+    requests.Session.request = lambda session, method, url, **kw: transport(session, method, url, **kw)
+    try:
+        return _run(args, transport)
+    finally:
+        requests.Session.request = real_request
+
+
+def _run(args: argparse.Namespace, transport: FakeTransport) -> int:
+    baseline_path = Path(args.baseline_file)
+    recorded: Dict[str, Any] = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    baselines: Dict[str, float] = recorded.get("results", {})
+    # Baselines are in units of the reference work as timed when they were recorded
+    reference_us = recorded.get("reference_us") if not (args.update and args.force) else None
+    if not reference_us:
+        baselines = {} if args.update and args.force else baselines
+        reference_us = measure_reference()
+
+    results: Dict[str, float] = {}
+    regressions: List[str] = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keep the shared state store out of the working tree.
+        os.environ.setdefault("STATE_DB_PATH", os.path.join(workdir, "state.db"))
+        # Silence the handlers' debug prints while timing.
+        real_stdout = sys.stdout
+        for bench in build_benchmarks(transport, workdir):
+            if args.keyword and args.keyword not in bench.name:
+                continue
+            base = baselines.get(bench.name)
+            sys.stdout = open(os.devnull, "w")
+            try:
+                timing = time_benchmark(bench)
+                if base and not args.update and regressed(bench, timing.scaled(reference_us), timing, base, args.threshold):
+                    # Confirm before reporting: a one-off stall on a busy box shouldn't fail the run
+                    retry = time_benchmark(bench)
+                    if retry.ratio < timing.ratio:
+                        timing = retry
+            finally:
+                sys.stdout.close()
+                sys.stdout = real_stdout
+            us = timing.scaled(reference_us)
+            results[bench.name] = round(us, 3)
+
+            if base:
+                ratio = us / base
+                flag = ""
+                if regressed(bench, us, timing, base, args.threshold):
+                    flag = "  REGRESSION"
+                    regressions.append(bench.name)
+                print(f"{bench.name:<32} {us:>12.2f} us ±{timing.spread:4.0%}  "
+                      f"(baseline {base:.2f} us, x{ratio:.2f}){flag}")
+            else:
+                print(f"{bench.name:<32} {us:>12.2f} us ±{timing.spread:4.0%}  (no baseline)")
+
+    if args.update:
+        merged = dict(baselines)
+        for name, us in results.items():
+            if args.force or name not in merged:
+                merged[name] = us
+        baseline_path.write_text(json.dumps({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "reference_us": round(reference_us, 3),
+            "results": dict(sorted(merged.items())),
+        }, indent=2) + "\n")
+        print(f"Baselines written to {baseline_path}")
+        return 0
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
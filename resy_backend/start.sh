@@ -1,7 +1,10 @@
 #!/bin/bash
 # Startup script for Railway deployment
 # Uses PORT environment variable if set, otherwise defaults to 8000
+# WEB_CONCURRENCY sets the number of uvicorn worker processes (default 1).
+# Task sessions and rate limits are shared between workers through STATE_DB_PATH.
 
 PORT=${PORT:-8000}
-echo "Starting server on port $PORT"
-uvicorn app.main:app --host 0.0.0.0 --port $PORT
+WORKERS=${WEB_CONCURRENCY:-1}
+echo "Starting server on port $PORT with $WORKERS worker(s)"
+uvicorn app.main:app --host 0.0.0.0 --port $PORT --workers $WORKERS
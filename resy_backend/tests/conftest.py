@@ -0,0 +1,135 @@
+# tests/conftest.py
+"""
+Shared fixtures. Settings are read when app modules are imported, so the
+environment is set up here first: development mode, in-memory shared state,
+and scratch paths for anything written to disk.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+_scratch = tempfile.mkdtemp(prefix="resy-tests-")
+atexit.register(shutil.rmtree, _scratch, ignore_errors=True)
+os.environ.update({
+    "RESY_API_KEY": "test-resy-key",
+    "MODE": "development",
+    "API_KEY": "test-api-key",
+    "STATE_BACKEND": "memory",
+    "STATE_DB_PATH": os.path.join(_scratch, "state.db"),
+    "CACHE_SNAPSHOT_DIR": os.path.join(_scratch, "cache_snapshots"),
+    "NOTIFY_SINKS": "",
+    "AUTH_CACHE_ENABLED": "false",
+})
+
+from app.core.state_store import MemoryStateStore, SQLiteStateStore  # noqa: E402
+from app.services.clientManager import ClientManager  # noqa: E402
+from app.services.watch_registry import WatchRegistry  # noqa: E402
+from app.services.watch_store import WatchStore  # noqa: E402
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    """Each state store backend; they share one API and must behave alike."""
+    if request.param == "memory":
+        return MemoryStateStore()
+    return SQLiteStateStore(str(tmp_path / "state.db"))
+
+
+@pytest.fixture
+def client_manager(store):
+    return ClientManager(store)
+
+
+@pytest.fixture
+def watch_store(store, client_manager):
+    """This process's watches, persisted to `store` and polled with `client_manager`'s sessions."""
+    return WatchStore(WatchRegistry(client_manager), store, owner="this-worker")
+
+
+class FakeResyClient:
+    """Stands in for ResyClient: canned /find, calendar, preview and user results, recorded logins and /3/book calls."""
+
+    def __init__(self):
+        self.userAuth = ""
+        self.login_token = "resy-auth"
+        self.logins = []
+        self.find_result = {"results": {"venues": []}}
+        self.calendar_result = {"scheduled": []}
+        self.calendar_calls = 0
+        self.preview_result = {"book_token": {"value": "bt-1"}}
+        self.book_result = {"resy_token": "resy-1"}
+        self.reservations = []
+        self.booked = []
+        self.user = {"email": "me@example.com", "payment_methods": []}
+        self.user_calls = 0
+
+    @staticmethod
+    def _answer(result):
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def login(self, email, password):
+        self.logins.append(email)
+        self.userAuth = self.login_token
+
+    def setToken(self, token=None):
+        if token is not None:
+            self.userAuth = token
+
+    def find(self, **kwargs):
+        return self._answer(self.find_result)
+
+    def get_calendar(self, **kwargs):
+        self.calendar_calls += 1
+        return self._answer(self.calendar_result)
+
+    def getReservation(self, config_id, day, party_size):
+        return self._answer(self.preview_result)
+
+    def book(self, book_token, payment_method_id=None):
+        self.booked.append(book_token)
+        return self._answer(self.book_result)
+
+    def getUser(self):
+        self.user_calls += 1
+        return self._answer(self.user)
+
+    def get_reservations(self):
+        return {"reservations": self.reservations}
+
+
+@pytest.fixture
+def resy_client():
+    return FakeResyClient()
+
+
+@pytest.fixture
+def routes(monkeypatch):
+    """
+    The Resy routes against a fresh state store, with every task served by
+    one FakeResyClient: `routes.api` is the module, `routes.client` the client.
+    """
+    from app.api.v1 import resy_routes
+
+    client = FakeResyClient()
+    store = MemoryStateStore()
+
+    @contextmanager
+    def use_client(task_id, touch=True):
+        yield client
+
+    @contextmanager
+    def use_clients(task_id, n):
+        yield [client] * n
+
+    monkeypatch.setattr(resy_routes.client_manager, "store", store)
+    monkeypatch.setattr(resy_routes.client_manager, "use_client", use_client)
+    monkeypatch.setattr(resy_routes.client_manager, "use_clients", use_clients)
+    monkeypatch.setattr(resy_routes.booking_coordinator, "store", store)
+    return SimpleNamespace(api=resy_routes, client=client, store=store)
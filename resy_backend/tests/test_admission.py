@@ -0,0 +1,137 @@
+# tests/test_admission.py
+"""Admission control: per-class limits, booking's reserved capacity, queueing and shedding."""
+import asyncio
+
+from app.core.admission import CRITICAL, LOW, NORMAL, AdmissionController, AdmissionMiddleware, RouteClass
+from app.core.deadlines import Deadline, api_paths, deadline_scope
+
+
+def _controller(capacity=3, reserved=1, polling_limit=2, queue=0.2):
+    return AdmissionController(
+        [
+            RouteClass("booking", CRITICAL, api_paths("/reservation/"), capacity, queue),
+            RouteClass("polling", NORMAL, api_paths("/slots"), polling_limit, queue),
+            RouteClass("search", LOW, api_paths("/search/available"), 1, 0.0),
+        ],
+        capacity=capacity,
+        reserved=reserved,
+    )
+
+
+def _classes(controller):
+    return {c.name: c for c in controller.classes}
+
+
+def test_classify_by_path():
+    controller = _controller()
+    assert controller.classify("/api/v1/resy/reservation/book").name == "booking"
+    assert controller.classify("/api/v1/resy/slots").name == "polling"
+    assert controller.classify("/api/v1/resy/watches") is None
+    assert controller.classify("/health") is None
+
+
+def test_low_priority_is_shed_at_once_when_full():
+    async def run():
+        controller = _controller()
+        search = _classes(controller)["search"]
+        assert await controller.acquire(search)
+        assert not await controller.acquire(search)
+        assert search.shed == 1
+        controller.release(search, 0.0)
+        assert await controller.acquire(search)
+
+    asyncio.run(run())
+
+
+def test_reserved_capacity_is_left_to_booking():
+    async def run():
+        controller = _controller(capacity=3, reserved=1, polling_limit=3, queue=0.05)
+        classes = _classes(controller)
+        assert await controller.acquire(classes["polling"])
+        assert await controller.acquire(classes["polling"])
+        # Two of three slots in use: the last is booking's alone
+        assert not await controller.acquire(classes["polling"])
+        assert await controller.acquire(classes["booking"])
+        assert controller.active == 3
+
+    asyncio.run(run())
+
+
+def test_freed_capacity_goes_to_waiting_bookings_first():
+    async def run():
+        controller = _controller(capacity=2, reserved=0, polling_limit=2, queue=1.0)
+        classes = _classes(controller)
+        polling, booking = classes["polling"], classes["booking"]
+        assert await controller.acquire(polling)
+        assert await controller.acquire(polling)
+        waiting_poll = asyncio.ensure_future(controller.acquire(polling))
+        await asyncio.sleep(0)
+        waiting_booking = asyncio.ensure_future(controller.acquire(booking))
+        await asyncio.sleep(0)
+        assert polling.queued == 1 and booking.queued == 1
+
+        controller.release(polling, 0.5)
+        assert await waiting_booking
+        assert not waiting_poll.done()
+        controller.release(booking, 0.5)
+        assert await waiting_poll
+        assert controller.active == 2
+
+    asyncio.run(run())
+
+
+def test_queueing_never_outlasts_the_deadline():
+    async def run():
+        controller = _controller(capacity=1, reserved=0, polling_limit=1, queue=5.0)
+        polling = _classes(controller)["polling"]
+        assert await controller.acquire(polling)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with deadline_scope(Deadline(0.05)):
+            assert not await controller.acquire(polling)
+        assert loop.time() - started < 1.0
+        assert polling.shed == 1 and not polling.waiters
+
+    asyncio.run(run())
+
+
+def test_retry_after_follows_service_time():
+    controller = _controller()
+    polling = _classes(controller)["polling"]
+    polling.active, controller.active = 1, 1
+    controller.release(polling, 11.0)
+    assert polling.service_time == 3.0
+    assert controller.retry_after(polling) == 3
+
+
+def test_middleware_sheds_with_503_and_retry_after():
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        await asyncio.sleep(0.05)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def request(middleware, path):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": path, "headers": []}
+        await middleware(scope, None, send)
+        return sent[0]["status"], dict(sent[0]["headers"])
+
+    async def run():
+        controller = _controller()
+        middleware = AdmissionMiddleware(app, controller)
+        path = "/api/v1/resy/search/available"
+        (first, _), (second, headers) = await asyncio.gather(request(middleware, path), request(middleware, path))
+        assert first == 200 and second == 503
+        assert headers[b"retry-after"] == b"1"
+        assert await request(middleware, "/api/v1/resy/watches") == (200, {})  # not admission-controlled
+        assert controller.active == 0
+        assert calls == [path, "/api/v1/resy/watches"]
+
+    asyncio.run(run())
@@ -0,0 +1,73 @@
+# tests/test_auth_cache.py
+"""Resy auth tokens reused across logins of the same account."""
+import time
+
+import jwt
+import pytest
+from fastapi import BackgroundTasks
+
+from app.core.config import settings
+from app.services import auth_cache as auth_cache_module
+from app.services.auth_cache import AuthCache
+
+SECRET = "a-dedicated-auth-cache-secret-for-tests"
+
+
+def _resy_token(expires_in: float) -> str:
+    return jwt.encode({"exp": time.time() + expires_in}, "resy-signing-key-of-at-least-32-bytes", algorithm="HS256")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AuthCache(str(tmp_path / "state.db"), secret=SECRET, refresh_margin=60)
+
+
+def test_token_is_handed_out_only_for_the_right_password(cache):
+    token = _resy_token(3600)
+    cache.store("Me@Example.com ", "hunter2", token)
+    assert cache.get_token("me@example.com", "hunter2") == token
+    assert cache.get_token("me@example.com", "wrong") is None
+    assert cache.get_token("other@example.com", "hunter2") is None
+    cache.invalidate("me@example.com")
+    assert cache.get_token("me@example.com", "hunter2") is None
+
+
+def test_tokens_near_expiry_are_not_handed_out(cache):
+    cache.store("me@example.com", "hunter2", _resy_token(30))  # inside the refresh margin
+    assert cache.get_token("me@example.com", "hunter2") is None
+    cache.prune()
+    assert cache._conn.execute("SELECT COUNT(*) FROM auth_tokens").fetchone()[0] == 0
+
+
+def test_only_a_verifier_and_the_encrypted_token_are_stored(cache):
+    token = _resy_token(3600)
+    cache.store("me@example.com", "hunter2", token)
+    row = cache._conn.execute("SELECT * FROM auth_tokens").fetchone()
+    stored = b"".join(v if isinstance(v, bytes) else str(v).encode() for v in row)
+    for secret in (b"me@example.com", b"hunter2", token.encode()):
+        assert secret not in stored
+    # Another key cannot read it
+    other = AuthCache(":memory:", secret="another-dedicated-secret-for-tests", refresh_margin=60)
+    other._conn = cache._conn
+    assert other.get_token("me@example.com", "hunter2") is None
+
+
+def test_cache_stays_off_without_a_dedicated_secret(monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "AUTH_CACHE_SECRET", None)
+    assert auth_cache_module.create_auth_cache() is None
+    monkeypatch.setattr(settings, "AUTH_CACHE_SECRET", settings.JWT_SECRET_KEY)
+    assert auth_cache_module.create_auth_cache() is None
+    monkeypatch.setattr(settings, "AUTH_CACHE_SECRET", SECRET)
+    assert auth_cache_module.create_auth_cache() is not None
+
+
+def test_login_reuses_the_cached_token(monkeypatch, routes, cache):
+    monkeypatch.setattr(routes.api, "auth_cache", cache)
+    routes.client.login_token = _resy_token(3600)
+    body = routes.api.LoginRequest(email="me@example.com", password="hunter2")
+    for task_id in ("t1", "t2"):
+        routes.client.userAuth = ""
+        assert routes.api.login(body, BackgroundTasks(), task_id).status == "ok"
+        assert routes.client.userAuth == routes.client.login_token
+    assert routes.client.logins == ["me@example.com"]  # the second task skipped /4/auth/password
@@ -0,0 +1,62 @@
+# tests/test_availability_history.py
+"""History reads include buffered observations without flushing them."""
+from datetime import date
+
+import pytest
+
+from app.services.availability_history import AvailabilityHistory
+
+DAY = "2030-06-01"
+
+
+@pytest.fixture
+def history(tmp_path):
+    return AvailabilityHistory(str(tmp_path / "history.db"), retention_sec=86400 * 30)
+
+
+def _stored(history):
+    return history._conn.execute("SELECT COUNT(*) FROM slot_history").fetchone()[0]
+
+
+def test_reads_merge_pending_buffer_without_writing(history):
+    history.record(1, DAY, 2, [f"{DAY} 19:00:00"], observed_at=100.0)
+    history.record(1, DAY, 2, [f"{DAY} 19:00:00", f"{DAY} 20:30:00"], observed_at=200.0)
+    history.record(2, DAY, 2, [f"{DAY} 18:00:00"], observed_at=150.0)
+
+    events = history.events(1)
+
+    assert [(e["slot_start"], e["event"]) for e in events] == [
+        (f"{DAY} 19:00", "first_seen"),
+        (f"{DAY} 20:30", "appeared"),
+    ]
+    assert history.appearances(1) == [(date.fromisoformat(DAY).toordinal(), 2, 20 * 60 + 30, 200.0)]
+    assert history.appearances(1, buffered=False) == []
+    # Nothing was written and the buffer is left for the flush job
+    assert _stored(history) == 0
+    assert len(history._pending) == 3
+    assert not history._conn.in_transaction
+
+
+def test_pending_diffs_against_flushed_snapshot(history):
+    history.record(1, DAY, 2, [f"{DAY} 19:00:00", f"{DAY} 20:00:00"], observed_at=100.0)
+    assert history.flush() == 2
+    history.record(1, DAY, 2, [f"{DAY} 20:00:00", f"{DAY} 21:00:00"], observed_at=200.0)
+
+    events = history.events(1, since=150.0)
+
+    assert [(e["slot_start"], e["event"]) for e in events] == [
+        (f"{DAY} 19:00", "disappeared"),
+        (f"{DAY} 21:00", "appeared"),
+    ]
+    assert _stored(history) == 2
+
+
+def test_flush_after_read_does_not_duplicate(history):
+    history.record(1, DAY, 2, [f"{DAY} 19:00:00"], observed_at=100.0)
+    history.record(1, DAY, 4, [f"{DAY} 19:00:00"], observed_at=100.0)
+    before = history.events(1, party_size=2)
+
+    assert history.flush() == 2
+    assert history.events(1, party_size=2) == before
+    assert len(history.events(1)) == 2
+    assert len(history.events(1, limit=1)) == 1
@@ -0,0 +1,76 @@
+# tests/test_availability_index.py
+"""Per-venue availability bitmaps and the /calendar route they serve."""
+from datetime import date, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.services.availability_index import MAX_RANGE_DAYS, AvailabilityBitmap, AvailabilityIndex
+
+
+def _day(offset: int) -> str:
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+def _ordinal(offset: int) -> int:
+    return (date.today() + timedelta(days=offset)).toordinal()
+
+
+def test_calendar_refresh_answers_ranges_it_covered():
+    index = AvailabilityIndex(max_age=60)
+    index.record_calendar(1, 2, _day(0), _day(9), [_day(2), _day(5)])
+    assert index.available_dates(1, 2, _day(0), _day(9)) == [_day(2), _day(5)]
+    assert index.available_dates(1, 2, _day(3), _day(4)) == []
+    assert index.available_dates(1, 2, _day(0), _day(10)) is None  # not covered
+    assert index.available_dates(1, 4, _day(0), _day(9)) is None   # other party size
+    assert index.available_dates(1, 2, _day(0), _day(9), max_age=-1) is None
+
+
+def test_finds_update_single_days():
+    index = AvailabilityIndex(max_age=60)
+    index.record_calendar(1, 2, _day(0), _day(9), [_day(5)])
+    index.record_find(1, 2, _day(3), True)
+    index.record_find(1, 2, _day(5), False)
+    assert index.available_dates(1, 2, _day(0), _day(9)) == [_day(3)]
+    assert index.first_available(1, 2, _day(0)) == _day(3)
+    assert index.first_available(1, 2, _day(4)) is None
+
+
+def test_set_range_rejects_oversized_ranges():
+    bitmap = AvailabilityBitmap(_ordinal(0))
+    bitmap.set_range(_ordinal(0), _ordinal(MAX_RANGE_DAYS - 1), [_ordinal(1)])
+    with pytest.raises(ValueError):
+        bitmap.set_range(_ordinal(0), _ordinal(MAX_RANGE_DAYS), [])
+    assert bitmap.days_between(_ordinal(0), _ordinal(MAX_RANGE_DAYS)) == [_day(1)]
+
+
+# ---------- /calendar ----------
+
+def _calendar(routes, start_date, end_date, venue_id=1):
+    body = routes.api.calendarRequest(venue_id=venue_id, num_seats=2, start_date=start_date, end_date=end_date)
+    return routes.api.calendar(body, x_task_id="t1")
+
+
+@pytest.mark.parametrize("start_date, end_date", [
+    ("2030-13-01", "2030-12-31"),
+    ("2030-01-10", "2030-01-01"),
+    ("2030-01-01", "2040-01-01"),
+])
+def test_bad_calendar_ranges_are_rejected_before_going_upstream(routes, start_date, end_date):
+    with pytest.raises(HTTPException) as exc:
+        _calendar(routes, start_date, end_date)
+    assert exc.value.status_code == 400
+    assert routes.client.calendar_calls == 0
+
+
+def test_calendar_is_served_from_the_index_once_fetched(routes):
+    start, end = _day(0), _day(settings.CALENDAR_MAX_RANGE_DAYS - 1)
+    routes.client.calendar_result = {"scheduled": [
+        {"date": _day(1), "inventory": {"reservation": "available"}},
+        {"date": _day(2), "inventory": {"reservation": "sold-out"}},
+    ]}
+    venue_id = 987654  # the index is process-wide; keep clear of other tests
+    assert _calendar(routes, start, end, venue_id).dates == [_day(1)]
+    assert _calendar(routes, _day(1), _day(5), venue_id).dates == [_day(1)]
+    assert routes.client.calendar_calls == 1
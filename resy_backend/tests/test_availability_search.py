@@ -0,0 +1,49 @@
+# tests/test_availability_search.py
+"""The calendar -> find search pipeline: ranking, early stop and the `complete` flag."""
+from app.core.deadlines import Deadline, deadline_scope
+from app.services.availability_search import search_available
+
+START, END = "2030-06-01", "2030-06-03"
+VENUES = [{"venue_id": v, "name": f"Venue {v}", "distance_km": float(v)} for v in (1, 2, 3)]
+
+
+def _client(resy_client, days=(START, END)):
+    resy_client.calendar_result = {"scheduled": [
+        {"date": d, "inventory": {"reservation": "available"}} for d in days
+    ]}
+    resy_client.find_result = {"results": {"venues": [{"slots": [{
+        "config": {"token": "c1", "type": "Dining Room"},
+        "date": {"start": f"{START} 19:00:00", "end": f"{START} 20:30:00"},
+        "payment": {},
+    }]}]}}
+    return resy_client
+
+
+def _search(resy_client, **kwargs):
+    events = list(search_available([resy_client], VENUES, 2, START, END, fanout=1, **kwargs))
+    return events[:-1], events[-1]
+
+
+def test_stopping_once_the_top_results_are_settled_is_complete(resy_client):
+    events, done = _search(_client(resy_client), limit=1)
+    assert [(e["venue_id"], e["day"]) for e in events] == [(1, START)]
+    assert [(r["venue_id"], r["day"]) for r in done["results"]] == [(1, START)]
+    assert done["complete"] is True
+    assert done["calendar_calls"] == 1 and done["find_calls"] == 1  # nothing else could rank ahead
+
+
+def test_exhausting_the_search_is_complete(resy_client):
+    events, done = _search(_client(resy_client), limit=10)
+    assert [(e["day"], e["venue_id"]) for e in events] == [
+        (START, 1), (START, 2), (START, 3), (END, 1), (END, 2), (END, 3),
+    ]
+    assert done["complete"] is True and len(done["results"]) == 6
+
+
+def test_running_out_of_time_is_incomplete(resy_client):
+    deadline = Deadline(30.0)
+    deadline.cancel()  # the client went away
+    with deadline_scope(deadline):
+        events, done = _search(_client(resy_client), limit=1)
+    assert events == [] and done["results"] == []
+    assert done["complete"] is False
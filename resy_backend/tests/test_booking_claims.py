@@ -0,0 +1,114 @@
+# tests/test_booking_claims.py
+"""One booking per task: the store's booking claims, how /reservation/race takes and frees them, and its previews."""
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.booking_race import BOOKED, race_book
+from app.services.resy_client import ResyClientError
+
+STALE = 120.0
+
+
+# ---------- State store ----------
+
+def test_claim_is_exclusive(store):
+    assert store.claim_booking("t1", 1000.0, STALE)
+    assert not store.claim_booking("t1", 1001.0, STALE)
+    assert store.claim_booking("t2", 1001.0, STALE)
+    assert store.booking_status("t1") == "booking"
+
+
+def test_stale_claim_is_taken_over(store):
+    assert store.claim_booking("t1", 1000.0, STALE)
+    assert not store.claim_booking("t1", 1000.0 + STALE - 1, STALE)
+    assert store.claim_booking("t1", 1000.0 + STALE + 1, STALE)
+
+
+def test_failed_booking_frees_the_claim(store):
+    store.claim_booking("t1", 1000.0, STALE)
+    store.finish_booking("t1", False, 1001.0)
+    assert store.booking_status("t1") is None
+    assert store.claim_booking("t1", 1002.0, STALE)
+
+
+def test_booked_task_never_books_again(store):
+    store.claim_booking("t1", 1000.0, STALE)
+    store.finish_booking("t1", True, 1001.0)
+    assert store.booking_status("t1") == "booked"
+    assert not store.claim_booking("t1", 1001.0 + 10 * STALE, STALE)
+    # A late failure report for the same task must not undo the booking
+    store.finish_booking("t1", False, 1002.0)
+    assert store.booking_status("t1") == "booked"
+
+
+# ---------- /reservation/race ----------
+
+def _race(routes, task_id="t1"):
+    body = routes.api.RaceRequest(venue_id=1, day="2030-01-01", party_size=2)
+    return routes.api.race_reservation(body, x_task_id=task_id)
+
+
+def test_race_without_slots_frees_the_claim(routes):
+    assert _race(routes).status == "no_slots"
+    assert routes.store.booking_status("t1") is None
+
+
+def test_race_is_rejected_while_the_task_holds_a_claim(routes):
+    routes.store.claim_booking("t1", 1e12, STALE)
+    with pytest.raises(HTTPException) as exc:
+        _race(routes)
+    assert exc.value.status_code == 409
+
+
+def test_race_frees_the_claim_when_find_fails(routes):
+    routes.client.find_result = ResyClientError("upstream down", status_code=503)
+    with pytest.raises(HTTPException):
+        _race(routes)
+    assert routes.store.booking_status("t1") is None
+
+
+def test_race_frees_the_claim_on_unexpected_errors(routes):
+    routes.client.find_result = KeyError("results")
+    with pytest.raises(KeyError):
+        _race(routes)
+    assert routes.store.booking_status("t1") is None
+
+
+# ---------- Parallel previews ----------
+
+class PreviewClient:
+    """Records whether two threads ever used it at once."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.shared = False
+        self.previews = []
+
+    def getReservation(self, config_id, day, party_size):
+        with self._lock:
+            self.active += 1
+            self.shared = self.shared or self.active > 1
+        time.sleep(0.02)
+        with self._lock:
+            self.active -= 1
+            self.previews.append(config_id)
+        return {"book_token": {"value": f"bt-{config_id}"}}
+
+
+def test_each_preview_in_flight_has_its_own_client():
+    clients = [PreviewClient(), PreviewClient()]
+    candidates = [{"token": f"c{i}", "start": "2030-01-01 19:00:00"} for i in range(4)]
+    booked = []
+
+    def book(slot, book_token):
+        booked.append(book_token)
+        return {"resy_token": "r1"}
+
+    outcome = race_book(clients, candidates, "2030-01-01", 2, book)
+    assert outcome["status"] == BOOKED and booked == ["bt-c0"]
+    assert not any(client.shared for client in clients)
+    assert 1 <= sum(len(client.previews) for client in clients) <= 4
@@ -0,0 +1,176 @@
+# tests/test_booking_coordinator.py
+"""Slot leases, ambiguous /3/book outcomes and Idempotency-Key replays on /reservation/book."""
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.state_store import MemoryStateStore
+from app.services.booking_coordinator import BookingCoordinator, SlotLeasedError, slot_key, slot_ref
+from app.services.resy_client import ResyClientError
+
+CONFIG_ID = "rgs://resy/42/123/2/2030-01-01/2030-01-01/19:00:00/2/Dining Room"
+REF = (42, "2030-01-01", "19:00")
+RESERVATION = {"venue": {"id": {"resy": 42}}, "day": "2030-01-01", "time_slot": "19:00:00"}
+
+
+@pytest.fixture(autouse=True)
+def no_confirm_delay(monkeypatch):
+    monkeypatch.setattr(settings, "BOOKING_CONFIRM_DELAY_SEC", 0.0)
+
+
+# ---------- Slot refs ----------
+
+def test_slot_ref_from_config_token_or_start():
+    assert slot_ref(CONFIG_ID) == REF
+    assert slot_ref(None, 42, "2030-01-01 19:00:00") == REF
+    assert slot_ref(None, None, "2030-01-01 19:00:00") is None
+    assert slot_key(REF) == "42:2030-01-01:19:00"
+
+
+# ---------- Slot leases ----------
+
+def test_slot_lease_is_exclusive_until_it_expires(store):
+    assert store.claim_slot("s", "t1", 1000.0, 60.0)
+    assert store.claim_slot("s", "t1", 1010.0, 60.0)  # the holder may renew
+    assert not store.claim_slot("s", "t2", 1020.0, 60.0)
+    assert store.claim_slot("s", "t2", 1071.0, 60.0)
+
+
+def test_only_the_holder_releases_a_lease(store):
+    store.claim_slot("s", "t1", 1000.0, 60.0)
+    store.release_slot("s", "t2")
+    assert not store.claim_slot("s", "t2", 1001.0, 60.0)
+    store.release_slot("s", "t1")
+    assert store.claim_slot("s", "t2", 1001.0, 60.0)
+
+
+def test_prune_drops_expired_leases(store):
+    store.claim_slot("old", "t1", 1000.0, 10.0)
+    store.claim_slot("new", "t1", 1000.0, 100.0)
+    store.prune_slot_leases(1050.0)
+    assert store.claim_slot("old", "t2", 1050.0, 10.0)
+    assert not store.claim_slot("new", "t2", 1050.0, 10.0)
+
+
+def test_book_rejects_a_slot_leased_by_another_task(store, resy_client):
+    coordinator = BookingCoordinator(store)
+    assert coordinator.book(resy_client, "t1", REF, lambda: resy_client.book("bt1")) == {"resy_token": "resy-1"}
+    with pytest.raises(SlotLeasedError) as exc:
+        coordinator.book(resy_client, "t2", REF, lambda: resy_client.book("bt2"))
+    assert exc.value.status_code == 409
+    assert resy_client.booked == ["bt1"]
+
+
+def test_definite_failure_releases_the_lease(store, resy_client):
+    coordinator = BookingCoordinator(store)
+    resy_client.book_result = ResyClientError("slot gone", status_code=412)
+    with pytest.raises(ResyClientError):
+        coordinator.book(resy_client, "t1", REF, lambda: resy_client.book("bt1"))
+    resy_client.book_result = {"resy_token": "resy-2"}
+    assert coordinator.book(resy_client, "t2", REF, lambda: resy_client.book("bt2")) == {"resy_token": "resy-2"}
+
+
+def test_ambiguous_failure_is_settled_against_reservations(store, resy_client):
+    coordinator = BookingCoordinator(store)
+    resy_client.book_result = ResyClientError("timed out", status_code=None)
+    resy_client.reservations = [RESERVATION]
+    result = coordinator.book(resy_client, "t1", REF, lambda: resy_client.book("bt1"))
+    assert result == {"reservation": RESERVATION, "confirmed_from": "reservations"}
+    assert resy_client.booked == ["bt1"]  # confirmed, not resent
+
+
+def test_unconfirmed_ambiguous_failure_keeps_the_lease(store, resy_client):
+    coordinator = BookingCoordinator(store)
+    resy_client.book_result = ResyClientError("bad gateway", status_code=502)
+    with pytest.raises(ResyClientError):
+        coordinator.book(resy_client, "t1", REF, lambda: resy_client.book("bt1"))
+    with pytest.raises(SlotLeasedError):
+        coordinator.book(resy_client, "t2", REF, lambda: resy_client.book("bt2"))
+
+
+def test_preview_tokens_remember_their_slot():
+    coordinator = BookingCoordinator(MemoryStateStore(), preview_ttl=60.0)
+    coordinator.remember_preview("bt1", REF)
+    assert coordinator.slot_for_token("bt1") == REF
+    assert coordinator.slot_for_token("other") is None
+
+
+# ---------- Idempotency keys ----------
+
+def test_idempotency_key_lifecycle(store):
+    assert store.begin_idempotent("t1", "k", 1000.0, 60.0) == (True, None)
+    assert store.begin_idempotent("t1", "k", 1001.0, 60.0) == (False, None)  # still in flight
+    assert store.begin_idempotent("t2", "k", 1001.0, 60.0) == (True, None)   # keys are per task
+    store.finish_idempotent("t1", "k", {"status": "ok"})
+    assert store.begin_idempotent("t1", "k", 5000.0, 60.0) == (False, {"status": "ok"})
+
+
+def test_abandoned_or_stale_keys_run_again(store):
+    store.begin_idempotent("t1", "a", 1000.0, 60.0)
+    store.abandon_idempotent("t1", "a")
+    assert store.begin_idempotent("t1", "a", 1001.0, 60.0) == (True, None)
+
+    store.begin_idempotent("t1", "b", 1000.0, 60.0)
+    assert store.begin_idempotent("t1", "b", 1061.0, 60.0) == (True, None)
+
+
+def test_completed_keys_are_not_abandoned(store):
+    store.begin_idempotent("t1", "k", 1000.0, 60.0)
+    store.finish_idempotent("t1", "k", {"status": "ok"})
+    store.abandon_idempotent("t1", "k")
+    store.prune_idempotency(999.0)
+    assert store.begin_idempotent("t1", "k", 1001.0, 60.0) == (False, {"status": "ok"})
+    store.prune_idempotency(1000.5)
+    assert store.begin_idempotent("t1", "k", 1001.0, 60.0) == (True, None)
+
+
+# ---------- /reservation/book ----------
+
+@pytest.fixture
+def production(monkeypatch):
+    monkeypatch.setattr(settings, "MODE", "production")
+
+
+def _book(routes, key, task_id="t1", book_token="bt1"):
+    body = routes.api.BookRequest(book_token=book_token, config_id=CONFIG_ID)
+    return routes.api.book_reservation(body, x_task_id=task_id, idempotency_key=key)
+
+
+def test_retry_with_the_same_key_replays_the_booking(routes, production):
+    first = _book(routes, "k1")
+    assert first.status == "ok"
+    assert _book(routes, "k1") == first
+    assert routes.client.booked == ["bt1"]
+
+
+def test_second_booking_for_a_task_is_rejected(routes, production):
+    _book(routes, "k1")
+    with pytest.raises(HTTPException) as exc:
+        _book(routes, "k2")
+    assert exc.value.status_code == 409
+    assert routes.client.booked == ["bt1"]
+
+
+def test_rejected_booking_frees_the_key_for_a_retry(routes, production):
+    routes.client.book_result = ResyClientError("slot gone", status_code=412)
+    with pytest.raises(HTTPException) as exc:
+        _book(routes, "k1")
+    assert exc.value.status_code == 502
+    routes.client.book_result = {"resy_token": "resy-1"}
+    assert _book(routes, "k1").status == "ok"
+    assert routes.client.booked == ["bt1", "bt1"]
+
+
+def test_ambiguous_booking_keeps_the_key_in_flight(routes, production):
+    routes.client.book_result = ResyClientError("bad gateway", status_code=502)
+    with pytest.raises(HTTPException):
+        _book(routes, "k1")
+    with pytest.raises(HTTPException) as exc:
+        _book(routes, "k1")
+    assert exc.value.status_code == 409
+    assert routes.client.booked == ["bt1"]
+
+
+def test_booking_is_skipped_outside_production(routes):
+    assert _book(routes, "k1").status == "skipped"
+    assert routes.client.booked == []
@@ -0,0 +1,231 @@
+# tests/test_cli.py
+"""The headless runner: spec files, which watches it accepts, the run's event lines and race-booking found slots."""
+import argparse
+import asyncio
+import io
+import json
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from app import cli
+from app.core.config import settings
+from app.core.state_store import MemoryStateStore
+from app.services.clientManager import ClientManager
+from app.services.resy_client import ResyClientError
+
+DAY = "2030-01-01"
+
+
+def _find(*tokens):
+    return {"results": {"venues": [{"slots": [
+        {"config": {"token": token, "type": "Dining Room"},
+         "date": {"start": f"{DAY} 19:00:00", "end": f"{DAY} 20:30:00"}}
+        for token in tokens
+    ]}]}}
+
+
+def _events(out: io.StringIO, name=None):
+    events = [json.loads(line) for line in out.getvalue().splitlines()]
+    return [e for e in events if name is None or e["event"] == name]
+
+
+def _args(**overrides) -> argparse.Namespace:
+    args = dict(specs="", concurrency=4, max_rps=0.0, poll_timeout=5.0, spread=0.0,
+                duration=0.0, stats_interval=0.0, poll_events=False)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+@pytest.fixture
+def runner(monkeypatch, resy_client):
+    """A Runner whose every task is served by `resy_client`; its event lines go to `runner.out`."""
+    manager = ClientManager(MemoryStateStore())
+
+    @contextmanager
+    def use_client(task_id, touch=True):
+        yield resy_client
+
+    @contextmanager
+    def use_clients(task_id, n):
+        yield [resy_client] * n
+
+    monkeypatch.setattr(manager, "use_client", use_client)
+    monkeypatch.setattr(manager, "use_clients", use_clients)
+    monkeypatch.setattr(cli, "ClientManager", lambda: manager)
+    out = io.StringIO()
+    runner = cli.Runner(_args(), cli.EventWriter(out))
+    runner.out = out
+    return runner
+
+
+def _run_until(runner, watches, done, timeout=5.0):
+    """Run the fleet until `done()` holds for the events written so far, then stop it."""
+    async def run():
+        stop = asyncio.Event()
+        task = asyncio.create_task(runner.run(watches, stop))
+        deadline = time.monotonic() + timeout
+        while not done() and time.monotonic() < deadline and not task.done():
+            await asyncio.sleep(0.02)
+        stop.set()
+        await task
+
+    asyncio.run(run())
+
+
+# ---------- Specs ----------
+
+@pytest.mark.parametrize("text", [
+    json.dumps({"accounts": {"me": {"resy_token": "t"}}, "watches": [{"venue_id": 1, "day": DAY}]}),
+    json.dumps([{"venue_id": 1, "day": DAY}]),
+    json.dumps({"venue_id": 1, "day": DAY}) + "\n\n" + json.dumps({"venue_id": 2, "day": DAY}) + "\n",
+])
+def test_spec_file_formats(tmp_path, text):
+    path = tmp_path / "watches.json"
+    path.write_text(text)
+    accounts, specs = cli.load_specs(str(path))
+    assert isinstance(accounts, dict)
+    assert specs and all(spec["day"] == DAY for spec in specs)
+
+
+@pytest.mark.parametrize("text", [
+    "42", '"watches"', '{"accounts": ["me"], "watches": []}', '{"watches": {"venue_id": 1}}',
+])
+def test_spec_file_of_the_wrong_shape_is_rejected(tmp_path, text):
+    path = tmp_path / "watches.json"
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        cli.load_specs(str(path))
+
+
+def test_watch_spec_validation():
+    watch = cli.watch_from_spec({"venue_id": 7, "day": DAY, "time_start": "18:00", "time_end": "21:00"}, "cli:me")
+    assert (watch.task_id, watch.venue_id, watch.party_size) == ("cli:me", 7, 2)
+    for spec in ({"venue_id": 7}, {"venue_id": 7, "day": "01/01/2030"}, {"day": DAY}):
+        with pytest.raises(ValueError):
+            cli.watch_from_spec(spec, "cli:me")
+
+
+def test_main_reports_unreadable_and_empty_spec_files(tmp_path, capsys):
+    assert cli.main([str(tmp_path / "missing.json")]) == 2
+    assert json.loads(capsys.readouterr().out)["event"] == "invalid_spec"
+
+    path = tmp_path / "watches.json"
+    path.write_text(json.dumps([{"venue_id": 1}]))
+    assert cli.main([str(path)]) == 1
+    events = [json.loads(line)["event"] for line in capsys.readouterr().out.splitlines()]
+    assert events == ["invalid_spec", "stopped"]
+
+
+# ---------- Accounts and watches ----------
+
+def test_build_watches_logs_in_and_skips_bad_specs(runner, resy_client):
+    accounts = {
+        "token": {"resy_token": "tok-1"},
+        "password": {"email": "me@example.com", "password": "pw"},
+        "nothing": {},
+    }
+    specs = [
+        {"venue_id": 1, "day": DAY, "account": "token", "book": True},
+        {"venue_id": 2, "day": DAY, "account": "password"},
+        {"venue_id": 3, "day": DAY},                       # polls without an account
+        {"venue_id": 4, "day": DAY, "account": "nothing"},
+        {"venue_id": 5, "day": DAY, "account": "unknown"},
+        {"venue_id": 6, "day": DAY, "book": True},
+        {"venue_id": 7, "day": "tomorrow"},
+        ["not", "an", "object"],
+    ]
+    watches = runner.build_watches(accounts, specs)
+
+    assert [w.venue_id for w in watches] == [1, 2, 3]
+    assert [w.task_id for w in watches] == ["cli:token", "cli:password", "cli:default"]
+    assert list(runner.booking_watches) == [watches[0].watch_id]
+    assert resy_client.logins == ["me@example.com"]
+    logins = {e["account"]: e["ok"] for e in _events(runner.out, "login")}
+    assert logins == {"token": True, "password": True, "nothing": False}
+    assert [e["index"] for e in _events(runner.out, "invalid_spec")] == [3, 4, 5, 6, 7]
+
+
+def test_failed_login_is_reported(runner, resy_client):
+    def login(email, password):
+        raise ResyClientError("bad credentials", status_code=401)
+
+    resy_client.login = login
+    assert not runner.login("me", {"email": "me@example.com", "password": "pw"})
+    [event] = _events(runner.out, "login")
+    assert event["ok"] is False and event["error"] == "bad credentials"
+
+
+def test_rate_budget_spaces_out_poll_starts():
+    budget = cli.RateBudget(50.0)
+    started = time.monotonic()
+    for _ in range(6):
+        budget.wait()
+    assert time.monotonic() - started >= 5 / 50.0 - 0.005
+
+    unlimited = cli.RateBudget(0.0)
+    started = time.monotonic()
+    for _ in range(100):
+        unlimited.wait()
+    assert time.monotonic() - started < 0.05
+
+
+# ---------- Running ----------
+
+def test_run_emits_found_slots_and_dry_run_bookings(runner, resy_client):
+    resy_client.find_result = _find("c1", "c2")
+    watches = runner.build_watches({"me": {"resy_token": "tok"}}, [
+        {"venue_id": 1, "day": DAY, "time_start": "18:00", "time_end": "21:00", "account": "me", "book": True},
+        {"venue_id": 1, "day": DAY, "time_start": "22:00", "time_end": "23:00"},
+    ])
+    _run_until(runner, watches, lambda: _events(runner.out, "booking"))
+
+    names = [e["event"] for e in _events(runner.out)]
+    assert names[0] == "login" and names[1] == "started" and names[-1] == "stopped"
+    started = _events(runner.out, "started")[0]
+    assert started["watches"] == 2 and started["groups"] == 1 and started["dry_run"] is True
+
+    [found] = _events(runner.out, "slot_found")
+    assert found["watch_id"] == watches[0].watch_id
+    assert [s["token"] for s in found["slots"]] == ["c1", "c2"]
+
+    [booking] = _events(runner.out, "booking")
+    assert booking["status"] == "skipped" and booking["account"] == "me"
+    assert booking["slot"]["token"] == "c1"
+    assert resy_client.booked == []
+    # Nothing was booked: the claim is freed and the watches keep running until stopped
+    assert runner.client_manager.store.booking_status("cli:me") is None
+    assert _events(runner.out, "stopped")[0]["polls"] >= 1
+
+
+def test_booking_in_production_ends_the_accounts_watches(monkeypatch, runner, resy_client):
+    monkeypatch.setattr(runner, "production", True)
+    monkeypatch.setattr(cli.booking_coordinator, "store", MemoryStateStore())
+    resy_client.find_result = _find("c1")
+    watches = runner.build_watches({"me": {"resy_token": "tok"}}, [
+        {"venue_id": 1, "day": DAY, "account": "me", "book": True},
+        {"venue_id": 2, "day": DAY, "account": "me"},
+    ])
+    _run_until(runner, watches, lambda: _events(runner.out, "booking"))
+
+    [booking] = _events(runner.out, "booking")
+    assert booking["status"] == "booked" and booking["raw"] == {"resy_token": "resy-1"}
+    assert resy_client.booked == ["bt-1"]
+    assert runner.client_manager.store.booking_status("cli:me") == "booked"
+    assert len(runner.registry) == 0
+
+    # A second slot-found event for the account never books again
+    runner.book({"watch_id": watches[0].watch_id, "task_id": "cli:me", "slots": [{"token": "c2"}]})
+    assert resy_client.booked == ["bt-1"]
+
+
+def test_poll_errors_are_reported(runner, resy_client):
+    resy_client.find_result = ResyClientError("upstream down", status_code=503)
+    watches = runner.build_watches({}, [{"venue_id": 1, "day": DAY}])
+    _run_until(runner, watches, lambda: _events(runner.out, "poll_error"))
+
+    [error] = _events(runner.out, "poll_error")
+    assert error["venue_id"] == 1 and error["error"] == "upstream down"
+    assert error["next_in"] == settings.POLL_INTERVAL_WARM_SEC
+    assert _events(runner.out, "stopped")[0]["poll_errors"] == 1
@@ -0,0 +1,104 @@
+# tests/test_client_manager.py
+"""Task sessions: shared storage, pooled clients, idle expiry and background use."""
+import time
+
+from app.core.state_store import SQLiteStateStore
+from app.services.clientManager import ClientManager
+from app.services.watch_registry import Watch
+
+
+def test_watches_outlive_idle_session_expiry(store, client_manager, watch_store):
+    idle_since = time.time() - 10 * client_manager.max_age
+    store.save_session("t1", "auth-1", {"c": "1"}, idle_since)
+    store.save_session("t2", "auth-2", {}, idle_since)
+    watch = watch_store.add(Watch(task_id="t1", venue_id=1, day="2030-01-01", party_size=2))
+
+    # Background polls borrow the stored session without counting as activity
+    with client_manager.use_client("t1", touch=False) as resy_client:
+        assert resy_client.export_state()["auth_token"] == "auth-1"
+    assert store.load_session("t1")["last_access"] == idle_since
+
+    client_manager.clean_up_old_clients()
+    watch_store.sync()
+    assert watch_store.registry.get(watch.watch_id) is not None
+    assert [row["watch_id"] for row in store.load_watches("t1")] == [watch.watch_id]
+    assert store.load_session("t1")["auth_token"] == "auth-1"
+    assert store.load_session("t2") is None
+
+    # Once the last watch is gone the idle session expires as usual
+    watch_store.remove([watch.watch_id])
+    client_manager.clean_up_old_clients()
+    assert store.load_session("t1") is None
+
+
+# ---------- Shared across workers ----------
+
+def test_sessions_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "state.db")
+    a, b = ClientManager(SQLiteStateStore(path)), ClientManager(SQLiteStateStore(path))
+
+    with a.use_client("t1") as resy_client:
+        resy_client.setToken(token="auth-1")
+        resy_client.setCookie({"session": "s1"})
+    a.save_session("t1")
+    with b.use_client("t1") as resy_client:
+        assert resy_client.export_state() == {"auth_token": "auth-1", "cookies": {"session": "s1"}}
+
+    # A re-login on one worker reaches the other's live session
+    with a.use_client("t1") as resy_client:
+        resy_client.setToken(token="auth-2")
+    a.save_session("t1")
+    with b.use_client("t1") as resy_client:
+        assert resy_client.userAuth == "auth-2"
+
+
+def test_session_secrets_are_encrypted_at_rest(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "state.db"))
+    store.save_session("t1", "auth-secret", {"session": "cookie-secret"}, time.time())
+    auth_token, cookies = store._conn().execute(
+        "SELECT auth_token, cookies FROM task_sessions WHERE task_id = 't1'"
+    ).fetchone()
+    assert "auth-secret" not in auth_token and "cookie-secret" not in cookies
+    reopened = SQLiteStateStore(str(tmp_path / "state.db"))
+    assert reopened.load_session("t1")["auth_token"] == "auth-secret"
+    assert reopened.load_session("t1")["cookies"] == {"session": "cookie-secret"}
+
+
+# ---------- Pooled clients and expiry ----------
+
+def test_pooled_clients_carry_no_state_between_tasks(client_manager):
+    with client_manager.use_client("t1") as first:
+        first.setToken(token="auth-1")
+        first.setCookie({"session": "s1"})
+    assert client_manager.sessions["t1"].client is None
+    with client_manager.use_client("t2") as second:
+        assert second is first
+        assert second.export_state() == {"auth_token": "", "cookies": {}}
+    with client_manager.use_client("t1") as again:
+        assert again.export_state() == {"auth_token": "auth-1", "cookies": {"session": "s1"}}
+
+
+def test_pool_is_bounded(client_manager):
+    client_manager.max_idle_clients = 1
+    with client_manager.use_clients("t1", 3) as clients:
+        assert len({id(c) for c in clients}) == 3
+    assert len(client_manager._idle_clients) == 1
+
+
+def test_expiry_rearms_touched_sessions_and_spares_busy_ones(client_manager):
+    client_manager.max_age = 0  # armed to expire right away
+    with client_manager.use_client("t1"):
+        pass
+    with client_manager.use_client("t2"):
+        client_manager.max_age = 100  # t1 was used since it was armed: its deadline moved on
+        client_manager.clean_up_old_clients()
+        assert set(client_manager.sessions) == {"t1", "t2"}
+        assert sorted(task_id for _, task_id in client_manager._expiry_heap) == ["t1", "t2"]
+
+        client_manager.max_age = -1
+        client_manager.clean_up_old_clients()
+        assert set(client_manager.sessions) == {"t2"}  # in flight: checked again a second later
+    assert "t2" in {task_id for _, task_id in client_manager._expiry_heap}
+    client_manager._expiry_heap = sorted((0.0, task_id) for _, task_id in client_manager._expiry_heap)
+    client_manager.clean_up_old_clients()
+    assert client_manager.sessions == {} and client_manager._expiry_heap == []
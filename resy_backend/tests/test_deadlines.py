@@ -0,0 +1,174 @@
+# tests/test_deadlines.py
+"""Request deadlines: the middleware that sets them and how ResyClient spends what is left."""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from app.core.config import settings
+from app.core.deadlines import Deadline, DeadlineMiddleware, carry, current_deadline, deadline_scope
+from app.services.resy_client import DeadlineExceeded, ResyClient, ResyClientError
+
+
+def test_deadline_expiry_and_cancellation():
+    deadline = Deadline(10.0)
+    assert 9.0 < deadline.remaining() <= 10.0 and not deadline.expired()
+    deadline.cancel()
+    assert deadline.expired()
+    assert Deadline(-1.0).expired()
+    deadline = Deadline(0.0)
+    deadline.detach()
+    assert not deadline.expired()
+
+
+def test_cancel_wakes_a_sleeping_deadline():
+    deadline = Deadline(10.0)
+    threading.Timer(0.05, deadline.cancel).start()
+    started = time.monotonic()
+    assert not deadline.sleep(5.0)
+    assert time.monotonic() - started < 1.0
+    assert Deadline(10.0).sleep(0.0)
+
+
+def test_carry_runs_pool_work_under_the_callers_deadline():
+    deadline = Deadline(5.0)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        with deadline_scope(deadline):
+            assert pool.submit(current_deadline).result() is None  # pools don't copy the context
+            assert pool.submit(carry(current_deadline)).result() is deadline
+        assert pool.submit(carry(current_deadline)).result() is None
+    assert carry(current_deadline) is current_deadline
+
+
+# ---------- Middleware ----------
+
+def _serve(path, headers=(), respond_at=None, disconnect_at=None):
+    """
+    Run a request through DeadlineMiddleware: the handler responds after
+    `respond_at` seconds (or never) and the client disconnects after
+    `disconnect_at` (or never). Returns what the handler saw of its deadline.
+    """
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen["deadline"] = deadline = current_deadline()
+        seen["remaining"] = deadline.remaining()
+        if respond_at is not None:
+            await asyncio.sleep(respond_at)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+        await asyncio.sleep(0.1)  # still running, e.g. a background task
+        seen["cancelled"] = deadline.cancelled.is_set()
+
+    async def receive():
+        if disconnect_at is None:
+            await asyncio.sleep(10)
+        await asyncio.sleep(disconnect_at)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "path": path, "headers": list(headers)}
+    asyncio.run(DeadlineMiddleware(app)(scope, receive, send))
+    return seen
+
+
+def test_route_defaults_and_the_timeout_header(monkeypatch):
+    monkeypatch.setattr(settings, "REQUEST_DEADLINE_MAX_SEC", 40.0)
+    polling = settings.REQUEST_DEADLINE_POLLING_SEC
+    assert polling - 1 < _serve("/api/v1/resy/slots")["remaining"] <= polling
+    assert settings.REQUEST_DEADLINE_SEC - 1 < _serve("/api/v1/resy/me")["remaining"] <= settings.REQUEST_DEADLINE_SEC
+    assert 2.0 < _serve("/api/v1/resy/slots", [(b"x-request-timeout", b"3")])["remaining"] <= 3.0
+    assert 39.0 < _serve("/api/v1/resy/slots", [(b"x-request-timeout", b"600")])["remaining"] <= 40.0
+    for bad in (b"soon", b"-1", b"0"):
+        assert polling - 1 < _serve("/api/v1/resy/slots", [(b"x-request-timeout", bad)])["remaining"] <= polling
+
+
+def test_disconnect_cancels_a_running_request():
+    assert _serve("/api/v1/resy/slots", disconnect_at=0.02)["cancelled"]
+
+
+def test_work_after_the_response_is_not_bound_by_the_deadline():
+    seen = _serve("/api/v1/resy/slots", [(b"x-request-timeout", b"0.05")], respond_at=0.0, disconnect_at=0.02)
+    assert not seen["cancelled"]
+    assert not seen["deadline"].expired()
+
+
+# ---------- ResyClient ----------
+
+class FakeSession:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.timeouts = []
+
+    def request(self, method, url, **kwargs):
+        self.timeouts.append(kwargs["timeout"])
+        resp = requests.Response()
+        resp.status_code = self.statuses.pop(0)
+        resp._content = b"{}"
+        return resp
+
+
+def _client(*statuses, backoff_base=0.01):
+    client = ResyClient("key", "agent", request_timeout=12.0, backoff_base=backoff_base)
+    client.session = FakeSession(statuses)
+    return client
+
+
+def test_attempts_time_out_with_the_deadline():
+    client = _client(200, 200, 200)
+    client._request("GET", "https://api.resy.com/x")
+    with deadline_scope(Deadline(2.0)):
+        client._request("GET", "https://api.resy.com/x")
+        client._request("POST", "https://api.resy.com/3/book", idempotent=False)
+    full, cut, unbounded = client.session.timeouts
+    assert full == 12.0 and cut <= 2.0 and unbounded == 12.0
+
+
+def test_no_attempt_starts_past_the_deadline_or_after_a_disconnect():
+    client = _client(200)
+    with deadline_scope(Deadline(0.1)):
+        with pytest.raises(DeadlineExceeded) as exc:
+            client._request("GET", "https://api.resy.com/x")
+    assert exc.value.status_code == 504
+    cancelled = Deadline(10.0)
+    cancelled.cancel()
+    with deadline_scope(cancelled):
+        with pytest.raises(DeadlineExceeded) as exc:
+            client._request("GET", "https://api.resy.com/x")
+    assert exc.value.status_code == 499
+    assert client.session.timeouts == []
+
+
+def test_no_retry_without_time_for_another_attempt():
+    client = _client(503, 200, backoff_base=1.0)
+    with deadline_scope(Deadline(1.0)):
+        with pytest.raises(ResyClientError) as exc:
+            client._request("GET", "https://api.resy.com/x")
+    assert exc.value.status_code == 503
+    assert len(client.session.timeouts) == 1
+
+    client = _client(503, 200)
+    with deadline_scope(Deadline(5.0)):
+        assert client._request("GET", "https://api.resy.com/x").status_code == 200
+    assert len(client.session.timeouts) == 2
+
+
+def test_reservation_commit_pause_respects_the_deadline():
+    client = _client(200, 200, 200, 200)
+    client.userAuth = "token"
+    with deadline_scope(Deadline(0.6)):
+        started = time.monotonic()
+        client.getReservation("cfg", "2030-01-01", 2)
+        assert time.monotonic() - started < 0.4  # no time to pause: committed right away
+    cancelled = Deadline(10.0)
+    with deadline_scope(cancelled):
+        threading.Timer(0.05, cancelled.cancel).start()
+        with pytest.raises(DeadlineExceeded) as exc:
+            client.getReservation("cfg", "2030-01-01", 2)
+    assert exc.value.status_code == 499
+    assert len(client.session.timeouts) == 3  # the cancelled commit was never sent
@@ -0,0 +1,192 @@
+# tests/test_monitor_scheduler.py
+"""Monitor scheduler: due order, cancellation, rescheduling from the poll's delay, jitter and stats."""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+from app.services.monitor_scheduler import MonitorScheduler
+
+
+def _drive(scheduler: MonitorScheduler, done: threading.Event, timeout: float = 3.0) -> None:
+    """Run the scheduler on a fresh loop until `done` is set (or the timeout passes)."""
+    async def run():
+        scheduler.start()
+        try:
+            deadline = time.monotonic() + timeout
+            while not done.is_set() and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(run())
+
+
+def _result(value) -> Future:
+    future: Future = Future()
+    future.set_result(value)
+    return future
+
+
+def test_keys_fire_in_due_order():
+    fired, done = [], threading.Event()
+
+    def poll(key):
+        fired.append(key)
+        if len(fired) == 3:
+            done.set()
+        return None
+
+    scheduler = MonitorScheduler(poll, max_workers=1, jitter=0.0)
+    scheduler.schedule_many([("late", 0.15), ("early", 0.03), ("middle", 0.08)])
+    _drive(scheduler, done)
+
+    assert fired == ["early", "middle", "late"]
+    assert len(scheduler) == 0
+    assert scheduler.stats()["fired"] == 3
+
+
+def test_cancelled_and_replaced_entries_never_fire():
+    fired, done = [], threading.Event()
+
+    def poll(key):
+        fired.append(key)
+        if key == "last":
+            done.set()
+        return None
+
+    scheduler = MonitorScheduler(poll, max_workers=1, jitter=0.0)
+    scheduler.schedule("gone", 0.02)
+    scheduler.schedule("moved", 30.0)
+    scheduler.schedule("moved", 0.02)  # replaces the pending run, the old entry goes stale
+    scheduler.schedule("last", 0.1)
+    scheduler.cancel("gone")
+    _drive(scheduler, done)
+
+    assert fired == ["moved", "last"]
+    assert scheduler.stats()["fired"] == 2
+
+
+def test_returned_delay_reschedules_and_none_drops():
+    calls, done = [], threading.Event()
+
+    def poll(key):
+        calls.append(key)
+        if len(calls) < 3:
+            return 0.01
+        done.set()
+        return None
+
+    scheduler = MonitorScheduler(poll, jitter=0.0)
+    scheduler.schedule("venue")
+    _drive(scheduler, done)
+    time.sleep(0.05)
+
+    assert calls == ["venue"] * 3
+    assert len(scheduler) == 0
+
+
+def test_failed_poll_retries_after_error_delay():
+    calls, done = [], threading.Event()
+
+    def poll(key):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise RuntimeError("upstream down")
+        done.set()
+        return None
+
+    scheduler = MonitorScheduler(poll, jitter=0.0, error_delay=0.1)
+    scheduler.schedule("venue")
+    _drive(scheduler, done)
+
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.09
+
+
+def test_jitter_only_pulls_polls_earlier():
+    scheduler = MonitorScheduler(lambda key: None, jitter=0.5)
+    for i in range(200):
+        scheduler._running.add(i)
+        before = time.monotonic()
+        scheduler._finished(i, _result(10.0))
+        after = time.monotonic()
+        when = next(w for w, seq, key in scheduler._heap if key == i)
+        assert before + 5.0 <= when <= after + 10.0
+
+    # A zero delay is never jittered into the past
+    scheduler._running.add("now")
+    before = time.monotonic()
+    scheduler._finished("now", _result(0.0))
+    assert next(w for w, seq, key in scheduler._heap if key == "now") >= before
+
+
+def test_spread_places_keys_inside_the_window():
+    scheduler = MonitorScheduler(lambda key: None)
+    before = time.monotonic()
+    scheduler.spread(range(500), window=2.0)
+    after = time.monotonic()
+
+    whens = [when for when, seq, key in scheduler._heap]
+    assert len(scheduler) == 500
+    assert all(before <= when <= after + 2.0 for when in whens)
+    # Spread out rather than all landing on the same tick
+    assert max(whens) - min(whens) > 1.0
+
+
+def test_cancel_many_compacts_a_mostly_dead_heap():
+    scheduler = MonitorScheduler(lambda key: None)
+    scheduler.schedule_many((i, 60.0) for i in range(200))
+    scheduler.cancel_many(range(190))
+
+    assert len(scheduler) == 10
+    assert sorted(key for when, seq, key in scheduler._heap) == list(range(190, 200))
+
+    # A few cancellations leave the stale entries for the loop to skip
+    scheduler.cancel_many([190, 191])
+    assert len(scheduler._heap) == 10
+    assert len(scheduler) == 8
+
+
+def test_running_key_is_not_duplicated_and_cancel_wins():
+    scheduler = MonitorScheduler(lambda key: None, jitter=0.0)
+    scheduler._running.add("venue")
+
+    scheduler.schedule("venue")
+    assert "venue" not in scheduler._live and scheduler._heap == []
+
+    # Removed while running: the delay the poll returns is ignored
+    scheduler.cancel("venue")
+    scheduler._finished("venue", _result(5.0))
+    assert len(scheduler) == 0 and scheduler._heap == []
+
+    # Removed and re-added while running: it reschedules itself as usual
+    scheduler._running.add("venue")
+    scheduler.cancel("venue")
+    scheduler.schedule("venue")
+    scheduler._finished("venue", _result(5.0))
+    assert list(scheduler._live) == ["venue"]
+
+
+def test_stats_report_lag_percentiles():
+    done = threading.Event()
+    seen = []
+
+    def poll(key):
+        seen.append(key)
+        if len(seen) == 20:
+            done.set()
+        return None
+
+    scheduler = MonitorScheduler(poll, max_workers=4)
+    scheduler.spread(range(20), window=0.1)
+    _drive(scheduler, done)
+
+    stats = scheduler.stats()
+    assert stats["fired"] == 20
+    assert stats["scheduled"] == 0 and stats["running"] == 0
+    for name in ("dispatch_lag_ms", "start_lag_ms"):
+        lag = stats[name]
+        assert 0.0 <= lag["p50"] <= lag["p99"] <= lag["max"]
+    # A worker can only start after the loop dispatched the key
+    assert stats["start_lag_ms"]["max"] >= stats["dispatch_lag_ms"]["p50"]
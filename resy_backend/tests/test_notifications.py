@@ -0,0 +1,271 @@
+# tests/test_notifications.py
+"""Notification destinations, per-destination delivery and the notifier's retries."""
+import asyncio
+import smtplib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from app.services import notifications
+
+from app.core.config import settings
+from app.services.notifications import (
+    DeliveryError,
+    NotificationSink,
+    Notifier,
+    SmtpSink,
+    WebhookSink,
+    check_webhook_url,
+    email_allowed,
+)
+
+
+def _event(watch_id, url=None, tokens=("c1",)):
+    return {
+        "watch_id": watch_id, "task_id": "t1", "venue_id": 1, "day": "2030-01-01", "party_size": 2,
+        "slots": [{"token": t, "start": "2030-01-01 19:00:00"} for t in tokens],
+        "found_at": 0.0, "notify": {"webhook_url": url} if url else None,
+    }
+
+
+# ---------- Destinations ----------
+
+@pytest.mark.parametrize("url", [
+    "ftp://example.com/hook",
+    "http:///hook",
+    "http://127.0.0.1/hook",
+    "http://10.1.2.3/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://0.0.0.0/hook",
+])
+def test_non_public_webhooks_are_refused(url):
+    with pytest.raises(ValueError):
+        check_webhook_url(url)
+
+
+def test_public_addresses_are_allowed():
+    check_webhook_url("https://8.8.8.8/hook")
+
+
+def test_allowlist_replaces_address_checks(monkeypatch):
+    monkeypatch.setattr(settings, "NOTIFY_WEBHOOK_ALLOWED_HOSTS", "hooks.example.com, Internal.Local")
+    check_webhook_url("https://hooks.example.com/a")
+    check_webhook_url("http://internal.local/a")
+    with pytest.raises(ValueError):
+        check_webhook_url("https://8.8.8.8/hook")
+
+
+def test_email_destinations(monkeypatch):
+    monkeypatch.setattr(settings, "NOTIFY_EMAIL_TO", "ops@example.com")
+    monkeypatch.setattr(settings, "NOTIFY_EMAIL_ALLOWED", "team@example.com")
+    assert email_allowed("Me@Example.com", "me@example.com")
+    assert email_allowed("ops@example.com", None)
+    assert email_allowed("team@example.com", "me@example.com")
+    assert not email_allowed("someone@else.com", "me@example.com")
+    assert not email_allowed("me@example.com", None)
+
+
+# ---------- Webhook sink ----------
+
+class FakeHttp:
+    def __init__(self, statuses):
+        self.statuses = statuses  # url -> status code
+        self.posts = []
+
+    def post(self, url, json, timeout, allow_redirects):
+        assert allow_redirects is False
+        self.posts.append((url, [e["watch_id"] for e in json["events"]]))
+        resp = requests.Response()
+        resp.status_code = self.statuses.get(url, 200)
+        return resp
+
+
+def test_webhook_batches_per_url_and_reports_only_failed_ones():
+    sink = WebhookSink("http://127.0.0.1/operator", timeout=1.0)  # the operator's own URL is trusted
+    sink.session = FakeHttp({"https://8.8.8.8/down": 500, "https://8.8.4.4/moved": 302})
+    events = [
+        _event("w1", "https://8.8.8.8/down"),
+        _event("w2", "https://1.1.1.1/ok"),
+        _event("w3", "https://8.8.8.8/down"),
+        _event("w4", "https://8.8.4.4/moved"),
+        _event("w5", "http://10.0.0.1/internal"),
+        _event("w6"),
+    ]
+    with pytest.raises(DeliveryError) as exc:
+        sink.send(events)
+    assert [e["watch_id"] for e in exc.value.failed] == ["w1", "w3", "w4"]
+    assert exc.value.rejected == 1
+    assert sorted(sink.session.posts) == [
+        ("http://127.0.0.1/operator", ["w6"]),
+        ("https://1.1.1.1/ok", ["w2"]),
+        ("https://8.8.4.4/moved", ["w4"]),
+        ("https://8.8.8.8/down", ["w1", "w3"]),
+    ]
+
+
+@pytest.fixture
+def local_hook():
+    """An HTTP server on 127.0.0.1 recording the paths posted to."""
+    posts = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            posts.append(self.path)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_port, posts
+    server.shutdown()
+    server.server_close()
+
+
+def test_webhook_refuses_non_public_address_at_connect_time(monkeypatch, local_hook):
+    port, posts = local_hook
+    sink = WebhookSink(f"http://127.0.0.1:{port}/operator", timeout=2.0)
+    # As if DNS answered with a public address for the check and a private one for the POST
+    monkeypatch.setattr(notifications, "check_webhook_url", lambda url: None)
+    with pytest.raises(DeliveryError) as exc:
+        sink.send([_event("w1", f"http://localhost:{port}/user"), _event("w2")])
+    assert exc.value.rejected == 1 and exc.value.failed == []
+    assert posts == ["/operator"]
+
+
+# ---------- SMTP sink ----------
+
+class FakeSmtp:
+    """smtplib.SMTP stand-in: refuses `refused` and drops the connection on reaching `disconnect_at`."""
+
+    refused = set()
+    disconnect_at = None
+    sent = []
+
+    def __init__(self, host, port, timeout):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def starttls(self):
+        pass
+
+    def send_message(self, msg):
+        to = msg["To"]
+        if to == self.disconnect_at:
+            raise smtplib.SMTPServerDisconnected("connection lost")
+        if to in self.refused:
+            raise smtplib.SMTPRecipientsRefused({to: (550, b"no such user")})
+        self.sent.append(to)
+
+
+def _mail_event(watch_id, email):
+    event = _event(watch_id)
+    event["notify"] = {"email": email}
+    return event
+
+
+def test_smtp_retries_only_recipients_not_reached(monkeypatch):
+    monkeypatch.setattr(smtplib, "SMTP", FakeSmtp)
+    monkeypatch.setattr(FakeSmtp, "refused", {"b@example.com"})
+    monkeypatch.setattr(FakeSmtp, "disconnect_at", "c@example.com")
+    monkeypatch.setattr(FakeSmtp, "sent", [])
+    sink = SmtpSink("smtp.example.com", 587, "resy@example.com", None)
+    events = [
+        _mail_event("w1", "a@example.com"),
+        _mail_event("w2", "b@example.com"),
+        _mail_event("w3", "c@example.com"),
+        _mail_event("w4", "d@example.com"),
+        _mail_event("w5", "a@example.com"),
+    ]
+    with pytest.raises(DeliveryError) as exc:
+        sink.send(events)
+    assert FakeSmtp.sent == ["a@example.com"]
+    assert [e["watch_id"] for e in exc.value.failed] == ["w2", "w3", "w4"]
+
+
+# ---------- Notifier ----------
+
+def test_sinks_must_implement_send():
+    with pytest.raises(TypeError):
+        NotificationSink()
+
+class RecordingSink(NotificationSink):
+    """Fails the watches in `failing` (per destination) for the first `failures` attempts."""
+
+    name = "recording"
+
+    def __init__(self, failing=(), failures=0):
+        super().__init__(concurrency=1, batch_size=10)
+        self.failing = set(failing)
+        self.failures = failures
+        self.attempts = []
+
+    def send(self, events):
+        self.attempts.append([e["watch_id"] for e in events])
+        if self.failures and self.failing:
+            self.failures -= 1
+            failed = [e for e in events if e["watch_id"] in self.failing]
+            if failed:
+                raise DeliveryError("destination down", failed)
+
+
+def _deliver(sink, events, max_attempts=3):
+    notifier = Notifier([sink], batch_wait=0.05, max_attempts=max_attempts, backoff_base=0.01)
+
+    async def run():
+        notifier.start()
+        published = [notifier.publish(event) for event in events]
+        await asyncio.sleep(0)
+        await notifier.stop(drain_timeout=5.0)
+        return published
+
+    return asyncio.run(run()), notifier.stats()
+
+
+def test_only_failed_events_are_retried():
+    sink = RecordingSink(failing={"w2"}, failures=1)
+    _, stats = _deliver(sink, [_event("w1"), _event("w2"), _event("w3")])
+    assert sink.attempts == [["w1", "w2", "w3"], ["w2"]]
+    assert stats["sinks"]["recording"] == {"sent": 3, "failed": 0, "retried": 1, "dropped": 0, "queued": 0}
+
+
+def test_notifier_gives_up_after_max_attempts():
+    sink = RecordingSink(failing={"w2"}, failures=10)
+    _, stats = _deliver(sink, [_event("w1"), _event("w2")], max_attempts=3)
+    assert sink.attempts == [["w1", "w2"], ["w2"], ["w2"]]
+    assert stats["sinks"]["recording"]["sent"] == 1
+    assert stats["sinks"]["recording"]["failed"] == 1
+
+
+def test_repeated_slot_sets_are_not_republished():
+    sink = RecordingSink()
+    published, stats = _deliver(sink, [_event("w1"), _event("w1"), _event("w1", tokens=("c2",))])
+    assert published == [True, False, True]
+    assert stats["deduped"] == 1
+    assert sum(len(a) for a in sink.attempts) == 2
+
+
+def test_events_dropped_before_start_are_not_deduplicated():
+    notifier = Notifier([RecordingSink()])
+    assert notifier.publish(_event("w1")) is False
+    assert notifier.stats()["deduped"] == 0
+
+    async def run():
+        notifier.start()
+        published = notifier.publish(_event("w1"))
+        await notifier.stop(drain_timeout=5.0)
+        return published
+
+    assert asyncio.run(run()) is True
@@ -0,0 +1,59 @@
+# tests/test_profile_cache.py
+"""The per-task profile cache: prefetch, freshness and the card booking uses."""
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from app.services.profile_cache import ProfileCache
+from app.services.resy_client import ResyClientError
+
+CARDS = [{"id": 11, "is_default": False}, {"id": 22, "is_default": True}]
+
+
+@pytest.fixture
+def profiles(monkeypatch, client_manager, resy_client):
+    @contextmanager
+    def use_client(task_id, touch=True):
+        yield resy_client
+
+    monkeypatch.setattr(client_manager, "use_client", use_client)
+    resy_client.user = {"email": "me@example.com", "payment_methods": CARDS}
+    return ProfileCache(client_manager)
+
+
+def test_prefetched_profile_is_served_from_the_store(profiles, resy_client):
+    profiles.prefetch("t1")
+    assert profiles.get_or_fetch("t1")["email"] == "me@example.com"
+    assert profiles.get_or_fetch("t1")["email"] == "me@example.com"
+    assert resy_client.user_calls == 1
+
+
+def test_failed_prefetch_is_logged_not_raised(profiles, resy_client):
+    resy_client.user = ResyClientError("unauthorized", status_code=401)
+    profiles.prefetch("t1")
+    assert profiles.get("t1") is None
+    with pytest.raises(ResyClientError):
+        profiles.fetch("t1")
+
+
+def test_cards_come_from_stale_profiles_and_default_needs_opt_in(profiles, store):
+    store.save_profile("t1", {"payment_methods": CARDS}, time.time() - 10 * profiles.ttl)
+    assert profiles.get("t1") is None  # too old for /me
+    assert profiles.payment_methods("t1") == CARDS  # fine for booking
+    assert profiles.payment_method_for("t1", 11, use_default=False) == 11
+    assert profiles.payment_method_for("t1", None, use_default=False) is None
+    assert profiles.payment_method_for("t1", None, use_default=True) == 22
+    assert profiles.payment_method_for("t2", None, use_default=True) is None
+
+
+def test_refresh_only_touches_stale_profiles(monkeypatch, profiles, store, resy_client):
+    now = time.time()
+    store.save_profile("fresh", {"email": "old"}, now)
+    store.save_profile("stale", {"email": "old"}, now - 10 * profiles.ttl)
+    monkeypatch.setattr(profiles.client_manager, "authenticated_task_ids", lambda: ["fresh", "stale", "new"])
+    profiles.refresh_stale()
+    assert resy_client.user_calls == 2
+    assert profiles.get("fresh")["email"] == "old"
+    assert profiles.get("stale")["email"] == "me@example.com"
+    assert profiles.get("new")["email"] == "me@example.com"
@@ -0,0 +1,42 @@
+# tests/test_rate_limit.py
+"""The shared sliding-window rate limit and the hits workers claim from it ahead of use."""
+from app.core.state_store import SQLiteStateStore
+
+
+def _logged(store, identifier="key"):
+    return store._conn().execute(
+        "SELECT COUNT(*) FROM rate_limit_log WHERE identifier = ?", (identifier,)
+    ).fetchone()[0]
+
+
+def test_sliding_window(store):
+    assert [store.allow_request("key", 1000.0, 60, 3) for _ in range(4)] == [True, True, True, False]
+    assert store.allow_request("other", 1000.0, 60, 3)
+    assert not store.allow_request("key", 1059.0, 60, 3)
+    assert store.allow_request("key", 1061.0, 60, 3)
+
+
+def test_workers_claim_hits_in_batches_and_give_back_unused_ones(tmp_path):
+    path = str(tmp_path / "state.db")
+    a = SQLiteStateStore(path, rate_lease_size=4, rate_lease_sec=1.0)
+    b = SQLiteStateStore(path, rate_lease_size=4, rate_lease_sec=1.0)
+
+    # One write claims four hits; the next three are served from memory
+    assert all(a.allow_request("key", 1000.0, 60, 10) for _ in range(4))
+    assert _logged(a) == 4
+    assert a.allow_request("key", 1000.0, 60, 10)  # fifth: claims min(4, 6 // 2) = 3
+    assert _logged(a) == 7
+    # The other worker sees them as used, and its claims shrink near the limit
+    assert b.allow_request("key", 1000.0, 60, 10)
+    assert b.allow_request("key", 1000.0, 60, 10)
+    assert b.allow_request("key", 1000.0, 60, 10)
+    assert not b.allow_request("key", 1000.0, 60, 10)
+    assert _logged(b) == 10
+
+    # a still holds two unused claims; once they age out they go back to the shared log
+    assert a.allow_request("key", 1002.0, 60, 10)  # gives back 2, claims 1
+    assert _logged(a) == 9
+    assert b.allow_request("key", 1002.0, 60, 10)
+    assert not b.allow_request("key", 1002.0, 60, 10)
+    assert not a.allow_request("key", 1002.0, 60, 10)
+    assert _logged(a) == 10
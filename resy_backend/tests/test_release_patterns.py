@@ -0,0 +1,83 @@
+# tests/test_release_patterns.py
+"""Release windows and cancellation hours learnt from the slot history, and the poll cadence they give."""
+from datetime import date, datetime, time as dt_time, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.services.availability_history import AvailabilityHistory
+from app.services.release_patterns import ReleasePatternAnalyzer, release_window_for
+
+VENUE = 1
+BASE = date.today() - timedelta(days=10)
+
+
+def _at(day: date, hour: int, minute: int) -> float:
+    return datetime.combine(day, dt_time(hour, minute)).timestamp()
+
+
+def _slots(day: date, *hours):
+    return [f"{day.isoformat()} {h:02d}:00:00" for h in hours]
+
+
+@pytest.fixture
+def analyzer(tmp_path):
+    history = AvailabilityHistory(str(tmp_path / "history.db"), retention_sec=30 * 86400)
+    for i in range(5):
+        seen_on = BASE + timedelta(days=i)
+        day = seen_on + timedelta(days=14)
+        history.record(VENUE, day.isoformat(), 2, [], observed_at=_at(seen_on, 8, 0))
+        # Released 14 days ahead at 09:00-09:04: four slots at once
+        history.record(VENUE, day.isoformat(), 2, _slots(day, 18, 19, 20, 21), observed_at=_at(seen_on, 9, i))
+        # Then a single cancellation slot in the early evening
+        history.record(VENUE, day.isoformat(), 2, _slots(day, 17, 18, 19, 20, 21), observed_at=_at(seen_on, 18, 30))
+    history.flush()
+    return ReleasePatternAnalyzer(history, ttl=600, lookback_sec=30 * 86400)
+
+
+def test_release_horizon_window_and_cancellation_hours(analyzer):
+    prediction = analyzer.predict(VENUE)
+    assert prediction["observations"] == 10
+    assert prediction["release"] == {
+        "days_ahead": 14,
+        "time": "09:02",
+        "window_start": "08:55",
+        "window_end": "09:09",
+        "confidence": 1.0,
+        "samples": 5,
+    }
+    assert prediction["cancellations"]["peak_hours"] == [18]
+    assert prediction["cancellations"]["by_hour"] == {18: 5}
+
+    day = (date.today() + timedelta(days=20)).isoformat()
+    start, end = release_window_for(prediction, day)
+    release_day = date.today() + timedelta(days=6)
+    assert (start, end) == (_at(release_day, 8, 55), _at(release_day, 9, 9))
+
+
+def test_poll_interval_follows_the_prediction(analyzer):
+    hot, warm, cold = settings.POLL_INTERVAL_HOT_SEC, settings.POLL_INTERVAL_WARM_SEC, settings.POLL_INTERVAL_COLD_SEC
+    day = (date.today() + timedelta(days=20)).isoformat()
+    release_day = date.today() + timedelta(days=6)
+
+    assert analyzer.poll_interval(VENUE, day, now=_at(release_day, 9, 0)) == hot
+    assert analyzer.poll_interval(VENUE, day, now=_at(release_day, 18, 10)) == warm  # cancellation peak
+    assert analyzer.poll_interval(VENUE, day, now=_at(release_day, 13, 0)) == cold
+    # Never sleeps past the window opening
+    assert analyzer.poll_interval(VENUE, day, now=_at(release_day, 8, 53)) == 120
+    assert analyzer.poll_interval(VENUE, day, now=_at(release_day, 8, 54) + 58) == hot
+    # No history: a plain warm cadence
+    assert analyzer.poll_interval(2, day) == warm
+
+
+def test_predictions_are_cached_until_refreshed(analyzer):
+    first = analyzer.predict(VENUE)
+    day = BASE + timedelta(days=30)
+    analyzer.history.record(VENUE, day.isoformat(), 2, [], observed_at=_at(BASE, 7, 0))
+    analyzer.history.record(VENUE, day.isoformat(), 2, _slots(day, 18, 19, 20), observed_at=_at(BASE, 7, 30))
+    assert analyzer.predict(VENUE) is first
+    assert analyzer.refresh_stale() == 0
+    analyzer.ttl = 0
+    assert analyzer.refresh_stale() == 1
+    assert analyzer.cached(VENUE)["observations"] == 10  # the poll path leaves the buffer to the flush job
+    assert analyzer.predict(VENUE)["observations"] == 11  # API reads include it
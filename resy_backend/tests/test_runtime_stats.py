@@ -0,0 +1,62 @@
+# tests/test_runtime_stats.py
+"""Scheduler job stats and the admin runtime endpoint."""
+import asyncio
+import threading
+from datetime import datetime
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from app.api.v1 import admin_routes
+from app.services.runtime_stats import JobStats
+
+
+def test_job_stats_count_runs_and_errors():
+    scheduler = BackgroundScheduler()
+    stats = JobStats()
+    stats.attach(scheduler)
+    done = threading.Event()
+
+    def fail():
+        done.set()
+        raise RuntimeError("boom")
+
+    scheduler.add_job(lambda: None, "interval", hours=1, id="ok", next_run_time=datetime.now())
+    scheduler.add_job(fail, "interval", hours=1, id="fail", next_run_time=datetime.now())
+    scheduler.start()
+    try:
+        assert done.wait(5.0)
+        for _ in range(100):
+            jobs = {job["id"]: job for job in stats.stats()}
+            if jobs["ok"].get("runs") == 1 and jobs["fail"].get("runs") == 1:
+                break
+            threading.Event().wait(0.05)
+    finally:
+        scheduler.shutdown()
+
+    assert jobs["ok"]["errors"] == 0 and jobs["ok"]["running"] == 0
+    assert jobs["ok"]["next_run_at"] is not None and jobs["ok"]["last_duration_ms"] is not None
+    assert jobs["fail"]["errors"] == 1 and "boom" in jobs["fail"]["last_error"]
+    assert stats.running() == 0
+
+
+def test_runtime_lists_tasks_off_the_loop(monkeypatch, store, client_manager):
+    for task_id in ("t1", "t2"):
+        with client_manager.use_client(task_id):
+            pass
+    monkeypatch.setattr(admin_routes, "client_manager", client_manager)
+
+    loop_thread = []
+
+    def stats(limit):
+        loop_thread.append(threading.current_thread())
+        return type(client_manager).stats(client_manager, limit=limit)
+
+    monkeypatch.setattr(client_manager, "stats", stats)
+
+    async def call():
+        return threading.current_thread(), await admin_routes.runtime(limit=1)
+
+    loop, body = asyncio.run(call())
+    assert body["tasks"]["live"] == 2 and len(body["tasks"]["items"]) == 1
+    assert loop_thread and loop_thread[0] is not loop
+    assert set(body) >= {"jobs", "event_loop", "threadpools", "admission", "watches", "notifications"}
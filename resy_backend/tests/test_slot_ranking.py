@@ -0,0 +1,64 @@
+# tests/test_slot_ranking.py
+"""Preference-ranked slots: the ranker itself and /slots with saved preferences."""
+import pytest
+
+from app.services.slot_ranking import SlotRanker, slot_minute
+from app.services.slots import extract_slot_time
+
+DAY = "2030-06-01"
+
+
+def _slot(token, hhmm, slot_type="Dining Room", is_paid=False):
+    return {"token": token, "type": slot_type, "start": f"{DAY} {hhmm}:00", "end": None, "is_paid": is_paid}
+
+
+def _ranked(preferences, slots):
+    return [slot["token"] for _, slot in SlotRanker(preferences).rank(slots)]
+
+
+@pytest.mark.parametrize("start", [f"{DAY} 19:30:00", f"{DAY}T07:05:00", "19:30", "7:30 PM", "garbage", None])
+def test_slot_minute_agrees_with_extract_slot_time(start):
+    t = extract_slot_time(start)
+    assert slot_minute(start) == (None if t is None else t.hour * 60 + t.minute)
+
+
+def test_type_beats_price_beats_time():
+    slots = [
+        _slot("bar-1900", "19:00", "Bar"),
+        _slot("dining-paid-1900", "19:00", is_paid=True),
+        _slot("dining-2030", "20:30"),
+        _slot("patio-2200", "22:00", "Patio"),
+        _slot("dining-1915", "19:15"),
+    ]
+    prefs = {"target_time": "19:00", "preferred_types": ["Patio", "dining room"], "prefer_free": True}
+    assert _ranked(prefs, slots) == ["patio-2200", "dining-1915", "dining-2030", "dining-paid-1900", "bar-1900"]
+    prefs = {"target_time": "19:00", "preferred_types": ["Dining Room"], "excluded_types": ["bar"]}
+    assert _ranked(prefs, slots) == ["dining-paid-1900", "dining-1915", "dining-2030", "patio-2200"]
+    assert _ranked({**prefs, "allow_paid": False}, slots) == ["dining-1915", "dining-2030", "patio-2200"]
+
+
+def test_windows_and_targets_across_midnight():
+    slots = [_slot("2330", "23:30"), _slot("0030", "00:30"), _slot("1200", "12:00"), _slot("2300", "23:00")]
+    assert _ranked({"time_start": "23:00", "time_end": "01:00"}, slots) == ["2300", "2330", "0030"]
+    assert _ranked({"target_time": "00:10"}, slots) == ["0030", "2330", "2300", "1200"]
+    # Upstream order breaks ties; slots without a time only pass without time preferences
+    untimed = {"token": "untimed", "type": None, "start": None, "end": None, "is_paid": False}
+    assert _ranked({}, [untimed] + slots) == ["untimed", "2330", "0030", "1200", "2300"]
+    assert _ranked({"time_start": "00:00"}, [untimed]) == []
+
+
+def test_slots_are_ranked_by_saved_preferences(routes):
+    routes.client.find_result = {"results": {"venues": [{"slots": [
+        {"config": {"token": t, "type": kind}, "date": {"start": f"{DAY} {hhmm}:00", "end": f"{DAY} 23:00:00"}, "payment": {}}
+        for t, kind, hhmm in [("a", "Bar", "19:00"), ("b", "Patio", "21:00"), ("c", "Patio", "19:30"), ("d", "Patio", "17:00")]
+    ]}]}}
+    api = routes.api
+    api.set_preferences(api.SlotPreferences(target_time="19:00", preferred_types=["Patio"]), "t1")
+    query = api.SlotSearchQuery(venue_id=1, day=DAY, num_seats=2, time_start="18:00", time_end="22:00")
+    response = api.get_slots(query, "t1")
+    assert [(s.token, s.score) for s in response.slots] == [("c", 30), ("b", 120), ("a", 2 * 24 * 60)]
+    assert api.get_preferences("t1").preferred_types == ["Patio"]
+
+    # Without preferences the request's window is a plain filter in upstream order
+    response = api.get_slots(query, "t2")
+    assert [(s.token, s.score) for s in response.slots] == [("a", None), ("b", None), ("c", None)]
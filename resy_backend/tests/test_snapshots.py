@@ -0,0 +1,143 @@
+# tests/test_snapshots.py
+"""The mapped snapshot file format, and warm starts of a cache through CacheSnapshots."""
+import struct
+
+import pytest
+
+from app.core.snapshots import Snapshot, SnapshotError, merge_entries, open_snapshot, write_snapshot
+from app.services.cache_snapshots import CacheSnapshots
+from app.services.venue_resolver import VenueResolver
+
+NOW = 1_000_000.0
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cache.snap")
+
+
+def test_round_trip_in_key_order(path):
+    entries = [(f"k{i:04d}".encode(), f"v{i}".encode(), NOW + 60) for i in range(500, 0, -1)]
+    assert write_snapshot(path, entries, NOW) == 500
+    snapshot = Snapshot(path)
+    assert len(snapshot) == 500 and snapshot.created_at == NOW
+    assert snapshot.get(b"k0001", NOW) == (b"v1", NOW + 60)
+    assert snapshot.get(b"k0500", NOW) == (b"v500", NOW + 60)
+    assert snapshot.get(b"k0000", NOW) is None
+    assert snapshot.get(b"k9999", NOW) is None
+    keys = [key for key, _, _ in snapshot.items(NOW)]
+    assert keys == sorted(keys)
+    snapshot.close()
+
+
+def test_empty_keys_and_values(path):
+    write_snapshot(path, [(b"", b"root", NOW + 60), (b"empty", b"", NOW + 60)], NOW)
+    snapshot = Snapshot(path)
+    assert snapshot.get(b"", NOW) == (b"root", NOW + 60)
+    assert snapshot.get(b"empty", NOW) == (b"", NOW + 60)
+    snapshot.close()
+
+
+def test_expired_entries_are_skipped(path):
+    write_snapshot(path, [(b"gone", b"x", NOW), (b"soon", b"y", NOW + 10), (b"later", b"z", NOW + 100)], NOW)
+    snapshot = Snapshot(path)
+    assert len(snapshot) == 2  # not written at all
+    assert snapshot.get(b"soon", NOW + 5) == (b"y", NOW + 10)
+    assert snapshot.get(b"soon", NOW + 10) is None
+    assert [key for key, _, _ in snapshot.items(NOW + 50)] == [b"later"]
+    snapshot.close()
+
+
+def test_first_occurrence_of_a_key_wins(path):
+    write_snapshot(path, [(b"k", b"first", NOW + 60), (b"k", b"second", NOW + 90)], NOW)
+    snapshot = Snapshot(path)
+    assert snapshot.get(b"k", NOW) == (b"first", NOW + 60)
+    snapshot.close()
+
+
+def test_rewrite_keeps_an_open_mapping_valid(path):
+    write_snapshot(path, [(b"k", b"old", NOW + 60)], NOW)
+    snapshot = Snapshot(path)
+    write_snapshot(path, [(b"k", b"new", NOW + 60)], NOW)
+    assert snapshot.get(b"k", NOW) == (b"old", NOW + 60)
+    snapshot.close()
+    snapshot = open_snapshot(path, 3600, NOW)
+    assert snapshot.get(b"k", NOW) == (b"new", NOW + 60)
+    snapshot.close()
+
+
+def test_missing_stale_or_damaged_snapshots_are_ignored(path):
+    assert open_snapshot(path, 3600, NOW) is None
+
+    write_snapshot(path, [(b"k", b"v", NOW + 7200)], NOW)
+    assert open_snapshot(path, 3600, NOW + 3601) is None
+    assert open_snapshot(path, 3600, NOW + 3599) is not None
+
+    with open(path, "rb") as f:
+        data = f.read()
+    for damaged in (b"", data[:10], b"XXXX" + data[4:], data[:4] + struct.pack("<H", 99) + data[6:], data[:30]):
+        with open(path, "wb") as f:
+            f.write(damaged)
+        with pytest.raises(SnapshotError):
+            Snapshot(path)
+        assert open_snapshot(path, 3600, NOW) is None
+
+
+def test_merge_prefers_memory_over_the_snapshot(path):
+    write_snapshot(path, [(b"a", b"snap", NOW + 60), (b"b", b"snap", NOW + 60)], NOW)
+    snapshot = Snapshot(path)
+    merged = list(merge_entries([(b"a", b"memory", NOW + 90)], snapshot, NOW))
+    assert merged == [(b"a", b"memory", NOW + 90), (b"b", b"snap", NOW + 60)]
+    assert list(merge_entries([(b"a", b"memory", NOW + 90)], None, NOW)) == [(b"a", b"memory", NOW + 90)]
+    snapshot.close()
+
+
+# ---------- Warm start ----------
+
+class VenueLookups:
+    def __init__(self):
+        self.calls = 0
+
+    def lookup_venue_slug(self, city_slug, venue_slug):
+        self.calls += 1
+        return {"id": {"resy": 42}, "name": "Carbone"}
+
+
+def _restart(directory):
+    resolver = VenueResolver(ttl=3600)
+    snapshots = CacheSnapshots(directory, max_age=3600)
+    snapshots.register("venue_resolver", resolver)
+    return resolver, snapshots
+
+
+def test_cache_warm_starts_from_its_snapshot(tmp_path):
+    directory = str(tmp_path / "snaps")
+    first, second = ("new-york-ny", "carbone"), ("new-york-ny", "lilia")
+    lookups = VenueLookups()
+    resolver, snapshots = _restart(directory)
+    resolver.resolve_key(lookups, first)
+    resolver.resolve_key(lookups, second)
+    assert snapshots.save() == 2
+
+    resolver, snapshots = _restart(directory)
+    assert snapshots.load() == 1
+    assert resolver.resolve_key(lookups, first) == (42, "Carbone")
+    assert lookups.calls == 2  # answered from the snapshot
+    # `second` was never read after the restart, and must survive the next save anyway
+    assert snapshots.save() == 2
+
+    resolver, snapshots = _restart(directory)
+    snapshots.load()
+    resolver.resolve_key(lookups, first)
+    resolver.resolve_key(lookups, second)
+    assert lookups.calls == 2
+
+
+def test_stale_snapshots_are_not_loaded(tmp_path):
+    directory = str(tmp_path / "snaps")
+    resolver, snapshots = _restart(directory)
+    resolver.resolve_key(VenueLookups(), ("new-york-ny", "carbone"))
+    snapshots.save()
+    resolver, snapshots = _restart(directory)
+    snapshots.max_age = -1
+    assert snapshots.load() == 0
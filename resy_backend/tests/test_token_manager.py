@@ -0,0 +1,128 @@
+# tests/test_token_manager.py
+"""Session token checks: the verified-token cache and task-level revocation across workers."""
+import hashlib
+import threading
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from app.core import token_manager
+from app.core.state_store import MemoryStateStore
+from app.core.token_manager import generate_session_token, revoke_task_tokens, validate_session_token
+from app.services.clientManager import ClientManager
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    """Tokens are verified against module-level caches; start every test from empty ones."""
+    store = MemoryStateStore()
+    monkeypatch.setattr(token_manager, "state_store", store)
+    monkeypatch.setattr(token_manager, "_revoked", {})
+    monkeypatch.setattr(token_manager, "_last_revocation_sync", 0.0)
+    token_manager._token_cache.clear()
+    return store
+
+
+def _rejected(token, task_id="t1") -> str:
+    with pytest.raises(HTTPException) as exc:
+        validate_session_token(token, task_id)
+    assert exc.value.status_code == 401
+    return exc.value.detail
+
+
+def test_valid_token_is_verified_once():
+    token = generate_session_token("t1")
+    assert validate_session_token(token, "t1") == "t1"
+    assert len(token_manager._token_cache) == 1
+    assert validate_session_token(token, "t1") == "t1"
+    assert len(token_manager._token_cache) == 1
+
+
+def test_bad_tokens_are_rejected():
+    assert "Missing" in _rejected(None)
+    assert "Invalid" in _rejected("not-a-jwt")
+    forged = jwt.encode({"task_id": "t1", "iat": time.time(), "exp": time.time() + 60}, "a-different-secret-of-at-least-32-bytes", algorithm="HS256")
+    assert "Invalid" in _rejected(forged)
+    assert "mismatch" in _rejected(generate_session_token("t2"), "t1")
+
+
+def test_expired_tokens_are_rejected_even_from_the_cache():
+    now = time.time()
+    expired = jwt.encode({"task_id": "t1", "iat": now - 120, "exp": now - 60},
+                         token_manager.JWT_SECRET_KEY, algorithm="HS256")
+    assert "expired" in _rejected(expired)
+
+    # A token that expires while cached: its entry says so without another signature check
+    token = generate_session_token("t1")
+    assert validate_session_token(token, "t1") == "t1"
+    digest = hashlib.sha256(token.encode()).digest()
+    task_id, issued_at, _ = token_manager._token_cache[digest]
+    token_manager._token_cache[digest] = (task_id, issued_at, now - 1)
+    assert "expired" in _rejected(token)
+    assert not token_manager._token_cache
+
+
+def test_revocation_rejects_earlier_tokens_only():
+    old = generate_session_token("t1")
+    other = generate_session_token("t2")
+    assert validate_session_token(old, "t1") == "t1"  # cached before the revocation
+    time.sleep(0.01)
+    revoke_task_tokens(["t1"])
+    time.sleep(0.01)
+    assert "revoked" in _rejected(old)
+    assert validate_session_token(generate_session_token("t1"), "t1") == "t1"
+    assert validate_session_token(other, "t2") == "t2"
+
+
+def test_revocation_by_another_worker_is_picked_up(fresh_state):
+    token = generate_session_token("t1")
+    assert validate_session_token(token, "t1") == "t1"
+    time.sleep(0.01)
+    # Another worker's logout only reaches this one through the shared store
+    fresh_state.revoke_tasks(["t1"], time.time())
+    token_manager._last_revocation_sync -= token_manager.REVOCATION_SYNC_SEC
+    assert "revoked" in _rejected(token)
+
+
+def test_concurrent_requests_sync_revocations_once(monkeypatch, fresh_state):
+    fresh_state.revoke_tasks(["t1"], time.time())
+    loads = []
+
+    def load_revocations(since):
+        loads.append(since)
+        time.sleep(0.05)  # hold the other callers at the check
+        return [("t1", time.time())]
+
+    monkeypatch.setattr(fresh_state, "load_revocations", load_revocations)
+    now = time.time()
+    threads = [threading.Thread(target=token_manager._sync_revocations, args=(now,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loads == [-token_manager.REVOCATION_SYNC_SEC]
+    assert token_manager._last_revocation_sync == now
+    assert "t1" in token_manager._revoked
+
+
+def test_revocations_sync_incrementally(store):
+    store.revoke_tasks(["t1", "t2"], 1000.0)
+    store.revoke_tasks(["t2"], 2000.0)
+    assert sorted(store.load_revocations(0.0)) == [("t1", 1000.0), ("t2", 2000.0)]
+    assert store.load_revocations(1500.0) == [("t2", 2000.0)]
+    store.prune_revocations(1500.0)
+    assert store.load_revocations(0.0) == [("t2", 2000.0)]
+
+
+def test_logout_and_session_expiry_revoke_tokens(fresh_state):
+    manager = ClientManager(fresh_state)
+    fresh_state.save_session("t1", "auth", {}, time.time())
+    fresh_state.save_session("t2", "auth", {}, time.time() - 1000)
+    tokens = {t: generate_session_token(t) for t in ("t1", "t2")}
+    time.sleep(0.01)
+    manager.drop_task("t1")
+    manager.clean_up_old_clients()
+    assert "revoked" in _rejected(tokens["t1"], "t1")
+    assert "revoked" in _rejected(tokens["t2"], "t2")
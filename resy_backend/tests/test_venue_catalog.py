@@ -0,0 +1,113 @@
+# tests/test_venue_catalog.py
+"""The local venue catalog: typeahead search, geo search and when a query needs an upstream fetch."""
+import random
+
+import pytest
+
+from app.services.venue_catalog import (
+    VenueCatalog,
+    VenueRecord,
+    distance_from,
+    geohash,
+    haversine_km,
+    record_from_search_hit,
+)
+
+
+def _catalog(*records):
+    catalog = VenueCatalog(query_ttl=60)
+    catalog.add_many(records)
+    return catalog
+
+
+def test_search_ranks_name_prefixes_first():
+    catalog = _catalog(
+        VenueRecord(1, "Le Bernardin", cuisine="French"),
+        VenueRecord(2, "Bernie's", cuisine="Diner"),
+        VenueRecord(3, "Café Boulud", cuisine="French", neighborhood="Upper East Side"),
+        VenueRecord(4, "The French Laundry", cuisine="American"),
+    )
+    assert [r.venue_id for r in catalog.search("bern")] == [2, 1]
+    assert [r.venue_id for r in catalog.search("french")] == [4, 3, 1]  # then other fields, shortest name first
+    assert [r.venue_id for r in catalog.search("cafe bou")] == [3]  # accents folded
+    assert [r.venue_id for r in catalog.search("upper fr")] == [3]  # every token must match
+    assert catalog.search("sushi") == [] and catalog.search("  ") == []
+    assert [r.venue_id for r in catalog.search("fr", limit=1)] == [4]
+
+
+def test_updates_replace_old_tokens_and_keep_known_fields():
+    catalog = _catalog(VenueRecord(1, "Old Name", cuisine="Thai", latitude=40.7, longitude=-74.0, updated_at=100.0))
+    catalog.add(VenueRecord(1, "New Name", updated_at=200.0))
+    assert catalog.search("old") == []
+    record = catalog.get(1)
+    assert record.name == "New Name" and record.cuisine == "Thai" and record.latitude == 40.7
+    # An older copy (e.g. from a snapshot) never wins
+    catalog.add(VenueRecord(1, "Stale Name", updated_at=150.0))
+    assert catalog.get(1).name == "New Name" and catalog.search("stale") == []
+    assert len(catalog) == 1
+
+
+def test_search_hits_are_mapped_and_remembered_as_fetched():
+    hits = [
+        {"id": {"resy": 7}, "name": "Via Carota", "cuisine": ["Italian"], "_geoloc": {"lat": 40.73, "lng": -74.0}},
+        {"id": {}, "name": "No Resy id"},
+    ]
+    catalog = VenueCatalog(query_ttl=60)
+    assert not catalog.query_is_fresh("Via  carota")
+    catalog.ingest_search([r for r in map(record_from_search_hit, hits) if r], query="via carota")
+    assert [r.venue_id for r in catalog.search("via")] == [7]
+    assert catalog.get(7).cuisine == "Italian"
+    assert catalog.query_is_fresh("Via  carota")  # same tokens, same query
+    catalog.query_ttl = 0
+    assert not catalog.query_is_fresh("via carota")
+
+
+# ---------- Geo ----------
+
+def test_geo_helpers():
+    assert geohash(57.64911, 10.40744, 6) == "u4pruy"
+    distance = distance_from(40.7128, -74.0060)
+    assert distance(51.5074, -0.1278) == pytest.approx(haversine_km(40.7128, -74.0060, 51.5074, -0.1278))
+    assert haversine_km(40.7128, -74.0060, 51.5074, -0.1278) == pytest.approx(5570, rel=0.01)
+
+
+@pytest.mark.parametrize("origin", [(40.73, -73.99), (-33.87, 151.21), (64.1, -21.9), (0.0, 179.95)])
+def test_radius_search_matches_brute_force(origin):
+    rng = random.Random(7)
+    lat0, lng0 = origin
+    records = [
+        VenueRecord(i, f"Venue {i}", latitude=lat0 + rng.uniform(-0.5, 0.5),
+                    longitude=((lng0 + rng.uniform(-0.5, 0.5) + 180) % 360) - 180)
+        for i in range(1, 801)
+    ]
+    catalog = _catalog(*records, VenueRecord(9999, "Venue nowhere"))
+    for radius in (0.5, 3, 12, 40):
+        expected = sorted(
+            (haversine_km(lat0, lng0, r.latitude, r.longitude), r.venue_id) for r in records
+        )
+        expected = [venue_id for d, venue_id in expected if d <= radius][:50]
+        found = catalog.search_near("", lat0, lng0, radius, limit=50)
+        assert [r.venue_id for r, _ in found] == expected
+        # Text queries take the same radius and order (more than 256 matches go through the grid)
+        found = catalog.search_near("venue", lat0, lng0, radius, limit=50)
+        assert [r.venue_id for r, _ in found] == expected
+
+
+def test_name_prefix_outranks_distance_and_moves_reindex():
+    catalog = _catalog(
+        VenueRecord(1, "Pizza Place", latitude=40.700, longitude=-74.000),
+        VenueRecord(2, "Best Pizza", latitude=40.701, longitude=-74.000),
+        VenueRecord(3, "Pizzeria Far", latitude=41.500, longitude=-74.000),
+    )
+    assert [r.venue_id for r, _ in catalog.search_near("pizz", 40.7015, -74.0, 5)] == [1, 2]
+    catalog.add(VenueRecord(3, "Pizzeria Far", latitude=40.702, longitude=-74.000))
+    assert [r.venue_id for r, _ in catalog.search_near("pizz", 40.7015, -74.0, 5)] == [3, 1, 2]
+    assert 3 not in catalog.ids_near(41.5, -74.0, 1)
+
+
+def test_query_freshness_is_per_area():
+    catalog = VenueCatalog(query_ttl=60)
+    catalog.mark_query_fetched("sushi", 40.73, -73.99)
+    assert catalog.query_is_fresh("sushi", 40.731, -73.991)
+    assert not catalog.query_is_fresh("sushi", 34.05, -118.24)
+    assert not catalog.query_is_fresh("sushi")
@@ -0,0 +1,80 @@
+# tests/test_venue_resolver.py
+"""Venue URL resolution: bulk lookups, the cache and entries restored from a snapshot."""
+import time
+
+from app.core.snapshots import Snapshot, write_snapshot
+from app.services.resy_client import ResyClientError
+from app.services.venue_catalog import VenueCatalog
+from app.services.venue_resolver import VenueResolver
+
+VENUES = {
+    "carbone": {"id": {"resy": 6194}, "name": "Carbone", "location": {"latitude": 40.728, "longitude": -74.0}},
+    "lilia": {"id": {"resy": 418}, "name": "Lilia", "location": {"latitude": 40.718, "longitude": -73.952}},
+}
+
+
+class VenueLookups:
+    def __init__(self):
+        self.calls = []
+
+    def lookup_venue_slug(self, city_slug, venue_slug):
+        self.calls.append(venue_slug)
+        if venue_slug not in VENUES:
+            raise ResyClientError("not found", status_code=404)
+        return VENUES[venue_slug]
+
+
+def _url(slug, city="new-york-ny"):
+    return f"https://resy.com/cities/{city}/venues/{slug}"
+
+
+def test_bulk_resolution_looks_each_venue_up_once_in_input_order():
+    resolver, lookups, catalog = VenueResolver(ttl=3600), VenueLookups(), VenueCatalog()
+    urls = [_url("carbone"), _url("nowhere"), "https://example.com/x", _url("Carbone", "New-York-NY"), _url("lilia")]
+    results = resolver.resolve_many(lookups, urls, catalog, fanout=4)
+
+    assert [(r["url"], r["venue_id"], r["venue_name"]) for r in results] == [
+        (urls[0], 6194, "Carbone"),
+        (urls[1], None, None),
+        (urls[2], None, None),
+        (urls[3], 6194, "Carbone"),
+        (urls[4], 418, "Lilia"),
+    ]
+    assert results[1]["error"].startswith("Upstream error") and results[2]["error"].startswith("Invalid URL")
+    assert sorted(lookups.calls) == ["carbone", "lilia", "nowhere"]
+    assert catalog.get(6194).name == "Carbone"
+
+    # Hits come from the cache; failures are not cached
+    resolver.resolve_many(lookups, urls, catalog)
+    assert sorted(lookups.calls) == ["carbone", "lilia", "nowhere", "nowhere"]
+
+
+def test_cache_expires_and_is_bounded():
+    resolver, lookups = VenueResolver(ttl=-1), VenueLookups()
+    resolver.resolve_url(lookups, _url("carbone"))
+    resolver.resolve_url(lookups, _url("carbone"))
+    assert lookups.calls == ["carbone", "carbone"]
+
+    resolver, lookups = VenueResolver(ttl=3600, max_entries=1), VenueLookups()
+    for slug in ("carbone", "lilia", "carbone"):
+        resolver.resolve_url(lookups, _url(slug))
+    assert lookups.calls == ["carbone", "lilia", "carbone"]
+
+
+def test_entries_are_restored_from_the_snapshot_on_demand(tmp_path):
+    path = str(tmp_path / "venue_resolver.snap")
+    now = time.time()
+    write_snapshot(path, [
+        (b"new-york-ny/carbone", b'[6194, "Carbone"]', now + 3600),
+        (b"new-york-ny/lilia", b'[418, "Lilia"]', now + 0.05),
+    ], now)
+    resolver, lookups = VenueResolver(ttl=3600), VenueLookups()
+    resolver.attach_snapshot(Snapshot(path))
+    time.sleep(0.1)  # the lilia entry has run out since
+
+    results = resolver.resolve_many(lookups, [_url("carbone"), _url("lilia")])
+    assert [(r["venue_id"], r["venue_name"]) for r in results] == [(6194, "Carbone"), (418, "Lilia")]
+    assert lookups.calls == ["lilia"]
+    assert ("new-york-ny", "carbone") in resolver._cache  # moved into memory once read
+    entries = {key: value for key, value, _ in resolver.snapshot_entries(time.time())}
+    assert set(entries) == {b"new-york-ny/carbone", b"new-york-ny/lilia"}
@@ -0,0 +1,135 @@
+# tests/test_watch_store.py
+"""Durable watches shared by several workers: write-through, limits, removal, results and adoption."""
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.state_store import MemoryStateStore
+from app.services.watch_registry import Watch, WatchRegistry
+from app.services.watch_store import WatchStore
+
+DAY = "2030-01-01"
+FIND = {"results": {"venues": [{"slots": [{
+    "config": {"token": "c1", "type": "Dining Room"},
+    "date": {"start": f"{DAY} 19:00:00", "end": f"{DAY} 20:30:00"},
+    "payment": {},
+}]}]}}
+
+
+def _worker(store, owner, resy_client=None, max_per_task=3):
+    """One process's watches: its registry and the WatchStore persisting them to the shared `store`."""
+
+    @contextmanager
+    def use_client(task_id, touch=True):
+        yield resy_client
+
+    registry = WatchRegistry(SimpleNamespace(use_client=use_client), max_per_task=max_per_task)
+    return WatchStore(registry, store, owner=owner)
+
+
+def _watch(task_id="t1", venue_id=1):
+    return Watch(task_id=task_id, venue_id=venue_id, day=DAY, party_size=2, time_start="18:00", time_end="21:00")
+
+
+def test_new_watches_are_visible_to_other_workers(store):
+    a, b = _worker(store, "a"), _worker(store, "b")
+    watch = a.add(_watch())
+    [row] = store.load_watches("t1")
+    assert row["owner"] == "a" and row["spec"] == watch.spec()
+
+    [seen] = b.for_task("t1")
+    assert seen.watch_id == watch.watch_id and seen.spec() == watch.spec()
+    assert b.get(watch.watch_id, "t1").watch_id == watch.watch_id
+    assert b.get(watch.watch_id, "t2") is None
+    assert b.registry.get(watch.watch_id) is None  # read, not run
+
+
+def test_limit_counts_watches_on_every_worker(store):
+    a, b = _worker(store, "a", max_per_task=2), _worker(store, "b", max_per_task=2)
+    a.add(_watch(venue_id=1))
+    b.add(_watch(venue_id=2))
+    with pytest.raises(ValueError):
+        a.add(_watch(venue_id=3))
+    b.add(_watch(task_id="t2"))
+
+
+def test_removal_through_another_worker_stops_the_watch(store):
+    a, b = _worker(store, "a"), _worker(store, "b")
+    watch = a.add(_watch())
+    b.remove([watch.watch_id])
+    assert store.load_watches("t1") == []
+    assert a.registry.get(watch.watch_id) is not None
+    a.sync()
+    assert a.registry.get(watch.watch_id) is None
+    assert a.for_task("t1") == []
+
+
+def test_results_reach_other_workers_on_sync(store, resy_client):
+    resy_client.find_result = FIND
+    a, b = _worker(store, "a", resy_client), _worker(store, "b")
+    watch = a.add(_watch())
+    a.registry.poll(watch.key)
+    assert [s["token"] for s in watch.slots] == ["c1"]
+    assert b.for_task("t1")[0].slots == []
+    a.sync()
+    [seen] = b.for_task("t1")
+    assert [s["token"] for s in seen.slots] == ["c1"]
+    assert seen.checked_at == watch.checked_at
+
+
+def test_watches_of_a_dead_worker_are_adopted(store):
+    a, b = _worker(store, "a"), _worker(store, "b")
+    watch = a.add(_watch())
+    b.sync()
+    assert b.registry.get(watch.watch_id) is None  # a is alive
+
+    store.heartbeat_watches("a", time.time() - 3600)  # a stops heartbeating
+    b.sync()
+    adopted = b.registry.get(watch.watch_id)
+    assert adopted is not None and adopted.spec() == watch.spec() and adopted.created_at == watch.created_at
+    assert store.load_watches("t1")[0]["owner"] == "b"
+    # If a comes back, it finds its watch taken over and stops running it
+    a.sync()
+    assert a.registry.get(watch.watch_id) is None
+    assert b.registry.get(watch.watch_id) is not None
+
+
+def test_clean_shutdown_hands_watches_over_at_once(store):
+    a, b = _worker(store, "a"), _worker(store, "b")
+    watch = a.add(_watch())
+    a.close()
+    assert b.adopt(spread=0.0) == 1
+    assert b.registry.get(watch.watch_id) is not None
+
+
+def test_unreadable_rows_are_skipped(store):
+    store.write_watches([("bad", "t1", {"venue_id": 1, "unknown": True}, 0.0)], [], "gone", 0.0)
+    b = _worker(store, "b")
+    assert b.for_task("t1") == []
+    assert b.adopt(spread=0.0) == 0
+
+
+class FlakyStore(MemoryStateStore):
+    def __init__(self):
+        super().__init__()
+        self.failing = False
+
+    def write_watches(self, *args, **kwargs):
+        if self.failing:
+            raise RuntimeError("database is locked")
+        return super().write_watches(*args, **kwargs)
+
+
+def test_failed_write_through_is_retried_on_sync():
+    store = FlakyStore()
+    a = _worker(store, "a")
+    store.failing = True
+    watch = a.add(_watch())
+    assert store.load_watches("t1") == []
+    a.reconcile()
+    assert a.registry.get(watch.watch_id) is not None  # queued, not gone
+    store.failing = False
+    a.sync()
+    assert [row["watch_id"] for row in store.load_watches("t1")] == [watch.watch_id]